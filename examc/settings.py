@@ -213,6 +213,14 @@ PRIVATE_MEDIA_URL = "/_protected/"
 SCANS_ROOT = PRIVATE_MEDIA_ROOT / 'scans/'
 #SCANS_URL = '/protected/scans/'
 
+# Processes used to decode scans QR codes at import (0 = one per cpu)
+SCANS_DECODE_PROCESSES = env_int("SCANS_DECODE_PROCESSES", "0")
+
+# Scans preview levels generated at import for the review canvas (widths in px, webp or jpeg)
+SCANS_PREVIEWS_ROOT = PRIVATE_MEDIA_ROOT / 'scans_previews/'
+SCANS_PREVIEW_WIDTHS = [int(width) for width in env_list("SCANS_PREVIEW_WIDTHS", "1200,600")]
+SCANS_PREVIEW_FORMAT = env("SCANS_PREVIEW_FORMAT", "webp")
+
 # Marked scans folder
 MARKED_SCANS_ROOT = PRIVATE_MEDIA_ROOT / 'marked_scans/'
 #MARKED_SCANS_URL = '/protected/marked_scans/'
@@ -237,6 +245,24 @@ AMC_PROJECTS_URL = '/amc_projects/'
 # AMC config file
 AMC_CONFIG_FILE = AMC_PROJECTS_ROOT / 'config/amc_config.xml'
 
+# Concurrent AMC analyse processes for a data capture, each on a shard of the scans (0 = one per cpu)
+AMC_ANALYSE_PROCESSES = env_int("AMC_ANALYSE_PROCESSES", "0")
+
+# Concurrent AMC annotate processes, each on a group of students (0 = one per cpu)
+AMC_ANNOTATE_PROCESSES = env_int("AMC_ANNOTATE_PROCESSES", "0")
+
+# Processes rendering the grading scheme report PDFs of the annotated papers (0 = one per cpu)
+GRADING_REPORT_PROCESSES = env_int("GRADING_REPORT_PROCESSES", "0")
+
+# Annotated papers emails sent through one SMTP connection, their statuses are recorded together
+AMC_MAIL_BATCH_SIZE = env_int("AMC_MAIL_BATCH_SIZE", "25")
+
+# Maximum annotated papers emails sent per minute (0 = no limit)
+AMC_MAIL_RATE_PER_MINUTE = env_int("AMC_MAIL_RATE_PER_MINUTE", "120")
+
+# Retries of an annotated papers email after a transient SMTP failure
+AMC_MAIL_RETRIES = env_int("AMC_MAIL_RETRIES", "3")
+
 # Documentation folder
 DOCUMENTATION_ROOT = BASE_DIR / 'examc_app/static/docs/html/'
 DOCUMENTATION_URL = STATIC_URL + 'docs/html/'
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:12
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('examc_app', '0013_reviewlock_copy_no'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanPage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('copie_no', models.CharField(max_length=10)),
+                ('page_no', models.CharField(max_length=10)),
+                ('extra', models.PositiveIntegerField(default=0)),
+                ('filename', models.CharField(max_length=100)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('source_archive', models.CharField(blank=True, default='', max_length=255)),
+                ('imported_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('exam', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scanPages', to='examc_app.exam')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['exam', 'content_hash'], name='scan_page_exam_hash_idx')],
+                'constraints': [models.UniqueConstraint(fields=('exam', 'copie_no', 'page_no', 'extra'), name='uniq_scan_page_per_exam')],
+            },
+        ),
+    ]
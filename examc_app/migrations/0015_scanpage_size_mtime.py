@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('examc_app', '0014_scanpage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanpage',
+            name='size',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='scanpage',
+            name='mtime',
+            field=models.FloatField(default=0),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('examc_app', '0015_scanpage_size_mtime'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanpage',
+            name='width',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='scanpage',
+            name='height',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
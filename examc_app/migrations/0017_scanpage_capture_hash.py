@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('examc_app', '0016_scanpage_width_height'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanpage',
+            name='capture_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='scanpage',
+            name='captured_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
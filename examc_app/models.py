@@ -364,6 +364,42 @@ class PageMarkersUser(models.Model):
     created = models.DateTimeField(auto_now_add=True, blank=True)
     modified = models.DateTimeField(blank=True, null=True)
 
+class ScanPage(models.Model):
+    """ Stores the import manifest and index entry of a scan page (content hash, copy, page, file) and the hash of the inputs of its last AMC capture from review, related to :model:`examc_app.Exam` """
+    exam = models.ForeignKey(Exam, on_delete=models.CASCADE, related_name='scanPages')
+    copie_no = models.CharField(max_length=10)
+    page_no = models.CharField(max_length=10)
+    extra = models.PositiveIntegerField(default=0)
+    filename = models.CharField(max_length=100)
+    content_hash = models.CharField(max_length=64)
+    source_archive = models.CharField(max_length=255, blank=True, default='')
+    imported_at = models.DateTimeField(default=timezone.now)
+    size = models.BigIntegerField(default=0)
+    mtime = models.FloatField(default=0)
+    width = models.PositiveIntegerField(default=0)
+    height = models.PositiveIntegerField(default=0)
+    capture_hash = models.CharField(max_length=64, blank=True, default='')
+    captured_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['exam', 'copie_no', 'page_no', 'extra'],
+                name='uniq_scan_page_per_exam',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['exam', 'content_hash'], name='scan_page_exam_hash_idx'),
+        ]
+
+    def __str__(self):
+        return self.copie_no + " - " + self.filename + " " + self.exam.code
+
+    @property
+    def path(self):
+        """ Path of the scan relative to the exam scans folder """
+        return self.copie_no + "/" + self.filename
+
 ########################
 # RESULTS & STATISTICS
 ########################
@@ -24,14 +24,15 @@ def make_token_for(rel_path: str,type_root: str) -> str:
     Crée un token signé qui embarque {type, path}, et renvoie une URL
     du style: /protected/?token=<TOKEN>
     """
-    type = type_root.rstrip("/").split("/")[-1]  # "scans" | "marked_scans" | "amc_projects" | ...
+    type = type_root.rstrip("/").split("/")[-1]  # "scans" | "scans_previews" | "marked_scans" | "amc_projects" | ...
     payload = {"type": type, "path": rel_path}
     if type == 'extra':
         payload['path'] = type_root.replace(str(settings.AMC_PROJECTS_ROOT), "")[1:]+rel_path
     # JSON -> base64url pour un token compact et sans caractères spéciaux
     msg = b64url_encode(json.dumps(payload, separators=(",", ":")))
     token = signer.sign(msg)  # TimestampSigner
-    copy_page = rel_path.split('.jpg')[0].split("/").pop()
+    # preview levels are webp files, keep the copy/page hint of the original scan
+    copy_page = rel_path.split('.jpg')[0].split('.webp')[0].split("/").pop()
     return f"{settings.SIGNED_FILES_URL}{copy_page}/?{urlencode({'token': token})}"
 
 def verify_and_get_path(token: str, max_age=None) -> Path:
@@ -65,6 +66,7 @@ def verify_and_get_path(token: str, max_age=None) -> Path:
     # --- 3) Résolution de la racine en fonction du type ---
     roots = {
         "scans":          Path(settings.SCANS_ROOT),
+        "scans_previews": Path(settings.SCANS_PREVIEWS_ROOT),
         "marked_scans":   Path(settings.MARKED_SCANS_ROOT),
         "amc_projects":   Path(settings.AMC_PROJECTS_ROOT),
         "CATALOG":        Path(settings.AMC_PROJECTS_ROOT),
@@ -55,6 +55,12 @@
     /** Coordinates for corrector boxes, each item is {x, y, corner}. */
     let correctorBoxesData = [];
 
+    /** Width of the original scan (the displayed image can be a smaller preview level). */
+    let sourceImageOriginalWidth = null;
+
+    /** Url of the original scan, shown by the magnifier instead of the displayed preview level. */
+    let sourceImageOriginalSrc = null;
+
     /** Magnifier on/off state. */
     let magnifierActive = false;
 
@@ -509,6 +515,17 @@
         return false;
     }
 
+    /**
+     * Image url of a signed scan path from backend.
+     *
+     * @param {string} scanPath - File path from backend.
+     * @returns {string} Url to load the image from.
+     */
+    function getScanSrc(scanPath) {
+        const parts = scanPath.split('/');
+        return "/" + parts[1] + "/" + parts[3];
+    }
+
     /**
      * Update the main source image and table highlighting from a backend path.
      *
@@ -524,9 +541,8 @@
         }
 
         const parts = scanPath.split('/');
-        const srcUrl = "/" + parts[1] + "/" + parts[3];
 
-        sourceImage.src = srcUrl;
+        sourceImage.src = getScanSrc(scanPath);
         sourceImage.alt = parts[2];
 
         currentSourceIdParts = parts[2].split('_');
@@ -1050,13 +1066,16 @@
                             'csrfmiddlewaretoken': csrfToken,
                             'copy_no': copyNo,
                             'page_no': String(pageNo),
-                            'group_id': pagesGroupId
+                            'group_id': pagesGroupId,
+                            'viewport_width': Math.round(mjs3App.getBoundingClientRect().width * (window.devicePixelRatio || 1))
                         },
                         success: (raw) => {
                             if (raw !== "None") {
                                 const dataFull = JSON.parse(raw);
                                 const parsedMarkers = JSON.parse(dataFull.markers);
 
+                                sourceImageOriginalWidth = dataFull.copyPageWidth;
+                                sourceImageOriginalSrc = dataFull.copyPageOriginalUrl ? getScanSrc(dataFull.copyPageOriginalUrl) : null;
                                 setSourceScan(dataFull.copyPageUrl, fromCopy);
 
                                 markerState = parsedMarkers;
@@ -1105,7 +1124,7 @@
         const corrBoxDiv = getStageCorrBoxDiv();
         if (!corrBoxDiv) return;
 
-        const baseWidth = sourceImage.naturalWidth || 1;
+        const baseWidth = sourceImageOriginalWidth || sourceImage.naturalWidth || 1;
         const imgScale = markerArea.targetWidth / baseWidth;
 
         corrBoxDiv.innerHTML = '';
@@ -1620,7 +1639,8 @@
         glass.classList.add("magnifier-glass");
         elem.parentElement.insertBefore(glass, elem);
 
-        glass.style.backgroundImage = `url('${sourceImage.src}')`;
+        // the original scan, the displayed image can be a downscaled preview level
+        glass.style.backgroundImage = `url('${sourceImageOriginalSrc || sourceImage.src}')`;
         glass.style.backgroundRepeat = "no-repeat";
         glass.style.backgroundSize =
             (markerArea.targetWidth * zoom) + "px " + (markerArea.targetHeight * zoom) + "px";
@@ -21,11 +21,12 @@ from django.utils import timezone
 from fpdf import FPDF
 
 from django.conf import settings
-from examc_app.models import Student, StudentQuestionAnswer, Question, Exam, ReviewLock, PageMarkers
+from examc_app.models import Student, StudentQuestionAnswer, Question, Exam, ReviewLock, PageMarkers, ScanPage
 from examc_app.utils.amc_functions import (
     amc_automatic_data_capture,
     amc_automatic_datacapture_subprocess,
     amc_annotate,
+    amc_send_annotated_papers,
     get_amc_project_path,
 )
 from examc_app.utils.generate_statistics_functions import generate_exam_stats
@@ -37,8 +38,9 @@ from examc_app.utils.marker_rendering import (
     render_marked_scan,
 )
 from examc_app.utils.results_statistics_functions import update_common_exams, delete_exam_data
-from examc_app.utils.review_functions import import_scans, zipdir, generate_marked_pdfs
-from examc_app.utils.zip_security import safe_extract_zip
+from examc_app.utils.review_capture import compute_review_capture_hashes, get_changed_review_pages, record_review_capture
+from examc_app.utils.review_functions import import_scans_from_zip, zipdir, generate_marked_pdfs
+from examc_app.utils.scan_manifest import get_exam_scans_dir
 
 
 IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
@@ -223,17 +225,18 @@ def import_csv_data(self, temp_csv_file_path, exam_pk):
 
 
 @shared_task(bind=True)
-def import_exam_scans(self, zip_file_path, exam_pk,delete_old):
+def import_exam_scans(self, zip_file_path, exam_pk,delete_old, source_archive=''):
     """
-    Extracts and imports scanned files for an exam upload.
+    Imports scanned files for an exam upload.
 
-    This function is responsible for extracting scanned files from a zip archive and importing them into the system
+    This function is responsible for reading scanned files straight from a zip archive and importing them into the system
     for a specific exam upload process.
 
     Args:
         request: TThe HTTP request object.
         pk: The primary key of the exam.
         zip_file_path: The file path of the zip archive containing the scanned files.
+        source_archive: The name of the uploaded archive, recorded in the exam scans manifest.
 
     Returns:
         return: A message indicating the success or failure of the upload process.
@@ -253,33 +256,21 @@ def import_exam_scans(self, zip_file_path, exam_pk,delete_old):
         progress_recorder.set_progress(0, process_count, description='')
         time.sleep(2)
 
-        # remove
+        # scans are read straight from the archive, no extraction step anymore
         progress_recorder.set_progress(process_number, process_count, description=str(process_number) + '/' + str(
-            process_count) + ' - Extracting zip files...')
+            process_count) + ' - Reading zip file...')
 
+        # remove leftovers of previous imports extracted in the autoupload folder
         zip_path = str(settings.AUTOUPLOAD_ROOT) + "/" + str(exam.year.code) + "_" + str(
             exam.semester.code) + "_" + exam.code
-
         if os.path.exists(zip_path):
             shutil.rmtree(zip_path)
-        tmp_extract_path = zip_path + "/tmp_extract"
-
-        # extract zip file in tmp dir
-        with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
-            print("start extraction")
-            # Security hardening: validated extraction (no traversal/symlink/oversized archive).
-            safe_extract_zip(zip_ref, tmp_extract_path)
-
-        dirs = [entry for entry in os.listdir(tmp_extract_path) if os.path.isdir(os.path.join(tmp_extract_path, entry))]
-
-        if dirs:
-            tmp_extract_path = os.path.join(tmp_extract_path, dirs[0])
 
         process_number += 1
         progress_recorder.set_progress(process_number, process_count, description=str(process_number) + '/' + str(
             process_count) + ' - Importing scans...')
 
-        result = import_scans(exam, tmp_extract_path,delete_old,progress_recorder,process_count,process_number)
+        result = import_scans_from_zip(exam, zip_file_path,delete_old,progress_recorder,process_count,process_number,source_archive)
 
         process_number = result[1]
         print('******** import and split ok : ')
@@ -296,15 +287,6 @@ def import_exam_scans(self, zip_file_path, exam_pk,delete_old):
         progress_recorder.set_progress(process_number, process_count, description=str(process_number) + '/' + str(
             process_count) + ' - Removing tmp files...')
 
-        # remove imported Files (zip + extracted)
-        for filename in os.listdir(zip_path):
-            file_path = os.path.join(zip_path, filename)
-
-            if os.path.isfile(file_path) or os.path.islink(file_path):
-                os.unlink(file_path)
-            elif os.path.isdir(file_path):
-                shutil.rmtree(file_path)
-
         process_number += 1
         progress_recorder.set_progress(process_number, process_count, description=str(process_number) + '/' + str(
             process_count) + ' - AMC Automatic datacapture...')
@@ -322,7 +304,6 @@ def import_exam_scans(self, zip_file_path, exam_pk,delete_old):
         #result = amc_automatic_data_capture(exam,scans_folder_path,True,file_list_path)
         #print('end amc automatic data capture')
         os.remove(zip_file_path)
-        shutil.rmtree(zip_path)
 
     except Exception as exception:
         self.update_state(state='FAILURE', meta={'exc_type': type(exception).__name__, 'exc_message': "Error during import "+str(exception)})
@@ -501,7 +482,7 @@ def _render_review_marked_scans(task, exam, selected_filenames=None):
         _append_amc_import_line(
             task,
             lines,
-            f"Generating marked scans from review annotations for {len(selected_filenames)} selected page(s) ...",
+            f"Generating marked scans from review annotations for {len(selected_filenames)} page(s) ...",
         )
         page_markers_list = [
             page_markers
@@ -548,6 +529,11 @@ def _render_review_marked_scans(task, exam, selected_filenames=None):
     return lines
 
 
+def _get_marked_scan_path(scan):
+    marked_scan = pathlib.Path(str(scan).replace(str(settings.SCANS_ROOT), str(settings.MARKED_SCANS_ROOT)))
+    return marked_scan.with_name(f"marked_{marked_scan.stem}.png")
+
+
 def _write_review_import_file_list(exam, scans_list=None):
     amc_proj_path = get_amc_project_path(exam, False)
     file_list_path = amc_proj_path + "/list-file"
@@ -572,11 +558,7 @@ def _write_review_import_file_list(exam, scans_list=None):
     marked_count = 0
     with open(file_list_path, "w") as f:
         for scan in scans_list:
-            scan_path = pathlib.Path(scan)
-            marked_scan = pathlib.Path(
-                str(scan_path).replace(str(settings.SCANS_ROOT), str(settings.MARKED_SCANS_ROOT))
-            )
-            marked_scan = marked_scan.with_name(f"marked_{marked_scan.stem}.png")
+            marked_scan = _get_marked_scan_path(scan)
             if marked_scan.exists():
                 f.write(str(marked_scan) + "\n")
                 marked_count += 1
@@ -597,6 +579,35 @@ def amc_import_from_review_task(self, exam_pk, scans_list=None):
             selected_filenames = {pathlib.Path(scan).name for scan in scans_list}
 
         _append_amc_import_line(self, lines, f"Starting AMC import from review for exam {exam.pk} ...")
+
+        # pages whose marked scan inputs changed since the last capture from review
+        captured_pages = []
+        capture_hashes = {}
+        changed_review_pages = get_changed_review_pages(exam) if scans_list is None else None
+        if changed_review_pages is not None:
+            captured_pages, unchanged_count, capture_hashes = changed_review_pages
+            _append_amc_import_line(
+                self,
+                lines,
+                f"{unchanged_count} page(s) unchanged since the last capture from review, skipped.",
+            )
+            if not captured_pages:
+                _append_amc_import_line(self, lines, "No changed page to import, AMC import from review completed.")
+                return {
+                    "status": "done",
+                    "output": "".join(lines[-500:]),
+                    "line_count": len(lines),
+                }
+            scans_dir = get_exam_scans_dir(exam)
+            scans_list = [scans_dir + "/" + scan_page.path for scan_page in captured_pages]
+            selected_filenames = {scan_page.filename for scan_page in captured_pages}
+            # changed pages without markers anymore go back to their original scan
+            for scan in scans_list:
+                _get_marked_scan_path(scan).unlink(missing_ok=True)
+        elif selected_filenames is not None:
+            captured_pages = list(ScanPage.objects.filter(exam=exam, filename__in=selected_filenames))
+            capture_hashes = compute_review_capture_hashes(exam, captured_pages)
+
         lines.extend(_render_review_marked_scans(self, exam, selected_filenames=selected_filenames))
 
         file_list_path, file_count, marked_count = _write_review_import_file_list(exam, scans_list=scans_list)
@@ -606,9 +617,14 @@ def amc_import_from_review_task(self, exam_pk, scans_list=None):
             f"AMC file list written ({file_count} file(s), {marked_count} marked scan(s)).",
         )
 
+        analyse_errors = False
         for line in amc_automatic_datacapture_subprocess(None, exam, None, True, file_list_path=file_list_path):
+            analyse_errors = analyse_errors or "ERR:" in line
             _append_amc_import_line(self, lines, line)
 
+        if captured_pages and not analyse_errors:
+            record_review_capture(captured_pages, capture_hashes)
+
         _append_amc_import_line(self, lines, "AMC import from review completed.")
         return {
             "status": "done",
@@ -697,3 +713,48 @@ def amc_annotate_task(self, exam_pk: int, single_file: bool, add_grading_scheme_
             },
         )
         raise
+
+
+@shared_task(bind=True)
+def amc_send_annotated_papers_task(self, exam_pk: int, selected_students, email_subject, email_body, email_column):
+    last_progress = {"progress": ""}
+
+    def progress_callback(done=None, total=None, message=""):
+        last_progress["progress"] = message
+        self.update_state(
+            state="PROGRESS",
+            meta={
+                "progress": message,
+                "done": done,
+                "total": total,
+                "message": message,
+            },
+        )
+
+    try:
+        exam = Exam.objects.get(pk=exam_pk)
+        logger.info("AMC send annotated papers task started exam=%s students=%s", exam_pk, len(selected_students))
+        result = amc_send_annotated_papers(
+            exam,
+            selected_students,
+            email_subject,
+            email_body,
+            email_column,
+            progress_callback=progress_callback,
+        )
+        logger.info("AMC send annotated papers task completed exam=%s sent=%s errors=%s", exam_pk, result[0], result[1])
+        return {
+            "output": result,
+            "progress": last_progress["progress"],
+        }
+    except Exception as exception:
+        logger.exception("AMC send annotated papers task failed exam=%s", exam_pk)
+        self.update_state(
+            state="FAILURE",
+            meta={
+                "exc_type": type(exception).__name__,
+                "exc_message": str(exception),
+                "progress": "Failed",
+            },
+        )
+        raise
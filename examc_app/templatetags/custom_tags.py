@@ -15,6 +15,7 @@ from django.conf import settings
 from examc_app.models import ScaleDistribution, ComVsIndStatistic, Exam, PagesGroup, PageMarkers, ExamUser, ReviewLock, \
     Scale, PagesGroupGradingSchemeCheckedBox
 from examc_app.models import ScaleStatistic, Student, AnswerStatistic, logger
+from examc_app.utils.scan_manifest import get_exam_scan_copies
 
 register = template.Library()
 
@@ -202,8 +203,12 @@ def get_pages_group_graded_count_txt(pages_group_id,user_id=None):
     else:
         count_graded = PageMarkers.objects.filter(pages_group=pages_group,correctorBoxMarked=True).count()
     scans_path =  str(settings.SCANS_ROOT) + "/" + str(pages_group.exam.year.code) + "/" + str(pages_group.exam.semester.code) + "/" + pages_group.exam.code+"_"+pages_group.exam.date.strftime("%Y%m%d")
-    if os.path.exists(scans_path):
-        scans_folders = [x for x in os.listdir(scans_path) if x != '0000']
+    indexed_copies = get_exam_scan_copies(pages_group.exam)
+    if indexed_copies is not None or os.path.exists(scans_path):
+        if indexed_copies is not None:
+            scans_folders = [x for x in indexed_copies if x != '0000']
+        else:
+            scans_folders = [x for x in os.listdir(scans_path) if x != '0000']
         count_copies = len(scans_folders)
         try:
             print("copies: "+str(count_copies))
@@ -0,0 +1,69 @@
+import numpy as np
+from django.test import SimpleTestCase
+
+from examc_app.utils.amc.modules.box import AMCBox, AMCBoxStore, centres_extremes, etendues_xy, extremes
+from examc_app.utils.amc.modules.calage import AMCCalage
+
+
+def reference_extremes(boites):
+    """The extremes found by sorting the boxes in each direction, as AMC::Boite does."""
+    boites = list(boites)
+    result = []
+    for x, y in ((1, 1), (-1, 1), (-1, -1), (1, -1)):
+        boites.sort(key=lambda b: b.centre_projete(x, y))
+        result.append(boites[0])
+    return result
+
+
+class AMCBoxStoreTestCase(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(15)
+        centres = rng.uniform(0, 1000, (40, 2))
+        offsets = np.array([(-5, -4), (5, -4), (5, 4), (-5, 4)], dtype=np.float64)
+        self.corners = centres[:, None, :] + offsets + rng.normal(0, 0.5, (40, 4, 2))
+        self.store = AMCBoxStore.from_corners(self.corners)
+
+    def test_extremes_match_sorting_in_each_direction(self):
+        expected = [b.index for b in reference_extremes(self.store.boxes())]
+        self.assertEqual(self.store.extremes(), expected)
+        self.assertEqual([b.index for b in extremes(self.store.boxes())], expected)
+
+    def test_extremes_of_a_subset_return_store_indexes(self):
+        indexes = list(range(5, 40, 3))
+        expected = [b.index for b in reference_extremes([self.store.box(i) for i in indexes])]
+        self.assertEqual(self.store.extremes(indexes), expected)
+
+    def test_extremes_of_boxes_from_different_stores(self):
+        boites = [AMCBox.new_complete(*self.corners[i].ravel()) for i in range(10)]
+        self.assertEqual(extremes(boites), reference_extremes(boites))
+        self.assertEqual(
+            centres_extremes(boites),
+            [coord for b in reference_extremes(boites) for coord in b.centre()],
+        )
+        self.assertEqual(extremes([]), [])
+
+    def test_vectorized_geometry_matches_the_boxes(self):
+        boites = self.store.boxes()
+        np.testing.assert_allclose(self.store.centres(), [b.centre() for b in boites])
+        np.testing.assert_allclose(self.store.etendues_xy(), [b.etendue_xy('xy') for b in boites])
+        np.testing.assert_allclose(etendues_xy(boites), [b.etendue_xy('xy') for b in boites])
+        np.testing.assert_allclose(self.store.diametres(), [b.diametre() for b in boites])
+        self.assertEqual(list(self.store.bonnes_etendues(9, 11)), [b.bonne_etendue(9, 11) for b in boites])
+        np.testing.assert_allclose(self.store.directions(0, 2), [b.direction(0, 2) for b in boites])
+
+    def test_transforme_moves_the_store_and_its_views(self):
+        transf = AMCCalage.from_params([2, 0.1, -0.1, 2, 30, -20, 0])
+        box = self.store.box(7)
+        expected = [transf.transforme(x, y, nominmax=True) for x, y in self.corners[7]]
+        self.store.transforme(transf)
+        np.testing.assert_allclose(box.coins, expected)
+        self.assertFalse(box.droite)
+
+    def test_extend_grows_the_store(self):
+        store = AMCBoxStore()
+        box = store.new_MN(0, 0, 10, 20)
+        for i in range(20):
+            store.new_complete(i, i, i + 1, i, i + 1, i + 1, i, i + 1)
+        self.assertEqual(len(store), 21)
+        self.assertEqual(box.etendue_xy('xy'), (0.0, 10.0, 0.0, 20.0))
+        self.assertTrue(box.droite)
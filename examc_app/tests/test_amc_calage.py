@@ -0,0 +1,86 @@
+import math
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from examc_app.utils.amc.modules.calage import AMCCalage, calage_batch
+
+
+def mean(values):
+    return sum(values) / len(values)
+
+
+def crochet(a, b):
+    ma, mb = mean(a), mean(b)
+    return sum((x - ma) * (y - mb) for x, y in zip(a, b)) / len(a)
+
+
+def reference_fit(cx, cy, cxp, cyp, transform_type):
+    """The point by point closed form fit AMCCalage.calage used before solving by least squares."""
+    if transform_type.startswith('h'):
+        theta = math.atan2(crochet(cx, cyp) - crochet(cxp, cy), crochet(cx, cxp) + crochet(cy, cyp))
+        den = crochet(cx, cx) + crochet(cy, cy)
+        if abs(math.cos(theta)) > abs(math.sin(theta)):
+            alpha = (crochet(cx, cxp) + crochet(cy, cyp)) / (den * math.cos(theta))
+        else:
+            alpha = (crochet(cx, cyp) - crochet(cxp, cy)) / (den * math.sin(theta))
+        if alpha < 0:
+            alpha = abs(alpha)
+            theta += -math.pi if theta > 0 else math.pi
+        a, b = alpha * math.cos(theta), -alpha * math.sin(theta)
+        c, d = alpha * math.sin(theta), alpha * math.cos(theta)
+        e = mean(cxp) - alpha * (mean(cx) * math.cos(theta) - mean(cy) * math.sin(theta))
+        f = mean(cyp) - alpha * (mean(cx) * math.sin(theta) + mean(cy) * math.cos(theta))
+    else:
+        sxx, sxy, syy = crochet(cx, cx), crochet(cx, cy), crochet(cy, cy)
+        delta = sxx * syy - sxy * sxy
+
+        def resoud(e1, f1):
+            return (syy * e1 - sxy * f1) / delta, (-sxy * e1 + sxx * f1) / delta
+
+        a, b = resoud(crochet(cx, cxp), crochet(cy, cxp))
+        c, d = resoud(crochet(cx, cyp), crochet(cy, cyp))
+        e = mean(cxp) - (a * mean(cx) + b * mean(cy))
+        f = mean(cyp) - (c * mean(cx) + d * mean(cy))
+
+    squared = sum((a * x + b * y + e - xp) ** 2 + (c * x + d * y + f - yp) ** 2 for x, y, xp, yp in zip(cx, cy, cxp, cyp))
+    return [a, b, c, d, e, f, math.sqrt(squared / len(cx))]
+
+
+class AMCCalageTestCase(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(14)
+        self.pages = 20
+        # layout corner marks and a few more points, scanned with rotation, scale, shift and noise
+        self.cx = rng.uniform(0, 600, (self.pages, 6))
+        self.cy = rng.uniform(0, 800, (self.pages, 6))
+        angles = rng.uniform(-0.05, 0.05, self.pages)[:, None]
+        scales = rng.uniform(2.5, 3.5, self.pages)[:, None]
+        self.cxp = scales * (self.cx * np.cos(angles) - self.cy * np.sin(angles)) + 40 + rng.normal(0, 0.8, self.cx.shape)
+        self.cyp = scales * (self.cx * np.sin(angles) + self.cy * np.cos(angles)) - 25 + rng.normal(0, 0.8, self.cx.shape)
+
+    def page_points(self, page):
+        return [list(values[page]) for values in (self.cx, self.cy, self.cxp, self.cyp)]
+
+    def test_calage_matches_the_point_by_point_fit(self):
+        for transform_type in ('lineaire', 'helmert'):
+            for page in range(self.pages):
+                transf = AMCCalage(log=False)
+                transf.type = transform_type
+                transf.calage(*self.page_points(page))
+                np.testing.assert_allclose(transf.params(), reference_fit(*self.page_points(page), transform_type), rtol=1e-7, atol=1e-7)
+
+    def test_calage_batch_matches_the_point_by_point_fit(self):
+        for transform_type in ('lineaire', 'helmert'):
+            params = calage_batch(self.cx, self.cy, self.cxp, self.cyp, transform_type)
+            self.assertEqual(params.shape, (self.pages, 7))
+            for page in range(self.pages):
+                np.testing.assert_allclose(params[page], reference_fit(*self.page_points(page), transform_type), rtol=1e-7, atol=1e-7)
+
+    def test_from_params_transforms_points_like_the_fit(self):
+        params = calage_batch(self.cx, self.cy, self.cxp, self.cyp)
+        transf = AMCCalage.from_params(params[3])
+        points = np.stack([self.cx[3], self.cy[3]], axis=-1)
+        expected = [transf.transforme(x, y, nominmax=True) for x, y in points]
+        np.testing.assert_allclose(transf.transforme_points(points, nominmax=True), expected)
+        self.assertEqual(transf.params()[6], params[3][6])
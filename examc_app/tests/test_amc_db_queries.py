@@ -0,0 +1,96 @@
+import importlib.util
+import shutil
+import sqlite3
+import tempfile
+from pathlib import Path
+
+from django.test import SimpleTestCase
+
+from examc_app.utils import amc_db_queries
+
+BENCH_SCRIPT = Path(__file__).resolve().parents[2] / "scripts" / "bench_amc_queries.py"
+
+
+def load_bench_script():
+    spec = importlib.util.spec_from_file_location("bench_amc_queries", BENCH_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class BenchAmcQueriesTestCase(SimpleTestCase):
+    """Keep scripts/bench_amc_queries.py in step with the queries it times."""
+
+    def test_benchmark_runs_without_and_with_indexes(self):
+        bench = load_bench_script()
+        self.addCleanup(amc_db_queries.close_amc_sessions)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            bench.build_project(Path(tmp_dir), copies=2, pages=2, questions=4, answers=2)
+            amc_data_path = tmp_dir + "/"
+            without_indexes = bench.run_queries(amc_data_path, 2, 2)
+            amc_db_queries.ensure_amc_indexes(amc_data_path)
+            with_indexes = bench.run_queries(amc_data_path, 2, 2)
+            amc_db_queries.close_amc_sessions()
+            created_indexes = set()
+            for database in {database for database, _, _, _ in amc_db_queries.AMC_INDEXES}:
+                with sqlite3.connect(Path(tmp_dir) / (database + ".sqlite")) as connection:
+                    created_indexes.update(name for name, in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'"))
+        self.assertEqual(without_indexes.keys(), with_indexes.keys())
+        self.assertTrue({index_name for _, index_name, _, _ in amc_db_queries.AMC_INDEXES} <= created_indexes)
+
+
+class SelectManualDatacaptureQuestionsByPageTestCase(SimpleTestCase):
+    def setUp(self):
+        self.data_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.data_dir)
+        self.addCleanup(amc_db_queries.close_amc_sessions)
+        self.amc_data_path = str(self.data_dir) + "/"
+
+        capture = sqlite3.connect(self.data_dir / "capture.sqlite")
+        capture.executescript(
+            "CREATE TABLE capture_page (src TEXT, student INTEGER, page INTEGER, copy INTEGER, timestamp_auto INTEGER,"
+            " timestamp_manual INTEGER, mse REAL, PRIMARY KEY (student, page, copy));"
+            "CREATE TABLE capture_zone (zoneid INTEGER PRIMARY KEY, student INTEGER, page INTEGER, copy INTEGER,"
+            " type INTEGER, id_a INTEGER, id_b INTEGER, total INTEGER, black INTEGER, manual REAL);"
+        )
+        # copy 1 page 1: question 1 (2 answers) and 2, and a name field zone (type 1)
+        capture.executemany(
+            "INSERT INTO capture_zone (student, page, copy, type, id_a, id_b, total, black, manual) VALUES (?, ?, 0, ?, ?, ?, 100, 10, -1)",
+            [(1, 1, 4, 1, 1), (1, 1, 4, 1, 2), (1, 1, 4, 2, 1), (1, 1, 1, 0, 0)],
+        )
+        capture.commit()
+        capture.close()
+
+        layout = sqlite3.connect(self.data_dir / "layout.sqlite")
+        layout.executescript(
+            "CREATE TABLE layout_box (student INTEGER, page INTEGER, role INTEGER, question INTEGER, answer INTEGER);"
+        )
+        # page 1 is captured, only page 2 comes from the layout
+        layout.executemany(
+            "INSERT INTO layout_box VALUES (?, ?, 1, ?, ?)",
+            [(1, 1, 9, 1), (1, 2, 3, 1), (1, 2, 3, 2), (1, 2, 4, 1)],
+        )
+        layout.commit()
+        layout.close()
+
+    def add_scoring(self):
+        scoring = sqlite3.connect(self.data_dir / "scoring.sqlite")
+        scoring.executescript(
+            "CREATE TABLE scoring_score (student INTEGER, copy INTEGER, question INTEGER, score REAL, why TEXT, max REAL);"
+        )
+        scoring.executemany("INSERT INTO scoring_score VALUES (1, 0, ?, 1, ?, 1)", [(1, "V"), (2, "")])
+        scoring.commit()
+        scoring.close()
+
+    def test_questions_before_scoring(self):
+        self.assertEqual(amc_db_queries.select_manual_datacapture_questions_by_page(self.amc_data_path), {
+            (1, 1): [{"question_id": 1, "why": None}, {"question_id": 2, "why": None}],
+            (1, 2): [{"question_id": 3, "why": ""}, {"question_id": 4, "why": ""}],
+        })
+
+    def test_questions_with_scoring_why(self):
+        self.add_scoring()
+        self.assertEqual(amc_db_queries.select_manual_datacapture_questions_by_page(self.amc_data_path), {
+            (1, 1): [{"question_id": 1, "why": "V"}, {"question_id": 2, "why": ""}],
+            (1, 2): [{"question_id": 3, "why": ""}, {"question_id": 4, "why": ""}],
+        })
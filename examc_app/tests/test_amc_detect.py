@@ -0,0 +1,380 @@
+import math
+import shutil
+import sqlite3
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+import cv2
+import numpy as np
+from django.test import SimpleTestCase
+
+from examc_app.utils import amc_db_queries
+from examc_app.utils.amc import analyze_functions
+from examc_app.utils.amc.modules import analyze
+from examc_app.utils.amc.modules.detect import AMCDetect, measure_scan
+from examc_app.utils.process_pool import pool_imap, process_pool
+
+# A page layout in layout units: 4 corner marks, the ID digit boxes and the answer boxes
+WIDTH, HEIGHT, MARK_DIAMETER = 200.0, 280.0, 6.0
+MARKS = [(15.0, 15.0), (185.0, 15.0), (185.0, 265.0), (15.0, 265.0)]
+# (question, answer, xmin, xmax, ymin, ymax, filled fraction of the box, from its left side)
+BOXES = [
+    (1, 1, 40.0, 45.0, 60.0, 65.0, 1.0),
+    (1, 2, 60.0, 65.0, 60.0, 65.0, 0.0),
+    (1, 3, 80.0, 85.0, 60.0, 65.0, 0.5),
+    (2, 1, 40.0, 45.0, 120.0, 125.0, 0.0),
+    (2, 2, 60.0, 65.0, 120.0, 125.0, 1.0),
+    (3, 1, 150.0, 160.0, 200.0, 205.0, 0.5),
+]
+# (number, digit, x, y, filled): student 3 = binary 11, page 1 = binary 01
+DIGITS = [(1, 1, 30.0, 25.0, 1.0), (1, 2, 40.0, 25.0, 1.0), (2, 1, 30.0, 35.0, 0.0), (2, 2, 40.0, 35.0, 1.0)]
+DIGIT_SIZE = 4.0
+
+# Pixels per layout unit of the scans
+SCALE = 5.0
+PROP = 0.8
+MEASURE_ARGS = ['-x', str(WIDTH), '-y', str(HEIGHT), '-d', str(MARK_DIAMETER), '-p', '0.2', '-m', '0.2', '-c', '3', '-t', '0.6', '-o', '1']
+
+
+def scan_transform(angle=0.0, offset=(12.0, 8.0)):
+    """The layout -> scan pixels transform of a synthetic scan, rotated by angle degrees."""
+    cos, sin = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+    matrix = SCALE * np.array([[cos, -sin], [sin, cos]])
+    return lambda points: np.asarray(points, dtype=np.float64) @ matrix.T + offset
+
+
+def box_corners(xmin, xmax, ymin, ymax):
+    return [(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax)]
+
+
+def fill_polygon(image, transform, corners):
+    # 4 bits of sub-pixel precision
+    cv2.fillPoly(image, [np.rint(transform(corners) * 16).astype(np.int32)], 0, lineType=cv2.LINE_8, shift=4)
+
+
+def draw_scan(path, angle=0.0, hidden_mark=None, oval=False, upside_down=False):
+    """
+    Write the scan of the layout, with the answer boxes filled as BOXES says. The reference
+    measure of each box is then its filled fraction inside the box reduced by PROP.
+    """
+    transform = scan_transform(angle)
+    image = np.full((int(HEIGHT * SCALE) + 20, int(WIDTH * SCALE) + 20), 255, dtype=np.uint8)
+    for corner, (x, y) in enumerate(MARKS):
+        if corner != hidden_mark:
+            centre = transform([x, y])
+            cv2.circle(image, tuple(int(v) for v in np.rint(centre * 16)), int(MARK_DIAMETER * SCALE * 8), 0, -1, shift=4)
+    boxes = [(xmin, xmax, ymin, ymax, fill) for _, _, xmin, xmax, ymin, ymax, fill in BOXES]
+    boxes += [(x, x + DIGIT_SIZE, y, y + DIGIT_SIZE, fill) for _, _, x, y, fill in DIGITS]
+    for xmin, xmax, ymin, ymax, fill in boxes:
+        outline = np.rint(transform(box_corners(xmin, xmax, ymin, ymax))).astype(np.int32)
+        if oval:
+            centre = transform([(xmin + xmax) / 2, (ymin + ymax) / 2])
+            axes = (SCALE * (xmax - xmin) / 2, SCALE * (ymax - ymin) / 2)
+            cv2.ellipse(image, ((float(centre[0]), float(centre[1])), (2 * axes[0], 2 * axes[1]), angle), 0, 1)
+            if fill:
+                cv2.ellipse(image, ((float(centre[0]), float(centre[1])), (2 * axes[0], 2 * axes[1]), angle), 0, -1)
+            continue
+        cv2.polylines(image, [outline], True, 0, 1)
+        if fill:
+            fill_polygon(image, transform, box_corners(xmin, xmin + fill * (xmax - xmin), ymin, ymax))
+    if upside_down:
+        image = np.rot90(image, 2)
+    cv2.imwrite(str(path), image)
+    return transform
+
+
+def layout_boxes():
+    return [[xmin, xmax, ymin, ymax] for _, _, xmin, xmax, ymin, ymax, _ in BOXES]
+
+
+def darkness_delta(fill):
+    # where the drawn fill of a partly filled box ends, one pixel column of its 20 may go either way
+    return 0.03 if fill in (0.0, 1.0) else 0.06
+
+
+def measure_scan_job(scan_path):
+    return measure_scan(scan_path, WIDTH, HEIGHT, MARK_DIAMETER, MARKS, layout_boxes(), prop=PROP)
+
+
+class ScanTestCase(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def scan(self, name="scan.png", **options):
+        path = self.tmp_dir / name
+        self.transform = draw_scan(path, **options)
+        return str(path)
+
+    def detector(self, scan_path, **options):
+        detector = AMCDetect(WIDTH, HEIGHT, MARK_DIAMETER, **options)
+        lines = detector.load(scan_path)
+        self.assertFalse([line for line in lines if line.startswith('!')], lines)
+        detector.optim(MARKS)
+        return detector
+
+
+class AMCDetectTestCase(ScanTestCase):
+    fills = [fill for *_, fill in BOXES]
+    # pixels of each box reduced by PROP: 4 x 4 layout units, 20 x 20 pixels (3 is 8 x 4 units)
+    totals = [400, 400, 400, 400, 400, 800]
+
+    def test_load_finds_the_corner_marks(self):
+        scan_path = self.scan()
+        lines = AMCDetect(WIDTH, HEIGHT, MARK_DIAMETER).load(scan_path)
+
+        self.assertEqual(len(lines), 4)
+        frame = [[float(v) for v in line.split(': ')[1].split(' ; ')] for line in lines]
+        np.testing.assert_allclose(frame, self.transform(MARKS), atol=0.5)
+
+    def test_optim_fits_the_layout_to_the_scan(self):
+        detector = self.detector(self.scan())
+        self.assertAlmostEqual(detector.transf.t_a, SCALE, delta=0.01)
+        self.assertAlmostEqual(detector.transf.t_b, 0, delta=0.01)
+        np.testing.assert_allclose(detector.transf.transforme_points(MARKS), self.transform(MARKS), atol=0.5)
+        self.assertLess(detector.transf.MSE, 0.5)
+
+    def test_measure_boxes_on_a_straight_scan(self):
+        tcorners, corners, total, black, zoom_files = self.detector(self.scan()).measure_boxes(layout_boxes(), PROP)
+
+        for i, _ in enumerate(BOXES):
+            self.assertAlmostEqual(total[i], self.totals[i], delta=0.1 * self.totals[i])
+            self.assertAlmostEqual(black[i] / total[i], self.fills[i], delta=darkness_delta(self.fills[i]))
+        np.testing.assert_allclose(tcorners[0], self.transform(box_corners(40, 45, 60, 65)), atol=0.5)
+        np.testing.assert_allclose(corners[0], self.transform(box_corners(40.5, 44.5, 60.5, 64.5)), atol=0.5)
+        self.assertIsNone(zoom_files)
+
+    def test_measure_boxes_on_a_rotated_scan(self):
+        # the zones are no longer aligned: measured on polygon masks
+        detector = self.detector(self.scan(angle=4.0))
+        self.assertAlmostEqual(math.degrees(math.atan2(detector.transf.t_c, detector.transf.t_a)), 4.0, delta=0.1)
+
+        _, _, total, black, _ = detector.measure_boxes(layout_boxes(), PROP)
+        for i, _ in enumerate(BOXES):
+            self.assertAlmostEqual(total[i], self.totals[i], delta=0.1 * self.totals[i])
+            self.assertAlmostEqual(black[i] / total[i], self.fills[i], delta=darkness_delta(self.fills[i]))
+
+    def test_oval_boxes(self):
+        detector = self.detector(self.scan(oval=True))
+        _, _, total, black, _ = detector.measure_boxes(layout_boxes()[:2], PROP, oval=[True, True])
+
+        self.assertAlmostEqual(total[0], math.pi / 4 * 400, delta=0.1 * 400)
+        self.assertAlmostEqual(black[0] / total[0], 1.0, delta=0.03)
+        self.assertAlmostEqual(black[1] / total[1], 0.0, delta=0.03)
+
+    def test_hidden_corner_mark_is_completed(self):
+        scan_path = self.scan(hidden_mark=2)
+        self.assertEqual(AMCDetect(WIDTH, HEIGHT, MARK_DIAMETER, marks_min=4).load(scan_path),
+                         ["! NMARKS: Not enough corner marks detected."])
+
+        detector = self.detector(scan_path, marks_min=3)
+        np.testing.assert_allclose(detector.frame, self.transform(MARKS), atol=1.0)
+        _, _, total, black, _ = detector.measure_boxes(layout_boxes(), PROP)
+        self.assertAlmostEqual(black[0] / total[0], 1.0, delta=0.03)
+
+    def test_blank_page(self):
+        scan_path = self.tmp_dir / "blank.png"
+        cv2.imwrite(str(scan_path), np.full((400, 300), 255, dtype=np.uint8))
+        self.assertEqual(AMCDetect(WIDTH, HEIGHT, MARK_DIAMETER).load(str(scan_path)),
+                         ["! MAYBE_BLANK: This page seems to be blank."])
+        self.assertEqual(AMCDetect(WIDTH, HEIGHT, MARK_DIAMETER).load(str(self.tmp_dir / "missing.png"))[0][:7], "! LOAD:")
+
+    def test_upside_down_scan_is_measured_after_rotate180(self):
+        detector = AMCDetect(WIDTH, HEIGHT, MARK_DIAMETER)
+        detector.load(self.scan(upside_down=True))
+        detector.rotate180()
+        detector.optim(MARKS)
+
+        _, _, total, black, _ = detector.measure_boxes(layout_boxes(), PROP)
+        for i, _ in enumerate(BOXES):
+            self.assertAlmostEqual(black[i] / total[i], self.fills[i], delta=darkness_delta(self.fills[i]))
+
+    def test_commands_answer_like_amc_detect(self):
+        scan_path = self.scan()
+        detector = AMCDetect.from_args(MEASURE_ARGS + ['-r'])
+        self.assertTrue(detector.ignore_red)
+        self.assertIsNone(detector.debug_image)
+        self.assertEqual(len(detector.commande("load " + scan_path)), 4)
+        lines = detector.commande("optim " + " ".join("%s,%s" % mark for mark in MARKS))
+        self.assertEqual([line.split('=')[0] for line in lines], ['a', 'b', 'c', 'd', 'e', 'f', 'MSE'])
+
+        zooms_dir = self.tmp_dir / "zooms"
+        zooms_dir.mkdir()
+        detector.commande("zooms %s" % zooms_dir)
+        detector.commande("id 3 1 1 1")
+        lines = detector.commande("mesure0 0.8 square 40 45 60 65")
+        self.assertEqual([line.split()[0] for line in lines], ['TCORNER'] * 4 + ['COIN'] * 4 + ['PIX', 'ZOOM'])
+        total, black = (int(v) for v in lines[8].split()[1:])
+        self.assertAlmostEqual(black / total, 1.0, delta=0.03)
+        self.assertTrue((zooms_dir / "3-1-1-1.png").exists())
+        self.assertEqual(detector.commande("unknown 1"), ["! COMMAND: Unknown command unknown."])
+
+    def test_measure_scan_in_a_process_pool(self):
+        scan_paths = [self.scan("scan-%d.png" % angle, angle=angle) for angle in (0.0, 3.0)]
+        with process_pool(2) as pool:
+            results = list(pool_imap(pool, measure_scan_job, scan_paths))
+
+        self.assertEqual(results, [measure_scan_job(scan_path) for scan_path in scan_paths])
+        for result in results:
+            self.assertAlmostEqual(result['black'][0] / result['total'][0], 1.0, delta=0.06)
+
+
+class FakeLayout:
+    """The layout module of the analyze.py port, for the page drawn by draw_scan."""
+
+    def begin_read_transaction(self, tag):
+        pass
+
+    def end_transaction(self, tag):
+        pass
+
+    def dims(self, student, page):
+        return (WIDTH, HEIGHT, MARK_DIAMETER, None)
+
+    def all_marks(self, student, page):
+        return [v for mark in MARKS for v in mark]
+
+    def type_info(self, ttype, student, page):
+        if ttype == 'digit':
+            return [{'numberid': number, 'digitid': digit, 'xmin': x, 'ymin': y, 'xmax': x + DIGIT_SIZE, 'ymax': y + DIGIT_SIZE}
+                    for number, digit, x, y, _ in DIGITS]
+        if ttype == 'box':
+            return [{'question': question, 'answer': answer, 'xmin': xmin, 'ymin': ymin, 'xmax': xmax, 'ymax': ymax,
+                     'flags': analyze.BOX_FLAGS_DONTSCAN if question == 3 else 0}
+                    for question, answer, xmin, xmax, ymin, ymax, _ in BOXES]
+        return []
+
+
+class FakeCapture(analyze.AMCCaptureStub):
+    def __init__(self):
+        super().__init__()
+        self.zones = {}
+        self.zone_keys = {}
+
+    def get_zoneid(self, spc, zone_type, question, answer, create):
+        return self.zone_keys.setdefault((zone_type, question, answer), len(self.zone_keys) + 1)
+
+    def set_zone_auto_id(self, zoneid, total, black, nom_file, zoom_bin):
+        self.zones[zoneid] = (total, black, zoom_bin)
+
+
+class AnalyzePortTestCase(ScanTestCase):
+    def setUp(self):
+        super().setUp()
+        for patcher in (mock.patch.object(analyze, "debug"), mock.patch("builtins.print")):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def fitted_layout(self, detector):
+        ld = analyze.get_layout_data(FakeLayout(), 3, 1, True)
+        analyze.marks_fit(detector, ld)
+        return ld
+
+    def test_measure_boxes_matches_measure_box(self):
+        detector = AMCDetect.from_args(MEASURE_ARGS)
+        detector.commande("load " + self.scan(angle=2.0))
+        one_pass = self.fitted_layout(detector)
+        box_by_box = self.fitted_layout(detector)
+        keys = [k for k in one_pass['boxes'] if '.' in k]
+
+        analyze.measure_boxes(detector, one_pass, keys, 3, 1)
+        darkness = {k: analyze.measure_box(detector, box_by_box, k) for k in keys}
+
+        self.assertEqual(one_pass['darkness.data'], box_by_box['darkness.data'])
+        self.assertNotIn('3.1', one_pass['darkness.data'])
+        for k in keys:
+            np.testing.assert_allclose(one_pass['boxes.scan'][k].coins, box_by_box['boxes.scan'][k].coins, atol=1e-3)
+        for question, answer, *_, fill in BOXES[:-1]:
+            self.assertAlmostEqual(darkness["%d.%d" % (question, answer)], fill, delta=darkness_delta(fill))
+
+    def test_one_scan_captures_the_measures(self):
+        layout = FakeLayout()
+        capture = FakeCapture()
+        amc_data = mock.Mock()
+        amc_data.module.side_effect = {'layout': layout, 'capture': capture}.get
+        random_layout = analyze.get_layout_data(layout, 3, 1, True)
+
+        with mock.patch.object(analyze, "AMCData", return_value=amc_data), \
+                mock.patch.object(analyze, "random_layout", random_layout, create=True), \
+                mock.patch.object(analyze, "cr_dir", ""):
+            self.assertIsNone(analyze.one_scan(self.scan(angle=1.0), 0, False))
+
+        for question, answer, *_, fill in BOXES:
+            total, black, zoom = capture.zones[capture.zone_keys[(analyze.ZONE_BOX, question, answer)]]
+            with self.subTest(question=question, answer=answer):
+                if question == 3:
+                    # DONTSCAN
+                    self.assertEqual((total, black), (1, 0))
+                else:
+                    self.assertAlmostEqual(black / total, fill, delta=darkness_delta(fill))
+                    self.assertTrue(zoom.startswith(b"\x89PNG"))
+
+    def test_one_scan_reads_the_page_id(self):
+        layout = FakeLayout()
+        amc_data = mock.Mock()
+        amc_data.module.side_effect = {'layout': layout, 'capture': FakeCapture()}.get
+        random_layout = analyze.get_layout_data(layout, 3, 1, True)
+
+        with mock.patch.object(analyze, "AMCData", return_value=amc_data), \
+                mock.patch.object(analyze, "random_layout", random_layout, create=True):
+            self.assertEqual(analyze.one_scan(self.scan(), 0, True), {'ids': [3, 1]})
+            blank_path = self.tmp_dir / "blank.png"
+            cv2.imwrite(str(blank_path), np.full((400, 300), 255, dtype=np.uint8))
+            self.assertEqual(analyze.one_scan(str(blank_path), 0, True)['blank'], True)
+
+    def test_queue_runs_the_tasks_in_a_process_pool(self):
+        queue = analyze.AMCQueueStub('max.procs', 2, get_returned_values=True)
+        for angle in (0.0, 3.0, 5.0):
+            queue.add_process(measure_scan_job, self.scan("scan-%d.png" % angle, angle=angle))
+        queue.run()
+
+        self.assertEqual(len(queue.returned_values()), 3)
+        self.assertEqual(queue.tasks, [])
+        for result in queue.returned_values():
+            self.assertAlmostEqual(result['black'][1] / result['total'][1], 0.0, delta=0.03)
+
+
+class AnalyzeScanTestCase(ScanTestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(amc_db_queries.close_amc_sessions)
+        data_dir = self.tmp_dir / "project" / "data"
+        data_dir.mkdir(parents=True)
+        layout = sqlite3.connect(data_dir / "layout.sqlite")
+        layout.executescript(
+            "CREATE TABLE layout_page (student INTEGER, page INTEGER, checksum INTEGER, sourceid INTEGER, subjectpage INTEGER,"
+            " dpi REAL, width REAL, height REAL, markdiameter REAL, PRIMARY KEY (student,page));"
+            "CREATE TABLE layout_box (student INTEGER, page INTEGER, role INTEGER DEFAULT 1, question INTEGER, answer INTEGER,"
+            " xmin REAL, xmax REAL, ymin REAL, ymax REAL, flags INTEGER DEFAULT 0, char TEXT, PRIMARY KEY (student,role,question,answer));"
+            "CREATE TABLE layout_mark (student INTEGER, page INTEGER, corner INTEGER, x REAL, y REAL, PRIMARY KEY (student,page,corner));"
+        )
+        layout.execute("INSERT INTO layout_page VALUES (3, 1, 0, 1, 1, 300, ?, ?, ?)", (WIDTH, HEIGHT, MARK_DIAMETER))
+        layout.executemany("INSERT INTO layout_mark VALUES (3, 1, ?, ?, ?)", [(corner + 1, x, y) for corner, (x, y) in enumerate(MARKS)])
+        layout.executemany(
+            "INSERT INTO layout_box VALUES (3, 1, ?, ?, ?, ?, ?, ?, ?, ?, NULL)",
+            [(1, question, answer, xmin, xmax, ymin, ymax, analyze.BOX_FLAGS_DONTSCAN if question == 3 else 0)
+             for question, answer, xmin, xmax, ymin, ymax, _ in BOXES]
+            # a name field box is not measured
+            + [(4, 0, 0, 20.0, 60.0, 230.0, 240.0, 0)],
+        )
+        layout.commit()
+        layout.close()
+
+        options = mock.Mock(box_size_proportion=None)
+        for patcher in (mock.patch.object(analyze_functions, "get_amc_project_path", return_value=str(self.tmp_dir / "project")),
+                        mock.patch.object(analyze_functions, "AMCProjectOptions", return_value=options)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_analyze_scan_measures_the_answer_boxes(self):
+        result = analyze_functions.analyze_scan(self.scan(angle=1.5), None, 3, 1)
+
+        self.assertEqual([(box['question'], box['answer']) for box in result['boxes']], [(1, 1), (1, 2), (1, 3), (2, 1), (2, 2)])
+        for box, (*_, fill) in zip(result['boxes'], BOXES):
+            self.assertAlmostEqual(box['darkness'], fill, delta=darkness_delta(fill))
+            self.assertAlmostEqual(box['total'], 400, delta=40)
+        self.assertAlmostEqual(result['transf'][0], SCALE * math.cos(math.radians(1.5)), delta=0.01)
+
+    def test_analyze_scan_without_layout(self):
+        self.assertEqual(analyze_functions.analyze_scan(self.scan(), None, 4, 1), {'error': "No layout for page 4/1"})
@@ -0,0 +1,479 @@
+import io
+import json
+import os
+import shutil
+import smtplib
+import socket
+import sqlite3
+import subprocess
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+import pikepdf
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.test import SimpleTestCase, override_settings
+from PIL import Image
+from pypdf import PdfReader
+from reportlab.pdfgen import canvas
+
+from examc_app.utils import amc_functions
+
+
+class FakeAmcProcess:
+    def __init__(self, command, returncode=0):
+        self.args = command
+        self.returncode = returncode
+        self.stdout = iter(["analysing " + command[command.index("--liste-fichiers") + 1] + "\n"])
+
+    def wait(self):
+        return self.returncode
+
+    def poll(self):
+        return self.returncode
+
+
+class AmcAnalyseScansTestCase(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.file_list_path = os.path.join(self.tmp_dir, "list.txt")
+        self.scans = [f"/scans/copy_{copy_nr:04d}_{page_nr:02d}.jpg" for copy_nr in range(1, 4) for page_nr in range(1, 4)]
+        with open(self.file_list_path, "w") as file_list:
+            file_list.write("\n".join(self.scans) + "\n\n")
+
+        for name, value in (("get_amc_project_path", "/amc/project"), ("get_amc_option_by_key", "0.4")):
+            patcher = mock.patch.object(amc_functions, name, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def read_list(self, path):
+        with open(path) as file_list:
+            return file_list.read().splitlines()
+
+    def test_split_amc_file_list(self):
+        shard_paths = amc_functions.split_amc_file_list(self.file_list_path, 4)
+        self.assertEqual([self.read_list(path) for path in shard_paths], [self.scans[0:3], self.scans[3:6], self.scans[6:9]])
+        self.assertEqual(amc_functions.split_amc_file_list(self.file_list_path, 1), [self.file_list_path])
+
+    def run_analyse(self, processes, returncodes=None):
+        commands = []
+
+        def popen(command, **kwargs):
+            commands.append(command)
+            return FakeAmcProcess(command, (returncodes or {}).get(len(commands), 0))
+
+        with mock.patch.object(amc_functions.subprocess, "Popen", side_effect=popen):
+            lines = list(amc_functions.amc_analyse_scans(mock.Mock(pk=1), self.file_list_path, processes=processes))
+        return commands, lines
+
+    def test_each_shard_runs_a_single_amc_process(self):
+        commands, lines = self.run_analyse(processes=2)
+
+        self.assertEqual(len(commands), 2)
+        for command in commands:
+            self.assertEqual(command[command.index("--n-procs") + 1], "1")
+        self.assertEqual(len(lines), 2)
+        # shard lists are removed, the original list is kept
+        self.assertEqual(os.listdir(self.tmp_dir), ["list.txt"])
+
+    def test_failed_shard_raises_once_all_are_done(self):
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.run_analyse(processes=3, returncodes={2: 1})
+        self.assertEqual(os.listdir(self.tmp_dir), ["list.txt"])
+
+
+class AddExtraToAnnotatedPdfsTestCase(SimpleTestCase):
+    def setUp(self):
+        self.project_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.project_path)
+        self.pdfs_path = os.path.join(self.project_path, "cr", "corrections", "pdf")
+        os.makedirs(self.pdfs_path)
+        for student in (1, 2, 3):
+            pdf = pikepdf.new()
+            for _ in range(3):
+                pdf.add_blank_page()
+            pdf.save(os.path.join(self.pdfs_path, f"student_{student}.pdf"))
+        # students 1 and 2 have an extra page after their page 2, student 2 another after page 5 it does not have
+        for student, page in ((1, "02.1"), (2, "02.1"), (2, "05.1")):
+            extra_dir = os.path.join(self.project_path, "scans", "extra", f"{student:04d}")
+            os.makedirs(extra_dir, exist_ok=True)
+            Image.new("RGB", (20, 30), "white").save(os.path.join(extra_dir, f"copy_{student:04d}_{page}.jpg"))
+        self.report_rows = [{"student": student, "file": f"student_{student}.pdf"} for student in (1, 2, 3)]
+
+    def pages_count(self, student):
+        with pikepdf.open(os.path.join(self.pdfs_path, f"student_{student}.pdf")) as pdf:
+            return len(pdf.pages)
+
+    def assert_extra_pages_inserted(self, processes):
+        self.assertEqual(amc_functions.add_extra_to_annotated_pdfs(self.report_rows, self.project_path, processes), 2)
+        self.assertEqual([self.pages_count(student) for student in (1, 2, 3)], [4, 4, 3])
+
+    def test_serial_insertion(self):
+        self.assert_extra_pages_inserted(processes=1)
+
+    def test_pooled_insertion(self):
+        self.assert_extra_pages_inserted(processes=2)
+
+
+class IsTransientSmtpErrorTestCase(SimpleTestCase):
+    def test_transient_errors(self):
+        for error in (
+            smtplib.SMTPServerDisconnected("lost"),
+            smtplib.SMTPResponseException(421, b"try later"),
+            smtplib.SMTPRecipientsRefused({"a@example.com": (450, b"busy"), "b@example.com": (451, b"busy")}),
+            ConnectionResetError(),
+            socket.timeout(),
+        ):
+            self.assertTrue(amc_functions.is_transient_smtp_error(error), error)
+
+    def test_permanent_errors(self):
+        for error in (
+            smtplib.SMTPResponseException(550, b"no such user"),
+            smtplib.SMTPRecipientsRefused({"a@example.com": (450, b"busy"), "b@example.com": (550, b"unknown")}),
+            smtplib.SMTPAuthenticationError(535, b"bad credentials"),
+            smtplib.SMTPException("other"),
+            ValueError(),
+        ):
+            self.assertFalse(amc_functions.is_transient_smtp_error(error), error)
+
+
+class FlakyEmailBackend(locmem.EmailBackend):
+    """locmem backend whose sends to the addresses in failures raise the listed errors first."""
+    failures = {}
+
+    def send_messages(self, messages):
+        for message in messages:
+            errors = self.failures.get(message.to[0])
+            if errors:
+                raise errors.pop(0)
+        return super().send_messages(messages)
+
+
+@override_settings(
+    EMAIL_BACKEND="examc_app.tests.test_amc_functions.FlakyEmailBackend",
+    AMC_MAIL_BATCH_SIZE=2,
+    AMC_MAIL_RATE_PER_MINUTE=0,
+    AMC_MAIL_RETRIES=2,
+)
+class AmcSendAnnotatedPapersTestCase(SimpleTestCase):
+    def setUp(self):
+        self.project_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.project_path)
+        self.addCleanup(amc_functions.close_amc_sessions)
+        os.makedirs(os.path.join(self.project_path, "data"))
+        pdfs_path = os.path.join(self.project_path, "cr", "corrections", "pdf")
+        os.makedirs(pdfs_path)
+
+        self.students = []
+        with sqlite3.connect(os.path.join(self.project_path, "data", "report.sqlite")) as report:
+            report.execute(
+                "CREATE TABLE report_student (student INTEGER, copy INTEGER, type INTEGER, file TEXT, timestamp INTEGER,"
+                " mail_status INTEGER, mail_timestamp INTEGER, mail_message TEXT)"
+            )
+            for student, email in enumerate(["a@example.com", "b@example.com", "not an email", "d@example.com", "e@example.com"], 1):
+                filename = f"student_{student}.pdf"
+                with open(os.path.join(pdfs_path, filename), "wb") as pdf_file:
+                    pdf_file.write(b"%PDF-1.4")
+                report.execute("INSERT INTO report_student VALUES (?, 0, 1, ?, 0, 0, 0, '')", (student, filename))
+                self.students.append({"id": str(student), "copy": str(student), "email": email})
+
+        FlakyEmailBackend.failures = {
+            "b@example.com": [smtplib.SMTPServerDisconnected("lost"), smtplib.SMTPResponseException(421, b"busy")],
+            "d@example.com": [smtplib.SMTPRecipientsRefused({"d@example.com": (550, b"unknown")})],
+        }
+        mail.outbox = []
+        patcher = mock.patch.object(amc_functions, "get_amc_project_path", return_value=self.project_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(amc_functions.time, "sleep")
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def mail_statuses(self):
+        with sqlite3.connect(os.path.join(self.project_path, "data", "report.sqlite")) as report:
+            return dict(report.execute("SELECT student, mail_status FROM report_student"))
+
+    def test_sends_retries_and_records_statuses(self):
+        progress = mock.Mock()
+        sent, errors, failures = amc_functions.amc_send_annotated_papers(
+            mock.Mock(pk=1), self.students, "Your exam", "<p>Annotated paper</p>", "email", progress_callback=progress,
+        )
+
+        self.assertEqual((sent, errors), (3, 2))
+        self.assertEqual([message.to for message in mail.outbox], [["a@example.com"], ["b@example.com"], ["e@example.com"]])
+        self.assertEqual(mail.outbox[0].attachments[0][0], "student_1.pdf")
+        self.assertEqual(len(failures), 2)
+        self.assertTrue(failures[0].startswith("3 - not an email : Failed to send email: ValidationError"))
+        self.assertTrue(failures[1].startswith("4 - d@example.com : Failed to send email: SMTPRecipientsRefused"))
+        # b@example.com was retried twice, with a growing delay
+        self.assertEqual([call.args[0] for call in self.sleep.call_args_list], [1, 2])
+        self.assertEqual(self.mail_statuses(), {1: 1, 2: 1, 3: 100, 4: 100, 5: 1})
+        self.assertEqual([call.kwargs["done"] for call in progress.call_args_list], [0, 2, 4, 5])
+
+    @override_settings(AMC_MAIL_RETRIES=1)
+    def test_gives_up_after_the_retries(self):
+        sent, errors, failures = amc_functions.amc_send_annotated_papers(
+            mock.Mock(pk=1), self.students[:2], "Your exam", "<p>Annotated paper</p>", "email",
+        )
+
+        self.assertEqual((sent, errors), (1, 1))
+        self.assertIn("SMTPResponseException", failures[0])
+        self.assertEqual(self.mail_statuses()[2], 100)
+
+
+class FakeAnnotateProcess:
+    def __init__(self, lines):
+        self.stdout = iter(lines)
+        self.stderr = io.StringIO("")
+        self.returncode = 0
+
+    def wait(self):
+        return self.returncode
+
+
+class RunAmcAnnotateCommandsTestCase(SimpleTestCase):
+    def setUp(self):
+        for patcher in (
+            mock.patch.object(amc_functions, "get_annotated_pdfs_dir", return_value="/amc/project/cr/corrections/pdf"),
+            mock.patch.object(amc_functions, "AMC_PROGRESS_MIN_INTERVAL", 0),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_single_file_progress_follows_the_amc_fractions(self):
+        outputs = iter([
+            ["===<annotate>=+0.25\n", "===<annotate>=+0.25\n", "annotated\n"],
+            ["===<annotate>=+0.5\n"],
+        ])
+        progress = mock.Mock()
+        with mock.patch.object(amc_functions.subprocess, "Popen", side_effect=lambda command, **kwargs: FakeAnnotateProcess(next(outputs))):
+            result = amc_functions.run_amc_annotate_commands([["annotate", "0"], ["annotate", "1"]], mock.Mock(pk=1), True, progress)
+
+        reported = [call.kwargs["done"] for call in progress.call_args_list]
+        self.assertEqual(reported[0], 0)
+        self.assertEqual(reported[-1], 2)
+        # fractional progress is reported before the commands end
+        self.assertTrue(any(0 < done < 2 and done != 1 for done in reported), reported)
+        self.assertEqual(reported, sorted(reported))
+        self.assertEqual(progress.call_args.kwargs["message"], "Generating AMC annotations: 2/2 files generated")
+        self.assertEqual(result.stdout, "annotated\n")
+
+
+def write_labelled_pdf(path, label):
+    pdf = canvas.Canvas(str(path))
+    pdf.drawString(72, 720, label)
+    pdf.showPage()
+    pdf.save()
+
+
+class AmcAnnotateGroupsTestCase(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.project_path = str(self.tmp_dir / "project")
+        self.pdfs_dir = Path(self.project_path) / "cr" / "corrections" / "pdf"
+        self.pdfs_dir.mkdir(parents=True)
+        self.exam = mock.Mock(pk=1)
+        self.restore_report_rows = mock.Mock()
+        self.update_report_file = mock.Mock()
+        for patcher in (
+            mock.patch.object(amc_functions, "get_annotated_pdfs_dir", return_value=self.pdfs_dir),
+            mock.patch.object(amc_functions, "restore_report_rows", self.restore_report_rows),
+            mock.patch.object(amc_functions, "update_report_file", self.update_report_file),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write_parts(self, groups_count):
+        for group_nr in range(groups_count):
+            write_labelled_pdf(self.pdfs_dir / f"annotated_papers.{group_nr}.pdf", f"group {group_nr}")
+
+    def test_split_keeps_consecutive_copies_and_caps_the_groups(self):
+        copies = [(10, 1), (11, 2), (12, 3), (13, 4), (14, 5)]
+
+        groups = amc_functions.split_amc_annotate_ids(self.project_path, copies, 2)
+
+        self.assertEqual([group_copies for _, group_copies in groups], [copies[:3], copies[3:]])
+        self.assertEqual(
+            [Path(id_file_path).read_text() for id_file_path, _ in groups],
+            ["10:1\n11:2\n12:3\n", "13:4\n14:5\n"],
+        )
+        self.assertEqual(groups[1][0], f"{self.project_path}/cr/corrections/annotate_ids.1")
+
+        # no more groups than copies, no empty group
+        groups = amc_functions.split_amc_annotate_ids(self.project_path, copies[:3], 8)
+        self.assertEqual([group_copies for _, group_copies in groups], [[copy] for copy in copies[:3]])
+
+    def test_merge_restores_rows_and_concatenates_parts_in_group_order(self):
+        self.write_parts(3)
+        # groups end in any order
+        group_rows = {2: [{"copy": 3}], 0: [{"copy": 1}], 1: [{"copy": 2}]}
+
+        amc_functions.merge_amc_annotate_groups(self.exam, self.project_path, True, group_rows, 3)
+
+        self.restore_report_rows.assert_called_once_with(self.project_path + "/data/", [{"copy": 1}, {"copy": 2}, {"copy": 3}])
+        self.update_report_file.assert_called_once_with(self.project_path + "/data/", 2, "annotated_papers.pdf")
+        reader = PdfReader(self.pdfs_dir / "annotated_papers.pdf")
+        self.assertEqual([page.extract_text().strip() for page in reader.pages], ["group 0", "group 1", "group 2"])
+        self.assertEqual([path.name for path in self.pdfs_dir.iterdir()], ["annotated_papers.pdf"])
+
+    def test_failed_group_restores_rows_and_removes_parts(self):
+        copies = [(10, 1), (11, 2), (12, 3), (13, 4)]
+        report_rows = [{"student": student, "copy": copy} for student, copy in copies]
+
+        def run_commands(commands, exam, single_file, progress_callback=None, command_done_callback=None):
+            # group 0 is done, group 1 fails after writing its part
+            self.write_parts(2)
+            command_done_callback(0)
+            command_done_callback(1)
+            return subprocess.CompletedProcess(commands, 1, stdout="", stderr="annotate failed")
+
+        with mock.patch.object(amc_functions, "get_amc_project_path", return_value=self.project_path), \
+                mock.patch.object(amc_functions, "get_amc_option_by_key", return_value=""), \
+                mock.patch.object(amc_functions, "get_annotation_symbols", return_value=""), \
+                mock.patch.object(amc_functions, "cleanup_previous_annotated_outputs"), \
+                mock.patch.object(amc_functions, "get_amc_annotate_processes", return_value=2), \
+                mock.patch.object(amc_functions, "select_scored_copies", return_value=copies), \
+                mock.patch.object(amc_functions, "select_report_rows", return_value=report_rows), \
+                mock.patch.object(amc_functions, "run_amc_annotate_commands", side_effect=run_commands):
+            result = amc_functions.amc_annotate(self.exam, True, False)
+
+        self.assertEqual(result, "ERR:annotate failed")
+        self.restore_report_rows.assert_called_once_with(self.project_path + "/data/", report_rows)
+        self.update_report_file.assert_not_called()
+        self.assertEqual(list(self.pdfs_dir.iterdir()), [])
+        self.assertEqual(os.listdir(Path(self.project_path) / "cr" / "corrections"), ["pdf"])
+
+
+class AmcManualAssociationImagesTestCase(SimpleTestCase):
+    def setUp(self):
+        self.amc_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.amc_root)
+        self.project_path = os.path.join(self.amc_root, "2025", "1", "EXAM")
+        self.cr_dir = os.path.join(self.project_path, "cr")
+        self.zoom = self.write_file("zooms", "0001-0", "name-1.jpg")
+        students_path = os.path.join(self.project_path, "students.csv")
+        with open(students_path, "w") as students_file:
+            students_file.write("id,name\n")
+        settings_override = override_settings(AMC_PROJECTS_ROOT=self.amc_root, AMC_PROJECTS_URL="/amc_projects/", SIGNED_FILES_URL="/signed/")
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.image_paths = []
+        for patcher in (
+            mock.patch.object(amc_functions, "get_amc_project_path", return_value=self.project_path),
+            mock.patch.object(amc_functions, "get_amc_option_by_key", return_value=students_path),
+            mock.patch.object(amc_functions, "select_associations", side_effect=lambda *args: [{"image_path": path} for path in self.image_paths]),
+            mock.patch.object(amc_functions, "make_token_for", side_effect=lambda rel_path, root: "/protected/?token=" + rel_path),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write_file(self, *parts):
+        path = os.path.join(self.cr_dir, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as file:
+            file.write("x")
+        return path
+
+    def signed_paths(self, *image_paths):
+        self.image_paths = list(image_paths)
+        data_assoc = json.loads(amc_functions.get_amc_manual_association_data(mock.Mock(pk=1))["data_assoc"])
+        return [assoc["image_path"].split("?token=", 1)[1] for assoc in data_assoc]
+
+    def test_existing_moved_and_deleted_images(self):
+        relative = os.path.relpath(self.zoom, self.amc_root)
+        moved = "/amc_projects/" + os.path.relpath(os.path.join(self.cr_dir, "name-1.jpg"), self.amc_root)
+        self.assertEqual(self.signed_paths("/amc_projects/" + relative, moved), [relative, relative])
+
+        # deleted deep in cr/: the index built above must not return it
+        os.remove(self.zoom)
+        self.assertEqual(self.signed_paths(moved), [moved[len("/amc_projects/"):]])
+
+    def test_index_follows_changes_in_nested_folders(self):
+        self.assertEqual(amc_functions.get_cr_file_index(self.cr_dir)["names"], {"name-1.jpg": Path(self.zoom)})
+        nested = self.write_file("zooms", "0001-0", "name-2.jpg")
+        self.assertEqual(amc_functions.get_cr_file_index(self.cr_dir)["names"]["name-2.jpg"], Path(nested))
+        self.assertIsNone(amc_functions.get_cr_file_index(os.path.join(self.amc_root, "missing")))
+
+
+class CheckPagesRecognitionConsistencyTestCase(SimpleTestCase):
+    def setUp(self):
+        self.project_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.project_path)
+        self.addCleanup(amc_functions.close_amc_sessions)
+        self.scans_path = os.path.join(self.project_path, "scans")
+        os.makedirs(os.path.join(self.project_path, "data"))
+        os.makedirs(self.scans_path)
+        patcher = mock.patch.object(amc_functions, "get_amc_project_path", return_value=self.project_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        with sqlite3.connect(os.path.join(self.project_path, "data", "capture.sqlite")) as capture:
+            capture.execute("CREATE TABLE capture_page (src TEXT, student INTEGER, page INTEGER, copy INTEGER, PRIMARY KEY (student, page, copy))")
+            for student in range(1, 7):
+                for page in (1, 2):
+                    # odd students keep the name AMC gave the scan, listed with %PROJET or with the full path
+                    filename = f"scan-{student}-{page}.ab12.jpg" if student % 2 else f"copy_{student:04d}_{page:02d}.jpg"
+                    with open(os.path.join(self.scans_path, filename), "w") as scan_file:
+                        scan_file.write(f"{student}/{page}")
+                    src_dir = "%PROJET/scans/" if student == 1 else self.scans_path + "/"
+                    capture.execute("INSERT INTO capture_page VALUES (?, ?, ?, 0)", (src_dir + filename, student, page))
+
+    def capture_srcs(self):
+        with sqlite3.connect(os.path.join(self.project_path, "data", "capture.sqlite")) as capture:
+            return [src for src, in capture.execute("SELECT src FROM capture_page ORDER BY student, page")]
+
+    def scan_contents(self):
+        contents = {}
+        for filename in os.listdir(self.scans_path):
+            with open(os.path.join(self.scans_path, filename)) as scan_file:
+                contents[filename] = scan_file.read()
+        return contents
+
+    def test_plan_capture_page_renames(self):
+        capture_pages = [
+            {"student": 1, "page": 2, "src": "%PROJET/scans/scan-1-2.ab12.jpg"},
+            {"student": 2, "page": 1, "src": "%HOME/scans/scan-2-1.x.png"},
+            {"student": 3, "page": 1, "src": "%PROJET/scans/copy_0003_01.jpg"},
+        ]
+        self.assertEqual(amc_functions.plan_capture_page_renames("/amc/project", capture_pages), [
+            (1, 2, "%PROJET/scans/copy_0001_02.jpg", "/amc/project/scans/scan-1-2.ab12.jpg", "/amc/project/scans/copy_0001_02.jpg"),
+            (2, 1, "%HOME/scans/copy_0002_01.png", str(Path.home()) + "/scans/scan-2-1.x.png", str(Path.home()) + "/scans/copy_0002_01.png"),
+        ])
+
+    def test_renames_files_and_capture_pages(self):
+        before = self.scan_contents()
+        self.assertEqual(amc_functions.check_pages_recognition_consistency(mock.Mock(pk=1), workers=3), 6)
+
+        srcs = self.capture_srcs()
+        self.assertEqual(srcs[:2], ["%PROJET/scans/copy_0001_01.jpg", "%PROJET/scans/copy_0001_02.jpg"])
+        self.assertEqual(srcs[2:], [f"{self.scans_path}/copy_{student:04d}_{page:02d}.jpg" for student in range(2, 7) for page in (1, 2)])
+        after = self.scan_contents()
+        self.assertEqual(sorted(after), sorted(os.path.basename(src) for src in srcs))
+        self.assertEqual(sorted(after.values()), sorted(before.values()))
+        self.assertEqual(after["copy_0003_02.jpg"], "3/2")
+
+    def test_missing_scan_rolls_back_the_renames(self):
+        os.remove(os.path.join(self.scans_path, "scan-3-2.ab12.jpg"))
+        before_srcs = self.capture_srcs()
+        before = self.scan_contents()
+
+        with self.assertRaises(FileNotFoundError):
+            amc_functions.check_pages_recognition_consistency(mock.Mock(pk=1), workers=3)
+
+        self.assertEqual(self.scan_contents(), before)
+        self.assertEqual(self.capture_srcs(), before_srcs)
+
+    def test_failed_update_rolls_back_the_renames(self):
+        before_srcs = self.capture_srcs()
+        before = self.scan_contents()
+
+        with mock.patch.object(amc_functions, "update_capture_pages_src", side_effect=sqlite3.OperationalError("locked")):
+            with self.assertRaises(sqlite3.OperationalError):
+                amc_functions.check_pages_recognition_consistency(mock.Mock(pk=1), workers=1)
+
+        self.assertEqual(self.scan_contents(), before)
+        self.assertEqual(self.capture_srcs(), before_srcs)
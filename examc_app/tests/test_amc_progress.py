@@ -0,0 +1,95 @@
+import queue
+import shutil
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from examc_app.utils import amc_progress
+from examc_app.utils.amc_progress import DirectoryWatcher, parse_amc_progress_line
+
+
+class ParseAmcProgressLineTestCase(SimpleTestCase):
+    def test_progress_lines(self):
+        self.assertEqual(parse_amc_progress_line("===<annotate>=+0.25\n"), 0.25)
+        self.assertEqual(parse_amc_progress_line("===<analyse>=+1"), 1.0)
+        self.assertEqual(parse_amc_progress_line("===<annotate>=+2.5e-2  \n"), 0.025)
+        self.assertEqual(parse_amc_progress_line("===<>=+0.5"), 0.5)
+
+    def test_other_lines(self):
+        for line in (
+            "",
+            "annotated\n",
+            "===<annotate>=0.25",
+            "===<annotate>=+",
+            "===<annotate>=+abc",
+            "===<annotate>=+0.1.2",
+            "===<annotate>=+0.25 done",
+            " ===<annotate>=+0.25",
+            "===<annotate=+0.25",
+        ):
+            self.assertIsNone(parse_amc_progress_line(line), line)
+
+
+class DirectoryWatcherTestCase(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.events = queue.Queue()
+
+    def wait_count(self, count):
+        while True:
+            event = self.events.get(timeout=10)
+            self.assertEqual(event[:2], ("files", None))
+            if event[2] == count:
+                return
+
+    def test_written_files_are_counted(self):
+        watcher = DirectoryWatcher(self.tmp_dir, self.events, suffix=".pdf",
+                                   count_function=lambda: len(list(self.tmp_dir.glob("*.pdf"))))
+        self.addCleanup(watcher.close)
+        if not watcher.inotify:
+            self.skipTest("inotify is not available")
+
+        (self.tmp_dir / "a.pdf").write_bytes(b"a")
+        (self.tmp_dir / "b.pdf").write_bytes(b"b")
+        (self.tmp_dir / "notes.txt").write_text("ignored")
+        # a file written again counts once
+        (self.tmp_dir / "a.pdf").write_bytes(b"a2")
+        self.wait_count(2)
+        (self.tmp_dir / "c.pdf.tmp").write_bytes(b"c")
+        (self.tmp_dir / "c.pdf.tmp").rename(self.tmp_dir / "c.pdf")
+        self.wait_count(3)
+
+        watcher.close()
+        self.assertFalse(watcher._thread.is_alive())
+        self.assertEqual(watcher.count, 3)
+
+    def test_polling_fallback(self):
+        with mock.patch.object(amc_progress, "_get_libc", return_value=False), \
+                mock.patch.object(amc_progress, "POLL_INTERVAL", 0.01):
+            watcher = DirectoryWatcher(self.tmp_dir, self.events, suffix=".pdf",
+                                       count_function=lambda: len(list(self.tmp_dir.glob("*.pdf"))))
+            self.addCleanup(watcher.close)
+            self.assertFalse(watcher.inotify)
+
+            (self.tmp_dir / "a.pdf").write_bytes(b"a")
+            (self.tmp_dir / "b.pdf").write_bytes(b"b")
+            self.wait_count(2)
+
+            watcher.close()
+        self.assertFalse(watcher._thread.is_alive())
+        # closing twice is harmless
+        watcher.close()
+
+    def test_stop_polling_ends_the_thread(self):
+        with mock.patch.object(amc_progress, "_get_libc", return_value=False), \
+                mock.patch.object(amc_progress, "POLL_INTERVAL", 0.01):
+            watcher = DirectoryWatcher(self.tmp_dir, self.events, count_function=lambda: 1)
+            self.addCleanup(watcher.close)
+            self.wait_count(1)
+            watcher.stop_polling()
+            watcher._thread.join(timeout=10)
+        self.assertFalse(watcher._thread.is_alive())
+        self.assertTrue(self.events.empty())
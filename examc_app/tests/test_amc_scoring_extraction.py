@@ -0,0 +1,207 @@
+import dataclasses
+import importlib
+import os
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from examc_app import models
+
+
+def import_scoring_module():
+    """Import the scoring extraction module; the parser does not use the build models it imports."""
+    module_name = "examc_app.utils.amc.back.amc_scoring_extraction_functons"
+    stand_ins = {name: mock.Mock() for name in ("ExamBuild", "ExamBuildQuestion") if not hasattr(models, name)}
+    if not stand_ins:
+        return importlib.import_module(module_name)
+    with mock.patch.multiple(models, create=True, **stand_ins):
+        return importlib.import_module(module_name)
+
+
+scoring = import_scoring_module()
+
+# Checked in this order, one message per line, with the guards of each kind
+REFERENCE_ORDER = [
+    ("total", None), ("student", None), ("alias", "student"), ("question_title", None), ("question", "student"),
+    ("question_partial", "question"), ("question_end", None), ("multiple", "question"), ("indicative", "question"),
+    ("answer", "question"), ("strategy", None), ("default_simple", None), ("default_multiple", None), ("variable", None),
+]
+
+
+def reference_parse_amc_scoring_log(amc_log_path):
+    """The parser iter_amc_scoring_log replaces: every pattern of AMC_MESSAGE_PATTERNS tried in turn."""
+    parsed = scoring.ParsedAmcScoring()
+    current = {"student": None, "question": None}
+    with open(amc_log_path, encoding="utf-8") as f:
+        lines = [line.strip() for line in f.readlines()]
+
+    for line in lines:
+        for kind, guard in REFERENCE_ORDER:
+            m = scoring.AMC_MESSAGE_PATTERNS[kind].search(line)
+            if m and (guard is None or current[guard]):
+                break
+        else:
+            continue
+
+        student, question = current["student"], current["question"]
+        if kind == "total":
+            total_raw = m.group(1).replace(" ", "")
+            parsed.total_sheets = int(total_raw) if total_raw.isdigit() else None
+        elif kind == "student":
+            current["student"] = scoring.ParsedStudentSheet(student_number=int(m.group(1)))
+            parsed.students.append(current["student"])
+            current["question"] = None
+        elif kind == "alias":
+            student.alias_of = int(m.group(1))
+        elif kind == "question_title":
+            parsed.question_titles[int(m.group(1))] = m.group(2)
+        elif kind == "question":
+            number = int(m.group(1))
+            current["question"] = student.questions.setdefault(number, scoring.ParsedQuestion(amc_question_number=number))
+            if number in parsed.question_titles:
+                current["question"].title = parsed.question_titles[number]
+        elif kind == "question_partial":
+            question.is_partial = True
+        elif kind == "question_end":
+            current["question"] = None
+        elif kind in ("multiple", "indicative"):
+            setattr(question, "is_" + kind, True)
+        elif kind == "answer":
+            number = int(m.group(1))
+            question.answers[number] = scoring.ParsedAnswer(answer_number=number, is_correct=(m.group(2) == "B"))
+        elif kind == "strategy":
+            target, name = (question, "question_strategy") if student and question else (student, "main_strategy")
+            if target:
+                setattr(target, name, getattr(target, name) + "," + m.group(1) if getattr(target, name) else m.group(1))
+        elif kind == "default_simple":
+            parsed.default_simple_strategy = m.group(1)
+        elif kind == "default_multiple":
+            parsed.default_multiple_strategy = m.group(1)
+        elif kind == "variable":
+            parsed.variables["postcorrect_flag" if m.group(1) == "postcorrect" else m.group(1)] = m.group(2)
+    return parsed
+
+AMC_LOG = r"""This is pdfTeX, Version 3.141592653
+\message{BDS=e=0,b=1}
+\message{BDM=haut=2}
+\message{VAR:postcorrect=1}
+\message{VAR:x.y=abc}
+\message{NUM=1=Q01}
+\message{NUM=2=Q02}
+\message{NUM=3=Q03}
+\message{ETU=1}
+\message{B=e=0}
+\message{Q=1}
+  \message{REP=1:B}
+\message{REP=2:M}
+\message{FQ}
+[1] Overfull \hbox noise
+\message{Q=2}
+\message{MULT}
+\message{B=b=2}
+\message{REP=1:B}
+\message{REP=2:B}
+\message{B=m=-1}
+\message{FQ}
+\message{ETU=2}
+\message{BR=1}
+\message{Q=1}
+\message{REP=1:M}
+\message{REP=2:M}
+\message{FQ}
+\message{Q=3}
+\message{INDIC}
+\message{REP=1:M}
+\message{FQ}
+\message{Q=1}
+\message{QPART}
+\message{REP=3:B}
+\message{FQ}
+\message{ETU=3}
+\message{TOTAL= 3 }
+"""
+
+
+# TeX writes several messages on a line when they fit: the first kind of the reference order is read
+AMC_LOG_SHARED_LINES = r"""\message{MULT}\message{NUM=1=Q01}
+\message{Q=1}\message{ETU=1}\message{BR=4}
+\message{B=e=0}\message{Q=1}\message{MULT}
+\message{REP=1:B}\message{INDIC}
+\message{REP=2:M} \message{B=m=-1}
+\message{QPART}\message{FQ}
+\message{REP=3:B}\message{BR=2}\message{Q=2}
+\message{B=b=1}\message{VAR:x=1}\message{FQ}\message{ETU=2}
+\message{TOTAL=2}\message{ETU=3}
+"""
+
+
+class AmcScoringLogTestCase(SimpleTestCase):
+    def setUp(self):
+        self.log_path = self.write_log(AMC_LOG)
+
+    def write_log(self, content):
+        log_file = tempfile.NamedTemporaryFile("w", suffix=".amc", delete=False)
+        log_file.write(content)
+        log_file.close()
+        self.addCleanup(os.remove, log_file.name)
+        return log_file.name
+
+    def expected_students(self):
+        answer = scoring.ParsedAnswer
+        question = scoring.ParsedQuestion
+        return [
+            scoring.ParsedStudentSheet(student_number=1, main_strategy="e=0", questions={
+                1: question(1, title="Q01", answers={1: answer(1, True), 2: answer(2, False)}),
+                2: question(2, title="Q02", is_multiple=True, question_strategy="b=2,m=-1", answers={1: answer(1, True), 2: answer(2, True)}),
+            }),
+            scoring.ParsedStudentSheet(student_number=2, alias_of=1, questions={
+                # a question seen again is completed, not replaced
+                1: question(1, title="Q01", is_partial=True, answers={1: answer(1, False), 2: answer(2, False), 3: answer(3, True)}),
+                3: question(3, title="Q03", is_indicative=True, answers={1: answer(1, False)}),
+            }),
+            scoring.ParsedStudentSheet(student_number=3),
+        ]
+
+    def test_parse_amc_scoring_log(self):
+        parsed = scoring.parse_amc_scoring_log(self.log_path)
+
+        self.assertEqual(parsed.total_sheets, 3)
+        self.assertEqual(parsed.default_simple_strategy, "e=0,b=1")
+        self.assertEqual(parsed.default_multiple_strategy, "haut=2")
+        self.assertEqual(parsed.variables, {"postcorrect_flag": "1", "x.y": "abc"})
+        self.assertEqual(parsed.question_titles, {1: "Q01", 2: "Q02", 3: "Q03"})
+        self.assertEqual(parsed.students, self.expected_students())
+
+    def test_parse_amc_scoring_log_matches_the_reference_parser(self):
+        for content in (AMC_LOG, AMC_LOG_SHARED_LINES):
+            with self.subTest(content=content.splitlines()[1]):
+                log_path = self.write_log(content)
+                parsed = scoring.parse_amc_scoring_log(log_path)
+                self.assertEqual(dataclasses.asdict(parsed), dataclasses.asdict(reference_parse_amc_scoring_log(log_path)))
+                self.assertTrue(parsed.students)
+
+    def test_iter_amc_scoring_log_yields_the_sheets_as_they_end(self):
+        parsed = scoring.ParsedAmcScoring()
+        sheets = scoring.iter_amc_scoring_log(self.log_path, parsed)
+
+        first = next(sheets)
+        self.assertEqual(first, self.expected_students()[0])
+        # the file-level data read so far is on parsed, the total comes at the end
+        self.assertEqual(parsed.question_titles, {1: "Q01", 2: "Q02", 3: "Q03"})
+        self.assertIsNone(parsed.total_sheets)
+
+        self.assertEqual([first] + list(sheets), self.expected_students())
+        self.assertEqual(parsed.students, [])
+        self.assertEqual(parsed.total_sheets, 3)
+
+    def test_validate_parsed_amc_scoring(self):
+        parsed = scoring.parse_amc_scoring_log(self.log_path)
+        # student 2 question 1 is partial and question 3 indicative: only the sheets of student 1 are checked
+        self.assertEqual(scoring.validate_parsed_amc_scoring(parsed), [])
+
+        parsed.students[0].questions[1].answers[2].is_correct = True
+        self.assertEqual(scoring.validate_parsed_amc_scoring(parsed), [
+            "Question 'Q01' for student 1 has 2/2 correct answers but is not multiple-choice.",
+        ])
+        self.assertEqual(scoring.validate_parsed_student_sheet(parsed.students[1]), [])
@@ -0,0 +1,58 @@
+import io
+from decimal import Decimal
+
+import billiard
+from django.test import SimpleTestCase
+from pypdf import PdfReader
+
+from examc_app.utils.grading_report_pdf import iter_grading_reports
+
+COPIES = [(str(copy_nr), str(copy_nr)) for copy_nr in range(1, 7)]
+
+SNAPSHOT = {
+    "exam_pk": 1,
+    "pages_groups": [{
+        "pk": 1,
+        "group_name": "Q1",
+        "checked": {copy_nr: [(10, None)] for copy_nr, _ in COPIES},
+        "notes": {"3": "Well done"},
+    }],
+    "schemes": {5: [{"id": 10, "questionGradingScheme_id": 5, "name": "Correct", "points": Decimal("2.00"), "description": "All right"}]},
+    "checkbox_scheme": {10: 5},
+    # a distinct question number per copy tells the reports apart
+    "question_numbers": {(int(copy_nr), "Q1"): str(100 + int(copy_nr)) for copy_nr, _ in COPIES},
+}
+
+
+def report_question(pdf_bytes):
+    text = PdfReader(io.BytesIO(pdf_bytes)).pages[0].extract_text()
+    return next(line.split()[1].rstrip(":") for line in text.splitlines() if line.startswith("Question "))
+
+
+def render_in_daemonic_process(queue):
+    try:
+        queue.put([(index, report_question(pdf_bytes)) for index, pdf_bytes in iter_grading_reports(SNAPSHOT, COPIES, 3, ordered=True)])
+    except BaseException as e:
+        queue.put(repr(e))
+
+
+class IterGradingReportsTestCase(SimpleTestCase):
+    expected = [(index, str(101 + index)) for index in range(len(COPIES))]
+
+    def test_serial_and_ordered_pool_reports_follow_copies_order(self):
+        for processes in (1, 3):
+            reports = [(index, report_question(pdf_bytes)) for index, pdf_bytes in iter_grading_reports(SNAPSHOT, COPIES, processes, ordered=True)]
+            self.assertEqual(reports, self.expected)
+
+    def test_unordered_pool_reports_carry_their_copy_index(self):
+        reports = [(index, report_question(pdf_bytes)) for index, pdf_bytes in iter_grading_reports(SNAPSHOT, COPIES, 3)]
+        self.assertEqual(sorted(reports), self.expected)
+
+    def test_pool_runs_from_daemonic_worker_process(self):
+        # Celery prefork workers run the annotate task in a daemonic billiard process
+        queue = billiard.Queue()
+        process = billiard.Process(target=render_in_daemonic_process, args=(queue,), daemon=True)
+        process.start()
+        result = queue.get(timeout=120)
+        process.join(timeout=60)
+        self.assertEqual(result, self.expected)
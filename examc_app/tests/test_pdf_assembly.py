@@ -0,0 +1,165 @@
+import io
+import shutil
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+import img2pdf
+import pikepdf
+from django.test import SimpleTestCase
+from PIL import Image
+from pypdf import PdfReader, PdfWriter
+from reportlab.pdfgen import canvas
+
+from examc_app.utils import pdf_assembly
+from examc_app.utils.pdf_assembly import append_pdf_files, concat_pdf_files, insert_image_pages
+
+
+def make_pdf(label, pages=1):
+    """A reportlab PDF whose pages read "<label> page <n>", in Helvetica."""
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer)
+    for page_nr in range(1, pages + 1):
+        pdf.setFont("Helvetica", 12)
+        pdf.drawString(72, 720, "%s page %d" % (label, page_nr))
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def page_texts(path):
+    return [page.extract_text().strip() for page in PdfReader(path).pages]
+
+
+def page_labels(path):
+    """The text of each page, or the size of its image for the inserted image pages."""
+    labels = []
+    with pikepdf.open(path) as pdf:
+        for page in pdf.pages:
+            images = [image for _, image in page.images.items()]
+            labels.append("image %dx%d" % (images[0].Width, images[0].Height) if images else None)
+    return [label or text for label, text in zip(labels, page_texts(path))]
+
+
+def reference_insert_image_pages(pdf_path, plans):
+    """The per-student loop insert_image_pages replaces: the PDF is rewritten for each image."""
+    layout_fun = img2pdf.get_layout_fun((img2pdf.mm_to_pt(210), img2pdf.mm_to_pt(297)))
+    for plan in plans:
+        added_pages = 0
+        for page_nr, image_path in plan:
+            extra_pdf = PdfReader(io.BytesIO(img2pdf.convert(str(image_path), layout_fun=layout_fun)))
+            annotated_pdf = PdfReader(pdf_path)
+            final_annotated_pdf = PdfWriter()
+            page_added = False
+            for i in range(len(annotated_pdf.pages)):
+                final_annotated_pdf.add_page(annotated_pdf.pages[i])
+                if not page_added and i + 1 == page_nr + added_pages:
+                    final_annotated_pdf.add_page(extra_pdf.pages[0])
+                    added_pages += 1
+                    page_added = True
+            with open(pdf_path, "wb") as f:
+                final_annotated_pdf.write(f)
+
+
+class ConcatPdfFilesTestCase(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def write_pdf(self, label, pages=1):
+        path = self.tmp_dir / (label + ".pdf")
+        path.write_bytes(make_pdf(label, pages))
+        return path
+
+    def test_pages_follow_the_sources_order(self):
+        sources = [self.write_pdf("a", 2), make_pdf("b"), self.write_pdf("c", 3)]
+        destination = self.tmp_dir / "out.pdf"
+
+        self.assertEqual(concat_pdf_files(destination, sources), destination)
+
+        self.assertEqual(page_texts(destination), ["a page 1", "a page 2", "b page 1", "c page 1", "c page 2", "c page 3"])
+        self.assertEqual(sorted(path.name for path in self.tmp_dir.iterdir()), ["a.pdf", "c.pdf", "out.pdf"])
+
+    def test_destination_among_its_sources(self):
+        destination = self.write_pdf("annotated", 2)
+        append_pdf_files(destination, [self.write_pdf("extra")])
+        concat_pdf_files(destination, [self.write_pdf("first"), destination])
+
+        self.assertEqual(page_texts(destination), ["first page 1", "annotated page 1", "annotated page 2", "extra page 1"])
+        # the temporary file replaced the destination
+        self.assertEqual(sorted(path.name for path in self.tmp_dir.iterdir()), ["annotated.pdf", "extra.pdf", "first.pdf"])
+
+    def test_more_sources_than_kept_open_are_merged_by_batches(self):
+        sources = [self.write_pdf("s%02d" % i) for i in range(8)]
+        destination = self.tmp_dir / "out.pdf"
+
+        with mock.patch.object(pdf_assembly, "MAX_OPEN_SOURCES", 3), \
+                mock.patch.object(pdf_assembly, "_concat_batch", wraps=pdf_assembly._concat_batch) as concat_batch:
+            concat_pdf_files(destination, sources)
+
+        self.assertEqual(page_texts(destination), ["s%02d page 1" % i for i in range(8)])
+        # 3 batches of at most 3 sources, then the 3 batches
+        self.assertEqual([len(call.args[1]) for call in concat_batch.call_args_list], [3, 3, 2, 3])
+        self.assertEqual(sorted(path.name for path in self.tmp_dir.iterdir()), sorted(["out.pdf"] + [path.name for path in sources]))
+
+    def font_objects(self, path):
+        with pikepdf.open(path) as pdf:
+            page_fonts = {font.objgen for page in pdf.pages for _, font in page.obj.Resources.Font.items()}
+            font_objects = [obj for obj in pdf.objects if isinstance(obj, pikepdf.Dictionary) and obj.get("/Type") == "/Font"]
+        return page_fonts, font_objects
+
+    def test_fonts_shared_by_the_sources_are_written_once(self):
+        destination = self.tmp_dir / "out.pdf"
+        concat_pdf_files(destination, [make_pdf("a", 2), make_pdf("b")])
+
+        page_fonts, font_objects = self.font_objects(destination)
+        self.assertEqual(len(page_fonts), 1)
+        self.assertEqual(len(font_objects), 1)
+        self.assertEqual(page_texts(destination), ["a page 1", "a page 2", "b page 1"])
+
+        with mock.patch.object(pdf_assembly, "_deduplicate_page_resources"):
+            concat_pdf_files(destination, [make_pdf("a", 2), make_pdf("b")])
+        self.assertEqual(len(self.font_objects(destination)[1]), 2)
+
+
+class InsertImagePagesTestCase(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def image(self, width, height):
+        path = self.tmp_dir / ("extra-%dx%d.png" % (width, height))
+        Image.new("L", (width, height), 128).save(path)
+        return path
+
+    def test_two_copies_of_a_single_file_match_the_per_student_loop(self):
+        # one file for both copies: copy 1 is pages 1-3, copy 2 pages 4-6
+        annotated = make_pdf("annotated", 6)
+        plans = [
+            # copy 1: after its pages 1 and 2, counted without the image inserted after page 1
+            [(1, self.image(10, 11)), (2, self.image(12, 13))],
+            # copy 2: page 4 of the file, page 9 is dropped
+            [(4, self.image(14, 15)), (9, self.image(16, 17))],
+        ]
+        pdf_path = self.tmp_dir / "annotated_papers.pdf"
+        reference_path = self.tmp_dir / "reference.pdf"
+        pdf_path.write_bytes(annotated)
+        reference_path.write_bytes(annotated)
+
+        self.assertEqual(insert_image_pages(pdf_path, plans), 3)
+        reference_insert_image_pages(reference_path, plans)
+
+        self.assertEqual(page_labels(pdf_path), page_labels(reference_path))
+        # the page numbers of copy 2 count the images inserted for copy 1, as the loop did
+        self.assertEqual(page_labels(pdf_path), [
+            "annotated page 1", "image 10x11", "annotated page 2", "image 12x13", "image 14x15",
+            "annotated page 3", "annotated page 4", "annotated page 5", "annotated page 6",
+        ])
+
+    def test_nothing_to_insert_leaves_the_file(self):
+        pdf_path = self.tmp_dir / "annotated.pdf"
+        pdf_path.write_bytes(make_pdf("annotated", 2))
+        modified = pdf_path.stat().st_mtime_ns
+
+        self.assertEqual(insert_image_pages(pdf_path, [[(3, self.image(10, 11))]]), 0)
+        self.assertEqual(pdf_path.stat().st_mtime_ns, modified)
@@ -0,0 +1,33 @@
+import time
+
+from django.test import SimpleTestCase
+
+from examc_app.utils.process_pool import pool_imap, process_pool
+
+
+def square(value):
+    if value < 0:
+        raise ValueError(value)
+    # later items finish first
+    time.sleep(0.01 * (10 - value % 10))
+    return value * value
+
+
+class PoolImapTestCase(SimpleTestCase):
+    def test_ordered_and_unordered_results(self):
+        with process_pool(3) as pool:
+            self.assertEqual(list(pool_imap(pool, square, range(20))), [value * value for value in range(20)])
+            self.assertEqual(sorted(pool_imap(pool, square, range(20), ordered=False)), [value * value for value in range(20)])
+
+    def test_function_exception_is_raised(self):
+        for ordered in (True, False):
+            with self.assertRaises(ValueError):
+                with process_pool(2) as pool:
+                    list(pool_imap(pool, square, [1, -1, 2], ordered=ordered))
+
+    def test_workers_exit_once_the_results_are_read(self):
+        # billiard's own imap leaves all but one worker waiting 30s at exit
+        started_at = time.monotonic()
+        with process_pool(3) as pool:
+            list(pool_imap(pool, square, range(30)))
+        self.assertLess(time.monotonic() - started_at, 10)
@@ -0,0 +1,121 @@
+from datetime import date
+
+from django.test import TestCase
+
+from examc_app.models import (
+    AcademicYear,
+    Exam,
+    PageMarkers,
+    PagesGroup,
+    PagesGroupGradingSchemeCheckedBox,
+    QuestionGradingScheme,
+    QuestionGradingSchemeCheckBox,
+    ScanPage,
+    Semester,
+)
+from examc_app.utils.review_capture import (
+    clear_review_capture,
+    compute_review_capture_hashes,
+    get_changed_review_pages,
+    record_review_capture,
+)
+
+
+class ReviewCaptureTestCase(TestCase):
+    def setUp(self):
+        year = AcademicYear.objects.create(code="2025-2026", name="2025-2026")
+        semester = Semester.objects.create(code=1, name="Autumn")
+        self.exam = Exam.objects.create(code="CAPTURE", name="Capture", semester=semester, year=year, date=date(2026, 1, 20))
+        self.pages_group = PagesGroup.objects.create(exam=self.exam, group_name="Q1", nb_pages=1, use_grading_scheme=True)
+        scheme = QuestionGradingScheme.objects.create(pages_group=self.pages_group, name="Q1", max_points=4)
+        self.checkbox = QuestionGradingSchemeCheckBox.objects.create(questionGradingScheme=scheme, name="correct", points=4)
+        self.other_checkbox = QuestionGradingSchemeCheckBox.objects.create(questionGradingScheme=scheme, name="partial", points=2)
+        for copy_nr in ("0001", "0002"):
+            for page_nr in ("01", "02"):
+                filename = f"copy_{copy_nr}_{page_nr}.jpg"
+                ScanPage.objects.create(exam=self.exam, copie_no=copy_nr, page_no=page_nr, filename=filename, content_hash=filename)
+
+    def page(self, copy_nr, page_nr):
+        return ScanPage.objects.get(exam=self.exam, copie_no=copy_nr, page_no=page_nr)
+
+    def capture(self):
+        changed_pages, unchanged_count, capture_hashes = get_changed_review_pages(self.exam)
+        record_review_capture(changed_pages, capture_hashes)
+
+    def changed(self):
+        changed_pages, unchanged_count, capture_hashes = get_changed_review_pages(self.exam)
+        self.assertEqual(len(changed_pages) + unchanged_count, 4)
+        return [(scan_page.copie_no, scan_page.page_no) for scan_page in changed_pages]
+
+    def test_exam_without_indexed_scans(self):
+        ScanPage.objects.filter(exam=self.exam).delete()
+        self.assertIsNone(get_changed_review_pages(self.exam))
+
+    def test_recorded_pages_are_unchanged(self):
+        self.assertEqual(self.changed(), [("0001", "01"), ("0001", "02"), ("0002", "01"), ("0002", "02")])
+        self.capture()
+
+        self.assertEqual(self.changed(), [])
+        self.assertIsNotNone(self.page("0001", "01").captured_at)
+
+    def test_page_markers_change_their_page(self):
+        page_markers = PageMarkers.objects.create(
+            exam=self.exam, pages_group=self.pages_group, copie_no="0001", page_no="02",
+            filename="0001/copy_0001_02.jpg", markers='{"lines": []}',
+        )
+        self.capture()
+
+        page_markers.markers = '{"lines": [[1, 2]]}'
+        page_markers.save()
+        self.assertEqual(self.changed(), [("0001", "02")])
+
+        self.capture()
+        page_markers.delete()
+        self.assertEqual(self.changed(), [("0001", "02")])
+
+    def test_checked_boxes_change_the_pages_of_their_copy(self):
+        self.capture()
+
+        checked_box = PagesGroupGradingSchemeCheckedBox.objects.create(
+            pages_group=self.pages_group, gradingSchemeCheckBox=self.checkbox, copy_nr="0002",
+        )
+        self.assertEqual(self.changed(), [("0002", "01"), ("0002", "02")])
+        self.capture()
+
+        checked_box.gradingSchemeCheckBox = self.other_checkbox
+        checked_box.save()
+        self.assertEqual(self.changed(), [("0002", "01"), ("0002", "02")])
+        self.capture()
+
+        checked_box.adjustment = 1
+        checked_box.save()
+        self.assertEqual(self.changed(), [("0002", "01"), ("0002", "02")])
+
+    def test_clear_forces_every_page(self):
+        self.capture()
+        clear_review_capture(self.exam)
+
+        self.assertEqual(len(self.changed()), 4)
+        self.assertIsNone(self.page("0001", "01").captured_at)
+
+    def test_copy_numbers_with_and_without_padding(self):
+        scan_pages = [self.page("0002", "01")]
+        PagesGroupGradingSchemeCheckedBox.objects.create(
+            pages_group=self.pages_group, gradingSchemeCheckBox=self.checkbox, copy_nr="2",
+        )
+        unpadded_hashes = compute_review_capture_hashes(self.exam, scan_pages)
+
+        PagesGroupGradingSchemeCheckedBox.objects.filter(copy_nr="2").update(copy_nr="0002")
+        self.assertEqual(compute_review_capture_hashes(self.exam, scan_pages), unpadded_hashes)
+
+        # the box counts for its copy
+        PagesGroupGradingSchemeCheckedBox.objects.all().delete()
+        self.assertNotEqual(compute_review_capture_hashes(self.exam, scan_pages), unpadded_hashes)
+
+        # and a scan page numbered without padding reads the same boxes
+        PagesGroupGradingSchemeCheckedBox.objects.create(
+            pages_group=self.pages_group, gradingSchemeCheckBox=self.checkbox, copy_nr="0002",
+        )
+        unpadded_page = ScanPage(pk=scan_pages[0].pk, copie_no="2", filename=scan_pages[0].filename,
+                                 content_hash=scan_pages[0].content_hash)
+        self.assertEqual(compute_review_capture_hashes(self.exam, [unpadded_page]), unpadded_hashes)
@@ -0,0 +1,54 @@
+import billiard
+from django.test import SimpleTestCase
+
+from examc_app.utils.review_functions import iter_decoded_scans
+
+
+def decode_page_name(name, regions_order=None):
+    copy_nr, page_nr = name.split("_")
+    return True, True, ["eXamcQRC", copy_nr, page_nr], "top_left"
+
+
+def decode_in_daemonic_process(items, processes, queue):
+    try:
+        queue.put([
+            (item, result)
+            for item, payload, result in iter_decoded_scans(items, decode_function=decode_page_name, processes=processes)
+        ])
+    except BaseException as e:
+        queue.put(repr(e))
+
+
+class IterDecodedScansTestCase(SimpleTestCase):
+    items = [f"{copy_nr:04d}_{page_nr:02d}" for copy_nr in range(1, 11) for page_nr in range(1, 5)]
+
+    def expected(self):
+        return [(item, decode_page_name(item)) for item in self.items]
+
+    def test_serial_and_pool_results_follow_items_order(self):
+        for processes in (1, 3):
+            decoded = [
+                (item, result)
+                for item, payload, result in iter_decoded_scans(self.items, decode_function=decode_page_name, processes=processes)
+            ]
+            self.assertEqual(decoded, self.expected())
+
+    def test_known_results_are_not_decoded(self):
+        known = {self.items[0]: (True, False, None, None)}
+        decoded = list(iter_decoded_scans(
+            self.items,
+            decode_function=decode_page_name,
+            known_result=lambda item, payload: known.get(item),
+            processes=2,
+        ))
+        self.assertEqual(decoded[0][2], (True, False, None, None))
+        self.assertEqual(decoded[1][2], decode_page_name(self.items[1]))
+
+    def test_pool_runs_from_daemonic_worker_process(self):
+        # Celery prefork workers run the import task in a daemonic billiard process
+        queue = billiard.Queue()
+        process = billiard.Process(target=decode_in_daemonic_process, args=(self.items, 3, queue), daemon=True)
+        process.start()
+        result = queue.get(timeout=60)
+        process.join(timeout=60)
+        self.assertEqual(result, self.expected())
@@ -0,0 +1,163 @@
+import io
+import os
+import shutil
+import stat
+import tempfile
+import zipfile
+from datetime import date
+from unittest import mock
+
+import cv2
+import numpy as np
+from django.test import TestCase, SimpleTestCase, override_settings
+
+from examc_app.models import AcademicYear, Exam, ScanPage, Semester
+from examc_app.utils.review_functions import get_scans_list, get_zip_scans_members, import_scans_from_zip
+from examc_app.utils.zip_security import UnsafeZipArchiveError, validate_zip_members
+
+
+def make_zip(members):
+    """Return an in-memory zip of members [(name or ZipInfo, bytes), ...]."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, content in members:
+            archive.writestr(name, content)
+    buffer.seek(0)
+    return zipfile.ZipFile(buffer)
+
+
+def make_jpeg(value):
+    _, encoded = cv2.imencode(".jpg", np.full((40, 30, 3), value, dtype=np.uint8))
+    return encoded.tobytes()
+
+
+class NoProgress:
+    def set_progress(self, *args, **kwargs):
+        pass
+
+
+class ValidateZipMembersTestCase(SimpleTestCase):
+    def test_returns_members_with_their_path(self):
+        archive = make_zip([("scans/a.jpg", b"a"), ("scans/b.jpg", b"b")])
+        members = validate_zip_members(archive)
+        self.assertEqual([str(member_path) for zip_info, member_path in members], ["scans/a.jpg", "scans/b.jpg"])
+
+    def test_rejects_traversal_and_absolute_paths(self):
+        for name in ("../a.jpg", "scans/../../a.jpg", "/etc/a.jpg"):
+            with self.assertRaises(UnsafeZipArchiveError):
+                validate_zip_members(make_zip([(name, b"a")]))
+
+    def test_rejects_symlinks(self):
+        zip_info = zipfile.ZipInfo("scans/link.jpg")
+        zip_info.external_attr = (stat.S_IFLNK | 0o777) << 16
+        with self.assertRaises(UnsafeZipArchiveError):
+            validate_zip_members(make_zip([(zip_info, b"/etc/passwd")]))
+
+    def test_enforces_limits(self):
+        archive = make_zip([("a.jpg", b"a" * 10), ("b.jpg", b"b" * 10)])
+        with self.assertRaises(UnsafeZipArchiveError):
+            validate_zip_members(archive, max_files=1)
+        with self.assertRaises(UnsafeZipArchiveError):
+            validate_zip_members(archive, max_total_uncompressed_size=15)
+
+
+class GetZipScansMembersTestCase(SimpleTestCase):
+    def test_takes_the_first_top_level_folder_sorted_by_name(self):
+        archive = make_zip([
+            ("__MACOSX/scans/._b.jpg", b"x"),
+            ("scans/b.jpg", b"b"),
+            ("scans/a.jpg", b"a"),
+            ("scans/sub/c.jpg", b"c"),
+            ("z_other/d.jpg", b"d"),
+            ("root.jpg", b"r"),
+        ])
+        self.assertEqual([zip_info.filename for zip_info in get_zip_scans_members(archive)], ["scans/a.jpg", "scans/b.jpg"])
+
+    def test_takes_the_archive_root_without_folder(self):
+        archive = make_zip([("b.jpg", b"b"), ("a.jpg", b"a")])
+        self.assertEqual([zip_info.filename for zip_info in get_zip_scans_members(archive)], ["a.jpg", "b.jpg"])
+
+
+class ImportScansFromZipTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(
+            SCANS_ROOT=os.path.join(self.media_root, "scans"),
+            SCANS_PREVIEWS_ROOT=os.path.join(self.media_root, "scans_previews"),
+            SCANS_DECODE_PROCESSES=1,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        year = AcademicYear.objects.create(code="2025-2026", name="2025-2026")
+        semester = Semester.objects.create(code=1, name="Autumn")
+        self.exam = Exam.objects.create(code="SCANS", name="Scans", semester=semester, year=year, date=date(2026, 1, 20))
+        self.scans_dir = os.path.join(self.media_root, "scans", "2025-2026", "1", "SCANS_20260120")
+
+        # scan name -> (content, decoded copy/page or None for an extra page)
+        self.scans = {
+            "scan_001.jpg": (make_jpeg(10), ("1", "1")),
+            "scan_002.jpg": (make_jpeg(20), ("1", "2")),
+            "scan_003.jpg": (make_jpeg(30), None),
+            "scan_004.jpg": (make_jpeg(40), ("2", "1")),
+        }
+
+    def decode(self, image_bytes, regions_order=None):
+        for content, position in self.scans.values():
+            if content == image_bytes:
+                if position is None:
+                    return True, False, None, None
+                return True, True, ["eXamcQRC", position[0], position[1]], "top_left"
+        raise AssertionError("unknown scan")
+
+    def import_zip(self, names, delete_old=False):
+        zip_path = os.path.join(self.media_root, "upload.zip")
+        with zipfile.ZipFile(zip_path, "w") as archive:
+            for name in names:
+                archive.writestr("scans/" + name, self.scans[name][0])
+        with mock.patch("examc_app.utils.review_functions.decode_scan_qrcode_bytes", side_effect=self.decode) as decode:
+            result = import_scans_from_zip(self.exam, zip_path, delete_old, NoProgress(), 100, 0, "upload.zip")
+        return result, decode.call_count
+
+    def read_scan(self, copy_dir, filename):
+        with open(os.path.join(self.scans_dir, copy_dir, filename), "rb") as scan_file:
+            return scan_file.read()
+
+    def test_scans_are_written_once_to_their_copy_location(self):
+        (copies_count, _), decoded = self.import_zip(sorted(self.scans))
+
+        self.assertEqual(copies_count, 2)
+        self.assertEqual(decoded, 4)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.scans_dir, "0001"))), ["copy_0001_01.jpg", "copy_0001_02.1.jpg", "copy_0001_02.jpg"])
+        self.assertEqual(self.read_scan("0001", "copy_0001_02.1.jpg"), self.scans["scan_003.jpg"][0])
+        self.assertEqual(self.read_scan("0002", "copy_0002_01.jpg"), self.scans["scan_004.jpg"][0])
+        self.assertEqual(ScanPage.objects.filter(exam=self.exam).count(), 4)
+        self.exam.refresh_from_db()
+        self.assertEqual(self.exam.pages_by_copy, '[["0001", 3], ["0002", 1]]')
+
+    def test_reimport_only_decodes_new_pages(self):
+        self.import_zip(["scan_001.jpg", "scan_002.jpg"])
+        written_at = os.stat(os.path.join(self.scans_dir, "0001", "copy_0001_01.jpg")).st_mtime_ns
+
+        (copies_count, _), decoded = self.import_zip(sorted(self.scans))
+
+        self.assertEqual(copies_count, 2)
+        self.assertEqual(decoded, 2)
+        self.assertEqual(os.stat(os.path.join(self.scans_dir, "0001", "copy_0001_01.jpg")).st_mtime_ns, written_at)
+        self.assertEqual(ScanPage.objects.filter(exam=self.exam).count(), 4)
+
+    def test_topping_up_an_unindexed_exam_keeps_its_earlier_scans(self):
+        # exam imported before the scans index existed: files but no ScanPage rows
+        os.makedirs(os.path.join(self.scans_dir, "0001"))
+        with open(os.path.join(self.scans_dir, "0001", "copy_0001_01.jpg"), "wb") as scan_file:
+            scan_file.write(self.scans["scan_001.jpg"][0])
+
+        (copies_count, _), decoded = self.import_zip(["scan_004.jpg"])
+
+        self.assertEqual(copies_count, 2)
+        self.assertEqual(decoded, 1)
+        self.assertEqual(
+            [(copy["copy"], [page["page"] for page in copy["pages"]]) for copy in get_scans_list(self.exam)],
+            [("0001", ["copy 0001 01"]), ("0002", ["copy 0002 01"])],
+        )
@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+from datetime import date
+
+from django.test import TestCase
+
+from examc_app.models import AcademicYear, Exam, ScanPage, Semester
+from examc_app.utils.scan_manifest import (
+    ScanManifest,
+    get_exam_scan_copies,
+    get_exam_scan_files,
+    parse_scan_filename,
+    scan_content_hash,
+)
+
+
+class ScanManifestTestCase(TestCase):
+    def setUp(self):
+        self.scans_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.scans_dir)
+        year = AcademicYear.objects.create(code="2025-2026", name="2025-2026")
+        semester = Semester.objects.create(code=1, name="Autumn")
+        self.exam = Exam.objects.create(code="MANIFEST", name="Manifest", semester=semester, year=year, date=date(2026, 1, 20))
+
+    def write_scan(self, filename, content):
+        copy_dir = os.path.join(self.scans_dir, filename.split("_")[1])
+        os.makedirs(copy_dir, exist_ok=True)
+        scan_path = os.path.join(copy_dir, filename)
+        with open(scan_path, "wb") as scan_file:
+            scan_file.write(content)
+        return scan_path
+
+    def record(self, manifest, filename, content):
+        scan_path = self.write_scan(filename, content)
+        manifest.record(scan_path, scan_content_hash(content), (30, 40))
+        return scan_path
+
+    def test_parse_scan_filename(self):
+        self.assertEqual(parse_scan_filename("/x/0001/copy_0001_02.jpg"), ("0001", "02", 0))
+        self.assertEqual(parse_scan_filename("copy_0001_02.3.jpg"), ("0001", "02", 3))
+        self.assertIsNone(parse_scan_filename("scan_001.jpg"))
+
+    def test_record_and_flush_create_then_update_rows(self):
+        manifest = ScanManifest(self.exam, "first.zip")
+        self.record(manifest, "copy_0001_01.jpg", b"page 1")
+        self.record(manifest, "copy_0001_01.1.jpg", b"extra")
+        manifest.flush()
+        self.assertEqual(ScanPage.objects.filter(exam=self.exam).count(), 2)
+
+        manifest = ScanManifest(self.exam, "second.zip")
+        self.record(manifest, "copy_0001_01.jpg", b"page 1 rescanned")
+        manifest.flush()
+
+        scan_page = ScanPage.objects.get(exam=self.exam, copie_no="0001", page_no="01", extra=0)
+        self.assertEqual(scan_page.content_hash, scan_content_hash(b"page 1 rescanned"))
+        self.assertEqual(scan_page.source_archive, "second.zip")
+        self.assertEqual((scan_page.width, scan_page.height), (30, 40))
+        self.assertEqual(ScanPage.objects.filter(exam=self.exam).count(), 2)
+        self.assertIsNone(manifest.decode_result(scan_content_hash(b"page 1")))
+
+    def test_decode_result_of_known_contents(self):
+        manifest = ScanManifest(self.exam)
+        self.record(manifest, "copy_0001_01.jpg", b"page 1")
+        self.record(manifest, "copy_0001_01.1.jpg", b"extra")
+        self.record(manifest, "copy_0002_01.jpg", b"same")
+        self.record(manifest, "copy_0002_01.1.jpg", b"same")
+
+        self.assertEqual(manifest.decode_result(scan_content_hash(b"page 1")), (True, True, ["eXamcQRC", "0001", "01"], None))
+        self.assertEqual(manifest.decode_result(scan_content_hash(b"extra")), (True, False, None, None))
+        # stored both as a page and as an extra page: decoded again
+        self.assertIsNone(manifest.decode_result(scan_content_hash(b"same")))
+        self.assertIsNone(manifest.decode_result(scan_content_hash(b"unknown")))
+
+    def test_is_stored_checks_slot_content_and_file(self):
+        manifest = ScanManifest(self.exam)
+        scan_path = self.record(manifest, "copy_0001_01.jpg", b"page 1")
+
+        self.assertTrue(manifest.is_stored(scan_path, scan_content_hash(b"page 1")))
+        self.assertFalse(manifest.is_stored(scan_path, scan_content_hash(b"other")))
+        os.remove(scan_path)
+        self.assertFalse(manifest.is_stored(scan_path, scan_content_hash(b"page 1")))
+
+    def test_pages_by_copy(self):
+        manifest = ScanManifest(self.exam)
+        for filename in ("copy_0002_01.jpg", "copy_0001_01.jpg", "copy_0001_02.jpg", "copy_0001_02.1.jpg"):
+            self.record(manifest, filename, filename.encode())
+        self.assertEqual(manifest.pages_by_copy(), [["0001", 3], ["0002", 1]])
+
+    def test_backfill_records_the_pages_of_an_unindexed_folder(self):
+        self.write_scan("copy_0001_01.jpg", b"page 1")
+        self.write_scan("copy_0001_01.1.jpg", b"extra")
+        self.write_scan("copy_0002_01.jpg", b"page 2")
+        self.write_scan("copy_0001_notes.txt", b"not a scan")
+        self.assertIsNone(get_exam_scan_copies(self.exam))
+        self.assertIsNone(get_exam_scan_files(self.exam))
+
+        manifest = ScanManifest(self.exam, "new.zip")
+        self.assertEqual(manifest.backfill(self.scans_dir), 3)
+
+        self.assertEqual(get_exam_scan_copies(self.exam), ["0001", "0002"])
+        self.assertEqual(get_exam_scan_files(self.exam), [("0001", "copy_0001_01.1.jpg"), ("0001", "copy_0001_01.jpg"), ("0002", "copy_0002_01.jpg")])
+        self.assertEqual(set(ScanPage.objects.filter(exam=self.exam).values_list("source_archive", flat=True)), {""})
+        self.assertEqual(manifest.decode_result(scan_content_hash(b"page 2")), (True, True, ["eXamcQRC", "0002", "01"], None))
+
+    def test_backfill_leaves_an_indexed_exam_alone(self):
+        manifest = ScanManifest(self.exam)
+        self.record(manifest, "copy_0001_01.jpg", b"page 1")
+        manifest.flush()
+        self.write_scan("copy_0001_02.jpg", b"page 2")
+
+        self.assertEqual(ScanManifest(self.exam).backfill(self.scans_dir), 0)
+        self.assertEqual(get_exam_scan_files(self.exam), [("0001", "copy_0001_01.jpg")])
@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+
+import billiard
+import cv2
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+
+from examc_app.utils.scan_previews import generate_scans_previews, get_scan_preview_rel_path, select_scan_preview
+
+
+def generate_in_daemonic_process(scan_paths, processes, queue):
+    try:
+        generate_scans_previews(scan_paths, processes)
+        queue.put(None)
+    except BaseException as e:
+        queue.put(repr(e))
+
+
+class ScanPreviewsTestCase(SimpleTestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.scans_root = os.path.join(self.media_root, "scans")
+        self.previews_root = os.path.join(self.media_root, "scans_previews")
+        settings_override = override_settings(
+            SCANS_ROOT=self.scans_root,
+            SCANS_PREVIEWS_ROOT=self.previews_root,
+            SCANS_PREVIEW_WIDTHS=[600, 300],
+            SCANS_PREVIEW_FORMAT="jpeg",
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.scan_rel_paths = [f"2026/1/EXAM_20260120/0001/copy_0001_0{page_nr}.jpg" for page_nr in range(1, 5)]
+        for scan_rel_path in self.scan_rel_paths:
+            scan_path = os.path.join(self.scans_root, scan_rel_path)
+            os.makedirs(os.path.dirname(scan_path), exist_ok=True)
+            cv2.imwrite(scan_path, np.full((1000, 800, 3), 200, dtype=np.uint8))
+
+    def preview_width(self, scan_rel_path, width):
+        preview = cv2.imread(os.path.join(self.previews_root, get_scan_preview_rel_path(scan_rel_path, width)))
+        return None if preview is None else preview.shape[1]
+
+    def assert_previews_written(self):
+        for scan_rel_path in self.scan_rel_paths:
+            self.assertEqual(self.preview_width(scan_rel_path, 600), 600)
+            self.assertEqual(self.preview_width(scan_rel_path, 300), 300)
+
+    def test_previews_are_written_for_each_level(self):
+        generate_scans_previews([os.path.join(self.scans_root, path) for path in self.scan_rel_paths], 2)
+        self.assert_previews_written()
+
+    def test_pool_runs_from_daemonic_worker_process(self):
+        # Celery prefork workers run the import task in a daemonic billiard process
+        queue = billiard.Queue()
+        scan_paths = [os.path.join(self.scans_root, path) for path in self.scan_rel_paths]
+        process = billiard.Process(target=generate_in_daemonic_process, args=(scan_paths, 2, queue), daemon=True)
+        process.start()
+        result = queue.get(timeout=60)
+        process.join(timeout=60)
+        self.assertIsNone(result)
+        self.assert_previews_written()
+
+    def test_select_scan_preview(self):
+        generate_scans_previews([os.path.join(self.scans_root, self.scan_rel_paths[0])])
+        scan_rel_path = self.scan_rel_paths[0]
+        self.assertIsNone(select_scan_preview(scan_rel_path, None))
+        self.assertEqual(select_scan_preview(scan_rel_path, 250), get_scan_preview_rel_path(scan_rel_path, 300))
+        self.assertEqual(select_scan_preview(scan_rel_path, 500), get_scan_preview_rel_path(scan_rel_path, 600))
+        self.assertIsNone(select_scan_preview(scan_rel_path, 700))
+        self.assertIsNone(select_scan_preview(self.scan_rel_paths[1], 500))
@@ -0,0 +1,138 @@
+from datetime import date
+from unittest import mock
+
+from django.db.models import Q
+from django.test import TestCase
+
+from examc_app.models import AcademicYear, Exam, Semester, Student
+from examc_app.utils import amc_functions
+from examc_app.utils.amc_functions import (
+    StudentMatcher,
+    copy_number_candidates,
+    empty_student_amc_id,
+    find_student_for_amc_report,
+    report_row_amc_copy_nr,
+)
+
+
+def query_student_for_association_value(exam, assoc_primary_key, associated_student):
+    """The query per row StudentMatcher.find_by_association_value replaces."""
+    if associated_student is None or str(associated_student).strip() == "":
+        return None
+
+    associated_student = str(associated_student).strip()
+    if assoc_primary_key == "ID":
+        candidates = copy_number_candidates(associated_student)
+        return Student.objects.filter(Q(copie_no__in=candidates) | Q(amc_id__in=candidates), exam=exam).first()
+    if assoc_primary_key == "SCIPER":
+        return Student.objects.filter(exam=exam, sciper=associated_student).first()
+    if assoc_primary_key == "NAME":
+        return Student.objects.filter(exam=exam, name=associated_student).first()
+    return Student.objects.filter(exam=exam).filter(
+        Q(copie_no=associated_student) | Q(amc_id=associated_student) | Q(sciper=associated_student) | Q(name=associated_student)
+    ).first()
+
+
+def query_student_for_amc_report(exam, assoc_primary_key, report_row):
+    """The queries per row find_student_for_amc_report made before StudentMatcher."""
+    amc_copy_nr = report_row_amc_copy_nr(report_row)
+    amc_copy_candidates = copy_number_candidates(amc_copy_nr)
+    if amc_copy_candidates:
+        student = Student.objects.filter(exam=exam, amc_id__in=amc_copy_candidates).first()
+        if student:
+            return student
+
+    student = query_student_for_association_value(exam, assoc_primary_key, report_row.get("associated_student"))
+    if student is None:
+        copy_candidates = []
+        for value in (amc_copy_nr, report_row.get("copy")):
+            if value is not None and value != "":
+                copy_candidates.extend(copy_number_candidates(value))
+        student = Student.objects.filter(exam=exam, copie_no__in=list(dict.fromkeys(copy_candidates))).first()
+    if student and empty_student_amc_id(student.amc_id) and amc_copy_nr not in (None, "", "0"):
+        student.amc_id = str(amc_copy_nr)
+        student.save(update_fields=["amc_id"])
+    return student
+
+
+class StudentMatcherTestCase(TestCase):
+    values = ["1", "01", "0001", "2", "0002", "5", " 5 ", "7", "9", "100001", "100003", "Alice", "Bob", "Carol", "missing", "", None]
+
+    def setUp(self):
+        year = AcademicYear.objects.create(code="2025-2026", name="2025-2026")
+        semester = Semester.objects.create(code=1, name="Autumn")
+        self.exam = Exam.objects.create(code="MATCH", name="Match", semester=semester, year=year, date=date(2026, 1, 20))
+        other_exam = Exam.objects.create(code="OTHER", name="Other", semester=semester, year=year, date=date(2026, 1, 21))
+        # duplicated names, SCIPERs and numbers: the first student by pk wins
+        Student.objects.create(exam=other_exam, copie_no="9", amc_id="9", sciper="100009", name="Dave")
+        for copie_no, amc_id, sciper, name in (
+            ("7", "0", "100007", "Carol"),
+            ("1", "0", "100001", "Alice"),
+            ("0002", "5", "100002", "Bob"),
+            ("5", "0", "100003", "Alice"),
+            ("8", "2", "100001", "Eve"),
+        ):
+            Student.objects.create(exam=self.exam, copie_no=copie_no, amc_id=amc_id, sciper=sciper, name=name)
+
+    def amc_ids(self):
+        return dict(Student.objects.filter(exam=self.exam).values_list("pk", "amc_id"))
+
+    def test_association_values_match_the_queries(self):
+        for assoc_primary_key in ("ID", "SCIPER", "NAME", "OTHER"):
+            matcher = StudentMatcher(self.exam, assoc_primary_key)
+            for value in self.values:
+                with self.subTest(assoc_primary_key=assoc_primary_key, value=value):
+                    self.assertEqual(
+                        matcher.find_by_association_value(value),
+                        query_student_for_association_value(self.exam, assoc_primary_key, value),
+                    )
+
+    def test_sciper_and_name_ignore_case(self):
+        matcher = StudentMatcher(self.exam, "NAME")
+        self.assertEqual(matcher.find_by_association_value(" alice "), Student.objects.get(exam=self.exam, copie_no="1"))
+
+    def test_report_rows_match_the_queries_and_backfill_amc_ids(self):
+        report_rows = [
+            {"student": 3, "copy": 0, "associated_student": "Carol"},
+            {"student": 2, "copy": 0},
+            {"student": 4, "copy": 0, "associated_student": "100001"},
+            {"student": 6, "amc_copy": 6, "copy": 5},
+            {"student": 3, "copy": 0, "associated_student": "Alice"},
+            {"student": 12, "copy": 0, "associated_student": "missing"},
+        ]
+        initial_amc_ids = self.amc_ids()
+        expected = [query_student_for_amc_report(self.exam, "NAME", row) for row in report_rows[:2]]
+        expected += [query_student_for_amc_report(self.exam, "SCIPER", row) for row in report_rows[2:]]
+        expected_amc_ids = self.amc_ids()
+
+        for pk, amc_id in initial_amc_ids.items():
+            Student.objects.filter(pk=pk).update(amc_id=amc_id)
+        name_matcher = StudentMatcher(self.exam, "NAME")
+        found = [find_student_for_amc_report(self.exam, row, name_matcher) for row in report_rows[:2]]
+        name_matcher.save()
+        sciper_matcher = StudentMatcher(self.exam, "SCIPER")
+        found += [find_student_for_amc_report(self.exam, row, sciper_matcher) for row in report_rows[2:]]
+        sciper_matcher.save()
+
+        self.assertEqual([student and student.pk for student in found], [student and student.pk for student in expected])
+        self.assertEqual(self.amc_ids(), expected_amc_ids)
+        self.assertNotEqual(expected_amc_ids, initial_amc_ids)
+
+    def test_sync_amc_ids_from_association(self):
+        associations = [
+            {"amc_copy": 11, "associated_student": "100001"},
+            {"amc_copy": 12, "associated_student": "100002"},
+            {"amc_copy": 13, "associated_student": "100404"},
+            {"amc_copy": None, "associated_student": "100003"},
+        ]
+        with mock.patch.object(amc_functions, "get_amc_project_path", return_value="/amc/project"), \
+                mock.patch.object(amc_functions, "get_amc_option_by_key", return_value="SCIPER"), \
+                mock.patch.object(amc_functions, "select_student_association_data", return_value=associations):
+            self.assertEqual(amc_functions.sync_student_amc_ids_from_association(self.exam), 2)
+
+        self.assertEqual(
+            dict(Student.objects.filter(exam=self.exam).values_list("copie_no", "amc_id")),
+            {"7": "0", "1": "11", "0002": "12", "5": "0", "8": "0"},
+        )
+        # the updates are recorded in the students history
+        self.assertEqual(Student.history.filter(copie_no="1", amc_id="11").count(), 1)
@@ -1,34 +1,63 @@
 import os.path
 
 import cv2
-from pyzbar import pyzbar
 
-from examc_app.utils.amc_db_queries import get_page_layout_boxes
+from examc_app.utils.amc.modules.detect import measure_scan
+from examc_app.utils.amc_db_queries import get_page_layout_boxes, get_layout_page, get_page_layout_marks
 from examc_app.utils.amc_functions import get_amc_project_path
+from examc_app.utils.amc_options import AMCProjectOptions
+from examc_app.utils.qrcode_detection import get_exam_qrcode_detector, save_exam_qrcode_detector
 
+# layout_box roles and flags, as in AMC
+BOX_ROLE_ANSWER = 1
+BOX_FLAGS_SHAPE_OVAL = 2
+BOX_FLAGS_DONTSCAN = 4
 
-def get_scan_qrcode_data(file_path):
-    # read qrcode
+
+def get_scan_qrcode_data(file_path, exam=None):
+    # read qrcode, trying the page regions learned for the exam first
     image = cv2.imread(file_path)
-    decodeObjects = pyzbar.decode(image)
-    data = None
-    if len(decodeObjects) > 0:
-        for obj in decodeObjects:
-            if str(obj.type) == 'QRCODE' and 'CePROExamsQRC' in str(obj.data):
-                data = obj.data.decode("utf-8").split(',')
+    detector = get_exam_qrcode_detector(exam)
+    has_symbols, data, region = detector.detect(image)
+    if region:
+        detector.record_hit(region)
+        save_exam_qrcode_detector(exam, detector)
     return data
 
 def analyze_scan(file_path,exam,student=None,page_nr=None):
-
+    """
+    Measure the answer boxes of a scan in process (see modules/detect.py).
+    Return {'error': ...} or the 'transf' parameters and the 'boxes' measures
+    [{question, answer, total, black, darkness}, ...].
+    """
     if not student or not page_nr:
-        data = get_scan_qrcode_data(file_path)
+        data = get_scan_qrcode_data(file_path, exam)
         student = data[1]
         page_nr = data[2]
 
-    layout_boxes = get_page_layout_boxes(get_amc_project_path(exam, True) + "/data/",student, page_nr)
-
-
-
-
-
-
+    amc_project_path = get_amc_project_path(exam, True)
+    amc_data_path = amc_project_path + "/data/"
+    layout_page = get_layout_page(amc_data_path, student, page_nr)
+    layout_marks = get_page_layout_marks(amc_data_path, student, page_nr)
+    if not layout_page or len(layout_marks) != 4:
+        return {'error': "No layout for page %s/%s" % (student, page_nr)}
+
+    layout_boxes = [box for box in get_page_layout_boxes(amc_data_path, student, page_nr)
+                    if box['role'] == BOX_ROLE_ANSWER and not box['flags'] & BOX_FLAGS_DONTSCAN]
+    box_size_proportion = AMCProjectOptions(amc_project_path).box_size_proportion or 0.8
+
+    result = measure_scan(
+        file_path, layout_page['width'], layout_page['height'], layout_page['markdiameter'], layout_marks,
+        [[box['xmin'], box['xmax'], box['ymin'], box['ymax']] for box in layout_boxes],
+        prop=box_size_proportion,
+        oval=[bool(box['flags'] & BOX_FLAGS_SHAPE_OVAL) for box in layout_boxes],
+    )
+    if 'error' in result:
+        return result
+
+    result['boxes'] = [
+        {'question': box['question'], 'answer': box['answer'], 'total': total, 'black': black,
+         'darkness': black / total if total else 0}
+        for box, total, black in zip(layout_boxes, result.pop('total'), result.pop('black'))
+    ]
+    return result
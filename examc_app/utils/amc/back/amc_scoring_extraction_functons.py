@@ -21,6 +21,36 @@ AMC_MESSAGE_PATTERNS = {
     "total": re.compile(r"\\message\{TOTAL=([\s0-9]+)\}"),
 }
 
+# The patterns above by kind, with named groups, in the order AMC_MESSAGE_PATTERNS used to be tried
+AMC_MESSAGES = {
+    "total": r"(?P<total>TOTAL=(?P<total_value>[\s0-9]+)\})",
+    "student": r"(?P<student>ETU=(?P<student_number>[0-9]+)\})",
+    "alias": r"(?P<alias>BR=(?P<alias_of>[0-9]+)\})",
+    "question_title": r"(?P<question_title>NUM=(?P<title_number>[0-9]+)=(?P<title>.+)\})",
+    "question": r"(?P<question>Q=(?P<question_number>[0-9]+)\})",
+    "question_partial": r"(?P<question_partial>QPART\})",
+    "question_end": r"(?P<question_end>FQ\})",
+    "multiple": r"(?P<multiple>MULT\})",
+    "indicative": r"(?P<indicative>INDIC\})",
+    "answer": r"(?P<answer>REP=(?P<answer_number>[0-9]+):(?P<answer_state>[BM])\})",
+    "strategy": r"(?P<strategy>B=(?P<strategy_value>.+)\})",
+    "default_simple": r"(?P<default_simple>BDS=(?P<default_simple_value>.+)\})",
+    "default_multiple": r"(?P<default_multiple>BDM=(?P<default_multiple_value>.+)\})",
+    "variable": r"(?P<variable>VAR:(?P<var_name>[0-9a-zA-Z.:-]+)=(?P<var_value>.+)\})",
+}
+
+# The messages as one alternation: the outer group of each message names its kind
+# (match.lastgroup), so a line with a single message is dispatched with a single search.
+AMC_MESSAGE_RE = re.compile(r"\\message\{(?:" + "|".join(AMC_MESSAGES.values()) + ")")
+AMC_MESSAGE_RES = {kind: re.compile(r"\\message\{" + message) for kind, message in AMC_MESSAGES.items()}
+
+# Messages skipped outside a student sheet, and outside a question
+STUDENT_MESSAGES = {"alias", "question"}
+QUESTION_MESSAGES = {"question_partial", "multiple", "indicative", "answer"}
+
+# Number of mapped student sheets handed to the caller at once by iter_mapped_scoring_batches
+MAPPED_STUDENTS_BATCH_SIZE = 500
+
 
 class ScoringExtractionError(Exception):
     pass
@@ -62,100 +92,102 @@ class ParsedAmcScoring:
     students: list = field(default_factory=list)
 
 
-def load_amc_log_lines(amc_log_path):
+def iter_amc_log_lines(amc_log_path):
+    """Yield the stripped lines of an AMC .amc log file, read lazily."""
     with open(amc_log_path, "r", encoding="utf-8", errors="replace") as f:
-        return f.readlines()
+        for raw_line in f:
+            yield raw_line.strip()
 
 
-def parse_amc_scoring_log(amc_log_path) -> ParsedAmcScoring:
+def match_amc_message(line, in_student, in_question):
     """
-    Parse AMC .amc log file into a structured Python object.
+    Return the match of the AMC message of a log line, or None.
 
-    This follows the same core message patterns used by AMC-prepare.pl.
+    TeX may write several messages on one line: only one is read, the first kind of
+    AMC_MESSAGES found that applies where the log is, as the line was read before.
     """
-    lines = load_amc_log_lines(amc_log_path)
-    parsed = ParsedAmcScoring()
+    if line.count("\\message{") < 2:
+        return AMC_MESSAGE_RE.search(line)
+    for kind, message_re in AMC_MESSAGE_RES.items():
+        if (kind in STUDENT_MESSAGES and not in_student) or (kind in QUESTION_MESSAGES and not in_question):
+            continue
+        m = message_re.search(line)
+        if m:
+            return m
+    return None
 
+
+def iter_amc_scoring_log(amc_log_path, parsed: ParsedAmcScoring):
+    """
+    Stream an AMC .amc log file, yielding each ParsedStudentSheet once complete.
+
+    The file-level data (total, default strategies, variables, question titles) is
+    stored on parsed as it is read; the student sheets are not kept on it.
+    This follows the same core message patterns used by AMC-prepare.pl.
+    """
     current_student = None
     current_question = None
 
-    for raw_line in lines:
-        line = raw_line.strip()
+    for line in iter_amc_log_lines(amc_log_path):
+        m = match_amc_message(line, current_student is not None, current_question is not None)
+        if not m:
+            continue
+        kind = m.lastgroup
 
-        m = AMC_MESSAGE_PATTERNS["total"].search(line)
-        if m:
-            total_raw = m.group(1).replace(" ", "")
+        if kind == "total":
+            total_raw = m.group("total_value").replace(" ", "")
             parsed.total_sheets = int(total_raw) if total_raw.isdigit() else None
-            continue
 
-        m = AMC_MESSAGE_PATTERNS["student"].search(line)
-        if m:
-            student_number = int(m.group(1))
-            current_student = ParsedStudentSheet(student_number=student_number)
-            parsed.students.append(current_student)
+        elif kind == "student":
+            if current_student:
+                yield current_student
+            current_student = ParsedStudentSheet(student_number=int(m.group("student_number")))
             current_question = None
-            continue
 
-        m = AMC_MESSAGE_PATTERNS["alias"].search(line)
-        if m and current_student:
-            current_student.alias_of = int(m.group(1))
-            continue
-
-        m = AMC_MESSAGE_PATTERNS["question_title"].search(line)
-        if m:
-            amc_question_number = int(m.group(1))
-            rendered_id = m.group(2)
-            parsed.question_titles[amc_question_number] = rendered_id
-            continue
+        elif kind == "alias":
+            if current_student:
+                current_student.alias_of = int(m.group("alias_of"))
 
-        m = AMC_MESSAGE_PATTERNS["question"].search(line)
-        if m and current_student:
-            amc_question_number = int(m.group(1))
+        elif kind == "question_title":
+            parsed.question_titles[int(m.group("title_number"))] = m.group("title")
 
-            current_question = current_student.questions.get(amc_question_number)
-            if current_question is None:
-                current_question = ParsedQuestion(amc_question_number=amc_question_number)
-                current_student.questions[amc_question_number] = current_question
+        elif kind == "question":
+            if current_student:
+                amc_question_number = int(m.group("question_number"))
 
-            if amc_question_number in parsed.question_titles:
-                current_question.title = parsed.question_titles[amc_question_number]
+                current_question = current_student.questions.get(amc_question_number)
+                if current_question is None:
+                    current_question = ParsedQuestion(amc_question_number=amc_question_number)
+                    current_student.questions[amc_question_number] = current_question
 
-            continue
+                if amc_question_number in parsed.question_titles:
+                    current_question.title = parsed.question_titles[amc_question_number]
 
-        m = AMC_MESSAGE_PATTERNS["question_partial"].search(line)
-        if m and current_question:
-            current_question.is_partial = True
-            continue
+        elif kind == "question_partial":
+            if current_question:
+                current_question.is_partial = True
 
-        m = AMC_MESSAGE_PATTERNS["question_end"].search(line)
-        if m:
+        elif kind == "question_end":
             current_question = None
-            continue
 
-        m = AMC_MESSAGE_PATTERNS["multiple"].search(line)
-        if m and current_question:
-            current_question.is_multiple = True
-            continue
+        elif kind == "multiple":
+            if current_question:
+                current_question.is_multiple = True
 
-        m = AMC_MESSAGE_PATTERNS["indicative"].search(line)
-        if m and current_question:
-            current_question.is_indicative = True
-            continue
+        elif kind == "indicative":
+            if current_question:
+                current_question.is_indicative = True
 
-        m = AMC_MESSAGE_PATTERNS["answer"].search(line)
-        if m and current_question:
-            answer_number = int(m.group(1))
-            answer_state = m.group(2)  # B = correct, M = wrong
+        elif kind == "answer":
+            if current_question:
+                answer_number = int(m.group("answer_number"))
+                current_question.answers[answer_number] = ParsedAnswer(
+                    answer_number=answer_number,
+                    is_correct=(m.group("answer_state") == "B"),  # B = correct, M = wrong
+                )
 
-            current_question.answers[answer_number] = ParsedAnswer(
-                answer_number=answer_number,
-                is_correct=(answer_state == "B"),
-            )
-            continue
-
-        m = AMC_MESSAGE_PATTERNS["strategy"].search(line)
-        if m:
-            strategy = m.group(1)
+        elif kind == "strategy":
+            strategy = m.group("strategy_value")
 
             if current_student and current_question:
                 # question-level strategy unless a more detailed answer strategy system
@@ -169,50 +201,140 @@ def parse_amc_scoring_log(amc_log_path) -> ParsedAmcScoring:
                     current_student.main_strategy += "," + strategy
                 else:
                     current_student.main_strategy = strategy
-            continue
 
-        m = AMC_MESSAGE_PATTERNS["default_simple"].search(line)
-        if m:
-            parsed.default_simple_strategy = m.group(1)
-            continue
+        elif kind == "default_simple":
+            parsed.default_simple_strategy = m.group("default_simple_value")
 
-        m = AMC_MESSAGE_PATTERNS["default_multiple"].search(line)
-        if m:
-            parsed.default_multiple_strategy = m.group(1)
-            continue
+        elif kind == "default_multiple":
+            parsed.default_multiple_strategy = m.group("default_multiple_value")
 
-        m = AMC_MESSAGE_PATTERNS["variable"].search(line)
-        if m:
-            var_name = m.group(1)
-            var_value = m.group(2)
+        elif kind == "variable":
+            var_name = m.group("var_name")
             if var_name == "postcorrect":
                 var_name = "postcorrect_flag"
-            parsed.variables[var_name] = var_value
-            continue
+            parsed.variables[var_name] = m.group("var_value")
+
+    if current_student:
+        yield current_student
 
+
+def parse_amc_scoring_log(amc_log_path) -> ParsedAmcScoring:
+    """
+    Parse AMC .amc log file into a structured Python object.
+
+    This follows the same core message patterns used by AMC-prepare.pl.
+    """
+    parsed = ParsedAmcScoring()
+    parsed.students.extend(iter_amc_scoring_log(amc_log_path, parsed))
     return parsed
 
 
+def validate_parsed_student_sheet(student: ParsedStudentSheet):
+    """Return the warning/error strings of one parsed student sheet."""
+    issues = []
+
+    for amc_question_number, question in student.questions.items():
+        if question.title and not question.is_multiple and not question.is_partial:
+            n_correct = sum(1 for answer in question.answers.values() if answer.is_correct)
+            n_total = len(question.answers)
+
+            if n_total > 0 and n_correct != 1 and not question.is_indicative:
+                issues.append(
+                    f"Question '{question.title}' for student {student.student_number} "
+                    f"has {n_correct}/{n_total} correct answers but is not multiple-choice."
+                )
+
+    return issues
+
+
 def validate_parsed_amc_scoring(parsed: ParsedAmcScoring):
     """
     Basic sanity checks inspired by AMC's own validation logic.
     Returns a list of warning/error strings.
     """
     issues = []
-
     for student in parsed.students:
-        for amc_question_number, question in student.questions.items():
-            if question.title and not question.is_multiple and not question.is_partial:
-                n_correct = sum(1 for answer in question.answers.values() if answer.is_correct)
-                n_total = len(question.answers)
+        issues.extend(validate_parsed_student_sheet(student))
+    return issues
 
-                if n_total > 0 and n_correct != 1 and not question.is_indicative:
-                    issues.append(
-                        f"Question '{question.title}' for student {student.student_number} "
-                        f"has {n_correct}/{n_total} correct answers but is not multiple-choice."
-                    )
 
-    return issues
+def get_build_questions_index(build: ExamBuild):
+    """
+    Return {rendered_id: (ExamBuildQuestion, {rendered_answer_number: ExamBuildAnswer})}
+    for the questions of build, loaded once for all the student sheets.
+    """
+    build_questions = {}
+    for question in ExamBuildQuestion.objects.filter(build=build).prefetch_related("build_answers"):
+        build_questions[question.rendered_id] = (
+            question,
+            {answer.rendered_answer_number: answer for answer in question.build_answers.all()},
+        )
+    return build_questions
+
+
+def map_parsed_student_sheet(student: ParsedStudentSheet, question_titles, build_questions):
+    """Map one parsed student sheet onto the build questions index of get_build_questions_index."""
+    mapped_questions = []
+
+    for amc_question_number, parsed_question in student.questions.items():
+        rendered_id = parsed_question.title or question_titles.get(amc_question_number, "")
+        build_question, build_answers_by_number = build_questions.get(rendered_id, (None, None))
+
+        mapped_answers = []
+        if build_question:
+            for answer_number, parsed_answer in parsed_question.answers.items():
+                mapped_answers.append(
+                    {
+                        "answer_number": answer_number,
+                        "build_answer": build_answers_by_number.get(answer_number),
+                        "is_correct": parsed_answer.is_correct,
+                        "strategy": parsed_answer.strategy,
+                    }
+                )
+
+        mapped_questions.append(
+            {
+                "amc_question_number": amc_question_number,
+                "rendered_id": rendered_id,
+                "build_question": build_question,
+                "is_multiple": parsed_question.is_multiple,
+                "is_indicative": parsed_question.is_indicative,
+                "is_partial": parsed_question.is_partial,
+                "question_strategy": parsed_question.question_strategy,
+                "answers": mapped_answers,
+            }
+        )
+
+    return {
+        "student_number": student.student_number,
+        "alias_of": student.alias_of,
+        "main_strategy": student.main_strategy,
+        "questions": mapped_questions,
+    }
+
+
+def iter_mapped_scoring_batches(build: ExamBuild, students, parsed: ParsedAmcScoring,
+                                batch_size=MAPPED_STUDENTS_BATCH_SIZE, validate=True):
+    """
+    Map the parsed student sheets of students (e.g. iter_amc_scoring_log) onto build and
+    yield them as (mapped students, issues) batches of at most batch_size sheets, so they
+    can be persisted without holding the whole log in memory.
+    """
+    build_questions = get_build_questions_index(build)
+    mapped_students = []
+    issues = []
+
+    for student in students:
+        if validate:
+            issues.extend(validate_parsed_student_sheet(student))
+        mapped_students.append(map_parsed_student_sheet(student, parsed.question_titles, build_questions))
+        if len(mapped_students) >= batch_size:
+            yield mapped_students, issues
+            mapped_students = []
+            issues = []
+
+    if mapped_students or issues:
+        yield mapped_students, issues
 
 
 def map_parsed_scoring_to_build(build: ExamBuild, parsed: ParsedAmcScoring):
@@ -221,58 +343,12 @@ def map_parsed_scoring_to_build(build: ExamBuild, parsed: ParsedAmcScoring):
 
     Returns a structure ready for persistence or further grading logic.
     """
-    build_questions_by_rendered_id = {
-        question.rendered_id: question
-        for question in ExamBuildQuestion.objects.filter(build=build).prefetch_related("build_answers")
-    }
-
-    mapped_students = []
+    build_questions = get_build_questions_index(build)
 
-    for student in parsed.students:
-        mapped_questions = []
-
-        for amc_question_number, parsed_question in student.questions.items():
-            rendered_id = parsed_question.title or parsed.question_titles.get(amc_question_number, "")
-            build_question = build_questions_by_rendered_id.get(rendered_id)
-
-            mapped_answers = []
-            if build_question:
-                build_answers_by_number = {
-                    answer.rendered_answer_number: answer
-                    for answer in build_question.build_answers.all()
-                }
-
-                for answer_number, parsed_answer in parsed_question.answers.items():
-                    mapped_answers.append(
-                        {
-                            "answer_number": answer_number,
-                            "build_answer": build_answers_by_number.get(answer_number),
-                            "is_correct": parsed_answer.is_correct,
-                            "strategy": parsed_answer.strategy,
-                        }
-                    )
-
-            mapped_questions.append(
-                {
-                    "amc_question_number": amc_question_number,
-                    "rendered_id": rendered_id,
-                    "build_question": build_question,
-                    "is_multiple": parsed_question.is_multiple,
-                    "is_indicative": parsed_question.is_indicative,
-                    "is_partial": parsed_question.is_partial,
-                    "question_strategy": parsed_question.question_strategy,
-                    "answers": mapped_answers,
-                }
-            )
-
-        mapped_students.append(
-            {
-                "student_number": student.student_number,
-                "alias_of": student.alias_of,
-                "main_strategy": student.main_strategy,
-                "questions": mapped_questions,
-            }
-        )
+    mapped_students = [
+        map_parsed_student_sheet(student, parsed.question_titles, build_questions)
+        for student in parsed.students
+    ]
 
     return {
         "total_sheets": parsed.total_sheets,
@@ -6,9 +6,11 @@ import shutil
 import tempfile
 from math import floor
 
-from examc_app.utils.amc.modules.box import AMCBox
+from examc_app.utils.amc.modules.box import AMCBox, AMCBoxStore
 from examc_app.utils.amc.modules.calage import AMCCalage
 from examc_app.utils.amc.modules.data import AMCData
+from examc_app.utils.amc.modules.detect import AMCDetect
+from examc_app.utils.process_pool import pool_imap, process_pool
 
 
 # -------------------------------------------------------------------
@@ -65,22 +67,30 @@ def pageids_string(ids, path=False):
 # Next, stubs for "AMC::Boite" or "AMC::Calage", etc.
 
 # AMC::Queue stub
+def run_queue_task(task):
+    function, args = task
+    return function(*args)
+
 class AMCQueueStub:
-    """Mimic AMC::Queue->new(...) and concurrency. We run tasks sequentially here."""
+    """Mimic AMC::Queue->new(...): tasks run in a process pool of n_procs processes, or sequentially."""
 
     def __init__(self, max_procs_label, n_procs, get_returned_values=False):
         self.tasks = []
-        self.returned_values = get_returned_values
+        self.n_procs = n_procs
+        self.get_returned_values = get_returned_values
         self._results = []
 
     def add_process(self, func, *args):
         self.tasks.append((func, args))
 
     def run(self):
-        for (f, a) in self.tasks:
-            r = f(*a)
-            if self.returned_values:
-                self._results.append(r)
+        if self.n_procs and self.n_procs > 1 and len(self.tasks) > 1:
+            with process_pool(min(self.n_procs, len(self.tasks))) as pool:
+                results = list(pool_imap(pool, run_queue_task, self.tasks))
+        else:
+            results = [run_queue_task(task) for task in self.tasks]
+        if self.get_returned_values:
+            self._results.extend(results)
         self.tasks = []
 
     def returned_values(self):
@@ -89,27 +99,6 @@ class AMCQueueStub:
     def killall(self):
         pass
 
-# AMC::Subprocess stub
-class AMCSubprocessStub:
-    """Mimic AMC::Subprocess->new(...)."""
-
-    def __init__(self, mode=None, args=None):
-        self.mode = mode
-        self.args = args or []
-
-    def commande(self, cmd):
-        """
-        In Perl: $process->commande("load something"), returns an array of lines.
-        Here, we return a mock list or parse 'cmd'.
-        """
-        debug(f"[Subprocess] command: {cmd}")
-        # Return lines as if from actual process. For example:
-        return []
-
-    def ferme_commande(self):
-        """Mimic $process->ferme_commande()"""
-        pass
-
 # AMC::Exec stub
 class AMCExecStub:
     def __init__(self, name):
@@ -242,6 +231,8 @@ scans_list           = None
 n_procs              = 0
 project_dir          = ""
 tol_mark             = ""
+tol_mark_plus        = 0.2
+tol_mark_moins       = 0.2
 prop                 = 0.8
 bw_threshold         = 0.6
 blur                 = "1x1"
@@ -272,9 +263,8 @@ POSITION_MEASURE     = 202
 def error(e, process=None, scan=None, register_failed=None, silent=False):
     global debug_image, data_dir
     if process and debug_image:
-        # process.commande(f"output {debug_image}")
-        # process.ferme_commande()
-        pass
+        process.commande(f"output {debug_image}")
+        process.ferme_commande()
 
     if silent:
         debug(e)
@@ -306,11 +296,36 @@ def detecte_cb(k):
         return (int(m.group(1)), int(m.group(2)))
     return None
 
+def read_measure_lines(ld, k, lines):
+    """Store the TCORNER, COIN, PIX and ZOOM lines of a box measure. Return the darkness ratio."""
+    r = 0
+    tcorners, corners = [], []
+    for line in lines:
+        m = re.match(r"^(TCORNER|COIN)\s+(-?[\d.]+),(-?[\d.]+)", line)
+        if m:
+            (tcorners if m.group(1) == 'TCORNER' else corners).extend([float(m.group(2)), float(m.group(3))])
+            continue
+        m = re.match(r"^PIX\s+(\d+)\s+(\d+)", line)
+        if m:
+            total, black = int(m.group(1)), int(m.group(2))
+            ld['darkness.data'][k] = [total, black]
+            r = black / total if total > 0 else 0
+            continue
+        m = re.match(r"^ZOOM\s+(.*)", line)
+        if m:
+            ld['zoom.file'][k] = m.group(1)
+    if len(tcorners) == 8:
+        ld['boxes.scan'][k] = AMCBox.new_complete(*tcorners)
+    if len(corners) == 8:
+        ld['corners.test'][k] = AMCBox.new_complete(*corners)
+    return r
+
 def measure_box(process, ld, k, *spc):
     """
     Mimic measure_box from the script:
     - Possibly do a command: "id {spc0} {spc1} {q} {a}"
     - If not DONTSCAN, measure darkness data, etc.
+    Return the darkness ratio of the box.
     """
     r = 0
     flags = ld['flags'].get(k, 0)
@@ -335,19 +350,45 @@ def measure_box(process, ld, k, *spc):
 
     # if not DONTSCAN, do measure:
     if not (flags & BOX_FLAGS_DONTSCAN):
-        # create a command to measure
-        # pc = ...
-        # For now, a stub
-        lines = process.commande("some measure command")
-        for line in lines:
-            # parse e.g. "TCORNER x,y", "COIN x,y", "PIX total filled", "ZOOM file"
-            pass
-        # set darkness data, e.g.  [ total, filled ]
+        shape = 'oval' if flags & BOX_FLAGS_SHAPE_OVAL else 'square'
+        lines = process.commande(ld['boxes'][k].commande_mesure0(prop, shape))
         ld.setdefault('darkness.data', {})
-        ld['darkness.data'][k] = [100, 50]  # e.g. 50 out of 100
+        ld.setdefault('zoom.file', {})
+        r = read_measure_lines(ld, k, lines)
 
     return r
 
+def measure_boxes(process, ld, keys, *spc):
+    """
+    Measure all the given boxes at once with the detection engine, as measure_box
+    does box by box. DONTSCAN boxes are only transformed.
+    """
+    ld.setdefault('boxes.scan', {})
+    ld.setdefault('darkness.data', {})
+    ld.setdefault('zoom.file', {})
+    scanned = []
+    for k in keys:
+        if ld['flags'].get(k, 0) & BOX_FLAGS_DONTSCAN:
+            ld['boxes.scan'][k] = ld['boxes'][k].clone()
+            ld['boxes.scan'][k].transforme(ld['transf'])
+        else:
+            scanned.append(k)
+    if not scanned:
+        return
+
+    boxes = [ld['boxes'][k].etendue_xy('xy') for k in scanned]
+    oval = [bool(ld['flags'].get(k, 0) & BOX_FLAGS_SHAPE_OVAL) for k in scanned]
+    zoom_names = ["-".join(str(v) for v in list(spc[:2]) + k.split('.')) for k in scanned]
+    tcorners, corners, total, black, zoom_files = process.measure_boxes(boxes, prop, oval=oval, zoom_names=zoom_names)
+    boxes_scan = AMCBoxStore.from_corners(tcorners)
+    corners_test = AMCBoxStore.from_corners(corners)
+    for i, k in enumerate(scanned):
+        ld['boxes.scan'][k] = boxes_scan.box(i)
+        ld['corners.test'][k] = corners_test.box(i)
+        ld['darkness.data'][k] = [int(total[i]), int(black[i])]
+        if zoom_files and zoom_files[i]:
+            ld['zoom.file'][k] = zoom_files[i]
+
 def global_error(scans):
     global data_dir, unlink_on_global_err
 
@@ -416,16 +457,18 @@ def command_transf(process, c, *args):
     """
     lines = process.commande(" ".join(args))
     for ln in lines:
-        # e.g. parse "a=xx" or "MSE=xxx"
-        pass
+        m = re.match(r"^([a-f])=(\S+)", ln)
+        if m:
+            setattr(c, 't_' + m.group(1), float(m.group(2)))
+        m = re.match(r"^MSE=(\S+)", ln)
+        if m:
+            c.MSE = float(m.group(1))
 
 def marks_fit(process, ld, three=False):
     global cale
-    cale = AMCCalage()
-    # command_transf => "optim" + "3" if three => ld['frame'].draw_points()
-    # We'll skip for brevity
-    # Then ld['transf'] = cale
-    ld['transf'] = {'some': 'transformation'}
+    cale = AMCCalage(log=False)
+    command_transf(process, cale, "optim" + ("3" if three else ""), ld['frame'].draw_points())
+    ld['transf'] = cale
 
 def marks_fit_and_id(process, random_layout, data_layout, three=False):
     marks_fit(process, random_layout, three)
@@ -436,8 +479,9 @@ def marks_fit_and_id(process, random_layout, data_layout, three=False):
 def get_layout_data(layout_obj, student, page, all_):
     """
     In Perl: returns a dictionary with boxes, flags, corners.test, etc.
-    We'll produce a partial stub.
+    We'll produce a partial stub. The boxes of the page share one AMCBoxStore.
     """
+    store = AMCBoxStore()
     r = {
         'corners.test': {},
         'zoom.file': {},
@@ -447,20 +491,20 @@ def get_layout_data(layout_obj, student, page, all_):
     }
     # dims => (width, height, markdiameter, undef)
     r['width'], r['height'], r['markdiameter'], _ = layout_obj.dims(student, page)
-    r['frame'] = AMCBox.new_complete(layout_obj.all_marks(student, page))
+    r['frame'] = AMCBox.new_complete(*layout_obj.all_marks(student, page))
     # example for digit:
     for c in layout_obj.type_info('digit', student, page):
         k = code_cb(c['numberid'], c['digitid'])
-        r['boxes'][k] = AMCBox.new_MN([c['xmin'], c['ymin'], c['xmax'], c['ymax']])
+        r['boxes'][k] = store.new_MN(c['xmin'], c['ymin'], c['xmax'], c['ymax'])
         r['flags'][k] = 0
     if all_:
         # gather box, namefield, etc.
         for c in layout_obj.type_info('box', student, page):
             k2 = f"{c['question']}.{c['answer']}"
-            r['boxes'][k2] = AMCBox.new_MN([c['xmin'], c['ymin'], c['xmax'], c['ymax']])
+            r['boxes'][k2] = store.new_MN(c['xmin'], c['ymin'], c['xmax'], c['ymax'])
             r['flags'][k2] = c['flags']
         for c in layout_obj.type_info('namefield', student, page):
-            r['boxes']['namefield'] = AMCBox.new_MN([c['xmin'], c['ymin'], c['xmax'], c['ymax']])
+            r['boxes']['namefield'] = store.new_MN(c['xmin'], c['ymin'], c['xmax'], c['ymax'])
     return r
 
 def one_scan(scan, allocate, id_only):
@@ -513,7 +557,7 @@ def one_scan(scan, allocate, id_only):
     if debug_pixels:
         process_args.append('-k')
 
-    process = AMCSubprocessStub(mode='detect', args=process_args)
+    process = AMCDetect.from_args(process_args)
 
     # e.g. lines = process.commande(f"load {scan}")
     lines = process.commande(f"load {scan}")
@@ -560,7 +604,7 @@ def one_scan(scan, allocate, id_only):
             error(m, process=process, scan=scan, register_failed=sf if nmarks else '')
             return
 
-    cadre_general = AMCBox.new_complete(coords)
+    cadre_general = AMCBox.new_complete(*coords)
     debug("Global frame:", cadre_general.txt())
 
     # ID detection
@@ -629,10 +673,8 @@ def one_scan(scan, allocate, id_only):
 
     process.commande(f"zooms {zoom_dir}")
 
-    # Read darkness data from all boxes
-    for k in ld['boxes']:
-        if re.match(r'^\d+\.\d+$', k):
-            measure_box(process, ld, k, *spc)
+    # Read darkness data from all boxes, in one pass
+    measure_boxes(process, ld, [k for k in ld['boxes'] if re.match(r'^\d+\.\d+$', k)], *spc)
 
     if debug_image_local:
         error("End of diagnostic", silent=True, process=process, scan=scan)
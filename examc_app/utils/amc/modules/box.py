@@ -3,10 +3,16 @@
 
 """
 Translation of the AMC::Boite Perl module into Python 3.
+
+The corners of the boxes are kept in NumPy arrays: an AMCBoxStore holds all the
+boxes of a page in one (N, 4, 2) array with vectorized geometry, and AMCBox
+objects are views over one row of a store.
 """
 
 import math
 
+import numpy as np
+
 
 # ------------------------------------------------------------------------------
 # Placeholder debug function. Replace with logging if desired.
@@ -51,31 +57,175 @@ def amc_min(*values):
     return m
 
 
+# Directions of the top-left, top-right, bottom-right and bottom-left extremes
+EXTREME_DIRECTIONS = np.array([(1, 1), (-1, 1), (-1, -1), (1, -1)], dtype=np.float64)
+
+
+class AMCBoxStore:
+    """
+    Corners of many boxes (e.g. all the boxes of a page) in one (N, 4, 2) array,
+    with vectorized geometry. Methods taking indexes work on all the boxes by default.
+    """
+
+    __slots__ = ('corners', 'droite', 'count')
+
+    def __init__(self, capacity=0):
+        self.corners = np.zeros((capacity, 4, 2), dtype=np.float64)
+        self.droite = np.ones(capacity, dtype=bool)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def _reserve(self, n):
+        if self.count + n <= len(self.corners):
+            return
+        capacity = max(2 * len(self.corners), self.count + n, 8)
+        corners = np.zeros((capacity, 4, 2), dtype=np.float64)
+        droite = np.ones(capacity, dtype=bool)
+        corners[:self.count] = self.corners[:self.count]
+        droite[:self.count] = self.droite[:self.count]
+        self.corners = corners
+        self.droite = droite
+
+    def extend(self, corners, droite=True):
+        """Add (N, 4, 2) corners, return the range of their indexes."""
+        corners = np.asarray(corners, dtype=np.float64).reshape(-1, 4, 2)
+        self._reserve(len(corners))
+        start = self.count
+        self.corners[start:start + len(corners)] = corners
+        self.droite[start:start + len(corners)] = droite
+        self.count += len(corners)
+        return range(start, self.count)
+
+    @classmethod
+    def from_corners(cls, corners, droite=False):
+        store = cls(len(corners))
+        store.extend(corners, droite)
+        return store
+
+    @classmethod
+    def from_xy(cls, boxes):
+        """Store of the straight boxes given as an (N, 4) array of xmin, xmax, ymin, ymax."""
+        xmin, xmax, ymin, ymax = np.asarray(boxes, dtype=np.float64).reshape(-1, 4).T
+        corners = np.stack([
+            np.stack([xmin, ymin], axis=1), np.stack([xmax, ymin], axis=1),
+            np.stack([xmax, ymax], axis=1), np.stack([xmin, ymax], axis=1),
+        ], axis=1)
+        return cls.from_corners(corners, droite=True)
+
+    def box(self, index):
+        return AMCBox(store=self, index=index)
+
+    def boxes(self):
+        return [AMCBox(store=self, index=i) for i in range(self.count)]
+
+    def new_MN(self, x, y, xp, yp):
+        """Add the straight box of corners (x,y) and (xp,yp), return its AMCBox view."""
+        return self.box(self.extend([[x, y], [xp, y], [xp, yp], [x, yp]], True)[0])
+
+    def new_complete(self, xa, ya, xb, yb, xc, yc, xd, yd):
+        """Add a 4 corners box, return its AMCBox view."""
+        return self.box(self.extend([[xa, ya], [xb, yb], [xc, yc], [xd, yd]], False)[0])
+
+    def _rows(self, indexes=None):
+        if indexes is None:
+            return slice(0, self.count)
+        return np.asarray(indexes, dtype=np.intp)
+
+    def centres(self, indexes=None):
+        """(N, 2) centres of the boxes."""
+        return self.corners[self._rows(indexes)].mean(axis=1)
+
+    def etendues_xy(self, indexes=None):
+        """(N, 4) xmin, xmax, ymin, ymax of the boxes."""
+        corners = self.corners[self._rows(indexes)]
+        minimum = corners.min(axis=1)
+        maximum = corners.max(axis=1)
+        return np.stack([minimum[:, 0], maximum[:, 0], minimum[:, 1], maximum[:, 1]], axis=1)
+
+    def tailles(self, indexes=None):
+        """(N, 2) width and height of the boxes."""
+        corners = self.corners[self._rows(indexes)]
+        return corners.max(axis=1) - corners.min(axis=1)
+
+    def diametres(self, indexes=None):
+        return self.tailles(indexes).mean(axis=1)
+
+    def bonnes_etendues(self, dmin, dmax, indexes=None):
+        """Boolean array of the boxes whose width and height are between dmin and dmax."""
+        sizes = self.tailles(indexes)
+        return ((sizes >= dmin) & (sizes <= dmax)).all(axis=1)
+
+    def directions(self, i, j, indexes=None):
+        """Angles of corner j relative to corner i of the boxes."""
+        corners = self.corners[self._rows(indexes)]
+        delta = corners[:, j] - corners[:, i]
+        return np.arctan2(delta[:, 1], delta[:, 0])
+
+    def transforme(self, transf, indexes=None):
+        """Apply an AMCCalage transform to the boxes at once."""
+        rows = self._rows(indexes)
+        self.corners[rows] = transf.transforme_points(self.corners[rows])
+        self.droite[rows] = False
+
+    def extremes(self, indexes=None):
+        """Indexes of the top-left, top-right, bottom-right and bottom-left boxes."""
+        rows = np.arange(self.count) if indexes is None else self._rows(indexes)
+        projections = self.centres(rows) @ EXTREME_DIRECTIONS.T
+        return [int(rows[k]) for k in projections.argmin(axis=0)]
+
+
 class AMCBox:
     """
     Python translation of the AMC::Boite package.
+    The corners are a (4, 2) view over a row of an AMCBoxStore.
     """
 
-    def __init__(self, **kwargs):
+    __slots__ = ('store', 'index', 'point_actuel')
+
+    def __init__(self, store=None, index=None, **kwargs):
         """
         Equivalent to 'sub new { ... }' in Perl.
         Creates a new box object with default attributes, 
         then merges any given kwargs if they match known keys.
+        Without a store, the box gets a store of its own.
         """
         # In Perl: 
         #   my $self = { coins => [[], [], [], []], droite => 1, ...}
         #   bless $self;
-        self.coins = [[], [], [], []]  # four corners
-        self.droite = 1  # whether the box is "straight" (aligned)
+        if store is None:
+            store = AMCBoxStore(1)
+            index = store.extend(np.zeros((4, 2)), True)[0]
+        self.store = store
+        self.index = index
 
         # Additional ephemeral attribute
         self.point_actuel = 0
 
         # Merge recognized keys from **kwargs
         for k in kwargs:
-            if hasattr(self, k):
+            if k in ('coins', 'droite'):
                 setattr(self, k, kwargs[k])
 
+    @property
+    def coins(self):
+        """The four corners, a (4, 2) view over the store."""
+        return self.store.corners[self.index]
+
+    @coins.setter
+    def coins(self, value):
+        self.store.corners[self.index] = value
+
+    @property
+    def droite(self):
+        """Whether the box is "straight" (aligned)."""
+        return int(self.store.droite[self.index])
+
+    @droite.setter
+    def droite(self, value):
+        self.store.droite[self.index] = bool(value)
+
     def clone(self):
         """
         Equivalent to sub clone: make a copy of the box object.
@@ -86,10 +236,7 @@ class AMCBox:
         #   droite => $self->{droite}
         # };
         # bless $s;
-        new_boite = AMCBox()
-        new_boite.coins = [corner[:] for corner in self.coins]  # deep copy each corner
-        new_boite.droite = self.droite
-        return new_boite
+        return AMCBox(coins=self.coins.copy(), droite=self.droite)
 
     def def_point_suivant(self, x, y):
         """
@@ -359,7 +506,7 @@ class AMCBox:
         # So let's replicate that logic by repeating the last corner or first corner?
         # The original code: for my $i (0..4) { $c .= " ". join(" ", @{ $self->{coins}->[$i] }) }
         # Possibly it repeated coin[0] at the end. We'll do that.
-        coords = self.coins + [self.coins[0]]
+        coords = list(self.coins) + [self.coins[0]]
         c = f"mesure {prop}"
         for corner in coords:
             c += " " + " ".join(f"{val}" for val in corner)
@@ -383,12 +530,8 @@ class AMCBox:
         """
         Equivalent to sub centre in Perl: returns the center (average of corners).
         """
-        x_sum = 0.0
-        y_sum = 0.0
-        for i in range(4):
-            x_sum += self.coins[i][0]
-            y_sum += self.coins[i][1]
-        return (x_sum / 4.0, y_sum / 4.0)
+        cx, cy = self.coins.mean(axis=0)
+        return (float(cx), float(cy))
 
     def centre_projete(self, ux, uy):
         """
@@ -398,63 +541,6 @@ class AMCBox:
         (cx, cy) = self.centre()
         return cx * ux + cy * uy
 
-    # --------------------------------------------------------------------------
-    # Sorting a list of boxes by projected center
-    # --------------------------------------------------------------------------
-
-
-def tri_dir(x, y, boites):
-    """
-    Equivalent to sub tri_dir in Perl: 
-    Sort box list by center_projete(x, y).
-    """
-    boites.sort(key=lambda b: b.centre_projete(x, y))
-
-
-def extremes(boites):
-    """
-    Equivalent to sub extremes in Perl:
-    Among a list of boxes, return the 4 extreme ones: 
-    HG, HD, BD, BG (top-left, top-right, bottom-right, bottom-left).
-    This is done by sorting the list in different directions and picking 
-    the first item each time. 
-    """
-    if not boites:
-        debug("Warning: Empty list in [extremes] call")
-        return []
-
-    # 1) tri_dir(1,1)
-    tri_dir(1, 1, boites)
-    hg = boites[0]
-    # 2) tri_dir(-1,1)
-    tri_dir(-1, 1, boites)
-    hd = boites[0]
-    # 3) tri_dir(-1,-1)
-    tri_dir(-1, -1, boites)
-    bd = boites[0]
-    # 4) tri_dir(1,-1)
-    tri_dir(1, -1, boites)
-    bg = boites[0]
-
-    return [hg, hd, bd, bg]
-
-
-def centres_extremes(boites):
-    """
-    Equivalent to sub centres_extremes in Perl:
-    Returns the centers of the extremes in the order [hg, hd, bd, bg].
-    """
-    ex = extremes(boites)
-    return [coord for b in ex for coord in b.centre()]
-
-
-class AMCBox:
-    """
-    The AMCBox class continues...
-    """
-
-    # continuing from above inside AMCBox for the rest:
-
     def direction(self, i, j):
         """
         Equivalent to sub direction in Perl:
@@ -502,23 +588,8 @@ class AMCBox:
         - 'ymax' => just ymax
         - else => (width, height)
         """
-        c0 = self.coins[0]
-        xmin = c0[0]
-        ymin = c0[1]
-        xmax = c0[0]
-        ymax = c0[1]
-
-        for i in range(1, 4):
-            x = self.coins[i][0]
-            y = self.coins[i][1]
-            if x > xmax:
-                xmax = x
-            if x < xmin:
-                xmin = x
-            if y > ymax:
-                ymax = y
-            if y < ymin:
-                ymin = y
+        xmin, ymin = (float(v) for v in self.coins.min(axis=0))
+        xmax, ymax = (float(v) for v in self.coins.max(axis=0))
 
         if mode == 'xml':
             return f'xmin="{xmin:.2f}" xmax="{xmax:.2f}" ymin="{ymin:.2f}" ymax="{ymax:.2f}"'
@@ -558,7 +629,7 @@ class AMCBox:
         Return x and/or y of corner i, depending on 'c' pattern.
         For example 'xy' => (x_i, y_i), 'x' => x_i, 'y' => y_i, etc.
         """
-        x_i, y_i = self.coins[i]
+        x_i, y_i = (float(v) for v in self.coins[i])
         r = []
         if 'x' in c.lower():
             r.append(x_i)
@@ -585,17 +656,67 @@ class AMCBox:
     def transforme(self, transf):
         """
         Equivalent to sub transforme in Perl:
-        for each corner, apply transf->transforme(x, y). 
+        apply transf->transforme(x, y) to the 4 corners at once.
         Then set self->droite=0.
         """
-        for i in range(4):
-            x, y = self.coins[i]
-            xp, yp = transf.transforme(x, y)  # see AMC::Calage
-            self.coins[i] = [xp, yp]
+        self.coins = transf.transforme_points(self.coins)  # see AMC::Calage
         self.droite = 0
         return self
 
 
+# --------------------------------------------------------------------------
+# Sorting a list of boxes by projected center
+# --------------------------------------------------------------------------
+
+
+def _centres(boites):
+    """(N, 2) centres of a list of boxes, in one pass when they share a store."""
+    stores = {id(b.store) for b in boites}
+    if len(stores) == 1:
+        return boites[0].store.centres([b.index for b in boites])
+    return np.array([b.centre() for b in boites], dtype=np.float64).reshape(-1, 2)
+
+
+def etendues_xy(boites):
+    """(N, 4) xmin, xmax, ymin, ymax of a list of boxes, in one pass when they share a store."""
+    stores = {id(b.store) for b in boites}
+    if len(stores) == 1:
+        return boites[0].store.etendues_xy([b.index for b in boites])
+    return np.array([b.etendue_xy('xy') for b in boites], dtype=np.float64).reshape(-1, 4)
+
+
+def tri_dir(x, y, boites):
+    """
+    Equivalent to sub tri_dir in Perl: 
+    Sort box list by center_projete(x, y).
+    """
+    order = np.argsort(_centres(boites) @ np.array([x, y], dtype=np.float64), kind='stable')
+    boites[:] = [boites[i] for i in order]
+
+
+def extremes(boites):
+    """
+    Equivalent to sub extremes in Perl:
+    Among a list of boxes, return the 4 extreme ones: 
+    HG, HD, BD, BG (top-left, top-right, bottom-right, bottom-left),
+    the first box of the list in each direction.
+    """
+    if not boites:
+        debug("Warning: Empty list in [extremes] call")
+        return []
+
+    projections = _centres(boites) @ EXTREME_DIRECTIONS.T
+    return [boites[i] for i in projections.argmin(axis=0)]
+
+
+def centres_extremes(boites):
+    """
+    Equivalent to sub centres_extremes in Perl:
+    Returns the centers of the extremes in the order [hg, hd, bd, bg].
+    """
+    ex = extremes(boites)
+    return [coord for b in ex for coord in b.centre()]
+
 # We place the top-level amc_max, amc_min, tri_dir, extremes, centres_extremes in the same file 
 # for convenience. They correspond to `@EXPORT_OK = qw(&max &min);` plus the subroutines 
 # tri_dir, extremes, centres_extremes in the Perl code.
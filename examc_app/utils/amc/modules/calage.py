@@ -1,11 +1,56 @@
 import math
 
+import numpy as np
+
 from examc_app.utils.amc.modules.basic import debug
 
 
+def _design_matrices(cx, cy, transform_type):
+    """
+    Least squares design matrices of the (..., n) layout points, for parameters
+    (a, b, e, c, d, f) of a linear transform or (p, q, e, f) of a Helmert one.
+    """
+    ones = np.ones_like(cx)
+    zeros = np.zeros_like(cx)
+    if transform_type.lower().startswith('h'):
+        # x' = p x - q y + e, y' = q x + p y + f
+        rows_x = np.stack([cx, -cy, ones, zeros], axis=-1)
+        rows_y = np.stack([cy, cx, zeros, ones], axis=-1)
+    else:
+        rows_x = np.stack([cx, cy, ones, zeros, zeros, zeros], axis=-1)
+        rows_y = np.stack([zeros, zeros, zeros, cx, cy, ones], axis=-1)
+    return np.concatenate([rows_x, rows_y], axis=-2)
+
+
+def _solution_params(solution, transform_type):
+    """Return the (..., 6) parameters a, b, c, d, e, f of least squares solutions."""
+    if transform_type.lower().startswith('h'):
+        p, q, e, f = np.moveaxis(solution, -1, 0)
+        return np.stack([p, -q, q, p, e, f], axis=-1)
+    a, b, e, c, d, f = np.moveaxis(solution, -1, 0)
+    return np.stack([a, b, c, d, e, f], axis=-1)
+
+
+def calage_batch(cx, cy, cxp, cyp, transform_type='lineaire'):
+    """
+    Fit the transforms of many pages at once. cx, cy, cxp, cyp are (P, n) arrays of
+    the layout and scan points of P pages. Return a (P, 7) array of the parameters
+    a, b, c, d, e, f and MSE of each page transform (see AMCCalage.calage).
+    """
+    cx, cy, cxp, cyp = (np.asarray(v, dtype=np.float64) for v in (cx, cy, cxp, cyp))
+    design = _design_matrices(cx, cy, transform_type)
+    targets = np.concatenate([cxp, cyp], axis=-1)[..., None]
+    solution = (np.linalg.pinv(design) @ targets)[..., 0]
+    residuals = (design @ solution[..., None])[..., 0] - targets[..., 0]
+    mse = np.sqrt((residuals ** 2).sum(axis=-1) / cx.shape[-1])
+    return np.concatenate([_solution_params(solution, transform_type), mse[..., None]], axis=-1)
+
+
 class AMCCalage:
     """
     Python translation of the Perl package AMC::Calage.
+
+    Points may be given as scalars, lists or NumPy arrays; fits are solved by least squares.
     """
 
     # Equivalent constants
@@ -78,9 +123,10 @@ class AMCCalage:
         Translated from 'sub moyenne' in Perl.
         Returns the mean of the elements in arr.
         """
-        if not arr:
+        arr = np.asarray(arr, dtype=np.float64)
+        if arr.size == 0:
             return 0.0
-        return sum(arr) / len(arr)
+        return float(arr.mean())
 
     @staticmethod
     def crochet(a, b):
@@ -88,12 +134,11 @@ class AMCCalage:
         Translated from 'sub crochet' in Perl.
         Computation of the 'cross' measure used in the code.
         """
-        ma = AMCCalage.moyenne(a)
-        mb = AMCCalage.moyenne(b)
-        s = 0.0
-        for i in range(len(a)):
-            s += (a[i] - ma) * (b[i] - mb)
-        return s / len(a) if len(a) > 0 else 0.0
+        a = np.asarray(a, dtype=np.float64)
+        b = np.asarray(b, dtype=np.float64)
+        if a.size == 0:
+            return 0.0
+        return float(((a - a.mean()) * (b - b.mean())).mean())
 
     @staticmethod
     def resoud_22(a, b, c, d, e, f):
@@ -122,7 +167,7 @@ class AMCCalage:
     def transforme(self, x, y, nominmax=False):
         """
         Translated from 'sub transforme' in Perl.
-        Applies the linear (or Helmert) transformation to (x,y).
+        Applies the linear (or Helmert) transformation to (x,y), scalars or arrays.
         Updates the bounding box unless nominmax=True.
         """
         if self.type.lower().startswith('h') or self.type.lower().startswith('l'):
@@ -132,91 +177,40 @@ class AMCCalage:
             # Default to identity if unknown type, or raise an error
             xp, yp = x, y
 
-        if not nominmax:
-            if xp < self.t_x_min:
-                self.t_x_min = xp
-            if yp < self.t_y_min:
-                self.t_y_min = yp
-            if xp > self.t_x_max:
-                self.t_x_max = xp
-            if yp > self.t_y_max:
-                self.t_y_max = yp
+        if not nominmax and np.size(xp):
+            self.t_x_min = min(self.t_x_min, float(np.min(xp)))
+            self.t_y_min = min(self.t_y_min, float(np.min(yp)))
+            self.t_x_max = max(self.t_x_max, float(np.max(xp)))
+            self.t_y_max = max(self.t_y_max, float(np.max(yp)))
 
         return xp, yp
 
+    def transforme_points(self, points, nominmax=False):
+        """
+        Applies the transformation to an (..., 2) array of points in one call.
+        Returns an array of the same shape.
+        """
+        points = np.asarray(points, dtype=np.float64)
+        xp, yp = self.transforme(points[..., 0], points[..., 1], nominmax=nominmax)
+        return np.stack([xp, yp], axis=-1)
+
     def calage(self, cx, cy, cxp, cyp):
         """
         Translated from 'sub calage' in Perl.
         Adjusts the transformation parameters to best match the
         (cx,cy) points to (cxp,cyp) points via either Helmert or
-        linear approach.
+        linear approach, solved by least squares.
         """
-        # We check the transform type
-        if self.type.lower().startswith('h'):
-            # HELMERT
-            theta = math.atan2(
-                self.crochet(cx, cyp) - self.crochet(cxp, cy),
-                self.crochet(cx, cxp) + self.crochet(cy, cyp)
-            )
-            debug(f"theta = {theta * 180.0 / self.M_PI:.3f}\n")
-
-            den = self.crochet(cx, cx) + self.crochet(cy, cy)
-            if abs(math.cos(theta)) > abs(math.sin(theta)):
-                alpha = (self.crochet(cx, cxp) + self.crochet(cy, cyp)) / (den * math.cos(theta))
-            else:
-                alpha = (self.crochet(cx, cyp) - self.crochet(cxp, cy)) / (den * math.sin(theta))
-
-            # If alpha < 0, adjust alpha and theta
-            if alpha < 0:
-                alpha = abs(alpha)
-                if theta > 0:
-                    theta -= self.M_PI
-                else:
-                    theta += self.M_PI
-
-            self.t_e = (
-                    self.moyenne(cxp)
-                    - alpha * (
-                            self.moyenne(cx) * math.cos(theta)
-                            - self.moyenne(cy) * math.sin(theta)
-                    )
-            )
-            self.t_f = (
-                    self.moyenne(cyp)
-                    - alpha * (
-                            self.moyenne(cx) * math.sin(theta)
-                            + self.moyenne(cy) * math.cos(theta)
-                    )
-            )
-
-            debug(f"alpha = {alpha}\n")
-
-            self.t_a = alpha * math.cos(theta)
-            self.t_b = -alpha * math.sin(theta)
-            self.t_c = alpha * math.sin(theta)
-            self.t_d = alpha * math.cos(theta)
-
-        elif self.type.lower().startswith('l'):
-            # LINEAR
-            sxx = self.crochet(cx, cx)
-            sxy = self.crochet(cx, cy)
-            syy = self.crochet(cy, cy)
-
-            sxxp = self.crochet(cx, cxp)
-            syxp = self.crochet(cy, cxp)
-            sxyp = self.crochet(cx, cyp)
-            syyp = self.crochet(cy, cyp)
-
-            self.t_a, self.t_b = self.resoud_22(sxx, sxy, sxy, syy, sxxp, syxp)
-            self.t_e = self.moyenne(cxp) - (
-                    self.t_a * self.moyenne(cx) + self.t_b * self.moyenne(cy)
-            )
-
-            self.t_c, self.t_d = self.resoud_22(sxx, sxy, sxy, syy, sxyp, syyp)
-            self.t_f = self.moyenne(cyp) - (
-                    self.t_c * self.moyenne(cx) + self.t_d * self.moyenne(cy)
-            )
+        cx, cy, cxp, cyp = (np.asarray(v, dtype=np.float64) for v in (cx, cy, cxp, cyp))
 
+        if self.type.lower().startswith('h') or self.type.lower().startswith('l'):
+            design = _design_matrices(cx, cy, self.type)
+            solution = np.linalg.lstsq(design, np.concatenate([cxp, cyp]), rcond=None)[0]
+            (self.t_a, self.t_b, self.t_c, self.t_d,
+             self.t_e, self.t_f) = (float(v) for v in _solution_params(solution, self.type))
+            if self.type.lower().startswith('h'):
+                debug(f"theta = {math.degrees(math.atan2(self.t_c, self.t_a)):.3f}\n")
+                debug(f"alpha = {math.hypot(self.t_a, self.t_c)}\n")
         else:
             debug(f"ERR: invalid type: {self.type}\n")
 
@@ -228,15 +222,12 @@ class AMCCalage:
             )
 
         # Compute MSE
-        sd = 0.0
-        n = len(cx)
-        for i in range(n):
-            x, y = self.transforme(cx[i], cy[i], nominmax=True)
-            dx = x - cxp[i]
-            dy = y - cyp[i]
-            sd += dx * dx + dy * dy
-
-        self.MSE = math.sqrt(sd / n) if n > 0 else 0.0
+        n = cx.size
+        if n > 0:
+            xp, yp = self.transforme(cx, cy, nominmax=True)
+            self.MSE = float(np.sqrt((((xp - cxp) ** 2) + ((yp - cyp) ** 2)).sum() / n))
+        else:
+            self.MSE = 0.0
 
         debug(f"MSE = {self.MSE:.3f}\n")
         if self.log:
@@ -244,6 +235,15 @@ class AMCCalage:
 
         return self.MSE
 
+    @classmethod
+    def from_params(cls, params, transform_type='lineaire'):
+        """Build a transform from the parameters a, b, c, d, e, f and MSE, e.g. a row of calage_batch()."""
+        transf = cls(log=False)
+        transf.type = transform_type
+        (transf.t_a, transf.t_b, transf.t_c, transf.t_d,
+         transf.t_e, transf.t_f, transf.MSE) = (float(v) for v in params)
+        return transf
+
     def params(self):
         """
         Translated from 'sub params' in Perl.
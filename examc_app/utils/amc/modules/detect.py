@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+In-process port of AMC-detect, the image process driven by AMC-analyse.
+
+The scan is loaded once into NumPy arrays (grey levels, black pixels mask and
+its integral image). The corner marks are found among the connected components
+of the black pixels, the layout -> scan transform is fitted with AMCCalage, and
+the darkness of all the boxes of a page is measured in one vectorized pass on
+the integral image. Only oval or rotated boxes are measured one by one on a
+polygon mask.
+
+AMCDetect answers the commands AMC-analyse sends to AMC-detect (load, optim,
+optim3, rotate180, rotateOK, id, zooms, mesure0, output) with the same output
+lines, so the analyze.py port uses it in place of the external process.
+measure_scan() is the picklable entry point for process pools.
+"""
+
+import math
+import os
+import re
+
+import cv2
+import numpy as np
+
+from examc_app.utils.amc.modules.box import EXTREME_DIRECTIONS, AMCBoxStore
+from examc_app.utils.amc.modules.calage import AMCCalage
+
+# Fraction of black pixels under which a page without marks is reported as blank
+BLANK_PAGE_DARKNESS = 0.002
+
+# Filled proportion of the bounding square of a corner mark: a disc fills pi/4, a filled box 1
+MARK_FILL_RANGE = (0.6, 0.9)
+
+# Boxes whose measured corners are less than this many pixels away from an axis-aligned
+# rectangle are measured on the integral image
+ALIGNED_TOLERANCE = 1.0
+
+# Margin around the box for zoom images, as a proportion of the box size
+ZOOM_MARGIN = 0.3
+
+
+def extreme_points(points):
+    """
+    Return the indexes of the top-left, top-right, bottom-right and bottom-left points
+    of an (N, 2) array, as AMCBoxStore.extremes() does with boxes centres.
+    """
+    return [int(i) for i in (np.asarray(points, dtype=np.float64) @ EXTREME_DIRECTIONS.T).argmin(axis=0)]
+
+
+def complete_three_marks(points):
+    """
+    Return the 4 corners of the parallelogram of 3 corner marks: the missing mark is
+    opposite to the mark with the angle closest to a right angle.
+    """
+    best = None
+    for i in range(3):
+        u = points[(i + 1) % 3] - points[i]
+        v = points[(i + 2) % 3] - points[i]
+        cosine = abs(float(u @ v)) / max(float(np.linalg.norm(u) * np.linalg.norm(v)), 1e-9)
+        if best is None or cosine < best[0]:
+            best = (cosine, i)
+    i = best[1]
+    missing = points[(i + 1) % 3] + points[(i + 2) % 3] - points[i]
+    return np.vstack([points, missing])
+
+
+def parse_points(text):
+    """Parse "x0,y0 x1,y1 ..." into an (N, 2) array."""
+    return np.array([[float(v) for v in point.split(',')] for point in text.split()], dtype=np.float64)
+
+
+class AMCDetect:
+    """
+    Corner marks detection and boxes measurement of a scan, with the command interface
+    of the AMC-detect process (commande / ferme_commande).
+    """
+
+    def __init__(self, width, height, markdiameter, tol_plus=0.2, tol_minus=0.2, marks_min=3,
+                 bw_threshold=0.6, ignore_red=False, debug_image=None):
+        self.width = float(width)
+        self.height = float(height)
+        self.markdiameter = float(markdiameter)
+        self.tol_plus = float(tol_plus)
+        self.tol_minus = float(tol_minus)
+        self.marks_min = int(marks_min)
+        self.bw_threshold = float(bw_threshold)
+        self.ignore_red = ignore_red
+        self.debug_image = debug_image
+
+        self.gray = None
+        self.black = None
+        self.integral = None
+        self.frame = None
+        self.transf = AMCCalage(log=False)
+        self.zooms_dir = None
+        self.box_id = None
+        self.measured = []
+
+    @classmethod
+    def from_args(cls, args):
+        """Create the detector from the AMC-detect command line arguments built by AMC-analyse."""
+        options = {}
+        flags = set()
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            if arg in ('-x', '-y', '-d', '-p', '-m', '-c', '-t', '-o') and i + 1 < len(args):
+                options[arg] = args[i + 1]
+                i += 2
+            else:
+                flags.add(arg)
+                i += 1
+        debug_image = options.get('-o')
+        return cls(
+            options['-x'], options['-y'], options['-d'],
+            tol_plus=options.get('-p', 0.2),
+            tol_minus=options.get('-m', 0.2),
+            marks_min=options.get('-c', 3),
+            bw_threshold=options.get('-t', 0.6),
+            ignore_red='-r' in flags,
+            debug_image=debug_image if debug_image not in (None, '1') else None,
+        )
+
+    # ------------------------------------------------------------------
+    # Image
+    # ------------------------------------------------------------------
+
+    def load(self, scan_path):
+        """Load the scan and detect its corner marks. Return the AMC-detect output lines."""
+        image = cv2.imread(scan_path, cv2.IMREAD_COLOR)
+        if image is None:
+            return ["! LOAD: Unable to load image %s." % scan_path]
+        if self.ignore_red:
+            # red ink disappears in the red channel
+            gray = image[:, :, 2]
+        else:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        self.set_image(gray)
+        return self.detect_marks()
+
+    def set_image(self, gray):
+        self.gray = np.ascontiguousarray(gray)
+        self.black = (self.gray < self.bw_threshold * 255).astype(np.uint8)
+        self.integral = cv2.integral(self.black, sdepth=cv2.CV_32S)
+        self.frame = None
+        self.measured = []
+
+    def rotate180(self):
+        self.set_image(np.rot90(self.gray, 2))
+        return self.detect_marks()
+
+    def detect_marks(self):
+        image_height, image_width = self.black.shape
+        diameter = self.markdiameter * 0.5 * (image_width / self.width + image_height / self.height)
+        dmin = diameter * (1 - self.tol_minus)
+        dmax = diameter * (1 + self.tol_plus)
+
+        count, labels, stats, centroids = cv2.connectedComponentsWithStats(self.black, connectivity=8)
+        widths = stats[1:, cv2.CC_STAT_WIDTH]
+        heights = stats[1:, cv2.CC_STAT_HEIGHT]
+        areas = stats[1:, cv2.CC_STAT_AREA]
+        is_mark = ((widths >= dmin) & (widths <= dmax) & (heights >= dmin) & (heights <= dmax)
+                   & (areas >= MARK_FILL_RANGE[0] * widths * heights)
+                   & (areas <= MARK_FILL_RANGE[1] * widths * heights))
+        candidates = centroids[1:][is_mark]
+
+        marks = None
+        if len(candidates) >= 3:
+            corners = candidates[sorted(set(extreme_points(candidates)))]
+            if len(corners) == 4:
+                marks = corners
+            elif len(corners) == 3 and self.marks_min <= 3:
+                marks = complete_three_marks(corners)
+        if marks is None:
+            if len(candidates) == 0 and self.black.mean() < BLANK_PAGE_DARKNESS:
+                return ["! MAYBE_BLANK: This page seems to be blank."]
+            return ["! NMARKS: Not enough corner marks detected."]
+
+        self.frame = marks[extreme_points(marks)]
+        return ["Frame[%d]: %.3f ; %.3f" % (i, x, y) for i, (x, y) in enumerate(self.frame)]
+
+    # ------------------------------------------------------------------
+    # Transform
+    # ------------------------------------------------------------------
+
+    def optim(self, layout_points, three=False):
+        """
+        Fit the layout -> scan transform on the corner marks. With three, the fit uses the
+        3 marks giving the transform closest to a similarity, as one mark may be hidden.
+        """
+        if self.frame is None:
+            return ["! NMARKS: Not enough corner marks detected."]
+        layout_points = np.asarray(layout_points, dtype=np.float64)
+        subsets = [list(range(4))]
+        if three:
+            subsets = [[i for i in range(4) if i != dropped] for dropped in range(4)]
+
+        best = None
+        for subset in subsets:
+            transf = AMCCalage(log=False)
+            transf.calage(list(layout_points[subset, 0]), list(layout_points[subset, 1]),
+                          list(self.frame[subset, 0]), list(self.frame[subset, 1]))
+            distortion = abs(transf.t_a - transf.t_d) + abs(transf.t_b + transf.t_c)
+            if best is None or distortion < best[0]:
+                best = (distortion, transf)
+        self.transf = best[1]
+        return self.transf_lines()
+
+    def transf_lines(self):
+        t = self.transf
+        return ["a=%.12g" % t.t_a, "b=%.12g" % t.t_b, "c=%.12g" % t.t_c, "d=%.12g" % t.t_d,
+                "e=%.12g" % t.t_e, "f=%.12g" % t.t_f, "MSE=%.12g" % t.MSE]
+
+    # ------------------------------------------------------------------
+    # Boxes measurement
+    # ------------------------------------------------------------------
+
+    def measure_boxes(self, boxes, prop, oval=None, zoom_names=None):
+        """
+        Measure the darkness of layout boxes, given as an (N, 4) array of xmin, xmax,
+        ymin, ymax. oval is an optional (N,) boolean array of oval shaped boxes.
+
+        Return (transformed box corners (N, 4, 2), measured zone corners (N, 4, 2),
+        total pixels (N,), black pixels (N,), zoom file names or None).
+        """
+        tcorners = self.transf.transforme_points(AMCBoxStore.from_xy(boxes).corners, nominmax=True)
+        centres = tcorners.mean(axis=1, keepdims=True)
+        corners = centres + float(prop) * (tcorners - centres)
+        count = len(corners)
+        total = np.zeros(count, dtype=np.int64)
+        black = np.zeros(count, dtype=np.int64)
+        if count == 0:
+            return tcorners, corners, total, black, None
+        oval = np.zeros(count, dtype=bool) if oval is None else np.asarray(oval, dtype=bool)
+        image_height, image_width = self.black.shape
+
+        # axis-aligned zones: rectangle sums on the integral image, all boxes at once
+        left = np.ceil((corners[:, 0, 0] + corners[:, 3, 0]) / 2)
+        right = np.ceil((corners[:, 1, 0] + corners[:, 2, 0]) / 2)
+        top = np.ceil((corners[:, 0, 1] + corners[:, 1, 1]) / 2)
+        bottom = np.ceil((corners[:, 2, 1] + corners[:, 3, 1]) / 2)
+        skew = np.maximum.reduce([
+            np.abs(corners[:, 0, 0] - corners[:, 3, 0]), np.abs(corners[:, 1, 0] - corners[:, 2, 0]),
+            np.abs(corners[:, 0, 1] - corners[:, 1, 1]), np.abs(corners[:, 3, 1] - corners[:, 2, 1]),
+        ])
+        aligned = (skew < ALIGNED_TOLERANCE) & ~oval
+
+        x0 = np.clip(left, 0, image_width).astype(np.int64)[aligned]
+        x1 = np.clip(right, 0, image_width).astype(np.int64)[aligned]
+        y0 = np.clip(top, 0, image_height).astype(np.int64)[aligned]
+        y1 = np.clip(bottom, 0, image_height).astype(np.int64)[aligned]
+        x1 = np.maximum(x0, x1)
+        y1 = np.maximum(y0, y1)
+        integral = self.integral
+        total[aligned] = (x1 - x0) * (y1 - y0)
+        black[aligned] = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+
+        # oval or rotated zones: pixels inside the shape, box by box
+        for i in np.flatnonzero(~aligned):
+            total[i], black[i] = self._measure_shape(corners[i], oval[i])
+
+        zoom_files = None
+        if self.zooms_dir:
+            zoom_files = [self._write_zoom(tcorners[i], zoom_names[i] if zoom_names else "%d" % i)
+                          for i in range(count)]
+        self.measured.extend(corners)
+        return tcorners, corners, total, black, zoom_files
+
+    def _measure_shape(self, corners, oval):
+        """
+        Count the pixels whose centre is inside the zone, and the black ones. As on the
+        integral image, the top and left edges are inside, the right and bottom ones not.
+        """
+        image_height, image_width = self.black.shape
+        x_min = max(int(math.ceil(corners[:, 0].min())), 0)
+        y_min = max(int(math.ceil(corners[:, 1].min())), 0)
+        x_max = min(int(math.ceil(corners[:, 0].max())), image_width)
+        y_max = min(int(math.ceil(corners[:, 1].max())), image_height)
+        if x_max <= x_min or y_max <= y_min:
+            return 0, 0
+        ys, xs = np.mgrid[y_min:y_max, x_min:x_max]
+        points = np.stack([xs, ys], axis=-1).astype(np.float64)
+        if oval:
+            # the ellipse inscribed in the zone, in the coordinates of its half sides
+            half_sides = np.column_stack([corners[1] - corners[0], corners[3] - corners[0]]) / 2
+            local = (points - corners.mean(axis=0)) @ np.linalg.inv(half_sides).T
+            mask = (local ** 2).sum(axis=-1) < 1
+        else:
+            edges = np.roll(corners, -1, axis=0) - corners
+            orientation = np.sign(edges[0, 0] * edges[1, 1] - edges[0, 1] * edges[1, 0]) or 1.0
+            crosses = orientation * (edges[:, 0] * (points[..., None, 1] - corners[:, 1])
+                                     - edges[:, 1] * (points[..., None, 0] - corners[:, 0]))
+            mask = (crosses[..., [0, 3]] >= 0).all(axis=-1) & (crosses[..., [1, 2]] > 0).all(axis=-1)
+        black = self.black[y_min:y_max, x_min:x_max].astype(bool)
+        return int(np.count_nonzero(mask)), int(np.count_nonzero(mask & black))
+
+    def _write_zoom(self, tcorners, name):
+        image_height, image_width = self.gray.shape
+        size = tcorners.max(axis=0) - tcorners.min(axis=0)
+        x_min, y_min = np.maximum(np.floor(tcorners.min(axis=0) - ZOOM_MARGIN * size), 0).astype(int)
+        x_max, y_max = np.ceil(tcorners.max(axis=0) + ZOOM_MARGIN * size).astype(int)
+        x_max, y_max = min(x_max, image_width), min(y_max, image_height)
+        if x_max <= x_min or y_max <= y_min:
+            return None
+        zoom_file = name + ".png"
+        cv2.imwrite(os.path.join(self.zooms_dir, zoom_file), self.gray[y_min:y_max, x_min:x_max])
+        return zoom_file
+
+    def write_output(self, output_path):
+        """Write the scan with the detected frame and the measured zones drawn on it."""
+        image = cv2.cvtColor(self.gray, cv2.COLOR_GRAY2BGR)
+        if self.frame is not None:
+            cv2.polylines(image, [np.rint(self.frame).astype(np.int32)], True, (0, 0, 255), 2)
+        if self.measured:
+            cv2.polylines(image, list(np.rint(np.array(self.measured)).astype(np.int32)), True, (255, 0, 0), 1)
+        cv2.imwrite(output_path, image)
+
+    # ------------------------------------------------------------------
+    # AMC-detect command interface
+    # ------------------------------------------------------------------
+
+    def commande(self, cmd):
+        """Run an AMC-detect command and return its output lines."""
+        name, _, args = cmd.strip().partition(' ')
+        if name == 'load':
+            return self.load(args)
+        if name == 'rotate180':
+            return self.rotate180()
+        if name in ('optim', 'optim3'):
+            return self.optim(parse_points(args), three=(name == 'optim3'))
+        if name == 'rotateOK':
+            return self.transf_lines()
+        if name == 'id':
+            self.box_id = args.split()
+            return []
+        if name == 'zooms':
+            self.zooms_dir = args
+            return []
+        if name == 'output':
+            self.write_output(args)
+            return []
+        if name == 'mesure0':
+            prop, shape, xmin, xmax, ymin, ymax = args.split()
+            zoom_names = ["-".join(self.box_id)] if self.box_id else None
+            tcorners, corners, total, black, zoom_files = self.measure_boxes(
+                [[float(xmin), float(xmax), float(ymin), float(ymax)]], float(prop),
+                oval=[shape == 'oval'], zoom_names=zoom_names)
+            self.box_id = None
+            lines = ["TCORNER %.3f,%.3f" % tuple(point) for point in tcorners[0]]
+            lines += ["COIN %.3f,%.3f" % tuple(point) for point in corners[0]]
+            lines.append("PIX %d %d" % (total[0], black[0]))
+            if zoom_files and zoom_files[0]:
+                lines.append("ZOOM %s" % zoom_files[0])
+            return lines
+        return ["! COMMAND: Unknown command %s." % re.sub(r'\s.*', '', cmd.strip())]
+
+    def ferme_commande(self):
+        if self.debug_image:
+            self.write_output(self.debug_image)
+        self.gray = self.black = self.integral = None
+
+
+def measure_scan(scan_path, width, height, markdiameter, layout_marks, boxes, prop=0.8, oval=None, **options):
+    """
+    Detect the corner marks of a scan and measure the darkness of its layout boxes.
+    Module level and picklable, for process pools.
+
+    layout_marks are the layout (x, y) of the 4 corner marks (top-left, top-right,
+    bottom-right, bottom-left), boxes an (N, 4) array of layout xmin, xmax, ymin, ymax.
+    Return a dict with 'error', or with the scan 'frame', the 'transf' parameters
+    (a, b, c, d, e, f, MSE) and the 'total' and 'black' pixels of the boxes.
+    """
+    detector = AMCDetect(width, height, markdiameter, **options)
+    lines = detector.load(scan_path)
+    if lines and lines[0].startswith('!'):
+        return {'error': lines[0][2:]}
+    detector.optim(layout_marks)
+    tcorners, corners, total, black, zoom_files = detector.measure_boxes(boxes, prop, oval=oval)
+    result = {
+        'frame': detector.frame.tolist(),
+        'transf': detector.transf.params(),
+        'total': total.tolist(),
+        'black': black.tolist(),
+    }
+    detector.ferme_commande()
+    return result
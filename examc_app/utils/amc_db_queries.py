@@ -1,9 +1,29 @@
 # AMC sqlite connection and queries
+import os
 import sqlite3
 import sys
+import threading
 import time
 import traceback
-from pathlib import Path
+from collections import OrderedDict
+from urllib.request import pathname2url
+
+# AMC project databases, attached under these schema names in an AMC session
+AMC_DATABASES = ("capture", "layout", "scoring", "association", "report")
+
+# Sessions kept open per thread (one per project data path and access mode)
+AMC_SESSION_POOL_SIZE = 8
+
+# Indexes for the queries below, missing from the tables created by AMC:
+# (database, index name, table, columns)
+AMC_INDEXES = (
+    ("capture", "examc_capture_zone_student_page_type", "capture_zone", "student, page, type"),
+    ("capture", "examc_capture_position_zoneid_type", "capture_position", "zoneid, type"),
+    ("layout", "examc_layout_box_student_page", "layout_box", "student, page, question"),
+    ("layout", "examc_layout_question_name", "layout_question", "name, question"),
+    ("scoring", "examc_scoring_score_student_question", "scoring_score", "student, question"),
+)
+
 
 class AMC_DB:
     def __init__(self, db_path: str) -> None:
@@ -25,9 +45,9 @@ class AMC_DB:
     def close(self):
         self.conn.close()
 
-    def execute_query(self, query):
+    def execute_query(self, query, params=()):
         try:
-            result = self.cur.execute(query)
+            result = AMCQueryResult(self.cur.execute(query, params))
             self.conn.commit()
             return result
         except sqlite3.Error as er:
@@ -37,19 +57,155 @@ class AMC_DB:
             exc_type, exc_value, exc_tb = sys.exc_info()
             print(traceback.format_exception(exc_type, exc_value, exc_tb))
 
+
+class AMCQueryResult:
+    """
+    Rows of an executed query, fetched at once.
+
+    The cursor is exhausted right away so a pooled connection never keeps a read lock
+    on the AMC databases (which would block AMC itself when it writes them).
+    """
+
+    def __init__(self, cursor):
+        self.description = cursor.description
+        self.rowcount = cursor.rowcount
+        self.rows = cursor.fetchall() if cursor.description else []
+        self._position = 0
+
+    def fetchall(self):
+        rows = self.rows[self._position:]
+        self._position = len(self.rows)
+        return rows
+
+    def fetchone(self):
+        if self._position >= len(self.rows):
+            return None
+        row = self.rows[self._position]
+        self._position += 1
+        return row
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+
+def _amc_databases_signature(amc_data_path):
+    # identifies the database files attached by a session, to reconnect when AMC recreates them
+    signature = []
+    for name in AMC_DATABASES:
+        try:
+            stat = os.stat(amc_data_path + name + ".sqlite")
+            signature.append((name, stat.st_dev, stat.st_ino, stat.st_size > 0))
+        except FileNotFoundError:
+            signature.append((name, None))
+    return tuple(signature)
+
+
+class AMCSession(AMC_DB):
+    """
+    One connection to all the databases of an AMC project.
+
+    The existing non empty capture, layout, scoring, association and report databases are
+    attached under these names, so queries can use any of their tables without ATTACH.
+    Read only sessions open the files in sqlite read only mode and refuse writes.
+    Use get_amc_session to reuse sessions instead of creating them.
+    """
+
+    def __init__(self, amc_data_path, read_only=True):
+        self.amc_data_path = amc_data_path
+        self.read_only = read_only
+        self.signature = _amc_databases_signature(amc_data_path)
+        self.databases = set()
+        super().__init__(":memory:")
+
+    def connect(self) -> bool:
+        try:
+            self.conn = sqlite3.connect(":memory:", uri=True)
+            self.conn.row_factory = sqlite3.Row
+            self.cur = self.conn.cursor()
+            mode = "ro" if self.read_only else "rw"
+            for name, *file_signature in self.signature:
+                if file_signature[0] is None or not file_signature[-1]:
+                    continue
+                db_uri = "file:" + pathname2url(self.amc_data_path + name + ".sqlite") + "?mode=" + mode
+                self.cur.execute("ATTACH DATABASE ? AS " + name, (db_uri,))
+                self.databases.add(name)
+            if self.read_only:
+                self.cur.execute("PRAGMA query_only = 1")
+            return True
+        except sqlite3.Error as e:
+            print(f"Error connecting to database: {e}")
+            return False
+
+    def has_database(self, name):
+        return name in self.databases
+
+
+_amc_sessions = threading.local()
+
+
+def get_amc_session(amc_data_path, read_only=True):
+    """
+    Return the AMC session of a project data path for the current thread.
+
+    Sessions are pooled per thread and reopened when the database files changed on disk
+    (e.g. project re-imported). Do not close the returned session.
+    """
+    pool = getattr(_amc_sessions, "pool", None)
+    if pool is None:
+        pool = _amc_sessions.pool = OrderedDict()
+
+    key = (amc_data_path, read_only)
+    session = pool.pop(key, None)
+    if session is not None and session.signature != _amc_databases_signature(amc_data_path):
+        session.close()
+        session = None
+    if session is None:
+        session = AMCSession(amc_data_path, read_only)
+    pool[key] = session
+
+    while len(pool) > AMC_SESSION_POOL_SIZE:
+        _, old_session = pool.popitem(last=False)
+        old_session.close()
+
+    return session
+
+
+def ensure_amc_indexes(amc_data_path):
+    """
+    Create the indexes of AMC_INDEXES that are missing in the project databases.
+
+    Idempotent, to call after each AMC command that creates or fills the databases
+    (meptex, analyse, note). Tables that do not exist yet are skipped.
+    """
+    db = get_amc_session(amc_data_path, read_only=False)
+    for database, index_name, table, columns in AMC_INDEXES:
+        if not db.has_database(database):
+            continue
+        response = db.execute_query("SELECT name FROM " + database + ".sqlite_master WHERE type = 'table' AND name = ?", (table,))
+        if response and response.fetchone():
+            db.execute_query("CREATE INDEX IF NOT EXISTS " + database + "." + index_name + " ON " + table + " (" + columns + ")")
+
+
+def close_amc_sessions():
+    """Close the AMC sessions of the current thread (e.g. before AMC rewrites a project)."""
+    pool = getattr(_amc_sessions, "pool", None)
+    while pool:
+        _, session = pool.popitem()
+        session.close()
+
+
 def select_count_layout_pages(amc_data_path):
 
-    db = AMC_DB(amc_data_path + "layout.sqlite")
+    db = get_amc_session(amc_data_path)
     query_str = "SELECT count(*) FROM layout_page"
     response = db.execute_query(query_str)
     nb_pages_detected = 0
     if response:
         nb_pages_detected = response.fetchall()[0][0]
-    db.close()
     return nb_pages_detected
 
 def select_manual_datacapture_pages(amc_data_path,amc_data_url,amc_threshold):
-    db = AMC_DB(amc_data_path + "capture.sqlite")
+    db = get_amc_session(amc_data_path)
     query_str = ("SELECT  "
                 "   student as copy,"
                 "   page as page, "
@@ -57,83 +213,71 @@ def select_manual_datacapture_pages(amc_data_path,amc_data_url,amc_threshold):
                 "   timestamp_auto, "
                 "   timestamp_manual, "
                 #"   REPLACE(src,'%PROJET','" + amc_data_url + "') as source, "
-                "   (SELECT ROUND(10*("+str(amc_threshold)+" - MIN(ABS(1.0 * cz.black / cz.total - "+str(amc_threshold)+"))) / "+str(amc_threshold)+",2) FROM capture_zone cz WHERE cz.student = cp.student AND cz.page = cp.page AND cz.total > 0 AND cz.type = 4) as sensitivity "
+                "   (SELECT ROUND(10*(:threshold - MIN(ABS(1.0 * cz.black / cz.total - :threshold))) / :threshold,2) FROM capture_zone cz WHERE cz.student = cp.student AND cz.page = cp.page AND cz.total > 0 AND cz.type = 4) as sensitivity "
                 "FROM capture_page cp "
                 "ORDER BY copy, page")
 
-    response = db.execute_query(query_str)
+    response = db.execute_query(query_str, {"threshold": float(amc_threshold)})
     data_pages = []
     if response:
         colname_pages = [d[0] for d in response.description]
         data_pages = [dict(zip(colname_pages, r)) for r in response.fetchall()]
-    db.close()
 
     return data_pages
 
 def select_amc_scan_path(amc_data_path,copy_no,page_no):
-    db = AMC_DB(amc_data_path + "capture.sqlite")
-    query_str = "SELECT src FROM capture_page cp WHERE page = "+page_no+" AND student = "+copy_no
+    db = get_amc_session(amc_data_path)
+    query_str = "SELECT src FROM capture_page cp WHERE page = ? AND student = ?"
     scan_path = ''
-    response = db.execute_query(query_str)
+    response = db.execute_query(query_str, (int(page_no), int(copy_no)))
     if response:
         scan_path = response.fetchall()[0]['src']
-    db.close()
 
     return scan_path
 
-def select_manual_datacapture_questions(amc_data_path, data):
-
-    db = AMC_DB(amc_data_path + "capture.sqlite")
-
-    scoring_exists = False
-    if Path(amc_data_path + 'scoring.sqlite').stat().st_size > 0:
-        scoring_exists = True
-
-    query_str = ("SELECT DISTINCT(id_a) as question_id ")
-
-    if scoring_exists:
-        query_str += (",sc.why as why ")
-
-
-    query_str += ("   FROM capture_zone cz ")
-
-    if scoring_exists:
-        # Attach scoring db
-        db.cur.execute("ATTACH DATABASE '" + amc_data_path + "scoring.sqlite' as scoring")
-
-        query_str += ("INNER JOIN scoring.scoring_score as sc ON sc.student = " + str(data['copy']) + " AND sc.question = cz.id_a ")
-
-    query_str += ("WHERE type = 4 "
-                "AND cz.student = " + str(data['copy']) +
-                " AND cz.page = " + str(data['page']))
-
+def select_manual_datacapture_questions_by_page(amc_data_path):
+    """
+    Return the questions of all the pages at once, as {(copy, page): [{'question_id', 'why'}, ...]}.
 
+    Questions come from the capture zones of the page, with the scoring 'why' flag once the exam
+    is marked (None before), or from the layout boxes for the pages without capture zones.
+    """
+    db = get_amc_session(amc_data_path)
+    questions_by_page = {}
+
+    if db.has_database('scoring'):
+        query_str = ("SELECT DISTINCT cz.student, cz.page, cz.id_a as question_id, sc.why as why "
+                     "FROM capture_zone cz "
+                     "INNER JOIN scoring.scoring_score as sc ON sc.student = cz.student AND sc.question = cz.id_a "
+                     "WHERE cz.type = 4 "
+                     "ORDER BY cz.student, cz.page, cz.id_a")
+    else:
+        query_str = ("SELECT DISTINCT student, page, id_a as question_id, NULL as why "
+                     "FROM capture_zone "
+                     "WHERE type = 4 "
+                     "ORDER BY student, page, id_a")
 
     response = db.execute_query(query_str)
-    data_questions_id = []
     if response:
-        colname_questions_id = [d[0] for d in response.description]
-        data_questions_id = [dict(zip(colname_questions_id, r)) for r in response.fetchall()]
+        for row in response.fetchall():
+            questions_by_page.setdefault((row['student'], row['page']), []).append(
+                {'question_id': row['question_id'], 'why': row['why']})
 
-    if not len(data_questions_id) > 0:
-        db = AMC_DB(amc_data_path + "layout.sqlite")
-        query_str = ("SELECT DISTINCT(question) as question_id, '' AS why FROM layout_box WHERE student = " + str(data['copy']) + " "
-                     "AND page = " + str(data['page']) + " ORDER BY question ASC")
-
-        response = db.execute_query(query_str)
-
-        colname_questions_id = [d[0] for d in response.description]
-        data_questions_id = [dict(zip(colname_questions_id, r)) for r in response.fetchall()]
-
-        if not len(data_questions_id) > 0:
-            return None
-
-    db.close()
+    query_str = ("SELECT DISTINCT student, page, question as question_id FROM layout_box "
+                 "ORDER BY student, page, question")
+    response = db.execute_query(query_str)
+    layout_questions_by_page = {}
+    if response:
+        for row in response.fetchall():
+            if (row['student'], row['page']) not in questions_by_page:
+                layout_questions_by_page.setdefault((row['student'], row['page']), []).append(
+                    {'question_id': row['question_id'], 'why': ''})
+    questions_by_page.update(layout_questions_by_page)
 
-    return data_questions_id
+    return questions_by_page
 
 def select_questions(amc_data_path):
-    db = AMC_DB(amc_data_path + "layout.sqlite")
+    db = get_amc_session(amc_data_path)
     query_str = ("SELECT * FROM layout_question")
 
     response = db.execute_query(query_str)
@@ -141,17 +285,13 @@ def select_questions(amc_data_path):
     if response:
         colname_questions = [d[0] for d in response.description]
         data_questions = [dict(zip(colname_questions, r)) for r in response.fetchall()]
-    db.close()
 
     return data_questions
 
 def select_marks_positions(amc_data_path,copy,page,seuil):
 
-    scoring_exists = False
-    if Path(amc_data_path + 'scoring.sqlite').stat().st_size > 0:
-        scoring_exists = True
-
-    db = AMC_DB(amc_data_path + "capture.sqlite")
+    db = get_amc_session(amc_data_path)
+    scoring_exists = db.has_database('scoring')
 
     query_str = ("SELECT cp.zoneid, "
                  "cast(black as real) / total as bvalue,"
@@ -164,70 +304,48 @@ def select_marks_positions(amc_data_path,copy,page,seuil):
     if scoring_exists:
         query_str += ", sc.why "
 
-    # subquery computes per-zone sort keys from the same filtered set of positions
-    keys_subquery = (
-            "SELECT cp2.zoneid, "
-            "       MIN(cp2.y) AS y_key, "
-            "       MIN(cp2.x) AS x_key "
-            "FROM capture_position cp2 "
-            "WHERE cp2.type = 1 "
-            "  AND cp2.zoneid IN ("
-            "        SELECT cz2.zoneid "
-            "        FROM capture_zone cz2 "
-            "        WHERE cz2.student = " + str(copy) + " AND cz2.page = " + str(page) + ") "
-                                                                                          "GROUP BY cp2.zoneid"
-    )
-
     query_str +=  ("FROM capture_position cp "
                  "INNER JOIN capture_zone cz ON cz.zoneid = cp.zoneid ")
 
     if scoring_exists:
-        # Attach scoring db
-        db.cur.execute("ATTACH DATABASE '" + amc_data_path + "scoring.sqlite' as scoring")
-
-        query_str += ("LEFT OUTER JOIN scoring.scoring_score sc ON sc.student = " + str(copy) + " AND sc.question = cz.id_a ")
-
+        query_str += ("LEFT OUTER JOIN scoring.scoring_score sc ON sc.student = :copy AND sc.question = cz.id_a ")
 
     query_str += (
-             # " JOIN (" + keys_subquery + ") zk ON zk.zoneid = cp.zoneid "
              " WHERE cp.zoneid in "
-             "   (SELECT cz2.zoneid from capture_zone cz2 WHERE cz2.student = " + str(copy) + " AND cz2.page = " + str(page) + ") "
+             "   (SELECT cz2.zoneid from capture_zone cz2 WHERE cz2.student = :copy AND cz2.page = :page) "
              "AND cp.type = 1 "
              "AND cz.type = 4 "
-             "ORDER BY cz.id_b")#zk.y_key DESC, zk.x_key DESC, cp.corner ASC")
+             "ORDER BY cz.id_b")
 
-    response = db.execute_query(query_str)
+    response = db.execute_query(query_str, {"copy": int(copy), "page": int(page)})
     data_positions = []
     if response:
         colname_positions = [d[0] for d in response.description]
         data_positions = [dict(zip(colname_positions, r)) for r in response.fetchall()]
-    db.close()
 
     return data_positions
 
 def select_data_zones(amc_data_path, zoneid):
-    db = AMC_DB(amc_data_path + "capture.sqlite")
-    query_str = ("SELECT cast(black as real) / total as bvalue, * FROM capture_zone WHERE zoneid = " + str(zoneid))
-    response = db.execute_query(query_str)
+    db = get_amc_session(amc_data_path)
+    query_str = ("SELECT cast(black as real) / total as bvalue, * FROM capture_zone WHERE zoneid = ?")
+    response = db.execute_query(query_str, (int(zoneid),))
     colname_zones = [d[0] for d in response.description]
     data_zones = [dict(zip(colname_zones, r)) for r in response.fetchall()]
-    db.close()
     return data_zones
 
 def update_data_zone(amc_data_path, manual,zoneid, copy, page):
-    db = AMC_DB(amc_data_path + "capture.sqlite")
-    query_str = ("UPDATE capture_zone SET manual = " + manual + " WHERE zoneid = " + str(zoneid))
-    response = db.execute_query(query_str)
+    db = get_amc_session(amc_data_path, read_only=False)
+    query_str = ("UPDATE capture_zone SET manual = ? WHERE zoneid = ?")
+    response = db.execute_query(query_str, (float(manual), int(zoneid)))
 
     if manual != -1.0:
         timestamp_updated= int(time.time())
-        query_str = ("UPDATE capture_page SET timestamp_manual = " + str(timestamp_updated) + " WHERE student = " + copy + " AND page = " + page)
-        response = db.execute_query(query_str)
-    db.close()
+        query_str = ("UPDATE capture_page SET timestamp_manual = ? WHERE student = ? AND page = ?")
+        response = db.execute_query(query_str, (timestamp_updated, int(copy), int(page)))
     return response
 
 def select_nb_copies(amc_data_path):
-    db = AMC_DB(amc_data_path + "capture.sqlite")
+    db = get_amc_session(amc_data_path)
     query_str = ("SELECT COUNT(*) "
                             "FROM (SELECT student,copy "
                             "   FROM capture_page "
@@ -238,16 +356,12 @@ def select_nb_copies(amc_data_path):
     nb_copies = 0
     if response:
         nb_copies = len(response.fetchall())
-    db.close()
 
     return nb_copies
 
 def select_missing_pages(amc_data_path):
 
-    db = AMC_DB(amc_data_path + "capture.sqlite")
-
-    # Attach layout db
-    db.cur.execute("ATTACH DATABASE '" + amc_data_path + "layout.sqlite' as layout")
+    db = get_amc_session(amc_data_path)
 
     query_str = ("SELECT enter.student AS student,enter.page AS page ,capture_page.copy AS copy "
                  "FROM (SELECT student,page "
@@ -266,12 +380,11 @@ def select_missing_pages(amc_data_path):
     if response:
         colname_missing_pages = [d[0] for d in response.description]
         data_missing_pages = [dict(zip(colname_missing_pages, r)) for r in response.fetchall()]
-    db.close()
 
     return data_missing_pages
 
 def count_unrecognized_pages(amc_data_path):
-    db = AMC_DB(amc_data_path + "capture.sqlite")
+    db = get_amc_session(amc_data_path)
 
     query_str = ("SELECT COUNT(filename) as count FROM capture_failed")
 
@@ -280,13 +393,11 @@ def count_unrecognized_pages(amc_data_path):
     if response:
         nb_unrecognized = response.fetchall()[0]["count"]
 
-    db.close()
-
     return nb_unrecognized
 
 def select_unrecognized_pages(amc_data_path):
 
-    db = AMC_DB(amc_data_path + "capture.sqlite")
+    db = get_amc_session(amc_data_path)
     query_str = "SELECT filename FROM capture_failed"
     response = db.execute_query(query_str)
     data_unrecognized_pages = []
@@ -295,7 +406,6 @@ def select_unrecognized_pages(amc_data_path):
         data_unrecognized_pages = [dict(zip(colname_unrecognized_pages, r)) for r in response.fetchall()]
 
     data_unrecognized_pages_list = []
-    db.close()
 
     for p in data_unrecognized_pages:
         data_unrecognized_pages_list.append({"filename": p["filename"].split('/')[-1], "filepath": p["filename"]})
@@ -303,7 +413,7 @@ def select_unrecognized_pages(amc_data_path):
     return data_unrecognized_pages_list
 
 def select_overwritten_pages(amc_data_path):
-    db = AMC_DB(amc_data_path + "capture.sqlite")
+    db = get_amc_session(amc_data_path)
 
     query_str = ("SELECT student,page,copy,overwritten,timestamp_auto "
                  "FROM capture_page WHERE overwritten>0 "
@@ -315,12 +425,11 @@ def select_overwritten_pages(amc_data_path):
     if response:
         colname_overwritten_pages = [d[0] for d in response.description]
         data_overwritten_pages = [dict(zip(colname_overwritten_pages, r)) for r in response.fetchall()]
-    db.close()
 
     return data_overwritten_pages
 
 def select_copy_page_zooms(amc_data_path,copy,page):
-    db = AMC_DB(amc_data_path + "capture.sqlite")
+    db = get_amc_session(amc_data_path)
 
     query_str = ("SELECT zoneid, "
                  "  cast(black as real) / total as bvalue, "
@@ -328,41 +437,38 @@ def select_copy_page_zooms(amc_data_path,copy,page):
                  "  black,"
                  "  manual "
                  "FROM capture_zone "
-                 "WHERE student = "+copy+" AND page = "+page+" AND type=4")
+                 "WHERE student = ? AND page = ? AND type=4")
 
-    response = db.execute_query(query_str)
+    response = db.execute_query(query_str, (int(copy), int(page)))
 
     colname_zooms = [d[0] for d in response.description]
     data_zooms = [dict(zip(colname_zooms, r)) for r in response.fetchall()]
-    db.close()
 
     return data_zooms
 
 def select_copy_question_page(amc_data_path,copy,question):
-    db = AMC_DB(amc_data_path + "layout.sqlite")
+    db = get_amc_session(amc_data_path)
 
     query_str = ("SELECT DISTINCT lb.page "
                  "FROM layout_box lb "
                  "INNER JOIN layout_question lq ON lq.question = lb.question "
-                 "WHERE lb.student = " + copy + " AND lq.name = '" + question + "'")
+                 "WHERE lb.student = ? AND lq.name = ?")
 
-    response = db.execute_query(query_str)
+    response = db.execute_query(query_str, (int(copy), str(question)))
 
     page = response.fetchall()[0]['page']
-    db.close()
     return page
 
 def delete_unrecognized_page(amc_data_path,img_filename):
-    db = AMC_DB(amc_data_path + "capture.sqlite")
+    db = get_amc_session(amc_data_path, read_only=False)
 
     query_str = ("DELETE FROM capture_failed "
-                 "WHERE filename LIKE '%"+img_filename+"'")
+                 "WHERE filename LIKE '%' || ?")
 
-    response = db.execute_query(query_str)
-    db.close()
+    response = db.execute_query(query_str, (img_filename,))
 
 def get_mean(amc_data_path):
-    db = AMC_DB(amc_data_path + "scoring.sqlite")
+    db = get_amc_session(amc_data_path)
 
     query_str = ("SELECT AVG(mark) as mean FROM scoring_mark")
 
@@ -372,12 +478,19 @@ def get_mean(amc_data_path):
     if row and row['mean'] is not None:
         mean = round(row['mean'], 4)
 
-    db.close()
-
     return mean
 
+def select_scored_copies(amc_data_path):
+    db = get_amc_session(amc_data_path)
+    query_str = ("SELECT student, copy FROM scoring_mark ORDER BY student, copy")
+
+    response = db.execute_query(query_str)
+    if not response:
+        return []
+    return [(r['student'], r['copy']) for r in response.fetchall()]
+
 def get_marks(amc_data_path):
-    db = AMC_DB(amc_data_path + "scoring.sqlite")
+    db = get_amc_session(amc_data_path)
 
     query_str = ("SELECT student, total, max, mark FROM scoring_mark")
 
@@ -385,13 +498,9 @@ def get_marks(amc_data_path):
     colname_marks = [d[0] for d in response.description]
     data_marks = [dict(zip(colname_marks, r)) for r in response.fetchall()]
 
-    db.close()
-
     return data_marks
 def get_questions_scoring_details(amc_data_path):
-    db = AMC_DB(amc_data_path + "scoring.sqlite")
-    # Attach layout db
-    db.cur.execute("ATTACH DATABASE '" + amc_data_path + "layout.sqlite' as layout")
+    db = get_amc_session(amc_data_path)
 
     query_str = ("SELECT sm.student as copy,sm.total, sm.max as max_total, mark, lq.name as question, ss.score, ss.max as max_question "
                  "FROM scoring_score ss "
@@ -405,13 +514,10 @@ def get_questions_scoring_details(amc_data_path):
         colname_marking = [d[0] for d in response.description]
         marking_details = [dict(zip(colname_marking, r)) for r in response.fetchall()]
 
-    db.close()
-
     return marking_details
 
 def get_count_missing_associations(amc_data_path):
-    db = AMC_DB(amc_data_path + "capture.sqlite")
-    db.cur.execute("ATTACH DATABASE '" + amc_data_path + "association.sqlite' as association")
+    db = get_amc_session(amc_data_path)
 
     query_str = ("SELECT COUNT(*) as count FROM "
                     "(SELECT student FROM capture_page"
@@ -424,41 +530,34 @@ def get_count_missing_associations(amc_data_path):
     if row and row['count'] is not None:
         count = row['count']
 
-    db.close()
-
     return count
 
 def select_associations(amc_data_path,amc_assoc_img_path):
-    db = AMC_DB(amc_data_path + "association.sqlite")
-    db.cur.execute("ATTACH DATABASE '" + amc_data_path + "capture.sqlite' as capture")
-    query_str = ("SELECT aa.*, '"+amc_assoc_img_path+"' || cz.image as image_path "
+    db = get_amc_session(amc_data_path)
+    query_str = ("SELECT aa.*, ? || cz.image as image_path "
                  "FROM association_association aa "
                  "INNER JOIN capture_zone cz ON cz.student = aa.student "
                  "WHERE cz.type = 2")
 
-    response = db.execute_query(query_str)
+    response = db.execute_query(query_str, (amc_assoc_img_path,))
     colname_assoc = [d[0] for d in response.description]
     assoc_details = [dict(zip(colname_assoc, r)) for r in response.fetchall()]
 
-    db.close()
-
     return assoc_details
 
 def update_association(amc_data_path, copy_nr, student_id):
-    db = AMC_DB(amc_data_path + "association.sqlite")
+    db = get_amc_session(amc_data_path, read_only=False)
     query_str = ("UPDATE association_association "
-                 "SET manual = '"+student_id+"' "
-                 "WHERE student = "+copy_nr)
-
-    response = db.execute_query(query_str)
+                 "SET manual = ? "
+                 "WHERE student = ?")
 
-    db.close()
+    response = db.execute_query(query_str, (str(student_id), int(copy_nr)))
 
     return response
 
 
 def select_student_association_data(amc_data_path):
-    db = AMC_DB(amc_data_path + "association.sqlite")
+    db = get_amc_session(amc_data_path)
     query_str = (
         "SELECT "
         "student AS amc_copy, "
@@ -470,14 +569,11 @@ def select_student_association_data(amc_data_path):
     colname_assoc = [d[0] for d in response.description]
     assoc_details = [dict(zip(colname_assoc, r)) for r in response.fetchall()]
 
-    db.close()
-
     return assoc_details
 
 
 def select_students_report(amc_data_path):
-    db = AMC_DB(amc_data_path + "report.sqlite")
-    db.cur.execute("ATTACH DATABASE '" + amc_data_path + "association.sqlite' as association")
+    db = get_amc_session(amc_data_path)
     query_str = ("SELECT rs.student as id, coalesce(aa.auto,aa.manual) as copy, "
                  "rs.mail_status as status, rs.mail_message as error, rs.mail_timestamp as date "
                  "FROM report_student rs "
@@ -488,27 +584,35 @@ def select_students_report(amc_data_path):
     colname_rep = [d[0] for d in response.description]
     rep_details = [dict(zip(colname_rep, r)) for r in response.fetchall()]
 
-    db.close()
-
     return rep_details
 
 def get_annotated_pdf_path(amc_data_path,student_id):
-    db = AMC_DB(amc_data_path + "report.sqlite")
-    query_str = ("SELECT file FROM report_student WHERE student = "+student_id)
+    db = get_amc_session(amc_data_path)
+    query_str = ("SELECT file FROM report_student WHERE student = ?")
 
-    response = db.execute_query(query_str)
+    response = db.execute_query(query_str, (int(student_id),))
     file = None
     if response:
         file = response.fetchall()[0]['file']
 
-    db.close()
-
     return file
 
+def get_annotated_pdf_paths(amc_data_path):
+    """Return {student: annotated file} as get_annotated_pdf_path, for all the students."""
+    db = get_amc_session(amc_data_path)
+    query_str = ("SELECT student, file FROM report_student ORDER BY rowid")
+
+    response = db.execute_query(query_str)
+    files = {}
+    if response:
+        for row in response.fetchall():
+            files.setdefault(row['student'], row['file'])
+
+    return files
+
 def get_student_report_data(amc_data_path):
-    db = AMC_DB(amc_data_path + "report.sqlite")
+    db = get_amc_session(amc_data_path)
     try:
-        db.cur.execute("ATTACH DATABASE '" + amc_data_path + "association.sqlite' as association")
         query_str = (
             "SELECT rs.*, "
             "aa.student AS amc_copy, "
@@ -527,26 +631,63 @@ def get_student_report_data(amc_data_path):
     colname_rep = [d[0] for d in response.description]
     rep_details = [dict(zip(colname_rep, r)) for r in response.fetchall()]
 
-    db.close()
-
     return rep_details
 
+def select_report_rows(amc_data_path, report_type):
+    db = get_amc_session(amc_data_path)
+    query_str = ("SELECT * FROM report_student WHERE type = ? ORDER BY student, copy")
+
+    response = db.execute_query(query_str, (int(report_type),))
+    colname_rep = [d[0] for d in response.description]
+    return [dict(zip(colname_rep, r)) for r in response.fetchall()]
+
+def restore_report_rows(amc_data_path, report_rows):
+    """Write back report_student rows (e.g. read with select_report_rows), replacing the existing ones."""
+    if not report_rows:
+        return
+    db = get_amc_session(amc_data_path, read_only=False)
+    columns = list(report_rows[0].keys())
+    query_str = ("INSERT OR REPLACE INTO report_student (" + ", ".join(columns) + ") "
+                 "VALUES (" + ", ".join(":" + column for column in columns) + ")")
+    db.cur.executemany(query_str, report_rows)
+    db.conn.commit()
+
+def update_report_file(amc_data_path, report_type, filename):
+    db = get_amc_session(amc_data_path, read_only=False)
+    query_str = ("UPDATE report_student SET file = ? WHERE type = ?")
+
+    return db.execute_query(query_str, (filename, int(report_type)))
+
 def update_report_student(amc_data_path,student,mail_timestamp,mail_status,mail_message=''):
-    db = AMC_DB(amc_data_path + "report.sqlite")
+    db = get_amc_session(amc_data_path, read_only=False)
     query_str = ("UPDATE report_student "
-                 "SET mail_status = "+str(mail_status)+", "
-                 "mail_timestamp = "+str(int(mail_timestamp))+", "
-                 "mail_message = '"+mail_message.replace("'","''") + "' "
-                 "WHERE student = " + student)
+                 "SET mail_status = ?, "
+                 "mail_timestamp = ?, "
+                 "mail_message = ? "
+                 "WHERE student = ?")
 
-    response = db.execute_query(query_str)
-
-    db.close()
+    response = db.execute_query(query_str, (mail_status, int(mail_timestamp), mail_message, int(student)))
 
     return response
 
+def update_report_students(amc_data_path, mail_statuses):
+    """Record mail statuses [(student, mail_timestamp, mail_status, mail_message), ...] in one transaction."""
+    if not mail_statuses:
+        return
+    db = get_amc_session(amc_data_path, read_only=False)
+    query_str = ("UPDATE report_student "
+                 "SET mail_status = ?, "
+                 "mail_timestamp = ?, "
+                 "mail_message = ? "
+                 "WHERE student = ?")
+    db.cur.executemany(query_str, [
+        (mail_status, int(mail_timestamp), mail_message, int(student))
+        for student, mail_timestamp, mail_status, mail_message in mail_statuses
+    ])
+    db.conn.commit()
+
 def get_questions(amc_data_path):
-    db = AMC_DB(amc_data_path + "layout.sqlite")
+    db = get_amc_session(amc_data_path)
     query_str = "SELECT * FROM layout_question"
     response = db.execute_query(query_str)
     colname_question = [d[0] for d in response.description]
@@ -555,25 +696,24 @@ def get_questions(amc_data_path):
     return question_details
 
 def get_question_start_page_by_student(amc_data_path,question_name,student_id):
-    db = AMC_DB(amc_data_path + "layout.sqlite")
+    db = get_amc_session(amc_data_path)
     query_str = ("SELECT DISTINCT b.student, q.question, q.name, b.page FROM layout_box b"
                  " INNER JOIN layout_question q ON q.question = b.question"
-                 " WHERE q.name = '"+ str(question_name) + "' AND b.student = " + str(student_id))
+                 " WHERE q.name = ? AND b.student = ?")
 
-
-    response = db.execute_query(query_str)
+    response = db.execute_query(query_str, (str(question_name), int(student_id)))
     colname_qp = [d[0] for d in response.description]
     qp_details = [dict(zip(colname_qp, r)) for r in response.fetchall()]
 
     return qp_details
 
 def get_question_name_by_student_page(amc_data_path,student_id,page_no):
-    db = AMC_DB(amc_data_path + "layout.sqlite")
+    db = get_amc_session(amc_data_path)
     query_str = ("SELECT DISTINCT q.name FROM layout_box b"
                  " INNER JOIN layout_question q ON q.question = b.question"
-                 " WHERE b.page = " + str(page_no) + " AND b.student = " + str(student_id))
+                 " WHERE b.page = ? AND b.student = ?")
 
-    response = db.execute_query(query_str)
+    response = db.execute_query(query_str, (int(page_no), int(student_id)))
     rows = response.fetchall()
     if rows:
         qname = rows[0]['name']
@@ -582,7 +722,7 @@ def get_question_name_by_student_page(amc_data_path,student_id,page_no):
     return qname
 
 def select_capture_pages(amc_data_path):
-    db = AMC_DB(amc_data_path + "capture.sqlite")
+    db = get_amc_session(amc_data_path)
     query_str = ("SELECT student, page, src FROM capture_page ORDER BY student, page")
 
     response = db.execute_query(query_str)
@@ -592,38 +732,52 @@ def select_capture_pages(amc_data_path):
     return cp_details
 
 def update_capture_page_src(amc_data_path,student,page,new_filename):
-    db = AMC_DB(amc_data_path + "capture.sqlite")
-    query_str = ("UPDATE capture_page SET src = '"+new_filename+"' WHERE student = "+str(student)+" AND page = "+str(page))
-    response = db.execute_query(query_str)
+    db = get_amc_session(amc_data_path, read_only=False)
+    query_str = ("UPDATE capture_page SET src = ? WHERE student = ? AND page = ?")
+    response = db.execute_query(query_str, (new_filename, int(student), int(page)))
 
     return response
 
+def update_capture_pages_src(amc_data_path, updates):
+    """
+    Set capture_page src for [(student, page, src), ...] in a single transaction,
+    rolled back (and the error raised) if any update fails.
+    """
+    if not updates:
+        return
+    db = get_amc_session(amc_data_path, read_only=False)
+    query_str = ("UPDATE capture_page SET src = ? WHERE student = ? AND page = ?")
+    try:
+        db.cur.executemany(query_str, [(src, int(student), int(page)) for student, page, src in updates])
+        db.conn.commit()
+    except sqlite3.Error:
+        db.conn.rollback()
+        raise
+
 def get_question_max_points(amc_data_path,question_name,copy_nr):
-    db = AMC_DB(amc_data_path + "scoring.sqlite")
-    db.cur.execute("ATTACH DATABASE '" + amc_data_path + "layout.sqlite' as layout")
+    db = get_amc_session(amc_data_path)
     query_str = ("SELECT strategy FROM scoring_question sc"
                  " INNER JOIN layout_question lq ON lq.question = sc.question"
-                 " WHERE lq.name = '" + str(question_name) + "'")
+                 " WHERE lq.name = ?")
+    params = [str(question_name)]
 
     if copy_nr:
-        query_str += " AND sc.student = " + str(copy_nr)
+        query_str += " AND sc.student = ?"
+        params.append(int(copy_nr))
 
-    response = db.execute_query(query_str)
+    response = db.execute_query(query_str, params)
     strategy = response.fetchall()[0]['strategy']
     max_points = strategy.split("=")[1]
     return max_points
 
 def get_question_number(amc_data_path, copy_nr, question_name):
-    db = AMC_DB(amc_data_path + "layout.sqlite")
+    db = get_amc_session(amc_data_path)
 
-    # minimal safe quoting
-    qname = question_name.replace("'", "''")  # SQLite escaping
-
-    query_str = f"""
+    query_str = """
     WITH q AS (
       SELECT question
       FROM layout_question
-      WHERE name = '{qname}'
+      WHERE name = :name
     ),
     firstpos AS (
       SELECT b.question,
@@ -631,7 +785,7 @@ def get_question_number(amc_data_path, copy_nr, question_name):
              MIN(b.ymin) AS y0,
              MIN(b.xmin) AS x0
       FROM layout_box b
-      WHERE b.student = {int(copy_nr)}
+      WHERE b.student = :copy
         AND b.role = 1
       GROUP BY b.question
     ),
@@ -645,9 +799,8 @@ def get_question_number(amc_data_path, copy_nr, question_name):
     JOIN q USING(question);
     """
 
-    response = db.execute_query(query_str)
+    response = db.execute_query(query_str, {"name": str(question_name), "copy": int(copy_nr)})
     row = response.fetchone()
-    db.close()
 
     if row is None:
         raise ValueError(f"Question name '{question_name}' not found for student/copy {copy_nr}")
@@ -655,16 +808,67 @@ def get_question_number(amc_data_path, copy_nr, question_name):
     return row["qnum"]
 
 
+def select_question_numbers(amc_data_path):
+    """Return {(student, question name): question number} for all the copies, as get_question_number."""
+    db = get_amc_session(amc_data_path)
+
+    query_str = """
+    WITH firstpos AS (
+      SELECT b.student,
+             b.question,
+             MIN(b.page) AS p,
+             MIN(b.ymin) AS y0,
+             MIN(b.xmin) AS x0
+      FROM layout_box b
+      WHERE b.role = 1
+      GROUP BY b.student, b.question
+    ),
+    ordered AS (
+      SELECT student,
+             question,
+             ROW_NUMBER() OVER (PARTITION BY student ORDER BY p, y0, x0) AS qnum
+      FROM firstpos
+    )
+    SELECT o.student, q.name, o.qnum
+    FROM ordered o
+    JOIN layout_question q USING(question);
+    """
+
+    response = db.execute_query(query_str)
+    if response is None:
+        return {}
+
+    return {(row["student"], row["name"]): row["qnum"] for row in response.fetchall()}
+
+
 ################################################
 # AMC CONVERT
 ################################################
 
 def get_page_layout_boxes(amc_data_path,student, page_nr):
-    db = AMC_DB(amc_data_path + "layout.sqlite")
-    query_str = ("SELECT * FROM layout_box WHERE student = "+student+" AND page = "+page_nr+" ORDER BY question, answer")
+    db = get_amc_session(amc_data_path)
+    query_str = ("SELECT * FROM layout_box WHERE student = ? AND page = ? ORDER BY question, answer")
 
-    response = db.execute_query(query_str)
+    response = db.execute_query(query_str, (int(student), int(page_nr)))
     colname_layout_boxes = [d[0] for d in response.description]
     layout_boxes_details = [dict(zip(colname_layout_boxes, r)) for r in response.fetchall()]
 
     return layout_boxes_details
+
+
+def get_layout_page(amc_data_path, student, page_nr):
+    db = get_amc_session(amc_data_path)
+    query_str = ("SELECT * FROM layout_page WHERE student = ? AND page = ?")
+
+    response = db.execute_query(query_str, (int(student), int(page_nr)))
+    colname_layout_page = [d[0] for d in response.description]
+    row = response.fetchone()
+    return dict(zip(colname_layout_page, row)) if row else None
+
+
+def get_page_layout_marks(amc_data_path, student, page_nr):
+    db = get_amc_session(amc_data_path)
+    query_str = ("SELECT x, y FROM layout_mark WHERE student = ? AND page = ? ORDER BY corner")
+
+    response = db.execute_query(query_str, (int(student), int(page_nr)))
+    return [(r[0], r[1]) for r in response.fetchall()]
@@ -1,45 +1,38 @@
 import base64
 import csv
-import io
+import functools
 import json
 import logging
 import os
 import re
 import shutil
+import smtplib
+import queue
 import subprocess
+import tempfile
+import threading
 import time
 import unicodedata
 import xml.etree.ElementTree as xmlET
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from decimal import Decimal
-import html
 from pathlib import Path
 
 import chardet
-import img2pdf
 import pandas as pd
-import xmltodict
-from PIL import Image
-try:
-    from pypdf import PdfReader, PdfWriter
-except ImportError:
-    from PyPDF2 import PdfReader, PdfWriter
 from django.conf import settings
 from django.contrib.admin.utils import unquote
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.core.mail import EmailMessage
+from django.core.mail import EmailMessage, get_connection
 from django.core.validators import validate_email
-from django.db.models import Q, Sum
 from django.template.loader import get_template
-from django.utils.html import strip_tags
 from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
-from reportlab.lib.units import cm
 from reportlab.pdfgen import canvas
-from reportlab.platypus import LongTable, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+from reportlab.platypus import Table, TableStyle
 from setuptools import glob
+from simple_history.utils import bulk_update_with_history
 
 from examc_app.decorators import exam_permission_required
 from examc_app.models import (
@@ -52,11 +45,19 @@ from examc_app.models import (
 )
 from examc_app.signing import make_token_for, verify_and_get_path
 from examc_app.utils.amc_db_queries import *
+from examc_app.utils.amc_options import AMCProjectOptions, invalidate_options_cache
+from examc_app.utils.amc_progress import parse_amc_progress_line, watch_directory_writes
+from examc_app.utils.pdf_assembly import append_pdf_files, concat_pdf_files, insert_image_pages
+from examc_app.utils.process_pool import pool_imap, process_pool
+from examc_app.utils.grading_report_pdf import copy_number_candidates, iter_grading_reports
+from examc_app.utils.review_capture import clear_review_capture
 from examc_app.utils.zip_security import safe_extract_zip
 
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
 
+MANUAL_DATACAPTURE_CACHE_KEY = "amc_manual_datacapture_pages_{exam_pk}"
+
 def safe_filename_part(s: str) -> str:
     # 1) normalize unicode (splits accents from letters)
     s = unicodedata.normalize("NFKD", s)
@@ -94,50 +95,13 @@ def get_amc_layout_detection_info(exam):
 
     return info
 
-def get_amc_option_by_key(exam,key):
-    options_xml_path = get_amc_project_path(exam, False)+"/options.xml"
-    option_value = None
-    # Open the project xml config and read the contents
-    with open(options_xml_path, 'r', encoding='utf-8') as file:
-        options_xml = file.read()
-
-        # Use xmltodict to parse and convert
-        # the XML document
-        options_dict = xmltodict.parse(options_xml)
-
-        # search by key
-        option_value = find_value_dict_by_key(options_dict,key)
-
-    # if not found in project config, try in global amc config xml
-    if not option_value:
-        with open(settings.AMC_CONFIG_FILE, 'r', encoding='utf-8') as file:
-            config_xml = file.read()
-
-            # Use xmltodict to parse and convert
-            # the XML document
-            config_dict = xmltodict.parse(config_xml)
-
-            # search by key
-            option_value = find_value_dict_by_key(config_dict, key)
-
-    return option_value
-
-def find_value_dict_by_key(dict,search_key):
-    key_value=None
-    for key, value in dict.items():
-        if isinstance(value,type(dict)):
-            key_value=find_value_dict_by_key(value,search_key)
-            if key_value:
-                return key_value
-        elif key == search_key:
-            return value
+def get_amc_project_options(exam):
+    """Typed, cached access to the options of the exam AMC project (see amc_options)."""
+    return AMCProjectOptions(get_amc_project_path(exam, True))
 
-    # try searching in global by addind 'defaut_' in pre key name
-    if not key_value and not search_key.startswith("defaut_"):
-        key_value = find_value_dict_by_key(dict,'defaut_'+search_key)
-
-
-    return key_value
+def get_amc_option_by_key(exam,key):
+    # Project options.xml first, then global amc config xml (both parsed once and cached by mtime)
+    return get_amc_project_options(exam).get(key)
 
 def get_project_dir_info(exam):
 
@@ -295,6 +259,7 @@ def amc_layout_detection(exam):
         "--data", f"{project_path}/data/",
     ]
     result = subprocess.run(command, capture_output=True, text=True)
+    ensure_amc_indexes(project_path + "/data/")
     if result.stderr:
         return "ERR:"+result.stderr
     else:
@@ -351,6 +316,8 @@ def amc_automatic_datacapture_subprocess(request,exam,file_path,from_review,file
         command = ["auto-multiple-choice", "getimages", "--list", file_list_path]
         if not from_review:
             command.extend(["--copy-to", f"{project_path}/scans"])
+            # the captured pages will not be the review scans anymore
+            clear_review_capture(exam)
 
         logger.info("AMC datacapture getimages started exam=%s command=%s", exam.pk, command)
         yield "Getting images ...\n"
@@ -369,38 +336,18 @@ def amc_automatic_datacapture_subprocess(request,exam,file_path,from_review,file
         file_list_path += ".txt"
         logger.info("AMC datacapture file list renamed exam=%s file_list_path=%s", exam.pk, file_list_path)
 
-        box_prop = get_amc_option_by_key(exam, "box_size_proportion")
-
         # analyse scans
-        command = [
-            "auto-multiple-choice", "analyse",
-            "--prop", box_prop,
-            "--data", f"{project_path}/data/",
-            "--projet", project_path,
-            "--liste-fichiers", file_list_path,
-            "--try-three",
-        ]
-
-        logger.info("AMC datacapture analyse started exam=%s command=%s", exam.pk, command)
+        logger.info("AMC datacapture analyse started exam=%s file_list_path=%s", exam.pk, file_list_path)
         yield "Automatic data capture ...\n"
         errors = ''
-        with subprocess.Popen(
-            command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            bufsize=1,
-            universal_newlines=True,
-        ) as process:
-            for line in process.stdout:
-                logger.info("AMC analyse exam=%s output=%s", exam.pk, line.strip())
-                if "ERR:" in line:
-                    errors += line
-                yield line
+        for line in amc_analyse_scans(exam, file_list_path):
+            logger.info("AMC analyse exam=%s output=%s", exam.pk, line.strip())
+            if "ERR:" in line:
+                errors += line
+            yield line
+        logger.info("AMC datacapture analyse completed exam=%s", exam.pk)
 
-            returncode = process.wait()
-            logger.info("AMC datacapture analyse completed exam=%s returncode=%s", exam.pk, returncode)
-            if returncode:
-                raise subprocess.CalledProcessError(returncode, process.args)
+        ensure_amc_indexes(project_path + "/data/")
 
         # check consistency between AMC page recognition and review pages
         logger.info("AMC datacapture consistency check started exam=%s", exam.pk)
@@ -427,25 +374,181 @@ def amc_automatic_datacapture_subprocess(request,exam,file_path,from_review,file
         logger.exception("AMC datacapture failed exam=%s from_review=%s file_list_path=%s", exam.pk, from_review, file_list_path)
         raise
 
-def check_pages_recognition_consistency(exam):
+# Threads renaming the captured scans after an analyse
+CAPTURE_RENAME_WORKERS = 8
+
+
+def get_amc_analyse_processes():
+    processes = int(getattr(settings, "AMC_ANALYSE_PROCESSES", 0) or 0)
+    if processes <= 0:
+        processes = os.cpu_count() or 1
+    return processes
+
+def split_amc_file_list(file_list_path, shards_count):
+    """
+    Split an AMC list file in at most shards_count list files of consecutive scans, of the same
+    number of scans, and return their paths. A single shard is the list file itself.
+    Each scan page is analysed on its own, so a shard can end in the middle of a copy.
+    """
+    with open(file_list_path, 'r') as file_list:
+        files = [line for line in file_list.read().splitlines() if line.strip()]
+
+    shards_count = max(1, min(shards_count, len(files)))
+    if shards_count == 1:
+        return [file_list_path]
+
+    shard_size = -(-len(files) // shards_count)
+    shard_paths = []
+    for shard_nr, start in enumerate(range(0, len(files), shard_size)):
+        shard_path = file_list_path + "." + str(shard_nr)
+        with open(shard_path, 'w') as shard_file:
+            shard_file.write("\n".join(files[start:start + shard_size]) + "\n")
+        shard_paths.append(shard_path)
+    return shard_paths
+
+def amc_analyse_scans(exam, file_list_path, processes=None):
+    """
+    Run AMC analyse on the scans of a list file and yield the output lines as they come.
+
+    The list is split in shards analysed by concurrent AMC processes (AMC_ANALYSE_PROCESSES),
+    each run with --n-procs 1: AMC's own queue would otherwise start one process per CPU in
+    every shard. They all record their results in the project capture.sqlite, as the processes of AMC's
+    own queue do, so there is nothing to merge afterwards. Raises CalledProcessError once all
+    the shards are done if one of them failed.
+    """
     project_path = get_amc_project_path(exam, False)
+    box_prop = get_amc_option_by_key(exam, "box_size_proportion")
+    shard_paths = split_amc_file_list(file_list_path, processes or get_amc_analyse_processes())
+
+    output_lines = queue.Queue()
 
-    capture_pages = select_capture_pages(project_path+"/data/")
+    def read_output(process):
+        for line in process.stdout:
+            output_lines.put(line)
+        output_lines.put(None)
+
+    processes_list = []
+    try:
+        for shard_path in shard_paths:
+            command = [
+                "auto-multiple-choice", "analyse",
+                "--prop", box_prop,
+                "--data", f"{project_path}/data/",
+                "--projet", project_path,
+                "--liste-fichiers", shard_path,
+                "--n-procs", "1",
+                "--try-three",
+            ]
+            process = subprocess.Popen(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                bufsize=1,
+                universal_newlines=True,
+            )
+            processes_list.append(process)
+            threading.Thread(target=read_output, args=(process,), daemon=True).start()
+        logger.info("AMC analyse started exam=%s shards=%s", exam.pk, len(shard_paths))
+
+        running = len(processes_list)
+        while running:
+            line = output_lines.get()
+            if line is None:
+                running -= 1
+            else:
+                yield line
 
+        for process in processes_list:
+            returncode = process.wait()
+            if returncode:
+                raise subprocess.CalledProcessError(returncode, process.args)
+    finally:
+        for process in processes_list:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+        for shard_path in shard_paths:
+            if shard_path != file_list_path and os.path.exists(shard_path):
+                os.remove(shard_path)
+
+def plan_capture_page_renames(project_path, capture_pages):
+    """
+    Return the renames of the captured scans whose filename does not follow copy_<student>_<page>.<ext>,
+    as [(student, page, new src, current file path, new file path), ...].
+    """
+    home = str(Path.home())
+    renames = []
     for capture_page in capture_pages:
-        #yield " -- copy "+ str(capture_page['student']) + " page " + str(capture_page['page']) + "\n"
         filename = capture_page['src'].split("/")[-1]
         filename_split = filename.split('.')
         if len(filename_split) > 2:
             new_filename_path = capture_page['src'].replace(filename,'')
             new_filename = 'copy_'+str(capture_page['student']).zfill(4)+"_"+str(capture_page['page']).zfill(2)+"."+filename_split[2]
             new_filename = new_filename_path+new_filename
-            if '%HOME' in new_filename:
-                shutil.move(capture_page['src'].replace('%HOME',str(Path.home())),new_filename.replace('%HOME',str(Path.home())))
-            else:
-                shutil.move(capture_page['src'],new_filename)
-            update_capture_page_src(project_path+"/data/",capture_page['student'],capture_page['page'],new_filename)
+            renames.append((
+                capture_page['student'],
+                capture_page['page'],
+                new_filename,
+                capture_page['src'].replace('%HOME', home).replace('%PROJET', project_path),
+                new_filename.replace('%HOME', home).replace('%PROJET', project_path),
+            ))
+    return renames
+
+
+def check_pages_recognition_consistency(exam, workers=CAPTURE_RENAME_WORKERS):
+    """
+    Rename the captured scans to copy_<student>_<page>.<ext> (concurrently with workers threads)
+    and record their new src in capture.sqlite in one transaction. If a rename or the update
+    fails, the renamed files are moved back and the error is raised.
+    """
+    project_path = get_amc_project_path(exam, False)
+    amc_data_path = project_path+"/data/"
+
+    renames = plan_capture_page_renames(project_path, select_capture_pages(amc_data_path))
+    if not renames:
+        return 0
 
+    moved = []
+    errors = []
+
+    def move(rename):
+        try:
+            shutil.move(rename[3], rename[4])
+        except Exception as error:
+            errors.append(error)
+            return None
+        return rename
+
+    def move_back():
+        for rename in moved:
+            try:
+                shutil.move(rename[4], rename[3])
+            except Exception:
+                logger.exception("AMC capture page rename rollback failed exam=%s src=%s", exam.pk, rename[4])
+
+    if workers > 1 and len(renames) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(renames))) as executor:
+            moved = [rename for rename in executor.map(move, renames) if rename is not None]
+    else:
+        moved = [rename for rename in map(move, renames) if rename is not None]
+
+    try:
+        if errors:
+            raise errors[0]
+        update_capture_pages_src(amc_data_path, [(student, page, src) for student, page, src, _, _ in renames])
+    except Exception:
+        logger.error(
+            "AMC capture pages rename failed exam=%s renames=%s moved=%s errors=%s",
+            exam.pk,
+            len(renames),
+            len(moved),
+            len(errors),
+        )
+        move_back()
+        raise
+
+    logger.info("AMC capture pages renamed exam=%s renames=%s", exam.pk, len(renames))
+    return len(renames)
 
 
 def amc_automatic_data_capture(exam,file_path,from_review,file_list_path=None):
@@ -507,23 +610,14 @@ def amc_automatic_data_capture(exam,file_path,from_review,file_list_path=None):
 
     os.rename(file_list_path,file_list_path+".txt")
     file_list_path+=".txt"
-    box_prop = get_amc_option_by_key(exam, "box_size_proportion")
     print("before analyse")
     # analyse scans
     print("amc analyse")
-    command = [
-        "auto-multiple-choice", "analyse",
-        "--prop", box_prop,
-        "--data", f"{project_path}/data/",
-        "--projet", project_path,
-        "--liste-fichiers", file_list_path,
-        "--try-three",
-    ]
-    with subprocess.Popen(command, stdout=subprocess.PIPE, bufsize=1, universal_newlines=True) as process:
-        for line in process.stdout:
-            print(line.strip())
+    for line in amc_analyse_scans(exam, file_list_path):
+        print(line.strip())
 
     print("end analyse")
+    ensure_amc_indexes(project_path + "/data/")
     os.remove(file_list_path)
     return 'ok'
 
@@ -542,6 +636,7 @@ def amc_update_options_xml_by_key(exam,key,value):
     # Write back to file
     # et.write('file.xml')
     xml.write(get_amc_project_path(exam,False)+"/options.xml")
+    invalidate_options_cache(options_xml_path)
 
 
 def get_amc_exam_pdf_path(exam):
@@ -583,42 +678,61 @@ def get_amc_data_capture_manual_data(exam):
         amc_data_path = amc_project_path+"/data/"
         amc_project_url = get_amc_project_url(exam)
         amc_threshold = get_amc_option_by_key(exam,"seuil")
-        data_pages = select_manual_datacapture_pages(amc_data_path,amc_project_url,amc_threshold)
+        data_pages = get_manual_datacapture_pages(exam,amc_data_path,amc_project_url,amc_threshold)
 
         # get extra_pages
         extra_pages = get_extra_pages(amc_extra_pages_path,amc_project_url+"/scans/extra/")
+        for extra_page in extra_pages:
+            extra_page['questions_ids'] = '%'
         data_pages += extra_pages
         data_pages = sorted(data_pages, key=lambda k: (float(k['copy']), float(k['page'])))
 
-        # if data_pages and '%HOME' in data_pages[0]['source']:
-        #     app_home_path = str(settings.BASE_DIR).replace(str(Path.home()),'%HOME')
-        #     for data in data_pages:
-        #         data['source'] = data['source'].replace(app_home_path,'')
-
         data_copies = []
         for data in data_pages:
-            data_questions_id = select_manual_datacapture_questions(amc_data_path,data)
-            questions_ids = ''
-            if data_questions_id:
-                for qid in data_questions_id:
-                    questions_ids += '%' + str(qid['question_id']) + '%'
-                    if 'why' in qid.keys():
-                        if qid['why'] == 'E':
-                            questions_ids += '|INV|'
-                        elif qid['why'] == 'V':
-                            questions_ids += '|EMP|'
-
             if not data['copy'] in data_copies:
                 data_copies.append(data['copy'])
 
-            data['questions_ids'] = questions_ids + '%'
-
         data_questions = select_questions(amc_data_path)
 
         return [data_pages, data_questions, data_copies]
 
     return None
 
+def get_manual_datacapture_pages(exam,amc_data_path,amc_project_url,amc_threshold):
+    """
+    Return the captured pages of the manual data capture, each with its '%id%' questions_ids filter string.
+
+    The pages and their questions are read from the AMC databases with one query each, and cached
+    until the capture, layout or scoring database changes (or the threshold does).
+    """
+    signature = [amc_data_path, amc_project_url, amc_threshold]
+    for name in ('capture', 'layout', 'scoring'):
+        try:
+            db_stat = os.stat(amc_data_path + name + '.sqlite')
+            signature.append((db_stat.st_mtime_ns, db_stat.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+
+    cache_key = MANUAL_DATACAPTURE_CACHE_KEY.format(exam_pk=exam.pk)
+    cached = cache.get(cache_key)
+    if cached and cached[0] == signature:
+        return [dict(data) for data in cached[1]]
+
+    data_pages = select_manual_datacapture_pages(amc_data_path,amc_project_url,amc_threshold)
+    questions_by_page = select_manual_datacapture_questions_by_page(amc_data_path)
+    for data in data_pages:
+        questions_ids = ''
+        for qid in questions_by_page.get((data['copy'], data['page']), []):
+            questions_ids += '%' + str(qid['question_id']) + '%'
+            if qid['why'] == 'E':
+                questions_ids += '|INV|'
+            elif qid['why'] == 'V':
+                questions_ids += '|EMP|'
+        data['questions_ids'] = questions_ids + '%'
+
+    cache.set(cache_key, (signature, data_pages), timeout=None)
+    return [dict(data) for data in data_pages]
+
 def get_extra_pages(amc_extra_pages_path,amc_extra_pages_url=None,student=None):
     extra_pages_data = []
     if not amc_extra_pages_url:
@@ -641,11 +755,12 @@ def get_amc_marks_positions_data(exam,copy,page):
 
     if amc_data_path:
         amc_data_path += "/data/"
-        data_positions = select_marks_positions(amc_data_path,copy,page,float(get_amc_option_by_key(exam,"seuil")))
+        threshold = get_amc_project_options(exam).threshold
+        data_positions = select_marks_positions(amc_data_path,copy,page,threshold)
 
         for idx, item in enumerate(data_positions):
             item["checked"] = False
-            if (item["bvalue"] >= float(get_amc_option_by_key(exam, "seuil")) and item["manual"] == -1.0) or item[
+            if (item["bvalue"] >= threshold and item["manual"] == -1.0) or item[
                 "manual"] == 1.0:
                 item["checked"] = True
 
@@ -790,12 +905,14 @@ def get_copy_page_zooms(exam,copy,page):
 
         zooms_data = select_copy_page_zooms(amc_data_path, copy, page)
 
+        threshold = get_amc_project_options(exam).threshold
+
         #decode bytes imagedata to base64
         for idx, item in enumerate(zooms_data):
             imagedata = base64.b64encode(item["imagedata"])
             item["imagedata"] = imagedata.decode()
             item["checked"] = False
-            if (item["bvalue"] >= float(get_amc_option_by_key(exam,"seuil")) and item["manual"] == -1) or item["manual"] == 1:
+            if (item["bvalue"] >= threshold and item["manual"] == -1) or item["manual"] == 1:
                 item["checked"] = True
 
             zooms_data[idx] = item
@@ -925,6 +1042,8 @@ def amc_mark(exam,update_scoring_strategy):
         if  process.returncode and process.returncode != 0:
             raise subprocess.CalledProcessError(process.returncode, process.args)
 
+    ensure_amc_indexes(project_path + "/data/")
+
     if errors:
         yield "\n\n**************************\nERRORS: \n-------\n\n" + errors + "\n**************************\n\n"
 
@@ -964,6 +1083,8 @@ def amc_mark_subprocess(request, exam,update_scoring_strategy):
         if  process.returncode and process.returncode != 0:
             raise subprocess.CalledProcessError(process.returncode, process.args)
 
+    ensure_amc_indexes(project_path + "/data/")
+
     if errors:
         yield "\n\n**************************\nERRORS: \n-------\n\n" + errors + "\n**************************\n\n"
 
@@ -1137,12 +1258,77 @@ def count_updated_annotated_pdfs(annotated_pdfs_dir, initial_mtimes):
     return count
 
 
-def run_amc_annotate_command(command, exam, single_file, progress_callback=None):
+def get_amc_annotate_processes():
+    processes = int(getattr(settings, "AMC_ANNOTATE_PROCESSES", 0) or 0)
+    if processes <= 0:
+        processes = os.cpu_count() or 1
+    return processes
+
+
+def split_amc_annotate_ids(project_path, copies, groups_count):
+    """
+    Write the scored (student, copy) in at most groups_count AMC id files of consecutive copies
+    (so concatenated single outputs keep the copies order). Return [(id file path, copies), ...].
+    """
+    groups_count = max(1, min(groups_count, len(copies)))
+    group_size = -(-len(copies) // groups_count)
+    groups = []
+    for group_nr, start in enumerate(range(0, len(copies), group_size)):
+        id_file_path = f"{project_path}/cr/corrections/annotate_ids.{group_nr}"
+        group_copies = copies[start:start + group_size]
+        with open(id_file_path, 'w') as id_file:
+            id_file.write("".join(f"{student}:{copy}\n" for student, copy in group_copies))
+        groups.append((id_file_path, group_copies))
+    return groups
+
+
+# Minimum seconds between two annotate progress updates, and seconds after which an update is sent anyway
+AMC_PROGRESS_MIN_INTERVAL = 1.0
+AMC_PROGRESS_HEARTBEAT = 10.0
+
+
+def run_amc_annotate_commands(commands, exam, single_file, progress_callback=None, command_done_callback=None):
+    """
+    Run AMC annotate commands concurrently and report the progress summed over all of them.
+    command_done_callback(index) is called as each command ends.
+
+    The progress follows the AMC progress lines of the commands (see utils.amc_progress) and,
+    for per-student files, the annotated PDFs written (inotify, or polling when unavailable).
+    Progress updates are sent at most every AMC_PROGRESS_MIN_INTERVAL seconds.
+    """
     annotated_pdfs_dir = get_annotated_pdfs_dir(exam)
-    total = 1 if single_file else Student.objects.filter(exam=exam).count()
-    initial_mtimes = get_annotated_pdf_mtimes(annotated_pdfs_dir)
-    last_done = -1
-    last_update_at = 0
+    total = len(commands) if single_file else Student.objects.filter(exam=exam).count()
+    events = queue.Queue()
+    fractions = [0.0] * len(commands)
+    finished = set()
+    state = {"files": 0, "last_done": 0, "last_update_at": time.monotonic()}
+
+    def count_done():
+        if single_file:
+            # one output per command, in progress as AMC reports it
+            done = round(sum(fractions), 2)
+        else:
+            # files written, or the AMC progress when it is ahead (e.g. files rewritten in place)
+            estimate = int(sum(fractions) / len(commands) * total + 1e-6)
+            done = max(state["files"], estimate)
+        return min(done, total) if total else done
+
+    def report_progress(force=False):
+        done = count_done()
+        now = time.monotonic()
+        if not progress_callback:
+            return
+        if force or (
+            (done != state["last_done"] and now - state["last_update_at"] >= AMC_PROGRESS_MIN_INTERVAL)
+            or now - state["last_update_at"] >= AMC_PROGRESS_HEARTBEAT
+        ):
+            progress_callback(
+                done=done,
+                total=total,
+                message=f"Generating AMC annotations: {done:g}/{total} files generated",
+            )
+            state["last_done"] = done
+            state["last_update_at"] = now
 
     if progress_callback:
         progress_callback(
@@ -1151,37 +1337,102 @@ def run_amc_annotate_command(command, exam, single_file, progress_callback=None)
             message=f"Generating AMC annotations: 0/{total} files generated",
         )
 
-    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    while True:
-        try:
-            stdout, stderr = process.communicate(timeout=2)
-            break
-        except subprocess.TimeoutExpired:
-            done = count_updated_annotated_pdfs(annotated_pdfs_dir, initial_mtimes)
-            if total:
-                done = min(done, total)
-
-            now = time.time()
-            if progress_callback and (done != last_done or now - last_update_at >= 10):
-                progress_callback(
-                    done=done,
-                    total=total,
-                    message=f"Generating AMC annotations: {done}/{total} files generated",
-                )
-                last_done = done
-                last_update_at = now
-
-    done = count_updated_annotated_pdfs(annotated_pdfs_dir, initial_mtimes)
-    if total:
-        done = min(done, total)
-    if progress_callback:
-        progress_callback(
-            done=done,
-            total=total,
-            message=f"Generating AMC annotations: {done}/{total} files generated",
+    watcher = None
+    if not single_file:
+        initial_mtimes = get_annotated_pdf_mtimes(annotated_pdfs_dir)
+        watcher = watch_directory_writes(
+            annotated_pdfs_dir,
+            events,
+            suffix=".pdf",
+            count_function=lambda: count_updated_annotated_pdfs(annotated_pdfs_dir, initial_mtimes),
         )
 
-    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+    stdouts = [[] for _ in commands]
+    stderrs = [""] * len(commands)
+
+    def read_stdout(index, process):
+        for line in process.stdout:
+            fraction = parse_amc_progress_line(line)
+            if fraction is None:
+                stdouts[index].append(line)
+            else:
+                events.put(("progress", index, fraction))
+        process.wait()
+        events.put(("exit", index, None))
+
+    def read_stderr(index, process):
+        stderrs[index] = process.stderr.read()
+
+    processes = []
+    threads = []
+    try:
+        for index, command in enumerate(commands):
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            processes.append(process)
+            for target in (read_stdout, read_stderr):
+                thread = threading.Thread(target=target, args=(index, process), daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        while len(finished) < len(commands):
+            try:
+                event = events.get(timeout=AMC_PROGRESS_HEARTBEAT)
+            except queue.Empty:
+                report_progress()
+                continue
+
+            kind, index, value = event
+            if kind == "files":
+                state["files"] = value
+            elif kind == "progress":
+                fractions[index] = min(1.0, fractions[index] + value)
+                if watcher is not None:
+                    watcher.stop_polling()
+            elif kind == "exit":
+                finished.add(index)
+                fractions[index] = 1.0
+                if command_done_callback:
+                    command_done_callback(index)
+            report_progress()
+    finally:
+        if watcher is not None:
+            watcher.close()
+
+    for thread in threads:
+        thread.join()
+    if watcher is not None:
+        state["files"] = max(state["files"], watcher.count)
+    report_progress(force=True)
+
+    returncode = max((process.returncode for process in processes), key=abs)
+    stdout = "".join("".join(lines) for lines in stdouts)
+    stderr = "".join(stderrs)
+    return subprocess.CompletedProcess(commands[0] if len(commands) == 1 else commands, returncode, stdout, stderr)
+
+
+def merge_amc_annotate_groups(exam, project_path, single_file, group_rows, groups_count, failed=False):
+    """
+    Merge the outputs of grouped AMC annotate runs: write back the report rows of every group
+    (a run may replace the rows of the others) and, for a single output, concatenate the
+    groups outputs into annotated_papers.pdf. When a run failed, the groups outputs are
+    deleted instead of concatenated.
+    """
+    amc_data_path = project_path + "/data/"
+    restore_report_rows(amc_data_path, [row for group_nr in sorted(group_rows) for row in group_rows[group_nr]])
+    if not single_file:
+        return
+
+    annotated_pdfs_dir = get_annotated_pdfs_dir(exam)
+    part_paths = [annotated_pdfs_dir / f"annotated_papers.{group_nr}.pdf" for group_nr in range(groups_count)]
+    part_paths = [part_path for part_path in part_paths if part_path.exists()]
+    try:
+        if not failed:
+            concat_pdf_files(annotated_pdfs_dir / "annotated_papers.pdf", part_paths)
+            update_report_file(amc_data_path, 2, "annotated_papers.pdf")
+            logger.info("AMC annotate single outputs merged exam=%s parts=%s", exam.pk, len(part_paths))
+    finally:
+        for part_path in part_paths:
+            part_path.unlink(missing_ok=True)
 
 
 def amc_annotate(exam, single_file, add_grading_scheme_report, progress_callback=None):
@@ -1206,9 +1457,9 @@ def amc_annotate(exam, single_file, add_grading_scheme_report, progress_callback
         "--verdict-question-cancelled", verdict_qc,
         "--position", annote_position,
         "--compose", "0",
+        "--progression-id", "annotate",
+        "--progression", "1",
     ]
-    if single_file:
-        command.extend(["--single-output", "annotated_papers.pdf"])
 
     logger.info(
         "AMC annotate command started exam=%s single_file=%s add_grading_scheme_report=%s command=%s",
@@ -1221,12 +1472,56 @@ def amc_annotate(exam, single_file, add_grading_scheme_report, progress_callback
         progress_callback(message="Cleaning previous annotated outputs...")
     cleanup_previous_annotated_outputs(exam)
 
-    result = run_amc_annotate_command(
-        command,
-        exam,
-        single_file,
-        progress_callback=progress_callback,
-    )
+    # students groups annotated by concurrent AMC processes (AMC_ANNOTATE_PROCESSES)
+    report_type = 2 if single_file else 1
+    groups = []
+    processes = get_amc_annotate_processes()
+    if processes > 1:
+        copies = select_scored_copies(project_path + "/data/")
+        if len(copies) > 1:
+            groups = split_amc_annotate_ids(project_path, copies, processes)
+
+    group_rows = {}
+
+    def keep_group_report_rows(group_nr):
+        group_copies = set(groups[group_nr][1])
+        group_rows[group_nr] = [
+            row for row in select_report_rows(project_path + "/data/", report_type)
+            if (row["student"], row["copy"]) in group_copies
+        ]
+
+    if groups:
+        commands = []
+        for group_nr, (id_file_path, group_copies) in enumerate(groups):
+            group_command = command + ["--id-file", id_file_path]
+            if single_file:
+                group_command.extend(["--single-output", f"annotated_papers.{group_nr}.pdf"])
+            commands.append(group_command)
+        logger.info("AMC annotate groups started exam=%s groups=%s", exam.pk, len(groups))
+    else:
+        if single_file:
+            command.extend(["--single-output", "annotated_papers.pdf"])
+        commands = [command]
+
+    result = None
+    try:
+        result = run_amc_annotate_commands(
+            commands,
+            exam,
+            single_file,
+            progress_callback=progress_callback,
+            command_done_callback=keep_group_report_rows if groups else None,
+        )
+    finally:
+        try:
+            if groups:
+                # also when a group failed: restore the rows of the groups done, drop the partial outputs
+                failed = result is None or bool(result.stderr)
+                merge_amc_annotate_groups(exam, project_path, single_file, group_rows, len(groups), failed=failed)
+        finally:
+            for id_file_path, group_copies in groups:
+                if os.path.exists(id_file_path):
+                    os.remove(id_file_path)
     logger.info(
         "AMC annotate command completed exam=%s returncode=%s stdout_len=%s stderr_len=%s",
         exam.pk,
@@ -1240,7 +1535,6 @@ def amc_annotate(exam, single_file, add_grading_scheme_report, progress_callback
     else:
 
         student_report_data = get_student_report_data(project_path+"/data/")
-        report_type = 2 if single_file else 1
         generated_rows = [
             row for row in student_report_data
             if int(row.get("type") or 0) == report_type
@@ -1260,8 +1554,12 @@ def amc_annotate(exam, single_file, add_grading_scheme_report, progress_callback
                 message=f"{generated_count}/{generated_count} files generated",
             )
 
-        for st_rep in student_report_data:
-            add_extra_to_annotated_pdf(st_rep['student'], st_rep['file'], project_path)
+        extra_pages_count = add_extra_to_annotated_pdfs(
+            student_report_data,
+            project_path,
+            processes=get_amc_annotate_processes(),
+        )
+        logger.info("AMC annotate extra pages inserted exam=%s pages=%s", exam.pk, extra_pages_count)
 
         if add_grading_scheme_report:
             add_grading_schemes_reports(
@@ -1272,45 +1570,49 @@ def amc_annotate(exam, single_file, add_grading_scheme_report, progress_callback
 
         return result.stdout
 
-def add_extra_to_annotated_pdf(student, annotated_file, amc_project_path):
-    amc_extra_pages_path = amc_project_path+"/scans/extra/"
-    amc_annoted_pdfs_path = amc_project_path+"/cr/corrections/pdf/"
-    extra_pdf_tmp_path = amc_extra_pages_path+str(student).zfill(4)+"/"
-    extra_pages = get_extra_pages(amc_extra_pages_path,None,student)
-    extra_pages = sorted(extra_pages, key=lambda d: int(d['page'].split('.')[0]))
-
-    #set A4 for img conversion to pdf page
-    a4inpt = (img2pdf.mm_to_pt(210), img2pdf.mm_to_pt(297))
-    layout_fun = img2pdf.get_layout_fun(a4inpt)
-
-    if extra_pages:
-        added_pages = 0
-        for extra_page in extra_pages:
-            with Image.open(extra_page['source']) as img:
-                pdf = img2pdf.convert(extra_page['source'],layout_fun=layout_fun)
-                with open(extra_pdf_tmp_path+"tmp_extra.pdf","wb") as file:
-                    file.write(pdf)
-                    file.close()
+def get_extra_pages_plans(amc_project_path, report_rows):
+    """
+    Return {annotated file: [[(page number, extra page image), ...] for each student of the file], ...}
+    for the report rows of students with extra pages.
+    """
+    extra_pages_by_student = {}
+    for extra_page in get_extra_pages(amc_project_path+"/scans/extra/"):
+        student = Path(extra_page['source']).parent.name.lstrip("0")
+        extra_pages_by_student.setdefault(student, []).append(extra_page)
+
+    plans = {}
+    for report_row in report_rows:
+        extra_pages = extra_pages_by_student.get(str(report_row['student']).lstrip("0"))
+        if not extra_pages:
+            continue
+        plan = sorted(
+            ((int(extra_page['page'].split('.')[0]), extra_page['source']) for extra_page in extra_pages),
+            key=lambda page: page[0],
+        )
+        plans.setdefault(report_row['file'], []).append(plan)
+    return plans
 
-            extra_pdf = PdfReader(extra_pdf_tmp_path+"tmp_extra.pdf", 'rb')
-            annotated_pdf = PdfReader(amc_annoted_pdfs_path+annotated_file, 'rb')
-            final_annotated_pdf = PdfWriter()
 
-            page_to_add = extra_pdf.pages[0]
+def _insert_image_pages_worker(file_plans):
+    return insert_image_pages(*file_plans)
 
-            page_added = False
-            for i in range(len(annotated_pdf.pages)):
-                final_annotated_pdf.add_page(annotated_pdf.pages[i])
-                if not page_added and i+1 == int(extra_page['page'].split(".")[0])+added_pages:
-                    final_annotated_pdf.add_page(page_to_add)
-                    added_pages += 1
-                    page_added = True
 
+def add_extra_to_annotated_pdfs(report_rows, amc_project_path, processes=1):
+    """
+    Insert the extra pages of the students after their pages in the annotated PDFs of the report rows,
+    each PDF being written once. Files are processed by a pool of processes (see process_pool) when processes > 1.
+    """
+    amc_annoted_pdfs_path = amc_project_path+"/cr/corrections/pdf/"
+    plans = get_extra_pages_plans(amc_project_path, report_rows)
+    if not plans:
+        return 0
 
-            with open(amc_annoted_pdfs_path+annotated_file, 'wb') as f:
-                final_annotated_pdf.write(f)
+    files_plans = [(amc_annoted_pdfs_path+annotated_file, file_plans) for annotated_file, file_plans in plans.items()]
+    if processes <= 1 or len(files_plans) == 1:
+        return sum(insert_image_pages(*file_plans) for file_plans in files_plans)
 
-            os.remove(extra_pdf_tmp_path+"tmp_extra.pdf")
+    with process_pool(min(processes, len(files_plans))) as pool:
+        return sum(pool_imap(pool, _insert_image_pages_worker, files_plans, ordered=False))
 
 def get_annotation_symbols(exam):
     symb_0_0_color = get_amc_option_by_key(exam,'symbole_0_0_color')
@@ -1353,54 +1655,104 @@ def resolve_annotated_pdf_path(annotated_pdfs_dir, filename):
     return annotated_pdf_path
 
 
-def copy_number_candidates(copy_nr):
-    if copy_nr is None or copy_nr == "":
-        return []
-
-    value = str(copy_nr).strip()
-    return list(dict.fromkeys([
-        value,
-        value.zfill(4),
-        value.zfill(2),
-        value.lstrip("0") or "0",
-    ]))
-
-
 def report_row_amc_copy_nr(report_row):
     return report_row.get("amc_copy") or report_row.get("student")
 
 
-def find_student_for_association_value(exam, assoc_primary_key, associated_student):
-    if associated_student is None or str(associated_student).strip() == "":
-        return None
+def normalize_student_key(value):
+    return str(value).strip().casefold()
 
-    associated_student = str(associated_student).strip()
-    if assoc_primary_key == "ID":
-        return (
-            Student.objects
-            .filter(
-                Q(copie_no__in=copy_number_candidates(associated_student))
-                | Q(amc_id__in=copy_number_candidates(associated_student)),
-                exam=exam,
-            )
-            .first()
+
+class StudentMatcher:
+    """
+    Students of an exam loaded once and indexed by copy number, AMC id, SCIPER and name, to match
+    AMC association and report rows without a query per row. Like the queries it replaces, the
+    first student by pk wins. AMC ids set through the matcher are written back by save().
+    """
+
+    def __init__(self, exam, assoc_primary_key=None, students=None):
+        self.exam = exam
+        self.assoc_primary_key = (
+            assoc_primary_key if assoc_primary_key is not None else get_amc_option_by_key(exam, "liste_key")
         )
-    if assoc_primary_key == "SCIPER":
-        return Student.objects.filter(exam=exam, sciper=associated_student).first()
-    if assoc_primary_key == "NAME":
-        return Student.objects.filter(exam=exam, name=associated_student).first()
-
-    return (
-        Student.objects
-        .filter(exam=exam)
-        .filter(
-            Q(copie_no=associated_student)
-            | Q(amc_id=associated_student)
-            | Q(sciper=associated_student)
-            | Q(name=associated_student)
+        if students is None:
+            students = Student.objects.filter(exam=exam).order_by("pk")
+        self.students = sorted(students, key=lambda student: student.pk)
+        self.changed = {}
+        self.by_copie_no = {}
+        self.by_amc_id = {}
+        self.by_sciper = {}
+        self.by_name = {}
+        for student in self.students:
+            self.by_copie_no.setdefault(str(student.copie_no).strip(), []).append(student)
+            self.by_amc_id.setdefault(str(student.amc_id).strip(), []).append(student)
+            self.by_sciper.setdefault(normalize_student_key(student.sciper), []).append(student)
+            self.by_name.setdefault(normalize_student_key(student.name), []).append(student)
+
+    @staticmethod
+    def _first(index, keys):
+        matches = [index[key][0] for key in dict.fromkeys(keys) if index.get(key)]
+        return min(matches, key=lambda student: student.pk) if matches else None
+
+    def find_by_copie_no(self, copy_candidates):
+        return self._first(self.by_copie_no, copy_candidates)
+
+    def find_by_amc_id(self, copy_candidates):
+        return self._first(self.by_amc_id, copy_candidates)
+
+    def find_by_association_value(self, associated_student):
+        if associated_student is None or str(associated_student).strip() == "":
+            return None
+
+        associated_student = str(associated_student).strip()
+        key = normalize_student_key(associated_student)
+        if self.assoc_primary_key == "ID":
+            candidates = copy_number_candidates(associated_student)
+            return self._first_of(self.find_by_copie_no(candidates), self.find_by_amc_id(candidates))
+        if self.assoc_primary_key == "SCIPER":
+            return self._first(self.by_sciper, [key])
+        if self.assoc_primary_key == "NAME":
+            return self._first(self.by_name, [key])
+
+        return self._first_of(
+            self.find_by_copie_no([associated_student]),
+            self.find_by_amc_id([associated_student]),
+            self._first(self.by_sciper, [key]),
+            self._first(self.by_name, [key]),
         )
-        .first()
-    )
+
+    @staticmethod
+    def _first_of(*students):
+        students = [student for student in students if student is not None]
+        return min(students, key=lambda student: student.pk) if students else None
+
+    def set_amc_id(self, student, amc_id):
+        old_key = str(student.amc_id).strip()
+        if old_key in self.by_amc_id and student in self.by_amc_id[old_key]:
+            self.by_amc_id[old_key].remove(student)
+        student.amc_id = str(amc_id)
+        matches = self.by_amc_id.setdefault(student.amc_id.strip(), [])
+        matches.append(student)
+        matches.sort(key=lambda matched: matched.pk)
+        self.changed[student.pk] = student
+
+    def reset_amc_ids(self):
+        """Set all the AMC ids to "0" in memory, as after Student.objects.filter(exam=exam).update(amc_id="0")."""
+        self.by_amc_id = {"0": list(self.students)} if self.students else {}
+        for student in self.students:
+            student.amc_id = "0"
+
+    def save(self):
+        """Write the AMC ids set since the last save with a single bulk update."""
+        if self.changed:
+            bulk_update_with_history(list(self.changed.values()), Student, ["amc_id"], batch_size=500)
+        count = len(self.changed)
+        self.changed = {}
+        return count
+
+
+def find_student_for_association_value(exam, assoc_primary_key, associated_student):
+    return StudentMatcher(exam, assoc_primary_key).find_by_association_value(associated_student)
 
 
 def sync_student_amc_ids_from_association(exam):
@@ -1413,6 +1765,8 @@ def sync_student_amc_ids_from_association(exam):
     associations = select_student_association_data(amc_data_path)
 
     Student.objects.filter(exam=exam).update(amc_id="0")
+    matcher = StudentMatcher(exam, assoc_primary_key)
+    matcher.reset_amc_ids()
     updated_count = 0
     for association in associations:
         amc_copy_nr = association.get("amc_copy")
@@ -1420,7 +1774,7 @@ def sync_student_amc_ids_from_association(exam):
         if amc_copy_nr is None or associated_student is None:
             continue
 
-        student = find_student_for_association_value(exam, assoc_primary_key, associated_student)
+        student = matcher.find_by_association_value(associated_student)
         if not student:
             logger.warning(
                 "No student found while syncing AMC id exam=%s assoc_key=%s associated_student=%s amc_copy=%s",
@@ -1431,9 +1785,9 @@ def sync_student_amc_ids_from_association(exam):
             )
             continue
 
-        student.amc_id = str(amc_copy_nr)
-        student.save(update_fields=["amc_id"])
+        matcher.set_amc_id(student, amc_copy_nr)
         updated_count += 1
+    matcher.save()
 
     logger.info(
         "Student AMC ids synced from association exam=%s assoc_key=%s updated=%s associations=%s",
@@ -1455,10 +1809,13 @@ def student_amc_copy_nr(student):
     return student.copie_no
 
 
-def update_student_amc_id_if_missing(student, amc_copy_nr):
+def update_student_amc_id_if_missing(student, amc_copy_nr, matcher=None):
     if empty_student_amc_id(student.amc_id) and amc_copy_nr not in (None, "", "0"):
-        student.amc_id = str(amc_copy_nr)
-        student.save(update_fields=["amc_id"])
+        if matcher is not None:
+            matcher.set_amc_id(student, amc_copy_nr)
+        else:
+            student.amc_id = str(amc_copy_nr)
+            student.save(update_fields=["amc_id"])
         logger.info(
             "Backfilled student AMC id student_pk=%s copy=%s amc_id=%s",
             student.pk,
@@ -1467,39 +1824,31 @@ def update_student_amc_id_if_missing(student, amc_copy_nr):
         )
 
 
-def find_student_for_amc_report(exam, report_row):
-    assoc_primary_key = get_amc_option_by_key(exam, "liste_key")
-    amc_copy_nr = report_row_amc_copy_nr(report_row)
-    amc_copy_candidates = copy_number_candidates(amc_copy_nr)
-    if amc_copy_candidates:
-        student = (
-            Student.objects
-            .filter(exam=exam, amc_id__in=amc_copy_candidates)
-            .first()
-        )
-        if student:
-            return student
-
-    associated_student = report_row.get("associated_student")
-    if associated_student:
-        student = find_student_for_association_value(exam, assoc_primary_key, associated_student)
-        if student:
-            update_student_amc_id_if_missing(student, amc_copy_nr)
-            return student
-
-    copy_candidates = []
-    for value in (amc_copy_nr, report_row.get("copy")):
-        if value is None or value == "":
-            continue
-        copy_candidates.extend(copy_number_candidates(value))
+def find_student_for_amc_report(exam, report_row, matcher=None):
+    """
+    Return the student of an AMC report row. With a matcher (StudentMatcher), no query is made and
+    the backfilled AMC ids are written by matcher.save().
+    """
+    save_matcher = matcher is None
+    if matcher is None:
+        matcher = StudentMatcher(exam)
 
-    student = (
-        Student.objects
-        .filter(exam=exam, copie_no__in=list(dict.fromkeys(copy_candidates)))
-        .first()
-    )
-    if student:
-        update_student_amc_id_if_missing(student, amc_copy_nr)
+    amc_copy_nr = report_row_amc_copy_nr(report_row)
+    student = matcher.find_by_amc_id(copy_number_candidates(amc_copy_nr))
+    if student is None:
+        student = matcher.find_by_association_value(report_row.get("associated_student"))
+        if student is None:
+            copy_candidates = []
+            for value in (amc_copy_nr, report_row.get("copy")):
+                if value is None or value == "":
+                    continue
+                copy_candidates.extend(copy_number_candidates(value))
+            student = matcher.find_by_copie_no(copy_candidates)
+        if student is not None:
+            update_student_amc_id_if_missing(student, amc_copy_nr, matcher)
+
+    if save_matcher:
+        matcher.save()
     return student
 
 
@@ -1521,6 +1870,8 @@ def add_grading_schemes_reports(exam_pk, single_file=False, progress_callback=No
         report_type,
         len(report_rows),
     )
+    snapshot = get_grading_report_snapshot(exam)
+    matcher = StudentMatcher(exam)
     if single_file:
         filename = next((row.get("file") for row in report_rows if row.get("file")), "annotated_papers.pdf")
         annotated_pdf_path = resolve_annotated_pdf_path(annotated_pdfs_dir, filename)
@@ -1530,10 +1881,11 @@ def add_grading_schemes_reports(exam_pk, single_file=False, progress_callback=No
         if report_rows:
             student_reports = []
             for row in sorted(report_rows, key=lambda r: (int(r.get("student") or 0), int(r.get("copy") or 0))):
-                student = find_student_for_amc_report(exam, row)
+                student = find_student_for_amc_report(exam, row, matcher)
                 if not student:
                     raise RuntimeError(f"No eXamc student found for AMC report row {row}.")
                 student_reports.append((student, report_row_amc_copy_nr(row)))
+            matcher.save()
         else:
             student_reports = [
                 (student, student_amc_copy_nr(student))
@@ -1548,32 +1900,33 @@ def add_grading_schemes_reports(exam_pk, single_file=False, progress_callback=No
                 message=f"Adding grading scheme reports: 0/{total} reports added",
             )
 
-        pdf_parts = [annotated_pdf_path.read_bytes()]
-        for index, (student, amc_copy_nr) in enumerate(student_reports, start=1):
-            logger.info(
-                "AMC grading scheme report generated exam=%s mode=single student_pk=%s student_copy=%s amc_copy=%s index=%s total=%s target=%s",
-                exam_pk,
-                student.pk,
-                student.copie_no,
-                amc_copy_nr,
-                index,
-                total,
-                annotated_pdf_path,
-            )
-            pdf_parts.append(
-                build_grading_report_pdf_bytes(
+        # reports are kept on disk and appended to the annotated PDF without loading it
+        with tempfile.TemporaryDirectory(prefix="grading_reports.", dir=annotated_pdfs_dir) as reports_dir:
+            report_paths = []
+            copies = [(student.copie_no, amc_copy_nr) for student, amc_copy_nr in student_reports]
+            reports = iter_grading_reports(snapshot, copies, get_grading_report_processes(), ordered=True)
+            for index, (report_index, report_bytes) in enumerate(reports, start=1):
+                student, amc_copy_nr = student_reports[report_index]
+                logger.info(
+                    "AMC grading scheme report generated exam=%s mode=single student_pk=%s student_copy=%s amc_copy=%s index=%s total=%s target=%s",
                     exam_pk,
-                    student.id,
-                    amc_copy_nr=amc_copy_nr,
+                    student.pk,
+                    student.copie_no,
+                    amc_copy_nr,
+                    index,
+                    total,
+                    annotated_pdf_path,
                 )
-            )
-            if progress_callback:
-                progress_callback(
-                    done=index,
-                    total=total,
-                    message=f"Adding grading scheme reports: {index}/{total} reports added",
-                )
-        annotated_pdf_path.write_bytes(concat_pdfs(*pdf_parts))
+                report_path = Path(reports_dir) / f"report.{report_index:05d}.pdf"
+                report_path.write_bytes(report_bytes)
+                report_paths.append(report_path)
+                if progress_callback:
+                    progress_callback(
+                        done=index,
+                        total=total,
+                        message=f"Adding grading scheme reports: {index}/{total} reports added",
+                    )
+            append_pdf_files(annotated_pdf_path, report_paths)
         logger.info(
             "AMC grading scheme report append completed exam=%s mode=single target=%s total=%s",
             exam_pk,
@@ -1593,29 +1946,30 @@ def add_grading_schemes_reports(exam_pk, single_file=False, progress_callback=No
             message=f"Adding grading scheme reports: 0/{total} files generated",
         )
 
-    for index, row in enumerate(report_rows, start=1):
-        student = find_student_for_amc_report(exam, row)
+    student_reports = []
+    for row in report_rows:
+        student = find_student_for_amc_report(exam, row, matcher)
         if not student:
             raise RuntimeError(f"No eXamc student found for AMC report row {row}.")
 
         annotated_pdf_path = resolve_annotated_pdf_path(annotated_pdfs_dir, row.get("file"))
         if not annotated_pdf_path.exists():
             raise FileNotFoundError(f"Missing annotated PDF: {annotated_pdf_path}")
-
-        annotated_pdf_bytes = annotated_pdf_path.read_bytes()
-        grading_scheme_report_bytes = build_grading_report_pdf_bytes(
-            exam_pk,
-            student.id,
-            amc_copy_nr=report_row_amc_copy_nr(row),
-        )
-        merged = concat_pdfs(annotated_pdf_bytes, grading_scheme_report_bytes)
-        annotated_pdf_path.write_bytes(merged)
+        student_reports.append((student, report_row_amc_copy_nr(row), annotated_pdf_path))
+    matcher.save()
+
+    # each report is appended to its annotated PDF as soon as it is rendered
+    copies = [(student.copie_no, amc_copy_nr) for student, amc_copy_nr, _ in student_reports]
+    reports = iter_grading_reports(snapshot, copies, get_grading_report_processes())
+    for index, (report_index, grading_scheme_report_bytes) in enumerate(reports, start=1):
+        student, amc_copy_nr, annotated_pdf_path = student_reports[report_index]
+        append_pdf_files(annotated_pdf_path, [grading_scheme_report_bytes])
         logger.info(
             "AMC grading scheme report appended exam=%s student_pk=%s student_copy=%s amc_copy=%s index=%s total=%s target=%s",
             exam_pk,
             student.pk,
             student.copie_no,
-            report_row_amc_copy_nr(row),
+            amc_copy_nr,
             index,
             total,
             annotated_pdf_path,
@@ -1629,19 +1983,6 @@ def add_grading_schemes_reports(exam_pk, single_file=False, progress_callback=No
 
     logger.info("AMC grading scheme report append completed exam=%s total=%s", exam_pk, total)
 
-def concat_pdfs(*pdfs_bytes: bytes) -> bytes:
-    writer = PdfWriter()
-
-    for pdf in pdfs_bytes:
-        reader = PdfReader(io.BytesIO(pdf))
-        for page in reader.pages:
-            writer.add_page(page)
-
-    out = io.BytesIO()
-    writer.write(out)
-    out.seek(0)
-    return out.getvalue()
-
 def create_annotated_zip(exam):
     corrections_path = Path(get_amc_project_path(exam, False)) / "cr" / "corrections"
     zip_path = get_annotated_zip_path(exam)
@@ -1684,6 +2025,57 @@ def get_amc_results_file_path(exam):
 
     return None
 
+# cr/ file indexes by folder: (signature, index), see get_cr_file_index
+_cr_file_indexes = {}
+CR_FILE_INDEXES_MAX = 8
+
+
+def _cr_dir_signature(cr_dir):
+    """mtimes of cr/ and of all its subfolders: a file added, removed or renamed anywhere changes one."""
+    signature = [(".", cr_dir.stat().st_mtime_ns)]
+
+    def walk(dir_path, rel_dir):
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    rel_path = rel_dir + "/" + entry.name
+                    signature.append((rel_path, entry.stat(follow_symlinks=False).st_mtime_ns))
+                    walk(entry.path, rel_path)
+
+    walk(cr_dir, ".")
+    return tuple(sorted(signature))
+
+
+def get_cr_file_index(cr_dir):
+    """
+    Return the files of an AMC cr/ folder as {"names": {lower name: first path}, "stems": {lower stem: first path}},
+    first in rglob order, or None when the folder does not exist.
+    The index is rebuilt when cr/ or any of its subfolders changes.
+    """
+    cr_dir = Path(cr_dir)
+    try:
+        signature = _cr_dir_signature(cr_dir)
+    except FileNotFoundError:
+        _cr_file_indexes.pop(str(cr_dir), None)
+        return None
+
+    cached = _cr_file_indexes.get(str(cr_dir))
+    if cached and cached[0] == signature:
+        return cached[1]
+
+    index = {"names": {}, "stems": {}}
+    for path in cr_dir.rglob("*"):
+        if not path.is_file():
+            continue
+        index["names"].setdefault(path.name.lower(), path)
+        index["stems"].setdefault(path.stem.lower(), path)
+    _cr_file_indexes.pop(str(cr_dir), None)
+    while len(_cr_file_indexes) >= CR_FILE_INDEXES_MAX:
+        _cr_file_indexes.pop(next(iter(_cr_file_indexes)))
+    _cr_file_indexes[str(cr_dir)] = (signature, index)
+    return index
+
+
 def get_amc_manual_association_data(exam):
     project_path = get_amc_project_path(exam, False)
     amc_assoc_img_path = ""
@@ -1717,42 +2109,37 @@ def get_amc_manual_association_data(exam):
 
         return path_value.lstrip("/")
 
+    amc_root = Path(settings.AMC_PROJECTS_ROOT).resolve()
+    cr_dir = Path(project_path).resolve() / "cr" if project_path else None
+    # built on the first missing image only
+    get_cr_index = functools.cache(lambda: get_cr_file_index(cr_dir))
+
     def _resolve_existing_assoc_relpath(rel_path: str) -> str:
         """Best-effort fix when DB image path does not map to an existing file."""
         if not rel_path or not project_path:
             return rel_path
 
-        amc_root = Path(settings.AMC_PROJECTS_ROOT).resolve()
         rel_candidate = Path(rel_path)
         file_candidate = (amc_root / rel_candidate).resolve()
         if file_candidate.exists():
             return rel_path
 
-        cr_dir = Path(project_path).resolve() / "cr"
-        if not cr_dir.exists():
+        cr_index = get_cr_index()
+        if cr_index is None:
             return rel_path
 
-        # Try exact filename match anywhere under cr/
-        file_name = rel_candidate.name
-        if file_name:
-            exact_name_matches = [p for p in cr_dir.rglob("*") if p.is_file() and p.name.lower() == file_name.lower()]
-            if exact_name_matches:
-                try:
-                    return str(exact_name_matches[0].resolve().relative_to(amc_root))
-                except Exception:
-                    return rel_path
-
-        # Fallback to stem match.
-        stem = rel_candidate.stem
-        if stem:
-            exact_stem_matches = [p for p in cr_dir.rglob("*") if p.is_file() and p.stem.lower() == stem.lower()]
-            if exact_stem_matches:
-                try:
-                    return str(exact_stem_matches[0].resolve().relative_to(amc_root))
-                except Exception:
-                    return rel_path
-
-        return rel_path
+        # Try exact filename match anywhere under cr/, then fallback to stem match.
+        match = None
+        if rel_candidate.name:
+            match = cr_index["names"].get(rel_candidate.name.lower())
+        if match is None and rel_candidate.stem:
+            match = cr_index["stems"].get(rel_candidate.stem.lower())
+        if match is None:
+            return rel_path
+        try:
+            return str(match.resolve().relative_to(amc_root))
+        except Exception:
+            return rel_path
 
     if project_path:
         amc_data_path = project_path+"/data/"
@@ -1813,52 +2200,112 @@ def get_amc_send_annotated_papers_data(exam):
 
     return ''
 
-def amc_send_annotated_papers(exam,selected_students,email_subject,email_body,email_column):
+def is_transient_smtp_error(error):
+    """True for SMTP failures worth retrying: 4xx replies, lost connections and network errors."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(error, smtplib.SMTPException):
+        return False
+    return isinstance(error, OSError)
 
-    result = 'ok'
+
+def send_email_with_retries(connection, email, retries):
+    """
+    Send email through the (kept open) connection, retrying transient failures with a growing delay.
+    Return None when sent, else the last error.
+    """
+    for attempt in range(retries + 1):
+        try:
+            connection.open()
+            connection.send_messages([email])
+            return None
+        except Exception as error:
+            if attempt >= retries or not is_transient_smtp_error(error):
+                return error
+            logger.warning("Annotated paper email send retry to=%s attempt=%s error=%r", email.to, attempt + 1, error)
+            try:
+                connection.close()
+            except Exception:
+                pass
+            time.sleep(2 ** attempt)
+
+
+def amc_send_annotated_papers(exam,selected_students,email_subject,email_body,email_column,progress_callback=None):
+    """
+    Email the annotated papers of the selected students, AMC_MAIL_BATCH_SIZE messages per SMTP connection
+    at most AMC_MAIL_RATE_PER_MINUTE, and record the mail statuses of each batch at once in report.sqlite.
+    Return [sent count, error count, failure messages].
+    """
     project_path = get_amc_project_path(exam, False)
     amc_data_path = project_path+"/data/"
+    annotated_pdf_paths = get_annotated_pdf_paths(amc_data_path)
+    batch_size = max(1, int(getattr(settings, "AMC_MAIL_BATCH_SIZE", 25) or 1))
+    rate_per_minute = int(getattr(settings, "AMC_MAIL_RATE_PER_MINUTE", 0) or 0)
+    send_interval = 60.0 / rate_per_minute if rate_per_minute > 0 else 0.0
+    retries = max(0, int(getattr(settings, "AMC_MAIL_RETRIES", 0) or 0))
+
     result_list = []
     count_sent = 0
     count_error = 0
-    for student in selected_students:
-        student_send_result = student["copy"] + " - " + student["email"] + " : "
-        try:
-            validate_email(student['email'])
-        except ValidationError as e:
-            student_send_result += "Failed to send email: " + repr(e)
-            logger.error(result)
-            count_error += 1
-            update_report_student(amc_data_path, student["id"], time.time(), 100, repr(e))
-            result_list.append(student_send_result)
-        else:
-            # Create EmailMessage object
-            email = EmailMessage(
-                email_subject,  # Subject
-                email_body,  # HTML content
-                'noreply-cepro-exams@epfl.ch',  # From email address
-                [student['email']]  # To email addresses
-            )
-
-            annotated_pdf_path = get_annotated_pdf_path(amc_data_path,student["id"])
-
-            # Set content type to HTML
-            email.content_subtype = "html"
-            email.attach_file(project_path+"/cr/corrections/pdf/"+annotated_pdf_path)
+    total = len(selected_students)
+    last_send_at = None
+    logger.info("Annotated papers mailing started exam=%s total=%s batch_size=%s", exam.pk, total, batch_size)
+    if progress_callback:
+        progress_callback(done=0, total=total, message=f"Sending annotated papers: 0/{total} emails processed")
 
+    for batch_start in range(0, total, batch_size):
+        mail_statuses = []
+        connection = get_connection()
+        try:
+            for student in selected_students[batch_start:batch_start + batch_size]:
+                student_send_result = student["copy"] + " - " + student["email"] + " : "
+                error = None
+                try:
+                    validate_email(student['email'])
+                    # Create EmailMessage object
+                    email = EmailMessage(
+                        email_subject,  # Subject
+                        email_body,  # HTML content
+                        'noreply-cepro-exams@epfl.ch',  # From email address
+                        [student['email']],  # To email addresses
+                        connection=connection,
+                    )
+                    # Set content type to HTML
+                    email.content_subtype = "html"
+                    email.attach_file(project_path+"/cr/corrections/pdf/"+annotated_pdf_paths.get(int(student["id"]), ""))
+                except (ValidationError, OSError) as e:
+                    error = e
+                else:
+                    if last_send_at is not None and send_interval:
+                        time.sleep(max(0.0, last_send_at + send_interval - time.monotonic()))
+                    last_send_at = time.monotonic()
+                    error = send_email_with_retries(connection, email, retries)
+
+                if error is None:
+                    count_sent += 1
+                    mail_statuses.append((student["id"], time.time(), 1, ''))
+                else:
+                    student_send_result += "Failed to send email: " + repr(error)
+                    logger.error("Annotated paper email failed exam=%s copy=%s error=%r", exam.pk, student["copy"], error)
+                    count_error += 1
+                    mail_statuses.append((student["id"], time.time(), 100, repr(error)))
+                    result_list.append(student_send_result)
+        finally:
             try:
-                # Send email
-                email.send()
-                student_send_result += "email sent !"
-                count_sent += 1
-                update_report_student(amc_data_path, student["id"], time.time(), 1,'')
-            except Exception as e:
-                student_send_result += "Failed to send email: "+repr(e)
-                logger.error(result)
-                count_error += 1
-                update_report_student(amc_data_path,student["id"],time.time(),100,repr(e))
-                result_list.append(student_send_result)
+                connection.close()
+            except Exception:
+                pass
+            update_report_students(amc_data_path, mail_statuses)
+
+        done = min(batch_start + batch_size, total)
+        if progress_callback:
+            progress_callback(done=done, total=total, message=f"Sending annotated papers: {done}/{total} emails processed")
 
+    logger.info("Annotated papers mailing completed exam=%s sent=%s errors=%s", exam.pk, count_sent, count_error)
     return [count_sent, count_error, result_list]
 
 
@@ -1892,275 +2339,70 @@ def wrap_canvas_text_lines(c, text, max_width, font_name="Helvetica", font_size=
 
 
 
-def clean_report_text(value) -> str:
-    """Return plain text suitable for ReportLab paragraphs."""
-    if not value:
-        return ""
-
-    text = str(value)
-    text = re.sub(r"(?i)<br\s*/?>", "\n", text)
-    text = re.sub(r"(?i)</p\s*>", "\n", text)
-    text = re.sub(r"(?i)</li\s*>", "\n", text)
-    text = strip_tags(text)
-    text = html.unescape(text)
-    lines = [" ".join(line.split()) for line in text.replace("\r\n", "\n").replace("\r", "\n").split("\n")]
-    return "\n".join(line for line in lines if line).strip()
-
-
-def report_paragraph(value, style):
-    """Build a paragraph that preserves explicit line breaks."""
-    text = clean_report_text(value)
-    if not text:
-        return Paragraph("&nbsp;", style)
-    return Paragraph(html.escape(text).replace("\n", "<br/>"), style)
-
-
-def build_long_table(rows, col_widths, repeat_rows=1):
-    try:
-        return LongTable(rows, colWidths=col_widths, repeatRows=repeat_rows, splitByRow=1, splitInRow=1)
-    except TypeError:
-        return LongTable(rows, colWidths=col_widths, repeatRows=repeat_rows, splitByRow=1)
+def get_grading_report_processes():
+    processes = int(getattr(settings, "GRADING_REPORT_PROCESSES", 0) or 0)
+    if processes <= 0:
+        processes = os.cpu_count() or 1
+    return processes
 
 
-def build_grading_report_pdf_bytes(exam_pk, student_pk, amc_copy_nr=None, review_copy_nr=None) -> bytes:
+def get_grading_report_snapshot(exam):
     """
-    Generate grading report and return the content in bytes.
+    Read at once the grading data of the exam reports (see utils.grading_report_pdf),
+    or return None when the exam has no AMC project.
     """
-    exam = Exam.objects.get(pk=exam_pk)
     amc_data_path = get_amc_project_path(exam, False)
-
     if not amc_data_path:
         return None
 
-    amc_data_path += "/data/"
-    student = Student.objects.get(pk=student_pk)
-    review_copy_nr = str(review_copy_nr if review_copy_nr is not None else student.copie_no)
-    amc_copy_nr = str(amc_copy_nr if amc_copy_nr is not None else student_amc_copy_nr(student))
-    copy_candidates = list(dict.fromkeys(
-        copy_number_candidates(review_copy_nr) + copy_number_candidates(amc_copy_nr)
-    ))
-
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        leftMargin=2 * cm,
-        rightMargin=2 * cm,
-        topMargin=3.2 * cm,
-        bottomMargin=2.2 * cm,
-    )
-    width, height = A4
-    table_width = width - doc.leftMargin - doc.rightMargin
-
-    styles = getSampleStyleSheet()
-    question_style = ParagraphStyle(
-        "GradingReportQuestion",
-        parent=styles["Heading2"],
-        fontName="Helvetica-Bold",
-        fontSize=12,
-        leading=15,
-        spaceBefore=8,
-        spaceAfter=6,
-    )
-    body_style = ParagraphStyle(
-        "GradingReportBody",
-        parent=styles["BodyText"],
-        fontName="Helvetica",
-        fontSize=8,
-        leading=10,
-        splitLongWords=1,
-    )
-    body_center_style = ParagraphStyle(
-        "GradingReportBodyCenter",
-        parent=body_style,
-        alignment=1,
-    )
-    header_style = ParagraphStyle(
-        "GradingReportHeader",
-        parent=body_center_style,
-        fontName="Helvetica-Bold",
-    )
-    total_label_style = ParagraphStyle(
-        "GradingReportTotalLabel",
-        parent=body_style,
-        fontName="Helvetica-Bold",
-    )
-    total_center_style = ParagraphStyle(
-        "GradingReportTotalCenter",
-        parent=body_center_style,
-        fontName="Helvetica-Bold",
+    pages_groups = {
+        pages_group_pk: {"pk": pages_group_pk, "group_name": group_name, "checked": {}, "notes": {}}
+        for pages_group_pk, group_name in (
+            PagesGroup.objects
+            .filter(exam=exam, use_grading_scheme=True)
+            .order_by("pk")
+            .values_list("pk", "group_name")
+        )
+    }
+
+    checked_boxes = (
+        PagesGroupGradingSchemeCheckedBox.objects
+        .filter(pages_group__in=pages_groups.keys())
+        .order_by("pk")
+        .values_list("pages_group_id", "copy_nr", "gradingSchemeCheckBox_id", "adjustment")
     )
-    note_title_style = ParagraphStyle(
-        "GradingReportNoteTitle",
-        parent=body_style,
-        fontName="Helvetica-Bold",
-        spaceBefore=6,
-        spaceAfter=2,
+    for pages_group_pk, copy_nr, checkbox_id, adjustment in checked_boxes:
+        pages_groups[pages_group_pk]["checked"].setdefault(copy_nr, []).append((checkbox_id, adjustment))
+
+    notes = (
+        PagesGroupStudentReportNote.objects
+        .filter(pages_group__in=pages_groups.keys())
+        .order_by("pk")
+        .values_list("pages_group_id", "copy_nr", "content")
     )
-    note_style = ParagraphStyle(
-        "GradingReportNote",
-        parent=body_style,
-        leftIndent=0.2 * cm,
-        spaceAfter=8,
+    for pages_group_pk, copy_nr, content in notes:
+        pages_groups[pages_group_pk]["notes"].setdefault(copy_nr, content)
+
+    schemes = {}
+    checkbox_scheme = {}
+    scheme_checkboxes = (
+        QuestionGradingSchemeCheckBox.objects
+        .filter(questionGradingScheme__pages_group__in=pages_groups.keys())
+        .order_by("position", "pk")
+        .values("id", "questionGradingScheme_id", "name", "points", "description")
     )
+    for checkbox in scheme_checkboxes:
+        schemes.setdefault(checkbox["questionGradingScheme_id"], []).append(checkbox)
+        checkbox_scheme[checkbox["id"]] = checkbox["questionGradingScheme_id"]
+
+    return {
+        "exam_pk": exam.pk,
+        "pages_groups": list(pages_groups.values()),
+        "schemes": schemes,
+        "checkbox_scheme": checkbox_scheme,
+        "question_numbers": select_question_numbers(amc_data_path + "/data/") if pages_groups else {},
+    }
 
-    def draw_header_footer(canvas_obj, doc_obj):
-        canvas_obj.saveState()
-        canvas_obj.setFont("Helvetica-Bold", 18)
-        canvas_obj.drawString(doc.leftMargin, height - 2 * cm, "Grading Report")
-        canvas_obj.setLineWidth(1)
-        canvas_obj.line(doc.leftMargin, height - 2.4 * cm, width - doc.rightMargin, height - 2.4 * cm)
-        canvas_obj.setFont("Helvetica", 10)
-        canvas_obj.drawCentredString(width / 2, 1.2 * cm, str(doc_obj.page))
-        canvas_obj.restoreState()
-
-    story = []
-
-    pages_groups = PagesGroup.objects.filter(exam__pk=exam_pk, use_grading_scheme=True)
-    for pages_group in pages_groups:
-        pages_group_grading_schemes = PagesGroupGradingSchemeCheckedBox.objects.filter(
-            pages_group=pages_group,
-            copy_nr__in=copy_candidates,
-        )
-
-        if not pages_group_grading_schemes.exists():
-            continue
-
-        valid_checked_boxes = (
-            pages_group_grading_schemes
-            .filter(gradingSchemeCheckBox__isnull=False)
-            .select_related("gradingSchemeCheckBox__questionGradingScheme")
-        )
-        first_checked_box = None
-        for candidate in copy_candidates:
-            first_checked_box = valid_checked_boxes.filter(copy_nr=candidate).first()
-            if first_checked_box:
-                break
-        if not first_checked_box:
-            logger.warning(
-                "Skipping grading report section without valid checked boxes exam=%s student=%s pages_group=%s copy_nr=%s",
-                exam_pk,
-                student_pk,
-                pages_group.pk,
-                amc_copy_nr,
-            )
-            continue
-        grading_copy_nr = first_checked_box.copy_nr
-
-        grading_scheme_id = (
-            first_checked_box
-            .gradingSchemeCheckBox
-            .questionGradingScheme
-            .id
-        )
-
-        all_grading_scheme_checkboxes = QuestionGradingSchemeCheckBox.objects.filter(
-            questionGradingScheme_id=grading_scheme_id,
-        ).order_by("position", "pk")
-
-        max_points = all_grading_scheme_checkboxes.aggregate(points__sum=Sum("points"))["points__sum"] or Decimal("0.00")
-        grading_scheme_checkboxes = list(
-            all_grading_scheme_checkboxes
-            .exclude(name__in=("ZERO", "ADJ"))
-            .order_by("position", "pk")
-        )
-        adjustment_checkbox = all_grading_scheme_checkboxes.filter(name="ADJ").first()
-        if adjustment_checkbox:
-            grading_scheme_checkboxes.append(adjustment_checkbox)
-
-        table_rows = [[
-            Paragraph("Title", header_style),
-            Paragraph("Text", header_style),
-            Paragraph("Points", header_style),
-            Paragraph("Validated", header_style),
-        ]]
-        points = Decimal("0.00")
-
-        for grading_scheme_checkbox in grading_scheme_checkboxes:
-            pg_checked_box_item = PagesGroupGradingSchemeCheckedBox.objects.filter(
-                pages_group=pages_group,
-                gradingSchemeCheckBox_id=grading_scheme_checkbox.id,
-                copy_nr=grading_copy_nr,
-            ).first()
-            pg_checked_box = pg_checked_box_item is not None
-
-            add_row = not (
-                grading_scheme_checkbox.name == "ZERO"
-                or (
-                    grading_scheme_checkbox.name == "ADJ"
-                    and (not pg_checked_box_item or pg_checked_box_item.adjustment == 0)
-                )
-            )
-            if not add_row:
-                continue
-
-            if pg_checked_box:
-                if grading_scheme_checkbox.name == "ADJ":
-                    row_points = pg_checked_box_item.adjustment
-                    max_points += row_points
-                else:
-                    row_points = grading_scheme_checkbox.points
-                points += row_points
-            else:
-                row_points = grading_scheme_checkbox.points
-
-            title = "Adjustment" if grading_scheme_checkbox.name == "ADJ" else grading_scheme_checkbox.name
-            table_rows.append([
-                report_paragraph(title, body_style),
-                report_paragraph(grading_scheme_checkbox.description, body_style),
-                report_paragraph(row_points, body_center_style),
-                report_paragraph("Yes" if pg_checked_box else "No", body_center_style),
-            ])
-
-        table_rows.append([
-            Paragraph("Total", total_label_style),
-            Paragraph("&nbsp;", total_label_style),
-            report_paragraph(max_points, total_center_style),
-            report_paragraph(points, total_center_style),
-        ])
-
-        question_num = get_question_number(amc_data_path, amc_copy_nr, pages_group.group_name)
-        story.append(Paragraph(f"Question {question_num}:", question_style))
-
-        col_widths = [
-            table_width * 0.22,
-            table_width * 0.50,
-            table_width * 0.13,
-            table_width * 0.15,
-        ]
-        table = build_long_table(table_rows, col_widths)
-        table.setStyle(TableStyle([
-            ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
-            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-            ("ALIGN", (2, 0), (3, -1), "CENTER"),
-            ("FONTNAME", (0, -1), (-1, -1), "Helvetica-Bold"),
-            ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
-            ("VALIGN", (0, 0), (-1, -1), "TOP"),
-            ("LEFTPADDING", (0, 0), (-1, -1), 5),
-            ("RIGHTPADDING", (0, 0), (-1, -1), 5),
-            ("TOPPADDING", (0, 0), (-1, -1), 4),
-            ("BOTTOMPADDING", (0, 0), (-1, -1), 4),
-        ]))
-        story.append(table)
-
-        student_note_obj = PagesGroupStudentReportNote.objects.filter(
-            pages_group=pages_group,
-            copy_nr=grading_copy_nr,
-        ).first()
-        student_note = student_note_obj.content if student_note_obj else ""
-        if clean_report_text(student_note):
-            story.append(Paragraph("Comment:", note_title_style))
-            story.append(report_paragraph(student_note, note_style))
-
-        story.append(Spacer(1, 0.5 * cm))
-
-    if not story:
-        story.append(Paragraph("No grading scheme report data.", body_style))
-
-    doc.build(story, onFirstPage=draw_header_footer, onLaterPages=draw_header_footer)
-    pdf_bytes = buffer.getvalue()
-    buffer.close()
-    return pdf_bytes
 
 def draw_table(c, data, x, y, col_widths):
     """
@@ -0,0 +1,119 @@
+"""Cached access to the AMC project options.xml and the global AMC config file.
+
+Parsing options.xml with xmltodict and walking the whole tree for every option
+read is expensive, and options are read in loops (e.g. the box threshold for each
+detected box). Each file is parsed once into a flat key -> value index, kept per
+process and keyed by the file path, mtime and size: any change of the file on
+disk, whoever writes it, invalidates its entry.
+"""
+
+import os
+import threading
+
+import xmltodict
+from django.conf import settings
+
+_options_cache = {}
+_options_cache_lock = threading.Lock()
+
+
+def _index_options_dict(options_dict, index):
+    # Depth first, first non empty value wins, as the recursive search by key did
+    for key, value in options_dict.items():
+        if isinstance(value, dict):
+            _index_options_dict(value, index)
+        elif value and key not in index:
+            index[key] = value
+    return index
+
+
+def get_options_index(xml_path):
+    """Return the flat key -> value index of an options xml file, parsing it only when it changed."""
+    xml_path = str(xml_path)
+    stat = os.stat(xml_path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+
+    with _options_cache_lock:
+        cached = _options_cache.get(xml_path)
+    if cached and cached[0] == signature:
+        return cached[1]
+
+    with open(xml_path, 'r', encoding='utf-8') as file:
+        index = _index_options_dict(xmltodict.parse(file.read()), {})
+
+    with _options_cache_lock:
+        _options_cache[xml_path] = (signature, index)
+    return index
+
+
+def invalidate_options_cache(xml_path=None):
+    with _options_cache_lock:
+        if xml_path is None:
+            _options_cache.clear()
+        else:
+            _options_cache.pop(str(xml_path), None)
+
+
+def find_option(index, key):
+    """Value of key in an options index, falling back to the 'defaut_' prefixed key."""
+    value = index.get(key)
+    if not value and not key.startswith("defaut_"):
+        value = index.get("defaut_" + key)
+    return value
+
+
+class AMCProjectOptions:
+    """
+    Options of an AMC project: values of the project options.xml, then of the global AMC config.
+
+    Typed accessors return None when the option is not set.
+    """
+
+    def __init__(self, project_path):
+        self.options_xml_path = str(project_path) + "/options.xml"
+
+    def get(self, key):
+        value = find_option(get_options_index(self.options_xml_path), key)
+        if not value:
+            value = find_option(get_options_index(settings.AMC_CONFIG_FILE), key)
+        return value
+
+    def get_float(self, key):
+        value = self.get(key)
+        return float(value) if value else None
+
+    def get_int(self, key):
+        value = self.get(key)
+        return int(value) if value else None
+
+    @property
+    def threshold(self):
+        return self.get_float("seuil")
+
+    @property
+    def threshold_up(self):
+        return self.get_float("seuil_up")
+
+    @property
+    def box_size_proportion(self):
+        return self.get_float("box_size_proportion")
+
+    @property
+    def copies_count(self):
+        return self.get_int("nombre_copies")
+
+    @property
+    def students_list(self):
+        return self.get("listeetudiants")
+
+    @property
+    def association_key(self):
+        return self.get("liste_key")
+
+    @property
+    def question_document(self):
+        return self.get("doc_question")
+
+    @property
+    def catalog_document(self):
+        return self.get("doc_catalog")
@@ -0,0 +1,154 @@
+"""Progress sources of long AMC commands.
+
+AMC commands run with ``--progression-id <id> --progression 1`` print their progress
+on stdout as lines ``===<id>=+<fraction>``, the fractions of a run summing to 1:
+parse_amc_progress_line reads them so the callers follow AMC itself.
+
+The files an AMC command writes can also be followed: watch_directory_writes uses
+inotify where the platform has it (Linux, through libc) and reports the number of
+distinct files written in a folder, kept incrementally from the events. Elsewhere
+it falls back to calling a count function at a fixed interval.
+
+Both sources post events to a queue, so a caller waits on the queue instead of
+polling the processes and the output folder.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import re
+import select
+import struct
+import sys
+import threading
+
+logger = logging.getLogger(__name__)
+
+AMC_PROGRESS_RE = re.compile(r"^===<(?P<id>[^>]*)>=\+(?P<fraction>[-+0-9.eE]+)\s*$")
+
+# Seconds between two counts of the polling fallback
+POLL_INTERVAL = 2.0
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+INOTIFY_EVENT = struct.Struct("iIII")
+
+_libc = None
+
+
+def parse_amc_progress_line(line):
+    """Return the progress fraction of an AMC progress line, or None for other lines."""
+    match = AMC_PROGRESS_RE.match(line)
+    if not match:
+        return None
+    try:
+        return float(match.group("fraction"))
+    except ValueError:
+        return None
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        _libc = False
+        if sys.platform.startswith("linux"):
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+                libc.inotify_init1.argtypes = [ctypes.c_int]
+                libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+                _libc = libc
+            except (OSError, AttributeError):
+                logger.info("inotify is not available, directory writes are polled")
+    return _libc
+
+
+class DirectoryWatcher:
+    """
+    Post ("files", None, count) to events each time the count of distinct files written in a folder
+    (with a name ending with suffix) changes, until closed.
+    """
+
+    def __init__(self, directory, events, suffix="", count_function=None):
+        self.directory = str(directory)
+        self.events = events
+        self.suffix = suffix
+        self.count_function = count_function
+        self.written = set()
+        self.count = 0
+        self.inotify = False
+        self._stop_read, self._stop_write = os.pipe()
+        self._closed = False
+        self._fd = self._init_inotify()
+        target = self._read_inotify if self._fd is not None else self._poll
+        self._thread = threading.Thread(target=target, daemon=True)
+        self._thread.start()
+
+    def _init_inotify(self):
+        libc = _get_libc()
+        if not libc:
+            return None
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return None
+        if libc.inotify_add_watch(fd, os.fsencode(self.directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            logger.info("inotify watch failed directory=%s errno=%s", self.directory, ctypes.get_errno())
+            os.close(fd)
+            return None
+        self.inotify = True
+        return fd
+
+    def _post(self, count):
+        if count != self.count:
+            self.count = count
+            self.events.put(("files", None, count))
+
+    def _read_inotify(self):
+        try:
+            while True:
+                readable, _, _ = select.select([self._fd, self._stop_read], [], [])
+                if self._stop_read in readable:
+                    return
+                try:
+                    buffer = os.read(self._fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+                offset = 0
+                while offset + INOTIFY_EVENT.size <= len(buffer):
+                    _, _, _, name_length = INOTIFY_EVENT.unpack_from(buffer, offset)
+                    offset += INOTIFY_EVENT.size
+                    name = buffer[offset:offset + name_length].rstrip(b"\0").decode(errors="replace")
+                    offset += name_length
+                    if name.endswith(self.suffix):
+                        self.written.add(name)
+                self._post(len(self.written))
+        finally:
+            os.close(self._fd)
+
+    def _poll(self):
+        while True:
+            readable, _, _ = select.select([self._stop_read], [], [], POLL_INTERVAL)
+            count_function = self.count_function
+            if readable or count_function is None:
+                return
+            self._post(count_function())
+
+    def stop_polling(self):
+        """Stop the polling fallback, e.g. once another progress source reports."""
+        self.count_function = None
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        os.write(self._stop_write, b"\0")
+        self._thread.join()
+        os.close(self._stop_read)
+        os.close(self._stop_write)
+
+
+def watch_directory_writes(directory, events, suffix="", count_function=None):
+    """Start a DirectoryWatcher on directory, by inotify if available, else polling count_function."""
+    return DirectoryWatcher(directory, events, suffix=suffix, count_function=count_function)
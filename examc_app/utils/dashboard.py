@@ -5,6 +5,7 @@ from django.urls import reverse
 
 from examc_app.models import Exam, ExamUser, PageMarkers, PagesGroupGradingSchemeCheckedBox
 from examc_app.permissions import exam_group_names_allow
+from examc_app.utils.scan_manifest import get_exam_scan_copies
 
 
 DASHBOARD_EXAM_LIMIT = 20
@@ -151,6 +152,10 @@ def _get_exam_review_copy_dirs(exam):
     if not scans_path:
         return []
 
+    indexed_copies = get_exam_scan_copies(exam)
+    if indexed_copies is not None:
+        return [scans_path / copy_dir for copy_dir in indexed_copies if copy_dir != "0000"]
+
     return [
         scan_path
         for scan_path in scans_path.iterdir()
@@ -163,6 +168,9 @@ def _get_exam_review_copy_count(exam):
 
 
 def _exam_has_review_scan_files(exam):
+    indexed_copies = get_exam_scan_copies(exam)
+    if indexed_copies is not None:
+        return _get_exam_review_scans_path(exam) is not None and any(copy_dir != "0000" for copy_dir in indexed_copies)
     for copy_path in _get_exam_review_copy_dirs(exam):
         if any(scan_path.is_file() for scan_path in copy_path.iterdir()):
             return True
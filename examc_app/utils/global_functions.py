@@ -217,6 +217,8 @@ def update_folders_paths(old_path,new_path):
 
     if os.path.exists(str(settings.SCANS_ROOT)+old_path):
         shutil.move(str(settings.SCANS_ROOT)+old_path, str(settings.SCANS_ROOT)+new_path)
+    if os.path.exists(str(settings.SCANS_PREVIEWS_ROOT)+old_path):
+        shutil.move(str(settings.SCANS_PREVIEWS_ROOT)+old_path, str(settings.SCANS_PREVIEWS_ROOT)+new_path)
     if os.path.exists(str(settings.MARKED_SCANS_ROOT)+old_path):
         shutil.move(str(settings.MARKED_SCANS_ROOT)+old_path, str(settings.MARKED_SCANS_ROOT)+new_path)
     if os.path.exists(str(settings.AMC_PROJECTS_ROOT)+old_path):
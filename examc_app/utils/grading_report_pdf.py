@@ -0,0 +1,336 @@
+"""Grading scheme report PDFs, rendered from a snapshot of the exam grading data.
+
+The snapshot (see get_grading_report_snapshot in amc_functions) holds everything a
+report needs: the pages groups using grading schemes, their checked boxes and
+notes per copy, the schemes checkboxes and the AMC question numbers. It is plain
+picklable data, so the reports of an exam can be rendered by a process pool with
+no database access: the snapshot is sent once to each worker and the paragraph
+styles are built once per process.
+"""
+
+import html
+import logging
+import re
+from decimal import Decimal
+from functools import lru_cache
+import io
+
+from django.utils.html import strip_tags
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.platypus import LongTable, Paragraph, SimpleDocTemplate, Spacer, TableStyle
+
+from examc_app.utils.process_pool import pool_imap, process_pool
+
+logger = logging.getLogger(__name__)
+
+_worker_snapshot = None
+
+
+def copy_number_candidates(copy_nr):
+    if copy_nr is None or copy_nr == "":
+        return []
+
+    value = str(copy_nr).strip()
+    return list(dict.fromkeys([
+        value,
+        value.zfill(4),
+        value.zfill(2),
+        value.lstrip("0") or "0",
+    ]))
+
+
+def clean_report_text(value) -> str:
+    """Return plain text suitable for ReportLab paragraphs."""
+    if not value:
+        return ""
+
+    text = str(value)
+    text = re.sub(r"(?i)<br\s*/?>", "\n", text)
+    text = re.sub(r"(?i)</p\s*>", "\n", text)
+    text = re.sub(r"(?i)</li\s*>", "\n", text)
+    text = strip_tags(text)
+    text = html.unescape(text)
+    lines = [" ".join(line.split()) for line in text.replace("\r\n", "\n").replace("\r", "\n").split("\n")]
+    return "\n".join(line for line in lines if line).strip()
+
+
+def report_paragraph(value, style):
+    """Build a paragraph that preserves explicit line breaks."""
+    text = clean_report_text(value)
+    if not text:
+        return Paragraph("&nbsp;", style)
+    return Paragraph(html.escape(text).replace("\n", "<br/>"), style)
+
+
+def build_long_table(rows, col_widths, repeat_rows=1):
+    try:
+        return LongTable(rows, colWidths=col_widths, repeatRows=repeat_rows, splitByRow=1, splitInRow=1)
+    except TypeError:
+        return LongTable(rows, colWidths=col_widths, repeatRows=repeat_rows, splitByRow=1)
+
+
+@lru_cache(maxsize=None)
+def get_grading_report_styles():
+    """Paragraph and table styles of the reports, built once per process."""
+    styles = getSampleStyleSheet()
+    body_style = ParagraphStyle(
+        "GradingReportBody",
+        parent=styles["BodyText"],
+        fontName="Helvetica",
+        fontSize=8,
+        leading=10,
+        splitLongWords=1,
+    )
+    body_center_style = ParagraphStyle(
+        "GradingReportBodyCenter",
+        parent=body_style,
+        alignment=1,
+    )
+    return {
+        "question": ParagraphStyle(
+            "GradingReportQuestion",
+            parent=styles["Heading2"],
+            fontName="Helvetica-Bold",
+            fontSize=12,
+            leading=15,
+            spaceBefore=8,
+            spaceAfter=6,
+        ),
+        "body": body_style,
+        "body_center": body_center_style,
+        "header": ParagraphStyle(
+            "GradingReportHeader",
+            parent=body_center_style,
+            fontName="Helvetica-Bold",
+        ),
+        "total_label": ParagraphStyle(
+            "GradingReportTotalLabel",
+            parent=body_style,
+            fontName="Helvetica-Bold",
+        ),
+        "total_center": ParagraphStyle(
+            "GradingReportTotalCenter",
+            parent=body_center_style,
+            fontName="Helvetica-Bold",
+        ),
+        "note_title": ParagraphStyle(
+            "GradingReportNoteTitle",
+            parent=body_style,
+            fontName="Helvetica-Bold",
+            spaceBefore=6,
+            spaceAfter=2,
+        ),
+        "note": ParagraphStyle(
+            "GradingReportNote",
+            parent=body_style,
+            leftIndent=0.2 * cm,
+            spaceAfter=8,
+        ),
+        "table": TableStyle([
+            ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+            ("ALIGN", (2, 0), (3, -1), "CENTER"),
+            ("FONTNAME", (0, -1), (-1, -1), "Helvetica-Bold"),
+            ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
+            ("VALIGN", (0, 0), (-1, -1), "TOP"),
+            ("LEFTPADDING", (0, 0), (-1, -1), 5),
+            ("RIGHTPADDING", (0, 0), (-1, -1), 5),
+            ("TOPPADDING", (0, 0), (-1, -1), 4),
+            ("BOTTOMPADDING", (0, 0), (-1, -1), 4),
+        ]),
+    }
+
+
+def get_grading_report_sections(snapshot, review_copy_nr, amc_copy_nr):
+    """
+    Return the report sections of a copy:
+    [{question_num, rows: [(title, text, points, validated)], max_points, points, note}, ...]
+    """
+    copy_candidates = list(dict.fromkeys(
+        copy_number_candidates(review_copy_nr) + copy_number_candidates(amc_copy_nr)
+    ))
+
+    sections = []
+    for pages_group in snapshot["pages_groups"]:
+        checked_by_copy = pages_group["checked"]
+        if not any(candidate in checked_by_copy for candidate in copy_candidates):
+            continue
+
+        grading_copy_nr = None
+        first_checkbox_id = None
+        for candidate in copy_candidates:
+            first_checkbox_id = next(
+                (checkbox_id for checkbox_id, adjustment in checked_by_copy.get(candidate, []) if checkbox_id is not None),
+                None,
+            )
+            if first_checkbox_id is not None:
+                grading_copy_nr = candidate
+                break
+        if first_checkbox_id is None:
+            logger.warning(
+                "Skipping grading report section without valid checked boxes exam=%s pages_group=%s copy_nr=%s",
+                snapshot["exam_pk"],
+                pages_group["pk"],
+                amc_copy_nr,
+            )
+            continue
+
+        scheme_checkboxes = snapshot["schemes"][snapshot["checkbox_scheme"][first_checkbox_id]]
+        max_points = sum((checkbox["points"] for checkbox in scheme_checkboxes), Decimal("0.00"))
+        grading_scheme_checkboxes = [
+            checkbox for checkbox in scheme_checkboxes if checkbox["name"] not in ("ZERO", "ADJ")
+        ]
+        adjustment_checkbox = next((checkbox for checkbox in scheme_checkboxes if checkbox["name"] == "ADJ"), None)
+        if adjustment_checkbox:
+            grading_scheme_checkboxes.append(adjustment_checkbox)
+
+        # first checked box of each checkbox for the copy, as .first() by pk
+        copy_checked = {}
+        for checkbox_id, adjustment in checked_by_copy.get(grading_copy_nr, []):
+            copy_checked.setdefault(checkbox_id, adjustment)
+
+        rows = []
+        points = Decimal("0.00")
+        for grading_scheme_checkbox in grading_scheme_checkboxes:
+            pg_checked_box = grading_scheme_checkbox["id"] in copy_checked
+            adjustment = copy_checked.get(grading_scheme_checkbox["id"])
+
+            add_row = not (
+                grading_scheme_checkbox["name"] == "ZERO"
+                or (
+                    grading_scheme_checkbox["name"] == "ADJ"
+                    and (not pg_checked_box or adjustment == 0)
+                )
+            )
+            if not add_row:
+                continue
+
+            if pg_checked_box:
+                if grading_scheme_checkbox["name"] == "ADJ":
+                    row_points = adjustment
+                    max_points += row_points
+                else:
+                    row_points = grading_scheme_checkbox["points"]
+                points += row_points
+            else:
+                row_points = grading_scheme_checkbox["points"]
+
+            title = "Adjustment" if grading_scheme_checkbox["name"] == "ADJ" else grading_scheme_checkbox["name"]
+            rows.append((title, grading_scheme_checkbox["description"], row_points, "Yes" if pg_checked_box else "No"))
+
+        question_num = snapshot["question_numbers"].get((int(amc_copy_nr), pages_group["group_name"]))
+        if question_num is None:
+            raise ValueError(f"Question name '{pages_group['group_name']}' not found for student/copy {amc_copy_nr}")
+
+        sections.append({
+            "question_num": question_num,
+            "rows": rows,
+            "max_points": max_points,
+            "points": points,
+            "note": pages_group["notes"].get(grading_copy_nr, ""),
+        })
+    return sections
+
+
+def render_grading_report_pdf(sections) -> bytes:
+    """Render report sections (see get_grading_report_sections) to PDF bytes."""
+    styles = get_grading_report_styles()
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=A4,
+        leftMargin=2 * cm,
+        rightMargin=2 * cm,
+        topMargin=3.2 * cm,
+        bottomMargin=2.2 * cm,
+    )
+    width, height = A4
+    table_width = width - doc.leftMargin - doc.rightMargin
+
+    def draw_header_footer(canvas_obj, doc_obj):
+        canvas_obj.saveState()
+        canvas_obj.setFont("Helvetica-Bold", 18)
+        canvas_obj.drawString(doc.leftMargin, height - 2 * cm, "Grading Report")
+        canvas_obj.setLineWidth(1)
+        canvas_obj.line(doc.leftMargin, height - 2.4 * cm, width - doc.rightMargin, height - 2.4 * cm)
+        canvas_obj.setFont("Helvetica", 10)
+        canvas_obj.drawCentredString(width / 2, 1.2 * cm, str(doc_obj.page))
+        canvas_obj.restoreState()
+
+    col_widths = [
+        table_width * 0.22,
+        table_width * 0.50,
+        table_width * 0.13,
+        table_width * 0.15,
+    ]
+
+    story = []
+    for section in sections:
+        table_rows = [[
+            Paragraph("Title", styles["header"]),
+            Paragraph("Text", styles["header"]),
+            Paragraph("Points", styles["header"]),
+            Paragraph("Validated", styles["header"]),
+        ]]
+        for title, text, row_points, validated in section["rows"]:
+            table_rows.append([
+                report_paragraph(title, styles["body"]),
+                report_paragraph(text, styles["body"]),
+                report_paragraph(row_points, styles["body_center"]),
+                report_paragraph(validated, styles["body_center"]),
+            ])
+        table_rows.append([
+            Paragraph("Total", styles["total_label"]),
+            Paragraph("&nbsp;", styles["total_label"]),
+            report_paragraph(section["max_points"], styles["total_center"]),
+            report_paragraph(section["points"], styles["total_center"]),
+        ])
+
+        story.append(Paragraph(f"Question {section['question_num']}:", styles["question"]))
+        table = build_long_table(table_rows, col_widths)
+        table.setStyle(styles["table"])
+        story.append(table)
+
+        if clean_report_text(section["note"]):
+            story.append(Paragraph("Comment:", styles["note_title"]))
+            story.append(report_paragraph(section["note"], styles["note"]))
+
+        story.append(Spacer(1, 0.5 * cm))
+
+    if not story:
+        story.append(Paragraph("No grading scheme report data.", styles["body"]))
+
+    doc.build(story, onFirstPage=draw_header_footer, onLaterPages=draw_header_footer)
+    pdf_bytes = buffer.getvalue()
+    buffer.close()
+    return pdf_bytes
+
+
+def _init_grading_report_worker(snapshot):
+    global _worker_snapshot
+    _worker_snapshot = snapshot
+
+
+def _render_grading_report_worker(copy):
+    index, review_copy_nr, amc_copy_nr = copy
+    return index, render_grading_report_pdf(get_grading_report_sections(_worker_snapshot, review_copy_nr, amc_copy_nr))
+
+
+def iter_grading_reports(snapshot, copies, processes=1, ordered=False):
+    """
+    Render the reports of copies [(review copy nr, amc copy nr), ...] and yield
+    (index in copies, pdf bytes) as they are ready, in the copies order if ordered.
+    With processes > 1 the reports are rendered by a process pool (see process_pool).
+    """
+    if processes <= 1 or len(copies) <= 1:
+        for index, (review_copy_nr, amc_copy_nr) in enumerate(copies):
+            yield index, render_grading_report_pdf(get_grading_report_sections(snapshot, review_copy_nr, amc_copy_nr))
+        return
+
+    indexed_copies = [(index, review_copy_nr, amc_copy_nr) for index, (review_copy_nr, amc_copy_nr) in enumerate(copies)]
+    with process_pool(min(processes, len(copies)), _init_grading_report_worker, (snapshot,)) as pool:
+        yield from pool_imap(pool, _render_grading_report_worker, indexed_copies, ordered=ordered)
@@ -0,0 +1,181 @@
+"""Assembly of the annotated papers PDFs on disk.
+
+Source documents are opened with pikepdf (qpdf), which reads the objects of a file
+on demand: appending the pages of a large annotated_papers.pdf only copies its page
+tree, the streams (scans, fonts) are read from the source file while the result is
+written. The result goes to a temporary file next to the destination and replaces
+it once complete, so a destination may also be one of the sources.
+
+Extra pages scanned for a copy are inserted into its annotated PDF as A4 pages
+converted in memory, all the insertions of a file being written at once.
+
+Resources several sources share under different objects (e.g. the fonts of every
+grading scheme report) are written once: identical fonts and images found in the
+resources of the appended pages are replaced by the first copy.
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+from pathlib import Path
+
+import img2pdf
+import pikepdf
+
+# Number of source documents kept open at once, larger concatenations are merged by batches
+MAX_OPEN_SOURCES = 200
+
+DEDUPLICATED_RESOURCES = ("/Font", "/XObject")
+
+# Larger streams (typically the scans) are not compared, to avoid reading them twice
+MAX_DEDUPLICATED_STREAM_LENGTH = 256 * 1024
+
+
+def _is_direct_tree(obj):
+    if obj.is_indirect:
+        return False
+    if isinstance(obj, pikepdf.Dictionary):
+        return all(_is_direct_tree(value) for _, value in obj.items())
+    if isinstance(obj, pikepdf.Array):
+        return all(_is_direct_tree(value) for value in obj)
+    return True
+
+
+def _resource_key(obj):
+    """Key of a font or image resource made of direct objects only, None when it cannot be compared."""
+    if isinstance(obj, pikepdf.Stream):
+        if int(obj.stream_dict.get("/Length", 0)) > MAX_DEDUPLICATED_STREAM_LENGTH:
+            return None
+        stream_dict = pikepdf.Dictionary({key: value for key, value in obj.stream_dict.items() if key != "/Length"})
+        if not _is_direct_tree(stream_dict):
+            return None
+        return b"stream" + stream_dict.unparse() + hashlib.sha256(obj.read_raw_bytes()).digest()
+    if isinstance(obj, pikepdf.Dictionary):
+        direct = pikepdf.Dictionary({key: value for key, value in obj.items()})
+        if not _is_direct_tree(direct):
+            return None
+        return b"dict" + direct.unparse()
+    return None
+
+
+def _deduplicate_page_resources(page, seen):
+    resources = page.obj.get("/Resources")
+    if not isinstance(resources, pikepdf.Dictionary):
+        return
+    for category in DEDUPLICATED_RESOURCES:
+        named = resources.get(category)
+        if not isinstance(named, pikepdf.Dictionary):
+            continue
+        for name, resource in list(named.items()):
+            if not resource.is_indirect:
+                continue
+            key = _resource_key(resource)
+            if key is None:
+                continue
+            first = seen.setdefault(key, resource)
+            if first.objgen != resource.objgen:
+                named[name] = first
+
+
+def _open_source(source, stack):
+    if isinstance(source, (bytes, bytearray)):
+        pdf = pikepdf.open(io.BytesIO(source))
+    else:
+        pdf = pikepdf.open(source)
+    stack.append(pdf)
+    return pdf
+
+
+def _write_pdf(pdf, destination):
+    destination = Path(destination)
+    fd, tmp_path = tempfile.mkstemp(prefix=destination.stem + ".", suffix=".tmp.pdf", dir=destination.parent)
+    os.close(fd)
+    try:
+        pdf.save(tmp_path, object_stream_mode=pikepdf.ObjectStreamMode.generate)
+        os.replace(tmp_path, destination)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+
+def _concat_batch(destination, sources):
+    opened = []
+    seen = {}
+    try:
+        merged = pikepdf.new()
+        opened.append(merged)
+        for source in sources:
+            pdf = _open_source(source, opened)
+            first_page = len(merged.pages)
+            merged.pages.extend(pdf.pages)
+            for page in merged.pages[first_page:]:
+                _deduplicate_page_resources(page, seen)
+        _write_pdf(merged, destination)
+    finally:
+        for pdf in reversed(opened):
+            pdf.close()
+
+
+def concat_pdf_files(destination, sources):
+    """
+    Write the pages of sources (PDF file paths, or small PDFs as bytes) in order to destination.
+    Return the destination path.
+    """
+    destination = Path(destination)
+    sources = list(sources)
+    batch_paths = []
+    try:
+        while len(sources) > MAX_OPEN_SOURCES:
+            batches = []
+            for start in range(0, len(sources), MAX_OPEN_SOURCES):
+                fd, batch_path = tempfile.mkstemp(prefix=destination.stem + ".batch.", suffix=".pdf", dir=destination.parent)
+                os.close(fd)
+                batch_paths.append(batch_path)
+                _concat_batch(batch_path, sources[start:start + MAX_OPEN_SOURCES])
+                batches.append(batch_path)
+            sources = batches
+        _concat_batch(destination, sources)
+    finally:
+        for batch_path in batch_paths:
+            Path(batch_path).unlink(missing_ok=True)
+    return destination
+
+
+def append_pdf_files(destination, sources):
+    """Append the pages of sources to the existing destination PDF."""
+    return concat_pdf_files(destination, [destination, *sources])
+
+
+def insert_image_pages(pdf_path, plans):
+    """
+    Insert images as A4 pages into the PDF at pdf_path, written once.
+
+    plans lists, for each copy of the file, its [(page number, image path), ...] ordered by page:
+    each image follows the page of that number (counted without the images of the copy inserted
+    before it), an image for a page the PDF does not have yet is dropped.
+    """
+    a4inpt = (img2pdf.mm_to_pt(210), img2pdf.mm_to_pt(297))
+    layout_fun = img2pdf.get_layout_fun(a4inpt)
+
+    opened = []
+    inserted = 0
+    try:
+        pdf = pikepdf.open(pdf_path)
+        opened.append(pdf)
+        for plan in plans:
+            pages_count = len(pdf.pages)
+            added_pages = 0
+            for page_nr, image_path in plan:
+                if not 1 <= page_nr <= pages_count:
+                    continue
+                image_pdf = _open_source(img2pdf.convert(str(image_path), layout_fun=layout_fun), opened)
+                pdf.pages.insert(page_nr + added_pages, image_pdf.pages[0])
+                added_pages += 1
+            inserted += added_pages
+        if inserted:
+            _write_pdf(pdf, pdf_path)
+    finally:
+        for opened_pdf in reversed(opened):
+            opened_pdf.close()
+    return inserted
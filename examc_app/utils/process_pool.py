@@ -0,0 +1,64 @@
+"""Process pools usable from the Celery worker tasks.
+
+The worker runs with Celery's default prefork pool: every task executes in a daemonic
+billiard process, and the standard library pools (multiprocessing, concurrent.futures)
+refuse to start children from a daemonic process. billiard, the multiprocessing fork
+Celery is built on, has no such restriction, so the pools below are billiard pools and
+work in the worker as well as in a management command or a test.
+
+Map work over a pool with pool_imap below rather than the pool's own imap: billiard credits
+all the results of an imap job to its first worker, and the other workers then wait
+GUARANTEE_MESSAGE_CONSUMPTION_RETRY_LIMIT (30s) at exit for results they think unread.
+"""
+
+import contextlib
+import queue
+
+import billiard
+
+
+@contextlib.contextmanager
+def process_pool(processes, initializer=None, initargs=()):
+    """
+    Yield a billiard pool of processes, closed and joined on exit.
+
+    The workers are terminated if the body raises, so a failed task does not wait for
+    the work still queued.
+    """
+    pool = billiard.Pool(processes=processes, initializer=initializer, initargs=initargs)
+    try:
+        yield pool
+    except BaseException:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+
+
+def pool_imap(pool, function, items, ordered=True):
+    """
+    Apply function to each of items in pool and yield the results, in the items order
+    if ordered, else as they are ready. The first exception raised by function is raised.
+    """
+    if ordered:
+        results = [pool.apply_async(function, (item,)) for item in items]
+        for result in results:
+            yield result.get()
+        return
+
+    ready = queue.SimpleQueue()
+    count = 0
+    for item in items:
+        pool.apply_async(
+            function, (item,),
+            callback=lambda value: ready.put((True, value)),
+            error_callback=lambda exception_info: ready.put((False, exception_info)),
+        )
+        count += 1
+    for _ in range(count):
+        success, value = ready.get()
+        if not success:
+            raise value.exception
+        yield value
@@ -0,0 +1,103 @@
+"""Change tracking of the scan pages sent to AMC by the import from review.
+
+The file AMC analyses for a page is its marked scan, rendered from the original
+scan, the review markers of the page and the grading scheme boxes checked for
+the copy. A hash of these inputs is recorded on the page
+(:model:`examc_app.ScanPage`) when a capture from review succeeds, so the next
+import only renders and analyses the pages whose inputs changed since.
+
+Exams imported before the scans index existed have no pages to compare with,
+their import from review keeps rendering and analysing every scan.
+"""
+
+import hashlib
+from pathlib import Path
+
+from django.utils import timezone
+
+from examc_app.models import PageMarkers, PagesGroupGradingSchemeCheckedBox, ScanPage
+
+
+def _get_markers_by_filename(exam):
+    markers_by_filename = {}
+    page_markers_qs = (
+        PageMarkers.objects
+        .filter(exam=exam)
+        .exclude(markers__isnull=True)
+        .exclude(markers="")
+        .order_by("pk")
+        .values_list("filename", "pages_group_id", "markers")
+    )
+    for filename, pages_group_id, markers in page_markers_qs:
+        markers_by_filename.setdefault(Path(filename).name, []).append((pages_group_id, markers))
+    return markers_by_filename
+
+
+def _get_grading_state_by_copy(exam):
+    # the checked boxes, their points and the maximum of the scheme decide the derived correction box
+    grading_state_by_copy = {}
+    checked_boxes = (
+        PagesGroupGradingSchemeCheckedBox.objects
+        .filter(pages_group__exam=exam, pages_group__use_grading_scheme=True)
+        .exclude(gradingSchemeCheckBox__isnull=True)
+        .order_by("pages_group_id", "gradingSchemeCheckBox_id", "pk")
+        .values_list(
+            "copy_nr",
+            "pages_group_id",
+            "gradingSchemeCheckBox_id",
+            "gradingSchemeCheckBox__points",
+            "adjustment",
+            "gradingSchemeCheckBox__questionGradingScheme__max_points",
+        )
+    )
+    for copy_nr, *checked_box in checked_boxes:
+        copy_key = str(copy_nr).lstrip("0").zfill(4)
+        grading_state_by_copy.setdefault(copy_key, []).append(repr(checked_box))
+    return grading_state_by_copy
+
+
+def compute_review_capture_hashes(exam, scan_pages):
+    """Return {scan page pk: hash of the inputs of its marked scan} for the given scan pages."""
+    markers_by_filename = _get_markers_by_filename(exam)
+    grading_state_by_copy = _get_grading_state_by_copy(exam)
+    grading_groups = repr(sorted(exam.pagesGroup.filter(use_grading_scheme=True).values_list("pk", flat=True)))
+
+    capture_hashes = {}
+    for scan_page in scan_pages:
+        inputs_hash = hashlib.sha256()
+        inputs_hash.update(scan_page.content_hash.encode())
+        for pages_group_id, markers in markers_by_filename.get(scan_page.filename, []):
+            inputs_hash.update(b"\0markers\0" + str(pages_group_id).encode() + b"\0" + markers.encode())
+        inputs_hash.update(b"\0grading\0" + grading_groups.encode())
+        for checked_box in grading_state_by_copy.get(scan_page.copie_no.lstrip("0").zfill(4), []):
+            inputs_hash.update(b"\0" + checked_box.encode())
+        capture_hashes[scan_page.pk] = inputs_hash.hexdigest()
+    return capture_hashes
+
+
+def get_changed_review_pages(exam):
+    """
+    Return (changed scan pages, unchanged pages count, capture hashes) for an import from review,
+    or None when the exam scans are not indexed.
+    """
+    scan_pages = list(ScanPage.objects.filter(exam=exam).order_by("copie_no", "page_no", "extra"))
+    if not scan_pages:
+        return None
+
+    capture_hashes = compute_review_capture_hashes(exam, scan_pages)
+    changed_pages = [scan_page for scan_page in scan_pages if scan_page.capture_hash != capture_hashes[scan_page.pk]]
+    return changed_pages, len(scan_pages) - len(changed_pages), capture_hashes
+
+
+def record_review_capture(scan_pages, capture_hashes):
+    """Record the capture hashes of scan pages analysed by a successful capture from review."""
+    captured_at = timezone.now()
+    for scan_page in scan_pages:
+        scan_page.capture_hash = capture_hashes[scan_page.pk]
+        scan_page.captured_at = captured_at
+    ScanPage.objects.bulk_update(scan_pages, ["capture_hash", "captured_at"], batch_size=500)
+
+
+def clear_review_capture(exam):
+    """Forget the captured state of all the pages, e.g. when AMC capture data comes from another source."""
+    ScanPage.objects.filter(exam=exam).update(capture_hash='', captured_at=None)
@@ -7,12 +7,14 @@ import os
 import re
 import shutil
 import time
+import zipfile
 from decimal import Decimal
 from fileinput import filename
-from functools import lru_cache
+from functools import lru_cache, partial
 from os.path import isdir
 
 import cv2
+import numpy as np
 from PIL import Image, ImageStat, ImageEnhance
 from django.conf import settings
 from django.db.models import Sum
@@ -21,55 +23,134 @@ from docutils.nodes import entry
 from fpdf import FPDF
 
 from examc_app.models import *
-import pyzbar.pyzbar as pyzbar
 from datetime import datetime
 
 from examc_app.signing import make_token_for
 from examc_app.utils.amc_db_queries import get_questions, get_question_start_page_by_student, get_question_number
 from examc_app.utils.amc_functions import get_amc_project_path
+from examc_app.utils.process_pool import pool_imap, process_pool
+from examc_app.utils.qrcode_detection import QRCodeDetector, get_exam_qrcode_detector, save_exam_qrcode_detector
+from examc_app.utils.scan_manifest import ScanManifest, scan_content_hash, get_exam_scan_files, delete_exam_scan_index, get_exam_scans_dir
+from examc_app.utils.scan_previews import generate_scans_previews, select_scan_preview, delete_scans_previews
+from examc_app.utils.zip_security import validate_zip_members
 
 
 IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
 
 
-# Detect QRCodes on scans, split copies in subfolders and detect nb pages
-def split_scans_by_copy(exam, tmp_extract_path,progress_recorder,process_count,process_number):
+def get_scans_decode_processes():
+    processes = int(getattr(settings, "SCANS_DECODE_PROCESSES", 0) or 0)
+    if processes <= 0:
+        processes = os.cpu_count() or 1
+    return processes
+
+
+def decode_scan_image_qrcode(im, regions_order=None):
+    has_symbols, data, region = QRCodeDetector().detect(im, regions_order)
+    return True, has_symbols, data, region
+
+
+def decode_scan_qrcode(file_path, regions_order=None):
+    """
+    Read one scan and decode its eXamc QR code.
+
+    Returns a tuple (is_jpeg, has_symbols, qrcode_data, region) where qrcode_data is the split QR code
+    content (['eXamcQRC', copy_nr, page_nr, ...]) or None if no eXamc QR code was found, and region the
+    page region where the detector found it.
+    Runs in the decode pool workers, so it must stay a picklable module level function.
+    """
+    if imghdr.what(file_path) != 'jpeg':
+        return False, False, None, None
+
+    return decode_scan_image_qrcode(cv2.imread(file_path), regions_order)
+
+
+def decode_scan_qrcode_bytes(image_bytes, regions_order=None):
+    """Same as decode_scan_qrcode for a scan already loaded in memory (e.g. read from the uploaded zip)."""
+    if imghdr.what(None, h=image_bytes) != 'jpeg':
+        return False, False, None, None
+
+    im = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return decode_scan_image_qrcode(im, regions_order)
+
+
+def iter_decoded_scans(items, decode_function=decode_scan_qrcode, load_item=None, known_result=None, processes=None, detector=None):
+    """
+    Yield (item, payload, decode result) in the same order as items.
+
+    payload is load_item(item) (or the item itself) and is what decode_function receives.
+    known_result(item, payload) can return the result of an already decoded scan, which is then not decoded again.
+    Decoding is done in a process pool when more than one process is configured, the caller
+    still consumes the results sequentially. The pool is a billiard pool (see process_pool),
+    so it also runs inside the prefork Celery worker. Items are loaded and submitted by batches so the
+    memory stays bounded and the regions order learned by the detector is updated during the import.
+    """
+    if processes is None:
+        processes = get_scans_decode_processes()
+    processes = min(processes, len(items))
+    if detector is None:
+        detector = QRCodeDetector()
+    if load_item is None:
+        load_item = lambda item: item
+    if known_result is None:
+        known_result = lambda item, payload: None
+
+    if processes <= 1:
+        for item in items:
+            payload = load_item(item)
+            result = known_result(item, payload)
+            if result is None:
+                result = decode_function(payload, detector.regions_order())
+                detector.record_hit(result[3])
+            yield item, payload, result
+        return
 
+    batch_size = processes * 16
+    with process_pool(processes) as pool:
+        for batch_start in range(0, len(items), batch_size):
+            batch = items[batch_start:batch_start + batch_size]
+            payloads = [load_item(item) for item in batch]
+            results = [known_result(item, payload) for item, payload in zip(batch, payloads)]
+            to_decode = [index for index, result in enumerate(results) if result is None]
+            decode = partial(decode_function, regions_order=detector.regions_order())
+            for index, result in zip(to_decode, pool_imap(pool, decode, [payloads[index] for index in to_decode])):
+                detector.record_hit(result[3])
+                results[index] = result
+            for item, payload, result in zip(batch, payloads, results):
+                yield item, payload, result
+
+
+def assign_decoded_scans_to_copies(exam, decoded_scans, store_scan, progress_recorder, process_count, process_number):
+    """
+    Assign decoded scans to copies and pages and store them in the exam scans folder.
+
+    decoded_scans yields (filename, payload, decode result) in the scans sorted order, store_scan(filename, payload, path)
+    writes the scan to its final copy_XXXX_YY location.
+    """
     scans_dir = str(settings.SCANS_ROOT) + "/" + str(exam.year.code) + "/" + str(exam.semester.code) + "/" + exam.code+"_"+exam.date.strftime("%Y%m%d")
 
-    print("* Start splitting by copy")
-
     copy_nr = 0
     page_nr = 0
-    pages_by_copy = []
     extra_i = 0
-    pages_count = 0
-    last_copy_nr = 0
     last_page_nr = 0
-    copy_count = 0
-    scans_files = sorted(os.listdir(tmp_extract_path))
 
-
-    for filename in scans_files:
+    # QR codes are decoded in a process pool, copy/page/extra assignment below stays sequential
+    # because it depends on the sorted order of the scans
+    for filename, payload, (is_jpeg, has_symbols, qrcode_data, qrcode_region) in decoded_scans:
         print(' -- '+filename)
 
         process_number += 1
         progress_recorder.set_progress(process_number, process_count, description=str(process_number) + '/' + str(
             process_count) + ' - Splitting scans by copy :'+ filename)
 
-        f = os.path.join(tmp_extract_path, filename)
         # checking if it is a jpeg file
-        if imghdr.what(f) == 'jpeg':
-            # Read image
-            im = cv2.imread(f)
-            decodedObjects = pyzbar.decode(im)
-            if len(decodedObjects) > 0:
-                for obj in decodedObjects:
-                    if str(obj.type) == 'QRCODE' and ('CePROExamsQRC' in str(obj.data) or 'eXamcQRC' in str(obj.data)):
-                        data = obj.data.decode("utf-8").split(',')
-                        copy_nr = data[1]
-                        page_nr = data[2]
-                        extra_i = 0
+        if is_jpeg:
+            if has_symbols:
+                if qrcode_data:
+                    # padded like in the scans filenames, so decoded and manifest values compare equal
+                    copy_nr = str(qrcode_data[1]).zfill(4)
+                    page_nr = str(qrcode_data[2]).zfill(2)
+                    extra_i = 0
             else:
                 extra_i += 1
 
@@ -84,35 +165,115 @@ def split_scans_by_copy(exam, tmp_extract_path,progress_recorder,process_count,p
             if extra_i > 0:
                 page_nr_w_extra += "." + str(extra_i)
 
-            os.rename(f, subdir + "/copy_" + str(copy_nr).zfill(4) + "_" + str(page_nr_w_extra) + pathlib.Path(
+            store_scan(filename, payload, subdir + "/copy_" + str(copy_nr).zfill(4) + "_" + str(page_nr_w_extra) + pathlib.Path(
                 filename).suffix)
 
-            pages_count += 1
-            if last_copy_nr != 0 and last_copy_nr != copy_nr:
-                pages_by_copy.append([last_copy_nr, pages_count])
-                pages_count = 0
-                copy_count += 1
-
             if last_page_nr != page_nr:
                 extra_i = 0
 
             last_page_nr = page_nr
-            last_copy_nr = copy_nr
 
-    pages_by_copy.append([last_copy_nr, pages_count])
-    json_pages_by_copy = json.dumps(pages_by_copy)
+    return process_number
+
+
+# Detect QRCodes on scans read from the uploaded zip archive, split copies in subfolders and detect nb pages.
+# Pages already in the exam scans manifest are neither decoded nor written again.
+def split_zip_scans_by_copy(exam, archive, members, progress_recorder, process_count, process_number, source_archive=''):
+
+    print("* Start splitting by copy from zip")
+
+    manifest = ScanManifest(exam, source_archive)
+    manifest.backfill(get_exam_scans_dir(exam))
+    content_hashes = {}
+
+    def load_member(zip_info):
+        image_bytes = archive.read(zip_info)
+        content_hashes[zip_info.filename] = scan_content_hash(image_bytes)
+        return image_bytes
+
+    def known_result(zip_info, image_bytes):
+        return manifest.decode_result(content_hashes[zip_info.filename])
+
+    written_scans_paths = []
+
+    def store_scan(filename, image_bytes, scan_path):
+        content_hash = content_hashes[filename]
+        if manifest.is_stored(scan_path, content_hash):
+            return
+        with open(scan_path, 'wb') as scan_file:
+            scan_file.write(image_bytes)
+        # only the jpeg header is read to get the size
+        manifest.record(scan_path, content_hash, Image.open(io.BytesIO(image_bytes)).size)
+        written_scans_paths.append(scan_path)
+
+    qrcode_detector = get_exam_qrcode_detector(exam)
+
+    def decoded_scans():
+        for zip_info, image_bytes, result in iter_decoded_scans(
+            members,
+            decode_function=decode_scan_qrcode_bytes,
+            load_item=load_member,
+            known_result=known_result,
+            detector=qrcode_detector,
+        ):
+            yield zip_info.filename, image_bytes, result
+            # the scan is stored or skipped once the caller asks for the next one, only the hashes
+            # of the batch being decoded are kept
+            content_hashes.pop(zip_info.filename, None)
+
+    try:
+        process_number = assign_decoded_scans_to_copies(exam, decoded_scans(), store_scan, progress_recorder, process_count, process_number)
+    finally:
+        # keep what was imported so far, a crashed import resumes from there
+        manifest.flush()
+        save_exam_qrcode_detector(exam, qrcode_detector)
+
+    progress_recorder.set_progress(process_number, process_count, description=str(process_number) + '/' + str(
+        process_count) + ' - Generating scans previews...')
+    generate_scans_previews(written_scans_paths, get_scans_decode_processes())
 
-    exam.pages_by_copy = json_pages_by_copy
+    pages_by_copy = manifest.pages_by_copy()
+    exam.pages_by_copy = json.dumps(pages_by_copy)
     exam.save()
 
-    copy_count += 1
-    return [copy_count,process_number]
+    return [len(pages_by_copy), process_number]
+
+
+def get_zip_scans_members(archive):
+    """
+    Return the validated scan members of an uploaded archive, sorted by filename.
+
+    As with the extracted archive, scans are taken from the first top level folder if the archive
+    has one, otherwise from the archive root.
+    """
+    members = [
+        (zip_info, member_path)
+        for zip_info, member_path in validate_zip_members(archive)
+        if not zip_info.is_dir()
+    ]
+    folders = sorted({
+        member_path.parts[0]
+        for zip_info, member_path in members
+        if len(member_path.parts) > 1 and member_path.parts[0] != "__MACOSX"
+    })
+
+    if folders:
+        scans_members = [
+            (zip_info, member_path)
+            for zip_info, member_path in members
+            if len(member_path.parts) == 2 and member_path.parts[0] == folders[0]
+        ]
+    else:
+        scans_members = [
+            (zip_info, member_path)
+            for zip_info, member_path in members
+            if len(member_path.parts) == 1
+        ]
+
+    return [zip_info for zip_info, member_path in sorted(scans_members, key=lambda member: member[1].name)]
 
 
-def import_scans(exam, path,delete_old,progress_recorder,process_count,process_number):
-    print("* Start importing scans")
-    scans_dir = str(settings.SCANS_ROOT) + "/" + str(exam.year.code) + "/" + str(exam.semester.code) + "/" + exam.code+"_"+exam.date.strftime("%Y%m%d")
-    os.makedirs(scans_dir, exist_ok=True)
+def delete_old_scans_data(exam, delete_old, progress_recorder, process_count, process_number):
     progress_recorder.set_progress(process_number, process_count, description=str(process_number) + '/' + str(
         process_count) + ' - Deleting old scans...')
     process_number += 1
@@ -128,15 +289,34 @@ def import_scans(exam, path,delete_old,progress_recorder,process_count,process_n
     process_number += 1
     if delete_old:
         PagesGroupComment.objects.filter(pages_group__exam=exam).delete()
-    count = 0
-    for tmp_scan in os.listdir(path):
-        count += 1
 
-    print(str(count) + " scans imported")
-    process_number += 1
-    progress_recorder.set_progress(process_number, process_count, description=str(process_number) + '/' + str(
-        process_count) + ' - Splitting scans by copy...')
-    result = split_scans_by_copy(exam, path,progress_recorder,process_count,process_number)
+    return process_number
+
+
+def import_scans_from_zip(exam, zip_file_path, delete_old, progress_recorder, process_count, process_number, source_archive=''):
+    """
+    Import scans straight from the uploaded zip archive.
+
+    Members are validated like safe_extract_zip does, read in memory and written once to their
+    final copy_XXXX_YY location, without a temporary extraction folder.
+    Without delete_old, the import is incremental: only pages missing from the exam scans
+    manifest, or whose content changed, are written.
+    """
+    print("* Start importing scans from zip")
+    scans_dir = str(settings.SCANS_ROOT) + "/" + str(exam.year.code) + "/" + str(exam.semester.code) + "/" + exam.code+"_"+exam.date.strftime("%Y%m%d")
+    os.makedirs(scans_dir, exist_ok=True)
+
+    with zipfile.ZipFile(zip_file_path, 'r') as archive:
+        # Security hardening: validated members (no traversal/symlink/oversized archive).
+        members = get_zip_scans_members(archive)
+
+        process_number = delete_old_scans_data(exam, delete_old, progress_recorder, process_count, process_number)
+
+        print(str(len(members)) + " scans imported")
+        process_number += 1
+        progress_recorder.set_progress(process_number, process_count, description=str(process_number) + '/' + str(
+            process_count) + ' - Splitting scans by copy...')
+        result = split_zip_scans_by_copy(exam, archive, members, progress_recorder, process_count, process_number, source_archive)
 
     return result
 
@@ -172,6 +352,8 @@ def create_students_from_amc(exam):
 
 def delete_old_scans(exam):
     scans_dir = str(settings.SCANS_ROOT) + "/" + str(exam.year.code) + "/" + str(exam.semester.code) + "/" + exam.code+"_"+exam.date.strftime("%Y%m%d")
+    delete_exam_scan_index(exam)
+    delete_scans_previews(str(exam.year.code) + "/" + str(exam.semester.code) + "/" + exam.code+"_"+exam.date.strftime("%Y%m%d"))
     for filename in os.listdir(scans_dir):
         file_path = os.path.join(scans_dir, filename)
         try:
@@ -384,64 +566,66 @@ def get_copies_pages_by_group(pagesGroup):
 
     copies_pages_list = []
 
-    if scans_dir.exists():
-        # Iterate dirs and files with scandir (faster than listdir + isdir)
-        for d_entry in sorted(os.scandir(scans_dir), key=lambda e: e.name):
-            if not d_entry.is_dir():
-                continue
-
-            dir_path = pathlib.Path(d_entry.path)
-
-            for f_entry in sorted(os.scandir(dir_path), key=lambda e: e.name):
-                if not f_entry.is_file():
-                    continue
-                name = f_entry.name
-                if name.endswith("full.jpg"):
-                    continue
-
-                # Expect ..._<copy_no>_<page>.jpg
-                try:
-                    base = name[:-4] if name.lower().endswith(".jpg") else name
-                    left, copy_no, page_no_real = base.rsplit("_", 2)
-                except ValueError:
-                    # filename not matching pattern; skip quickly
+    # Scans files from the scan index, or from the scans folder for exams imported before it existed
+    scan_files = get_exam_scan_files(exam)
+    if scan_files is None:
+        scan_files = []
+        if scans_dir.exists():
+            # Iterate dirs and files with scandir (faster than listdir + isdir)
+            for d_entry in sorted(os.scandir(scans_dir), key=lambda e: e.name):
+                if not d_entry.is_dir():
                     continue
+                for f_entry in sorted(os.scandir(d_entry.path), key=lambda e: e.name):
+                    if f_entry.is_file():
+                        scan_files.append((d_entry.name, f_entry.name))
 
+    for _, name in scan_files:
+        if name.endswith("full.jpg"):
+            continue
 
-                # page number checks (first 2 chars)
-                try:
-                    page_no_int = int(page_no_real[:2])
-                except ValueError:
-                    continue
+        # Expect ..._<copy_no>_<page>.jpg
+        try:
+            base = name[:-4] if name.lower().endswith(".jpg") else name
+            left, copy_no, page_no_real = base.rsplit("_", 2)
+        except ValueError:
+            # filename not matching pattern; skip quickly
+            continue
 
-                # AMC range gate (cached)
-                try:
-                    copy_no_int = int(copy_no)
-                except ValueError:
-                    # copy number malformed; skip
-                    continue
 
-                from_to = get_from_to(copy_no_int)
-                if not from_to:
-                    continue
-                from_p, to_p = from_to
-                if not (from_p <= page_no_int <= to_p):
-                    continue
+        # page number checks (first 2 chars)
+        try:
+            page_no_int = int(page_no_real[:2])
+        except ValueError:
+            continue
 
-                copy_has_comment = copy_no in comments_set
-                # Normalize keys like before
-                copy_no_z4 = str(copy_no).zfill(4)
-                page_no_norm = str(page_no_real).zfill(2).replace(".", "x")
-                if pagesGroup.use_grading_scheme:
-                    marked = copy_no_z4 in grading_scheme_marked_copies and page_no_int == from_p
-                else:
-                    marked = markers_idx.get((copy_no_z4, page_no_norm), False)
-                copies_pages_list.append({
-                    "copy_no": copy_no,
-                    "page_no": page_no_real,
-                    "marked": marked,
-                    "comment": copy_has_comment,
-                })
+        # AMC range gate (cached)
+        try:
+            copy_no_int = int(copy_no)
+        except ValueError:
+            # copy number malformed; skip
+            continue
+
+        from_to = get_from_to(copy_no_int)
+        if not from_to:
+            continue
+        from_p, to_p = from_to
+        if not (from_p <= page_no_int <= to_p):
+            continue
+
+        copy_has_comment = copy_no in comments_set
+        # Normalize keys like before
+        copy_no_z4 = str(copy_no).zfill(4)
+        page_no_norm = str(page_no_real).zfill(2).replace(".", "x")
+        if pagesGroup.use_grading_scheme:
+            marked = copy_no_z4 in grading_scheme_marked_copies and page_no_int == from_p
+        else:
+            marked = markers_idx.get((copy_no_z4, page_no_norm), False)
+        copies_pages_list.append({
+            "copy_no": copy_no,
+            "page_no": page_no_real,
+            "marked": marked,
+            "comment": copy_has_comment,
+        })
     # Sorting: avoid float() (can fail if letters); sort by numeric copy_no then by (first two digits, full tail)
     def page_sort_key(page_no: str):
         head = page_no[:2]
@@ -578,13 +762,23 @@ def get_scans_list(exam):
     scans_dir_path = str(settings.SCANS_ROOT) + "/" + str(exam.year.code) + "/" + str(exam.semester.code) + "/" + exam.code + "_" + exam.date.strftime("%Y%m%d")
     scans_dir_path = scans_dir_path.replace(' ', '_')
     result = []
-    if os.path.exists(scans_dir_path):
-        list_dir_copies = sorted(os.listdir(scans_dir_path))
-        for entry in list_dir_copies:
+    scan_files = get_exam_scan_files(exam)
+    if scan_files is not None:
+        pages_by_copy_dir = {}
+        for copy_dir, filename in scan_files:
+            pages_by_copy_dir.setdefault(copy_dir, []).append(filename)
+    elif os.path.exists(scans_dir_path):
+        pages_by_copy_dir = {entry: sorted(os.listdir(os.path.join(scans_dir_path, entry)))
+                             for entry in os.listdir(scans_dir_path)}
+    else:
+        pages_by_copy_dir = {}
+
+    if pages_by_copy_dir:
+        for entry in sorted(pages_by_copy_dir):
             entry_path = os.path.join(scans_dir_path, entry)
             copy = {'copy': entry,
                       'pages': []}
-            list_dir_pages = sorted(os.listdir(entry_path))
+            list_dir_pages = pages_by_copy_dir[entry]
             for child in list_dir_pages:
                 #check if marked page exist
                 marked_scan_path = (entry_path+"/marked_"+child).replace('scans','marked_scans')
@@ -603,15 +797,24 @@ def get_scans_list_by_copy(exam,copy_nr):
     scans_dir_path = scans_dir_path.replace(' ', '_')
     scans_dir_path += "/"+copy_nr
     result = []
-    if os.path.exists(scans_dir_path):
+    scan_files = get_exam_scan_files(exam, copy_nr)
+    if scan_files is not None:
+        list_dir_copies = [filename for copy_dir, filename in scan_files]
+    elif os.path.exists(scans_dir_path):
         list_dir_copies = sorted(os.listdir(scans_dir_path))
-        for entry in list_dir_copies:
-            page = entry.replace('.jpg', '').split('_').pop()
-            if int(page.split('.')[0]) != 1:
-                result.append({'copy_no':copy_nr,'page_no':page})
+    else:
+        list_dir_copies = []
+    for entry in list_dir_copies:
+        page = entry.replace('.jpg', '').split('_').pop()
+        if int(page.split('.')[0]) != 1:
+            result.append({'copy_no':copy_nr,'page_no':page})
     return result
 
-def get_scan_url(exam,copy_nr,page_nr):
+def get_scan_url(exam,copy_nr,page_nr,viewport_width=None):
+    """
+    Return the signed url of a copy page scan. With the width (in device pixels) of the client
+    viewport, the url of the smallest preview level covering it is returned when there is one.
+    """
     scans_dir_path = str(settings.SCANS_ROOT) + "/" + str(exam.year.code) + "/" + str(exam.semester.code) + "/" + exam.code + "_" + exam.date.strftime("%Y%m%d")
     scans_dir_path = scans_dir_path.replace(' ', '_')
     scans_dir_path += "/" + copy_nr
@@ -619,14 +822,22 @@ def get_scan_url(exam,copy_nr,page_nr):
     scans_url += "/"+ copy_nr + "/"
 
     scan_url = ''
-    if os.path.exists(scans_dir_path):
+    scan_files = get_exam_scan_files(exam, copy_nr)
+    if scan_files is not None:
+        list_dir_copies = [filename for copy_dir, filename in scan_files]
+    elif os.path.exists(scans_dir_path):
         list_dir_copies = sorted(os.listdir(scans_dir_path))
-        for entry in list_dir_copies:
-            entry_path = os.path.join(scans_dir_path, entry)
-            page = entry.replace('.jpg', '').split('_').pop()
-            if page == page_nr:
+    else:
+        list_dir_copies = []
+    for entry in list_dir_copies:
+        page = entry.replace('.jpg', '').split('_').pop()
+        if page == page_nr:
+            preview_rel_path = select_scan_preview(scans_url+entry, viewport_width)
+            if preview_rel_path:
+                scan_url = make_token_for(preview_rel_path,str(settings.SCANS_PREVIEWS_ROOT))
+            else:
                 scan_url = make_token_for(scans_url+entry,str(settings.SCANS_ROOT))
-                break
+            break
     return scan_url
 
 def get_grading_scheme_checkboxes(grading_scheme_id, copy_nr):
@@ -0,0 +1,209 @@
+"""Per-exam manifest and index of the imported scan pages.
+
+Every page written to the exam scans folder is recorded with the hash of its
+content, its copy/page/extra position, the archive it came from and the import
+time (:model:`examc_app.ScanPage`). Importing a new batch of scans then only
+decodes and writes the pages the manifest does not know yet: already imported
+pages are skipped, replaced pages are rewritten and an import that crashed
+halfway can simply be run again.
+
+The same rows, with the size and mtime of the files, index the exam scans
+folder so review pages do not walk it on every request. Exams imported before
+the index existed have no rows: the readers below then return None and the
+callers fall back to listing the folder. The next import of such an exam first
+records the pages already in its folder (ScanManifest.backfill), so the index
+never covers only the pages of the latest import.
+"""
+
+import hashlib
+import os
+import re
+
+from django.conf import settings
+from django.utils import timezone
+from PIL import Image
+
+from examc_app.models import ScanPage
+
+SCAN_FILENAME_RE = re.compile(r"^copy_(?P<copy>\d+)_(?P<page>\d+)(?:\.(?P<extra>\d+))?\.[^.]+$")
+
+# Number of manifest entries written to the database at once
+MANIFEST_FLUSH_SIZE = 100
+
+
+def scan_content_hash(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def get_exam_scans_dir(exam):
+    return str(settings.SCANS_ROOT) + "/" + str(exam.year.code) + "/" + str(exam.semester.code) + "/" + exam.code+"_"+exam.date.strftime("%Y%m%d")
+
+
+def parse_scan_filename(filename):
+    """Return (copie_no, page_no, extra) of a copy_XXXX_YY[.E].ext scan filename, or None."""
+    match = SCAN_FILENAME_RE.match(os.path.basename(filename))
+    if not match:
+        return None
+    return match.group("copy"), match.group("page"), int(match.group("extra") or 0)
+
+
+class ScanManifest:
+    """Manifest of the scan pages of an exam, loaded once per import."""
+
+    def __init__(self, exam, source_archive=''):
+        self.exam = exam
+        self.source_archive = source_archive
+        self.pages_by_slot = {}
+        self.pages_by_hash = {}
+        self.pending = []
+        for scan_page in ScanPage.objects.filter(exam=exam):
+            self._index(scan_page)
+
+    def _index(self, scan_page):
+        self.pages_by_slot[(scan_page.copie_no, scan_page.page_no, scan_page.extra)] = scan_page
+        self.pages_by_hash.setdefault(scan_page.content_hash, []).append(scan_page)
+
+    def backfill(self, scans_dir):
+        """
+        Record the pages already stored in scans_dir when the manifest is empty, i.e. for an exam
+        imported before the index existed. Return the number of recorded pages.
+        """
+        if self.pages_by_slot or not os.path.isdir(scans_dir):
+            return 0
+        recorded = 0
+        for copy_dir in sorted(os.listdir(scans_dir)):
+            copy_path = os.path.join(scans_dir, copy_dir)
+            if not os.path.isdir(copy_path):
+                continue
+            for filename in sorted(os.listdir(copy_path)):
+                scan_path = os.path.join(copy_path, filename)
+                if parse_scan_filename(filename) is None or not os.path.isfile(scan_path):
+                    continue
+                with open(scan_path, 'rb') as scan_file:
+                    content_hash = scan_content_hash(scan_file.read())
+                try:
+                    with Image.open(scan_path) as image:
+                        image_size = image.size
+                except OSError:
+                    image_size = None
+                self.record(scan_path, content_hash, image_size, source_archive='')
+                recorded += 1
+        self.flush()
+        return recorded
+
+    def decode_result(self, content_hash):
+        """
+        Return the QR code decode result of an already imported page content, or None.
+
+        Pages are only decoded again when the manifest does not know their content (or
+        knows it at places that do not agree on being an extra page or not).
+        """
+        scan_pages = self.pages_by_hash.get(content_hash)
+        if not scan_pages:
+            return None
+        if all(scan_page.extra > 0 for scan_page in scan_pages):
+            return True, False, None, None
+        if all(scan_page.extra == 0 for scan_page in scan_pages):
+            scan_page = scan_pages[0]
+            return True, True, ["eXamcQRC", scan_page.copie_no, scan_page.page_no], None
+        return None
+
+    def is_stored(self, scan_path, content_hash):
+        """Tell whether this exact content is already recorded and stored at scan_path."""
+        slot = parse_scan_filename(scan_path)
+        scan_page = self.pages_by_slot.get(slot)
+        return scan_page is not None and scan_page.content_hash == content_hash and os.path.exists(scan_path)
+
+    def record(self, scan_path, content_hash, image_size=None, source_archive=None):
+        """
+        Record a page written to scan_path, with the (width, height) of the image if known
+        and the archive it came from (the manifest one by default).
+        Entries are saved by batches, call flush() at the end.
+        """
+        copie_no, page_no, extra = parse_scan_filename(scan_path)
+        scan_page = self.pages_by_slot.get((copie_no, page_no, extra))
+        if scan_page is None:
+            scan_page = ScanPage(exam=self.exam, copie_no=copie_no, page_no=page_no, extra=extra)
+        elif scan_page.content_hash in self.pages_by_hash:
+            # replaced page, forget the previous content
+            previous_pages = self.pages_by_hash[scan_page.content_hash]
+            previous_pages.remove(scan_page)
+            if not previous_pages:
+                del self.pages_by_hash[scan_page.content_hash]
+
+        scan_stat = os.stat(scan_path)
+        scan_page.filename = os.path.basename(scan_path)
+        scan_page.content_hash = content_hash
+        scan_page.size = scan_stat.st_size
+        scan_page.mtime = scan_stat.st_mtime
+        if image_size:
+            scan_page.width, scan_page.height = image_size
+        scan_page.source_archive = self.source_archive if source_archive is None else source_archive
+        scan_page.imported_at = timezone.now()
+        self._index(scan_page)
+        self.pending.append(scan_page)
+
+        if len(self.pending) >= MANIFEST_FLUSH_SIZE:
+            self.flush()
+
+    def flush(self):
+        new_pages = [scan_page for scan_page in self.pending if scan_page.pk is None]
+        updated_pages = [scan_page for scan_page in self.pending if scan_page.pk is not None]
+        # the same page can be recorded twice in a batch, keep one instance per slot
+        new_pages = list({id(scan_page): scan_page for scan_page in new_pages}.values())
+        updated_pages = list({scan_page.pk: scan_page for scan_page in updated_pages}.values())
+        if new_pages:
+            ScanPage.objects.bulk_create(new_pages)
+            if any(scan_page.pk is None for scan_page in new_pages):
+                # backends not returning the ids of bulk created rows (MySQL)
+                pks_by_slot = {
+                    (copie_no, page_no, extra): pk
+                    for copie_no, page_no, extra, pk in ScanPage.objects.filter(exam=self.exam).values_list(
+                        'copie_no', 'page_no', 'extra', 'pk')
+                }
+                for scan_page in new_pages:
+                    scan_page.pk = pks_by_slot[(scan_page.copie_no, scan_page.page_no, scan_page.extra)]
+                    scan_page._state.adding = False
+        if updated_pages:
+            ScanPage.objects.bulk_update(updated_pages, ['filename', 'content_hash', 'source_archive', 'imported_at', 'size', 'mtime', 'width', 'height'])
+        self.pending = []
+
+    def pages_by_copy(self):
+        """Return [[copie_no, pages count], ...] for all the pages of the manifest, ordered by copy."""
+        pages_count = {}
+        for copie_no, page_no, extra in self.pages_by_slot:
+            pages_count[copie_no] = pages_count.get(copie_no, 0) + 1
+        return [[copie_no, pages_count[copie_no]] for copie_no in sorted(pages_count)]
+
+
+def get_exam_scan_copies(exam):
+    """Return the sorted copy folders names of the exam scans index, or None if the exam has no index."""
+    copies = set(ScanPage.objects.filter(exam=exam).values_list('copie_no', flat=True))
+    if not copies:
+        return None
+    return sorted(copies)
+
+
+def get_exam_scan_files(exam, copy_nr=None):
+    """
+    Return the indexed (copy folder, filename) of the exam scans, sorted like the folder listing,
+    or None if the exam has no index. copy_nr restricts the result to one copy folder.
+    """
+    scan_pages = ScanPage.objects.filter(exam=exam)
+    if copy_nr is None:
+        return sorted(scan_pages.values_list('copie_no', 'filename')) or None
+    if not scan_pages.exists():
+        return None
+    return sorted(scan_pages.filter(copie_no=copy_nr).values_list('copie_no', 'filename'))
+
+
+def delete_exam_scan_index(exam):
+    ScanPage.objects.filter(exam=exam).delete()
+
+
+def get_exam_scan_page(exam, copy_nr, page_nr):
+    """Return the indexed scan page of a copy whose filename ends with _<page_nr>, or None."""
+    for scan_page in ScanPage.objects.filter(exam=exam, copie_no=copy_nr):
+        if scan_page.filename.replace('.jpg', '').split('_').pop() == page_nr:
+            return scan_page
+    return None
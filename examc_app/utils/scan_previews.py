@@ -0,0 +1,106 @@
+"""Preview levels of the scans for the review canvas.
+
+The review canvas shows a scan much smaller than the 300 dpi original, so the
+import also writes downscaled copies of every page (SCANS_PREVIEW_WIDTHS, in
+SCANS_PREVIEW_FORMAT). They live in SCANS_PREVIEWS_ROOT, in a tree mirroring
+SCANS_ROOT with one folder per width:
+
+    <exam folder>/<copy>/<width>/copy_XXXX_YY.webp
+
+so the scans folders themselves keep only the originals (AMC and the exports
+list them). Markers are stored in canvas coordinates and mapped back to the
+original when rendered, so they do not depend on the level displayed.
+"""
+
+import os
+import shutil
+
+import cv2
+from django.conf import settings
+
+from examc_app.utils.process_pool import pool_imap, process_pool
+
+PREVIEW_ENCODE_PARAMS = {
+    "webp": [cv2.IMWRITE_WEBP_QUALITY, 80],
+    "jpeg": [cv2.IMWRITE_JPEG_QUALITY, 80],
+}
+
+PREVIEW_EXTENSIONS = {
+    "webp": ".webp",
+    "jpeg": ".jpg",
+}
+
+
+def get_scan_preview_rel_path(scan_rel_path, width, preview_format=None):
+    """Return the preview path, relative to SCANS_PREVIEWS_ROOT, of a scan path relative to SCANS_ROOT."""
+    preview_format = preview_format or settings.SCANS_PREVIEW_FORMAT
+    copy_dir, filename = os.path.split(scan_rel_path)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(copy_dir, str(width), stem + PREVIEW_EXTENSIONS[preview_format])
+
+
+def generate_scan_previews(scan_path):
+    """
+    Write the preview levels of a scan and return the list of written widths.
+
+    Each level is resized from the previous (larger) one, levels not smaller than the
+    original are skipped. Runs in the import pool workers, so it stays a module level function.
+    """
+    im = cv2.imread(scan_path)
+    if im is None:
+        return []
+
+    scan_rel_path = os.path.relpath(scan_path, str(settings.SCANS_ROOT))
+    preview_format = settings.SCANS_PREVIEW_FORMAT
+    written_widths = []
+    for width in sorted(settings.SCANS_PREVIEW_WIDTHS, reverse=True):
+        height, original_width = im.shape[:2]
+        if width >= original_width:
+            continue
+        im = cv2.resize(im, (width, max(1, round(height * width / original_width))), interpolation=cv2.INTER_AREA)
+        preview_path = os.path.join(str(settings.SCANS_PREVIEWS_ROOT), get_scan_preview_rel_path(scan_rel_path, width, preview_format))
+        os.makedirs(os.path.dirname(preview_path), exist_ok=True)
+        cv2.imwrite(preview_path, im, PREVIEW_ENCODE_PARAMS[preview_format])
+        written_widths.append(width)
+
+    return written_widths
+
+
+def generate_scans_previews(scan_paths, processes=1):
+    """
+    Generate the previews of a list of scans, in a process pool when more than one process is given
+    (a billiard pool, which also runs inside the prefork Celery worker).
+    """
+    scan_paths = list(scan_paths)
+    processes = min(processes, len(scan_paths))
+    if processes <= 1:
+        for scan_path in scan_paths:
+            generate_scan_previews(scan_path)
+        return
+
+    with process_pool(processes) as pool:
+        for _ in pool_imap(pool, generate_scan_previews, scan_paths, ordered=False):
+            pass
+
+
+def select_scan_preview(scan_rel_path, viewport_width):
+    """
+    Return the relative path of the smallest preview at least as wide as the viewport, or None
+    when the original should be served (no viewport given, viewport larger than all the levels,
+    or previews not generated for this scan).
+    """
+    if not viewport_width:
+        return None
+    for width in sorted(settings.SCANS_PREVIEW_WIDTHS):
+        if width >= viewport_width:
+            preview_rel_path = get_scan_preview_rel_path(scan_rel_path, width)
+            if os.path.exists(os.path.join(str(settings.SCANS_PREVIEWS_ROOT), preview_rel_path)):
+                return preview_rel_path
+            return None
+    return None
+
+
+def delete_scans_previews(exam_rel_dir):
+    previews_dir = os.path.join(str(settings.SCANS_PREVIEWS_ROOT), exam_rel_dir)
+    if os.path.exists(previews_dir):
+        shutil.rmtree(previews_dir)
@@ -4,6 +4,7 @@ Secure ZIP extraction helpers.
 Purpose:
 - Replace direct `ZipFile.extractall(...)` calls on uploaded archives.
 - Enforce path and archive safety checks before writing files to disk.
+- Validate archives read member by member without extraction (`validate_zip_members`).
 
 Protections:
 - Reject absolute paths and `..` traversal in archive member names.
@@ -35,16 +36,13 @@ def _validate_zip_member_name(member_name: str) -> PurePosixPath:
     return member_path
 
 
-def safe_extract_zip(
+def validate_zip_members(
     archive: ZipFile,
-    destination: str | Path,
     *,
     max_files: int = 20000,
     max_total_uncompressed_size: int = 2 * 1024 * 1024 * 1024,
-) -> list[Path]:
-    destination_root = Path(destination).resolve()
-    destination_root.mkdir(parents=True, exist_ok=True)
-
+) -> list[tuple[ZipInfo, PurePosixPath]]:
+    """Validate every archive member and return them with their validated relative path."""
     members = archive.infolist()
     if len(members) > max_files:
         raise UnsafeZipArchiveError(
@@ -52,7 +50,7 @@ def safe_extract_zip(
         )
 
     total_size = 0
-    validated_members: list[tuple[ZipInfo, Path]] = []
+    validated_members: list[tuple[ZipInfo, PurePosixPath]] = []
 
     for zip_info in members:
         member_path = _validate_zip_member_name(zip_info.filename)
@@ -68,6 +66,28 @@ def safe_extract_zip(
                 "Archive uncompressed size exceeds allowed limit."
             )
 
+        validated_members.append((zip_info, member_path))
+
+    return validated_members
+
+
+def safe_extract_zip(
+    archive: ZipFile,
+    destination: str | Path,
+    *,
+    max_files: int = 20000,
+    max_total_uncompressed_size: int = 2 * 1024 * 1024 * 1024,
+) -> list[Path]:
+    destination_root = Path(destination).resolve()
+    destination_root.mkdir(parents=True, exist_ok=True)
+
+    validated_members: list[tuple[ZipInfo, Path]] = []
+
+    for zip_info, member_path in validate_zip_members(
+        archive,
+        max_files=max_files,
+        max_total_uncompressed_size=max_total_uncompressed_size,
+    ):
         target_path = (destination_root / Path(*member_path.parts)).resolve()
         try:
             target_path.relative_to(destination_root)
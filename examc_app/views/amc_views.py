@@ -18,7 +18,13 @@ from django.views.decorators.http import require_POST, require_GET
 
 from examc_app.decorators import exam_permission_required
 from examc_app.models import *
-from examc_app.tasks import import_csv_data, generate_marked_files_zip, amc_annotate_task, amc_import_from_review_task
+from examc_app.tasks import (
+    import_csv_data,
+    generate_marked_files_zip,
+    amc_annotate_task,
+    amc_import_from_review_task,
+    amc_send_annotated_papers_task,
+)
 from examc_app.utils.amc_functions import *
 from examc_app.utils.global_functions import user_allowed
 from examc_app.utils.marker_rendering import (
@@ -32,6 +38,7 @@ from examc_app.utils.review_functions import generate_marked_pdfs, create_studen
 
 AMC_ANNOTATE_JOBS_SESSION_KEY = "amc_annotate_jobs"
 AMC_IMPORT_JOBS_SESSION_KEY = "amc_import_jobs"
+AMC_MAIL_JOBS_SESSION_KEY = "amc_mail_jobs"
 AMC_ANNOTATE_JOB_TTL_SECONDS = 24 * 3600
 AMC_ANNOTATE_JOB_MAX_TRACKED = 200
 
@@ -134,6 +141,24 @@ def _is_amc_import_job_owned(request, exam_pk, job_id):
     return bool(meta and int(meta.get("exam_pk")) == int(exam_pk))
 
 
+def _track_amc_mail_job(request, exam_pk, job_id):
+    jobs = _prune_amc_annotate_jobs(request.session.get(AMC_MAIL_JOBS_SESSION_KEY, {}))
+    jobs[str(job_id)] = {
+        "exam_pk": int(exam_pk),
+        "created_at": int(timezone.now().timestamp()),
+    }
+    request.session[AMC_MAIL_JOBS_SESSION_KEY] = _prune_amc_annotate_jobs(jobs)
+    request.session.modified = True
+
+
+def _is_amc_mail_job_owned(request, exam_pk, job_id):
+    jobs = _prune_amc_annotate_jobs(request.session.get(AMC_MAIL_JOBS_SESSION_KEY, {}))
+    request.session[AMC_MAIL_JOBS_SESSION_KEY] = jobs
+    request.session.modified = True
+    meta = jobs.get(str(job_id))
+    return bool(meta and int(meta.get("exam_pk")) == int(exam_pk))
+
+
 #@login_required
 @exam_permission_required(['manage'])
 def upload_amc_project(request, exam_pk):
@@ -957,8 +982,51 @@ def call_amc_send_annotated_papers(request, exam_pk):
     email_body = request.POST['email-body']
     email_column = request.POST['email-column']
 
-    result = amc_send_annotated_papers(exam,selected_students,email_subject,email_body,email_column)
-    return HttpResponse(json.dumps(result))
+    job = amc_send_annotated_papers_task.delay(exam.pk, selected_students, email_subject, email_body, email_column)
+    _track_amc_mail_job(request, exam_pk, job.id)
+    return JsonResponse({
+        "job_id": job.id,
+        "status_url": reverse("amc_send_annotated_papers_status", args=[exam.pk, job.id]),
+    }, status=202)
+
+@require_GET
+@exam_permission_required(['manage'])
+def amc_send_annotated_papers_status(request, exam_pk, job_id):
+    if not _is_amc_mail_job_owned(request, exam_pk, job_id):
+        return JsonResponse({"status": "forbidden", "error": "Unknown or unauthorized job id."}, status=403)
+
+    res = AsyncResult(job_id)
+
+    if res.state in ("PENDING", "STARTED", "RETRY"):
+        return JsonResponse({"status": "running", "state": res.state})
+
+    if res.state == "PROGRESS":
+        meta = res.info if isinstance(res.info, dict) else {}
+        return JsonResponse({
+            "status": "running",
+            "state": res.state,
+            "progress": meta.get("progress", ""),
+            "done": meta.get("done"),
+            "total": meta.get("total"),
+        })
+
+    if res.state == "FAILURE":
+        meta = res.info if isinstance(res.info, dict) else {}
+        return JsonResponse({
+            "status": "error",
+            "state": res.state,
+            "error": meta.get("exc_message", str(res.result)),
+            "progress": meta.get("progress", ""),
+        }, status=500)
+
+    # SUCCESS: result is [sent count, error count, failure messages]
+    result = res.result if isinstance(res.result, dict) else {"output": res.result}
+    return JsonResponse({
+        "status": "done",
+        "state": res.state,
+        "result": result.get("output", []),
+        "progress": result.get("progress", ""),
+    })
 
 @require_POST
 @exam_permission_required(['manage'])
@@ -45,6 +45,7 @@ from examc_app.utils.review_settings_guards import (
     pages_group_name_available,
     pages_group_settings_changed,
 )
+from examc_app.utils.scan_manifest import get_exam_scan_page
 
 logger = logging.getLogger(__name__)
 
@@ -621,7 +622,7 @@ def upload_scans(request, exam_pk, task_id=None):
             for chunk in zip_file.chunks():
                 temp_file.write(chunk)
 
-        task = import_exam_scans.delay(temp_file_path, exam_pk,delete_old_data)
+        task = import_exam_scans.delay(temp_file_path, exam_pk,delete_old_data,zip_file.name)
         task_id = task.task_id
        # message = start_upload_scans(request, exam.pk, temp_file_path)
 
@@ -749,9 +750,18 @@ def getMarkersAndComments(request, exam_pk):
     copy_no = request.POST['copy_no']
     page_no = request.POST['page_no']
 
-    # get img signed url
-    scan_url = get_scan_url(exam, copy_no, page_no)
+    # get img signed url, a preview level fitting the client viewport when available
+    try:
+        viewport_width = int(request.POST.get('viewport_width', 0))
+    except ValueError:
+        viewport_width = 0
+    scan_url = get_scan_url(exam, copy_no, page_no, viewport_width)
     data_dict["copyPageUrl"] = scan_url
+    # the magnifier enlarges the original scan, not the preview level
+    data_dict["copyPageOriginalUrl"] = get_scan_url(exam, copy_no, page_no) if viewport_width else scan_url
+    # corrector boxes are in original scan coordinates
+    scan_page = get_exam_scan_page(exam, copy_no, page_no)
+    data_dict["copyPageWidth"] = scan_page.width if scan_page and scan_page.width else None
     try:
         scan_markers = PageMarkers.objects.get(copie_no=copy_no, page_no=page_no,exam=exam)
         if scan_markers.markers:
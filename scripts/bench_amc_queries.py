@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""Benchmark the AMC database queries of the review/data capture pages, without and with the eXamc indexes.
+
+Builds a synthetic AMC project (capture, layout and scoring databases with the columns
+used by eXamc) in a temporary directory, then times the per copy/page queries before
+and after ensure_amc_indexes.
+
+    python3 scripts/bench_amc_queries.py [--copies 500] [--pages 6] [--questions 20] [--answers 5]
+"""
+
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from examc_app.utils import amc_db_queries as q  # noqa: E402
+
+
+def build_project(data_path: Path, copies: int, pages: int, questions: int, answers: int):
+    capture = sqlite3.connect(data_path / "capture.sqlite")
+    capture.executescript(
+        "CREATE TABLE capture_page (src TEXT, student INTEGER, page INTEGER, copy INTEGER, timestamp_auto INTEGER,"
+        " timestamp_manual INTEGER, mse REAL, overwritten INTEGER, PRIMARY KEY (student, page, copy));"
+        "CREATE TABLE capture_zone (zoneid INTEGER PRIMARY KEY, student INTEGER, page INTEGER, copy INTEGER, type INTEGER,"
+        " id_a INTEGER, id_b INTEGER, total INTEGER, black INTEGER, manual REAL, image TEXT, imagedata BLOB);"
+        "CREATE TABLE capture_position (zoneid INTEGER, corner INTEGER, x REAL, y REAL, type INTEGER,"
+        " PRIMARY KEY (zoneid, corner, type));"
+        "CREATE TABLE capture_failed (filename TEXT);"
+    )
+    layout = sqlite3.connect(data_path / "layout.sqlite")
+    layout.executescript(
+        "CREATE TABLE layout_page (student INTEGER, page INTEGER, PRIMARY KEY (student, page));"
+        "CREATE TABLE layout_box (student INTEGER, page INTEGER, role INTEGER, question INTEGER, answer INTEGER,"
+        " xmin REAL, xmax REAL, ymin REAL, ymax REAL, flags INTEGER, PRIMARY KEY (student, role, question, answer));"
+        "CREATE TABLE layout_question (question INTEGER PRIMARY KEY, name TEXT);"
+    )
+    scoring = sqlite3.connect(data_path / "scoring.sqlite")
+    scoring.executescript(
+        "CREATE TABLE scoring_score (student INTEGER, copy INTEGER, question INTEGER, score REAL, why TEXT, max REAL,"
+        " PRIMARY KEY (student, copy, question));"
+    )
+
+    layout.executemany("INSERT INTO layout_question VALUES (?, ?)", [(question, "Q%d" % question) for question in range(1, questions + 1)])
+    zoneid = 0
+    questions_per_page = max(1, questions // pages)
+    for student in range(1, copies + 1):
+        zones, positions, boxes = [], [], []
+        for page in range(1, pages + 1):
+            capture.execute("INSERT INTO capture_page VALUES (?, ?, ?, 0, 1, 0, 0.1, 0)",
+                            ("%%PROJET/scans/copy_%04d_%02d.jpg" % (student, page), student, page))
+            layout.execute("INSERT INTO layout_page VALUES (?, ?)", (student, page))
+            first_question = (page - 1) * questions_per_page + 1
+            for question in range(first_question, min(questions, first_question + questions_per_page - 1) + 1):
+                scoring.execute("INSERT INTO scoring_score VALUES (?, 0, ?, 1, '', 1)", (student, question))
+                for answer in range(1, answers + 1):
+                    zoneid += 1
+                    zones.append((zoneid, student, page, 4, question, answer, 100, (zoneid * 7) % 100, -1.0))
+                    positions.extend((zoneid, corner, corner * 10.0, answer * 10.0, 1) for corner in range(1, 5))
+                    boxes.append((student, page, 1, question, answer, 0, 10, 0, 10, 0))
+        capture.executemany("INSERT INTO capture_zone (zoneid, student, page, type, id_a, id_b, total, black, manual)"
+                            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", zones)
+        capture.executemany("INSERT INTO capture_position VALUES (?, ?, ?, ?, ?)", positions)
+        layout.executemany("INSERT INTO layout_box VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", boxes)
+
+    for connection in (capture, layout, scoring):
+        connection.commit()
+        connection.close()
+    for name in ("association", "report"):
+        (data_path / (name + ".sqlite")).touch()
+
+
+def run_queries(amc_data_path: str, copies: int, pages: int):
+    timings = {}
+
+    def timed(name, function, *args):
+        start = time.perf_counter()
+        function(*args)
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+    for student in range(1, copies + 1):
+        for page in range(1, pages + 1):
+            timed("select_marks_positions", q.select_marks_positions, amc_data_path, student, page, 0.5)
+            timed("select_copy_page_zooms", q.select_copy_page_zooms, amc_data_path, str(student), str(page))
+            timed("get_page_layout_boxes", q.get_page_layout_boxes, amc_data_path, str(student), str(page))
+        timed("select_copy_question_page", q.select_copy_question_page, amc_data_path, str(student), "Q1")
+    timed("select_manual_datacapture_pages", q.select_manual_datacapture_pages, amc_data_path, "", 0.5)
+    timed("select_manual_datacapture_questions_by_page", q.select_manual_datacapture_questions_by_page, amc_data_path)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--copies", type=int, default=500)
+    parser.add_argument("--pages", type=int, default=6)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--answers", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_path = Path(tmp_dir)
+        print("Building a %d copies project ..." % args.copies)
+        build_project(data_path, args.copies, args.pages, args.questions, args.answers)
+        amc_data_path = str(data_path) + "/"
+
+        without_indexes = run_queries(amc_data_path, args.copies, args.pages)
+        q.ensure_amc_indexes(amc_data_path)
+        with_indexes = run_queries(amc_data_path, args.copies, args.pages)
+        q.close_amc_sessions()
+
+    print("%-44s %12s %12s %8s" % ("query (total)", "no index", "indexed", "speedup"))
+    for name, duration in without_indexes.items():
+        print("%-44s %11.3fs %11.3fs %7.1fx" % (name, duration, with_indexes[name], duration / max(with_indexes[name], 1e-9)))
+
+
+if __name__ == "__main__":
+    main()